@@ -0,0 +1,145 @@
+"""
+SuiLight Knowledge Salon - 向量检索基准测试
+内存映射向量存储上的暴力余弦 Top-K 基线: 追加写入、单条查询与批量查询耗时；
+--ann 时对比 IVF-flat 近似索引在不同 nprobe 下的 recall@10 与 QPS
+
+用法:
+    python scripts/benchmark_embeddings.py
+    python scripts/benchmark_embeddings.py --sizes 10000 100000 1000000 --dim 384
+    python scripts/benchmark_embeddings.py --sizes 100000 --batch 64 --dir /tmp/vectors
+    python scripts/benchmark_embeddings.py --ann --sizes 100000 1000000 --nprobe 1 4 16 64
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.storage.ivf_index import IVFIndex
+from src.storage.vector_store import VectorStore
+
+# 生成 / 追加向量的批大小
+APPEND_CHUNK = 50_000
+
+
+def _time_ms(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def build_store(directory: str, size: int, dim: int, seed: int = 7) -> VectorStore:
+    """分批追加随机向量 (带少量聚簇结构，避免相似度全部集中在 0 附近)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, dim)).astype(np.float32)
+    store = VectorStore(directory, dim, "benchmark")
+    for start in range(0, size, APPEND_CHUNK):
+        count = min(APPEND_CHUNK, size - start)
+        vectors = centers[rng.integers(0, len(centers), count)] + rng.standard_normal((count, dim)).astype(np.float32)
+        store.add([f"v{i}" for i in range(start, start + count)], vectors)
+    return store
+
+
+def run(size: int, dim: int, batch: int, k: int = 10, root: str = None) -> Dict:
+    directory = tempfile.mkdtemp(prefix="vectors_", dir=root)
+    try:
+        started = time.perf_counter()
+        store = build_store(directory, size, dim)
+        build_s = time.perf_counter() - started
+        
+        rng = np.random.default_rng(11)
+        queries = rng.standard_normal((batch, dim)).astype(np.float32)
+        store.search(queries[:1], k)  # 预热 (页缓存)
+        single_ms = _time_ms(lambda: store.search(queries[:1], k), 5)
+        batch_ms = _time_ms(lambda: store.search(queries, k), 2)
+        by_id_ms = _time_ms(lambda: store.search(store.get("v0")[None, :], k, exclude=["v0"]), 5)
+        
+        # 墓碑删除 10% 后的查询
+        store.delete([f"v{i}" for i in range(0, size, 10)])
+        deleted_ms = _time_ms(lambda: store.search(queries[:1], k), 5)
+        
+        return {
+            "size": size,
+            "build_s": round(build_s, 2),
+            "disk_mb": round(os.path.getsize(os.path.join(directory, "vectors.f32")) / 2 ** 20, 1),
+            "single_ms": single_ms,
+            "by_id_ms": by_id_ms,
+            "batch_per_query_ms": batch_ms / batch,
+            "qps": batch / (batch_ms / 1000),
+            "deleted_ms": deleted_ms
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_ann(size: int, dim: int, nprobes: List[int], k: int = 10, queries: int = 100, root: str = None) -> Dict:
+    """IVF 近似索引相对暴力检索的 recall@k 与单条查询 QPS"""
+    directory = tempfile.mkdtemp(prefix="vectors_", dir=root)
+    try:
+        store = build_store(directory, size, dim)
+        started = time.perf_counter()
+        index = IVFIndex.build(store)
+        build_s = time.perf_counter() - started
+        
+        # 查询取自数据分布 (已有向量加小扰动)
+        rng = np.random.default_rng(13)
+        picked = store.rows(np.sort(rng.choice(store.row_count, queries, replace=False)))
+        query_vectors = picked + 0.3 * rng.standard_normal(picked.shape).astype(np.float32)
+        
+        started = time.perf_counter()
+        exact = [store.search(q[None, :], k)[0] for q in query_vectors]
+        exact_qps = queries / (time.perf_counter() - started)
+        expected = [{capsule_id for capsule_id, _ in result} for result in exact]
+        
+        rows = []
+        for nprobe in nprobes:
+            started = time.perf_counter()
+            approx = [index.search(q[None, :], k, nprobe)[0] for q in query_vectors]
+            qps = queries / (time.perf_counter() - started)
+            recall = np.mean([
+                len(truth & {capsule_id for capsule_id, _ in result}) / k
+                for truth, result in zip(expected, approx)
+            ])
+            rows.append({"nprobe": nprobe, "recall": float(recall), "qps": qps})
+        return {"size": size, "nlist": index.nlist, "build_s": round(build_s, 1), "exact_qps": exact_qps, "rows": rows}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="向量检索基准测试 (暴力余弦 Top-K 基线)")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch", type=int, default=64, help="批量查询的查询数")
+    parser.add_argument("--dir", default=None, help="向量文件的临时目录")
+    parser.add_argument("--ann", action="store_true", help="对比 IVF 近似索引的 recall@10 与 QPS")
+    parser.add_argument("--nprobe", nargs="*", type=int, default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args(argv)
+    
+    if args.ann:
+        print(f"{'向量数':>10} {'簇数':>6} {'构建(s)':>8} {'nprobe':>7} {'recall@10':>10} {'QPS':>8} {'暴力QPS':>8}")
+        for size in args.sizes:
+            r = run_ann(size, args.dim, args.nprobe, root=args.dir)
+            for row in r["rows"]:
+                print(f"{r['size']:>10} {r['nlist']:>6} {r['build_s']:>8} {row['nprobe']:>7} "
+                      f"{row['recall']:>10.3f} {row['qps']:>8.0f} {r['exact_qps']:>8.0f}")
+        return
+    
+    print(f"{'向量数':>10} {'写入(s)':>8} {'文件(MB)':>9} {'单条(ms)':>9} {'按ID(ms)':>9} "
+          f"{'批量(ms/条)':>12} {'QPS':>8} {'删10%(ms)':>10}")
+    for size in args.sizes:
+        r = run(size, args.dim, args.batch, root=args.dir)
+        print(f"{r['size']:>10} {r['build_s']:>8} {r['disk_mb']:>9} {r['single_ms']:>9.2f} {r['by_id_ms']:>9.2f} "
+              f"{r['batch_per_query_ms']:>12.3f} {r['qps']:>8.0f} {r['deleted_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
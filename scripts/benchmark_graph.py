@@ -0,0 +1,183 @@
+"""
+SuiLight Knowledge Salon - 知识图谱基准测试
+对比逐边扫描与邻接索引的邻居查询 / 最短路径耗时，以及字典图谱与 CSR 紧凑图谱的内存
+
+用法:
+    python scripts/benchmark_graph.py
+    python scripts/benchmark_graph.py --sizes 10000 100000 1000000
+    python scripts/benchmark_graph.py --memory --sizes 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.graph import GraphEdge, GraphNode, KnowledgeGraph
+from src.graph_csr import CompactGraph
+
+# 逐边扫描的参考实现只在该规模以内运行 (更大规模耗时过长)
+LEGACY_MAX_EDGES = 100_000
+LEGACY_PATH_MAX_EDGES = 10_000
+
+
+def build_graph(edge_count: int, seed: int = 42) -> KnowledgeGraph:
+    """构建平均度数约为 10 的随机图"""
+    rng = random.Random(seed)
+    node_count = max(edge_count // 5, 2)
+    graph = KnowledgeGraph(name=f"benchmark_{edge_count}")
+    for i in range(node_count):
+        graph.add_node(GraphNode(id=f"n{i}", type="capsule", label=f"节点 {i}"))
+    for i in range(edge_count):
+        graph.add_edge(GraphEdge(
+            id=f"e{i}",
+            source=f"n{rng.randrange(node_count)}",
+            target=f"n{rng.randrange(node_count)}",
+            type="related" if i % 2 else "has_keyword"
+        ))
+    return graph
+
+
+def legacy_neighbors(graph: KnowledgeGraph, node_id: str) -> List[str]:
+    """原实现: 每次扫描全部边"""
+    result = []
+    for edge in graph.edges.values():
+        if edge.source == node_id:
+            result.append(edge.target)
+        elif edge.target == node_id:
+            result.append(edge.source)
+    return result
+
+
+def legacy_shortest_path(graph: KnowledgeGraph, start_id: str, end_id: str) -> List[str]:
+    """原实现: list.pop(0) + 复制路径 + 每个出队节点扫描全部边"""
+    queue = [[start_id]]
+    visited = {start_id}
+    while queue:
+        path = queue.pop(0)
+        node = path[-1]
+        if node == end_id:
+            return path
+        for edge in graph.edges.values():
+            if edge.source == node and edge.target not in visited:
+                visited.add(edge.target)
+                queue.append(path + [edge.target])
+            elif edge.target == node and edge.source not in visited:
+                visited.add(edge.source)
+                queue.append(path + [edge.source])
+    return []
+
+
+def _time_ms(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def run(edge_count: int, queries: int = 200, path_queries: int = 20) -> Dict:
+    rng = random.Random(7)
+    
+    started = time.perf_counter()
+    graph = build_graph(edge_count)
+    build_s = time.perf_counter() - started
+    
+    node_ids = list(graph.nodes)
+    samples = [rng.choice(node_ids) for _ in range(queries)]
+    pairs = [(rng.choice(node_ids), rng.choice(node_ids)) for _ in range(path_queries)]
+    
+    result = {
+        "edges": edge_count,
+        "nodes": len(node_ids),
+        "build_s": round(build_s, 2),
+        "neighbors_ms": _time_ms(lambda: [list(graph.neighbor_ids(n)) for n in samples], 1) / queries,
+        "neighbors_typed_ms": _time_ms(
+            lambda: [list(graph.neighbor_ids(n, "related")) for n in samples], 1
+        ) / queries,
+        "path_ms": _time_ms(lambda: [graph.get_shortest_path(a, b) for a, b in pairs], 1) / path_queries,
+    }
+    
+    if edge_count <= LEGACY_MAX_EDGES:
+        legacy_samples = samples[:20]
+        result["legacy_neighbors_ms"] = _time_ms(
+            lambda: [legacy_neighbors(graph, n) for n in legacy_samples], 1
+        ) / len(legacy_samples)
+    
+    if edge_count <= LEGACY_PATH_MAX_EDGES:
+        legacy_pairs = pairs[:2]
+        result["legacy_path_ms"] = _time_ms(
+            lambda: [legacy_shortest_path(graph, a, b) for a, b in legacy_pairs], 1
+        ) / len(legacy_pairs)
+        
+        # 结果一致性: 最短路径长度必须相同
+        for a, b in legacy_pairs:
+            assert len(graph.get_shortest_path(a, b)) == len(legacy_shortest_path(graph, a, b))
+    
+    return result
+
+
+def measure_memory(edge_count: int) -> Dict:
+    """字典图谱 (每条边一个 GraphEdge + uuid) 与 CSR 紧凑图谱的单边内存"""
+    rng = random.Random(42)
+    node_count = max(edge_count // 5, 2)
+    
+    tracemalloc.start()
+    graph = KnowledgeGraph()
+    for i in range(node_count):
+        graph.add_node(GraphNode(id=f"n{i}", type="capsule", label=f"节点 {i}"))
+    nodes_bytes = tracemalloc.get_traced_memory()[0]
+    for i in range(edge_count):
+        graph.add_edge(GraphEdge(
+            source=f"n{rng.randrange(node_count)}",
+            target=f"n{rng.randrange(node_count)}",
+            type="related" if i % 2 else "has_keyword",
+            weight=rng.random()
+        ))
+    dict_bytes = tracemalloc.get_traced_memory()[0] - nodes_bytes
+    tracemalloc.stop()
+    
+    started = time.perf_counter()
+    compact = CompactGraph.from_knowledge_graph(graph, keep_attributes=False)
+    convert_s = time.perf_counter() - started
+    compact_bytes = compact.memory_usage()["arrays"]
+    
+    return {
+        "edges": edge_count,
+        "dict_per_edge": dict_bytes / edge_count,
+        "compact_per_edge": compact_bytes / edge_count,
+        "ratio": dict_bytes / compact_bytes,
+        "convert_s": convert_s
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="知识图谱基准测试")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--memory", action="store_true", help="对比字典图谱与 CSR 紧凑图谱的内存")
+    args = parser.parse_args(argv)
+    
+    if args.memory:
+        print(f"{'边数':>10} {'字典(B/边)':>11} {'CSR(B/边)':>10} {'倍数':>6} {'转换(s)':>8}")
+        for size in args.sizes:
+            r = measure_memory(size)
+            print(f"{r['edges']:>10} {r['dict_per_edge']:>11.1f} {r['compact_per_edge']:>10.1f} "
+                  f"{r['ratio']:>6.1f} {r['convert_s']:>8.2f}")
+        return
+    
+    print(f"{'边数':>10} {'节点':>9} {'构建(s)':>8} {'邻居(ms)':>10} {'原邻居(ms)':>11} "
+          f"{'路径(ms)':>10} {'原路径(ms)':>11}")
+    for size in args.sizes:
+        r = run(size)
+        legacy_neighbors_ms = f"{r['legacy_neighbors_ms']:.3f}" if "legacy_neighbors_ms" in r else "-"
+        legacy_path_ms = f"{r['legacy_path_ms']:.1f}" if "legacy_path_ms" in r else "-"
+        print(f"{r['edges']:>10} {r['nodes']:>9} {r['build_s']:>8} {r['neighbors_ms']:>10.4f} "
+              f"{legacy_neighbors_ms:>11} {r['path_ms']:>10.3f} {legacy_path_ms:>11}")
+
+
+if __name__ == "__main__":
+    main()
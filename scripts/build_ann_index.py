@@ -0,0 +1,47 @@
+"""
+SuiLight Knowledge Salon - 离线构建语义近似索引
+从胶囊存储同步向量 (只向量化缺失 / 变化的胶囊)，再构建并持久化 IVF-flat 索引；
+服务启动时直接加载
+
+用法:
+    python scripts/build_ann_index.py
+    python scripts/build_ann_index.py --nlist 2048
+    python scripts/build_ann_index.py --db data/capsules.db --vectors data/vectors
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.semantic_index import SemanticIndex
+from src.storage.capsule_storage import CapsuleStorage
+from src.storage.sharded_storage import ShardedCapsuleStorage
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="离线构建语义近似索引 (IVF-flat)")
+    parser.add_argument("--db", default=os.path.join(DATA_DIR, "capsules.db"), help="胶囊数据库 (分片存储时为目录)")
+    parser.add_argument("--vectors", default=os.path.join(DATA_DIR, "vectors"), help="向量存储目录")
+    parser.add_argument("--nlist", type=int, default=None, help="簇数，默认约 sqrt(N)")
+    args = parser.parse_args(argv)
+    
+    storage = ShardedCapsuleStorage(args.db) if os.path.isdir(args.db) else CapsuleStorage(args.db)
+    index = SemanticIndex()
+    
+    started = time.perf_counter()
+    index.attach_storage(storage, args.vectors)
+    print(f"向量同步完成: {len(index.store)} 个胶囊, 耗时 {time.perf_counter() - started:.1f}s")
+    
+    started = time.perf_counter()
+    ann = index.build_ann(args.nlist)
+    print(f"IVF 索引构建完成: {len(ann.rows)} 个向量, {ann.nlist} 个簇, 耗时 {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+SuiLight Knowledge Salon - 导出胶囊列式快照
+把胶囊语料导出为 .npy 列文件 (安装 pyarrow 时另存 Parquet)，并输出向量化分析报告
+
+用法:
+    python scripts/export_columnar.py
+    python scripts/export_columnar.py --out data/columnar --no-parquet
+    python scripts/export_columnar.py --db data/shards --report report.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.analytics import CapsuleAnalytics
+from src.storage.capsule_storage import CapsuleStorage
+from src.storage.columnar import export_columnar
+from src.storage.sharded_storage import ShardedCapsuleStorage
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="导出胶囊列式快照并生成分析报告")
+    parser.add_argument("--db", default=os.path.join(DATA_DIR, "capsules.db"), help="胶囊数据库 (分片存储时为目录)")
+    parser.add_argument("--out", default=os.path.join(DATA_DIR, "columnar"), help="快照输出目录")
+    parser.add_argument("--no-parquet", action="store_true", help="不导出 Parquet")
+    parser.add_argument("--top", type=int, default=20, help="报告中关键词 / Agent 的 Top-N")
+    parser.add_argument("--report", default=None, help="分析报告输出文件 (默认打印)")
+    args = parser.parse_args(argv)
+    
+    storage = ShardedCapsuleStorage(args.db) if os.path.isdir(args.db) else CapsuleStorage(args.db)
+    
+    started = time.perf_counter()
+    snapshot = export_columnar(storage, args.out, parquet=False if args.no_parquet else None)
+    print(f"列式快照导出完成: {len(snapshot)} 个胶囊, "
+          f"{snapshot.memory_usage() / (1 << 20):.1f} MB, 耗时 {time.perf_counter() - started:.1f}s")
+    
+    report = CapsuleAnalytics(snapshot).report(args.top)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"分析报告已保存: {args.report}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,25 @@ SuiLight Knowledge Salon - 批量胶囊生成器
 """
 
 import json
+import os
+import sys
 import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.analytics import CapsuleAnalytics
+from src.capsule_lsh import CapsuleLSHIndex
+from src.storage.columnar import ColumnarSnapshot
+
 # 胶囊存储
 capsules = []
 
+# 近重复索引: 与已生成胶囊近重复的胶囊不再重复生成
+dedup_index = CapsuleLSHIndex()
+skipped = []
+
 
 def create_capsule(
     title: str,
@@ -22,7 +34,7 @@ def create_capsule(
     action_items: List[str] = None,
     quality: int = 70
 ) -> Dict:
-    """创建胶囊"""
+    """创建胶囊 (与已生成胶囊近重复时跳过，返回已有胶囊)"""
     capsule = {
         "id": f"cap_{uuid.uuid4().hex[:8]}",
         "title": title,
@@ -46,6 +58,14 @@ def create_capsule(
         "created_at": (datetime.now() - timedelta(days=30)).isoformat(),
         "updated_at": datetime.now().isoformat()
     }
+    duplicates = dedup_index.find_duplicates(capsule, limit=1)
+    if duplicates:
+        existing = next(c for c in capsules if c["id"] == duplicates[0][0])
+        print(f"跳过近重复胶囊: {title} (与「{existing['title']}」相似度 {duplicates[0][1]})")
+        skipped.append(title)
+        return existing
+    _, signature = dedup_index.capsule_signature(capsule)
+    dedup_index.add(capsule["id"], signature)
     capsules.append(capsule)
     return capsule
 
@@ -866,29 +886,21 @@ print("=" * 60)
 print(f"📦 批量生成胶囊完成")
 print("=" * 60)
 print(f"总胶囊数: {len(capsules)}")
+print(f"跳过近重复: {len(skipped)} 个")
 print()
 
-# 统计
-categories_count = {}
-for c in capsules:
-    cat = c["category"]
-    categories_count[cat] = categories_count.get(cat, 0) + 1
+# 统计 (在列式快照上向量化计算)
+analytics = CapsuleAnalytics(ColumnarSnapshot.from_capsules(capsules))
 
 print("按领域统计:")
-for cat, count in sorted(categories_count.items(), key=lambda x: -x[1]):
-    print(f"  {cat}: {count} 个")
+for row in analytics.category_summary():
+    print(f"  {row['category']}: {row['count']} 个")
 
 print()
 
 # 质量分布
-quality_dist = {"A(80+)": 0, "B(60-79)": 0, "C(<60)": 0}
-for c in capsules:
-    if c["quality_score"] >= 80:
-        quality_dist["A(80+)"] += 1
-    elif c["quality_score"] >= 60:
-        quality_dist["B(60-79)"] += 1
-    else:
-        quality_dist["C(<60)"] += 1
+grades = analytics.grade_distribution()
+quality_dist = {"A(80+)": grades["A"], "B(60-79)": grades["B"], "C(<60)": grades["C"]}
 
 print("质量分布:")
 for grade, count in quality_dist.items():
@@ -910,9 +922,5 @@ print(f"已导出: batch_capsules.json")
 print()
 
 # 统计关键词
-all_keywords = []
-for c in capsules:
-    all_keywords.extend(c["keywords"])
-unique_keywords = set(all_keywords)
-print(f"关键词总数: {len(all_keywords)}")
-print(f"独立关键词: {len(unique_keywords)}")
+print(f"关键词总数: {len(analytics.snapshot['keyword_codes'])}")
+print(f"独立关键词: {analytics.get_statistics()['total_keywords']}")
@@ -223,7 +223,8 @@ class Agent:
         """Mock 思考过程 (无 LLM 时使用)"""
         return f"【{self.config.name}】收到: {message}\n\n(配置 LLM 后可获得智能回复: Ollama/Groq/OpenAI/MiniMax)"
     
-    def chat(self, message: str, context: List[Dict] = None, save_to_storage: bool = True) -> str:
+    def chat(self, message: str, context: List[Dict] = None, save_to_storage: bool = True,
+             user_id: Optional[str] = None) -> str:
         """
         对话接口
         
@@ -231,6 +232,7 @@ class Agent:
             message: 用户消息
             context: 对话上下文
             save_to_storage: 是否保存到持久化存储
+            user_id: 发起对话的用户 (写入对话元数据，用于用户兴趣画像)
             
         Returns:
             Agent 回复
@@ -258,12 +260,15 @@ class Agent:
         if save_to_storage:
             try:
                 from src.storage import storage
+                metadata = {"domain": self.config.domain}
+                if user_id:
+                    metadata["user_id"] = user_id
                 storage.save_chat(
                     agent_id=self.id,
                     agent_name=self.config.name,
                     user_message=message,
                     bot_response=response,
-                    metadata={"domain": self.config.domain}
+                    metadata=metadata
                 )
             except Exception as e:
                 logger.warning(f"保存对话到存储失败: {e}")
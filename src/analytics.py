@@ -0,0 +1,198 @@
+"""
+SuiLight Knowledge Salon - 胶囊向量化分析
+基于列式快照计算等级分布、分类均值、关键词频次、时间线
+"""
+
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.storage.columnar import ColumnarSnapshot, GRADES
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CapsuleAnalytics:
+    """
+    胶囊分析器
+    
+    所有聚合都在快照的 NumPy 列上完成 (bincount / argpartition)，
+    不逐行遍历 Python 字典。
+    """
+    
+    def __init__(self, snapshot: ColumnarSnapshot):
+        self.snapshot = snapshot
+    
+    @classmethod
+    def from_storage(cls, storage) -> "CapsuleAnalytics":
+        return cls(ColumnarSnapshot.from_storage(storage))
+    
+    @classmethod
+    def load(cls, snapshot_dir: str) -> "CapsuleAnalytics":
+        return cls(ColumnarSnapshot.load(snapshot_dir))
+    
+    # ============ 分布 ============
+    
+    def grade_distribution(self) -> Dict[str, int]:
+        """等级分布"""
+        vocab = self.snapshot.vocab["grade"]
+        counts = np.bincount(self.snapshot["grade_code"], minlength=len(vocab))
+        result = {grade: 0 for grade in GRADES}
+        result.update({vocab[i]: int(c) for i, c in enumerate(counts)})
+        return result
+    
+    def category_summary(self) -> List[Dict]:
+        """按分类统计数量与各项均值 (按数量降序)"""
+        vocab = self.snapshot.vocab["category"]
+        codes = self.snapshot["category_code"]
+        counts = np.bincount(codes, minlength=len(vocab))
+        safe_counts = np.maximum(counts, 1)
+        
+        averages = {
+            name: np.bincount(codes, weights=self.snapshot[name], minlength=len(vocab)) / safe_counts
+            for name in ("quality_score", "confidence", "truth_score", "goodness_score",
+                         "beauty_score", "intelligence_score")
+        }
+        
+        summary = [
+            {
+                "category": vocab[i],
+                "count": int(counts[i]),
+                **{f"avg_{name}": round(float(values[i]), 2) for name, values in averages.items()}
+            }
+            for i in np.argsort(-counts, kind="stable") if counts[i] > 0
+        ]
+        return summary
+    
+    def _top_counts(self, name: str, top_n: Optional[int]) -> List[Dict]:
+        vocab = self.snapshot.vocab[name]
+        counts = np.bincount(self.snapshot[f"{name}_codes"], minlength=len(vocab))
+        if top_n is not None and top_n < len(counts):
+            top = np.argpartition(-counts, top_n)[:top_n]
+        else:
+            top = np.arange(len(counts))
+        top = top[np.lexsort((top, -counts[top]))]
+        return [{name: vocab[i], "count": int(counts[i])} for i in top if counts[i] > 0]
+    
+    def keyword_counts(self, top_n: int = 50) -> List[Dict]:
+        """关键词频次 Top-N"""
+        return self._top_counts("keyword", top_n)
+    
+    def agent_counts(self, top_n: int = 50) -> List[Dict]:
+        """Agent 参与胶囊数量 Top-N"""
+        return self._top_counts("agent", top_n)
+    
+    # ============ 时间线 ============
+    
+    def weekly_timeline(self) -> List[Dict]:
+        """按周 (%Y-W%U，周日为一周起点) 统计数量与平均质量，最新在前"""
+        created = self.snapshot["created_at"]
+        valid = ~np.isnat(created)
+        days = created[valid].astype("datetime64[D]")
+        quality = self.snapshot["quality_score"][valid]
+        if len(days) == 0:
+            return []
+        
+        years = days.astype("datetime64[Y]")
+        day_of_year = (days - years.astype("datetime64[D]")).astype(np.int64)
+        # 1970-01-01 是周四: (天数 + 4) % 7 得到周日为 0 的星期
+        weekday = (days.astype(np.int64) + 4) % 7
+        week = (day_of_year + 7 - weekday) // 7
+        keys = (years.astype(np.int64) + 1970) * 100 + week
+        
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse)
+        quality_sums = np.bincount(inverse, weights=quality)
+        
+        return [
+            {
+                "week": f"{key // 100}-W{key % 100:02d}",
+                "count": int(counts[i]),
+                "avg_quality": round(float(quality_sums[i] / counts[i]), 2)
+            }
+            for i, key in reversed(list(enumerate(unique_keys)))
+        ]
+    
+    # ============ 汇总 ============
+    
+    def get_statistics(self) -> Dict:
+        """与 KnowledgeGraphManager.get_statistics 相同结构的统计"""
+        n = len(self.snapshot)
+        grades = self.grade_distribution()
+        return {
+            "total_capsules": n,
+            "total_keywords": int(np.count_nonzero(np.bincount(
+                self.snapshot["keyword_codes"], minlength=len(self.snapshot.vocab["keyword"])
+            ))),
+            "total_agents": int(np.count_nonzero(np.bincount(
+                self.snapshot["agent_codes"], minlength=len(self.snapshot.vocab["agent"])
+            ))),
+            "categories": int(np.count_nonzero(np.bincount(self.snapshot["category_code"]))) if n else 0,
+            "avg_quality": round(float(self.snapshot["quality_score"].mean(dtype=np.float64)), 2) if n else 0,
+            "a_grade_count": grades.get("A", 0),
+            "b_grade_count": grades.get("B", 0),
+            "c_grade_count": grades.get("C", 0)
+        }
+    
+    def report(self, top_n: int = 20) -> Dict:
+        """完整分析报告"""
+        return {
+            "statistics": self.get_statistics(),
+            "grade_distribution": self.grade_distribution(),
+            "categories": self.category_summary(),
+            "top_keywords": self.keyword_counts(top_n),
+            "top_agents": self.agent_counts(top_n),
+            "timeline": self.weekly_timeline()
+        }
+
+
+# ============ 演示 / 基准 ============
+
+def _synthetic_capsules(n: int) -> List[Dict]:
+    rng = np.random.default_rng(42)
+    categories = ["自然科学", "社会科学", "人文科学", "交叉科学"]
+    scores = rng.uniform(30, 100, n)
+    days = rng.integers(0, 365, n)
+    return [
+        {
+            "id": f"cap_{i}",
+            "category": categories[i % 4],
+            "quality_score": float(scores[i]),
+            "keywords": [f"kw{k}" for k in rng.integers(0, 2000, 5)],
+            "source_agents": [f"agent{i % 100}"],
+            "created_at": (np.datetime64("2026-01-01") + int(days[i])).astype(str) + "T00:00:00"
+        }
+        for i in range(n)
+    ]
+
+
+def _dict_statistics(capsules: List[Dict]) -> Dict:
+    """逐行遍历字典的参考实现 (基准对照)"""
+    return {
+        "total_keywords": len(set(kw for c in capsules for kw in c.get("keywords", []))),
+        "avg_quality": sum(c.get("quality_score", 0) for c in capsules) / len(capsules),
+        "a_grade_count": len([c for c in capsules if c.get("quality_score", 0) >= 80]),
+    }
+
+
+if __name__ == "__main__":
+    n = 200_000
+    capsules = _synthetic_capsules(n)
+    
+    started = time.perf_counter()
+    for _ in range(5):
+        _dict_statistics(capsules)
+    dict_ms = (time.perf_counter() - started) * 1000 / 5
+    
+    analytics = CapsuleAnalytics(ColumnarSnapshot.from_capsules(capsules))
+    started = time.perf_counter()
+    for _ in range(5):
+        analytics.get_statistics()
+    columnar_ms = (time.perf_counter() - started) * 1000 / 5
+    
+    print(f"{n} 个胶囊: 字典遍历 {dict_ms:.1f}ms, 列式向量化 {columnar_ms:.1f}ms "
+          f"({dict_ms / columnar_ms:.0f}x)")
+    print(f"快照内存: {analytics.snapshot.memory_usage() / (1 << 20):.1f} MB")
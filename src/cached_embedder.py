@@ -0,0 +1,192 @@
+"""
+SuiLight Knowledge Salon - 带缓存的向量化
+位于 LLMClient.embedding 之前的按内容寻址缓存层
+
+- 查询先按 (provider, model, 内容哈希) 查进程内 LRU 与 SQLite 缓存 (EmbeddingCache)
+- 未命中的文本去重后按 provider 的批大小切分，在有界线程池中并发调用
+- 多个调用方同时请求同一段未缓存文本时只调用一次 provider，其余调用方等待同一结果
+- stats() 返回命中率等指标
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import logging
+
+import numpy as np
+
+from src.storage.embedding_cache import EmbeddingCache, content_hash
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 各 provider 单次 embedding 请求的文本数
+PROVIDER_BATCH_SIZES = {
+    "openai": 256,
+    "ollama": 32,
+    "groq": 64,
+    "minimax": 32,
+    "mock": 256
+}
+DEFAULT_BATCH_SIZE = 64
+
+# 同时进行的 provider 请求数
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class CachedEmbedder:
+    """
+    带缓存的向量函数
+    
+    可直接作为 SemanticIndex 的 embed_fn: 文本列表 → [n, dim] float32 数组。
+    """
+    
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        provider: str,
+        model: str = "",
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ):
+        """
+        初始化
+        
+        Args:
+            embed_fn: 底层向量函数 (如 LLMClient.embedding)
+            provider: 提供方名称 (缓存键的一部分)
+            model: 模型名称 (缓存键的一部分)
+            cache: 持久化缓存，默认为 data/embeddings.db
+            batch_size: 单次 provider 请求的文本数，默认按 provider 取值
+            max_concurrency: 同时进行的 provider 请求数
+        """
+        self.embed_fn = embed_fn
+        self.provider = provider
+        self.model = model or ""
+        self.cache = cache or EmbeddingCache()
+        self.batch_size = batch_size or PROVIDER_BATCH_SIZES.get(provider, DEFAULT_BATCH_SIZE)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embedding")
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "duplicate_hits": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "provider_calls": 0,
+            "provider_errors": 0,
+            "provider_seconds": 0.0
+        }
+    
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        return self.embed(texts)
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        批量向量化 (命中缓存的文本不调用 provider)
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            向量 [len(texts), dim]
+        """
+        digests = [content_hash(text) for text in texts]
+        unique = dict(zip(digests, texts))
+        found, memory_hits = self.cache.get_many(self.provider, self.model, unique)
+        
+        # 未命中的文本: 已在其他调用中请求的等待其结果，其余由本次调用发起
+        waiting: Dict[str, Future] = {}
+        owned: List[str] = []
+        with self._lock:
+            for digest in unique:
+                if digest in found:
+                    continue
+                future = self._inflight.get(digest)
+                if future is None:
+                    future = Future()
+                    self._inflight[digest] = future
+                    owned.append(digest)
+                waiting[digest] = future
+        
+        for start in range(0, len(owned), self.batch_size):
+            batch = owned[start:start + self.batch_size]
+            self._executor.submit(self._embed_batch, batch, [unique[digest] for digest in batch])
+        for digest, future in waiting.items():
+            found[digest] = future.result()
+        
+        with self._lock:
+            metrics = self._metrics
+            metrics["requests"] += len(texts)
+            metrics["duplicate_hits"] += len(texts) - len(unique)
+            metrics["memory_hits"] += memory_hits
+            metrics["disk_hits"] += len(unique) - len(waiting) - memory_hits
+            metrics["coalesced"] += len(waiting) - len(owned)
+            metrics["misses"] += len(owned)
+        
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[digest] for digest in digests]).astype(np.float32, copy=False)
+    
+    def _embed_batch(self, digests: List[str], texts: List[str]):
+        """调用 provider 向量化一批文本，写入缓存并完成等待中的 Future"""
+        started = time.perf_counter()
+        try:
+            vectors = np.asarray(self.embed_fn(texts), dtype=np.float32).reshape(len(texts), -1)
+            self.cache.put_many(self.provider, self.model, dict(zip(digests, vectors)))
+        except Exception as e:
+            logger.error(f"向量化失败 ({self.provider}/{self.model}, {len(texts)} 条): {e}")
+            with self._lock:
+                self._metrics["provider_errors"] += 1
+                for digest in digests:
+                    self._inflight.pop(digest).set_exception(e)
+            return
+        with self._lock:
+            self._metrics["provider_calls"] += 1
+            self._metrics["provider_seconds"] += time.perf_counter() - started
+            for digest, vector in zip(digests, vectors):
+                self._inflight.pop(digest).set_result(vector)
+    
+    def stats(self) -> Dict:
+        """命中率等指标"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        requests = metrics["requests"]
+        metrics["hit_rate"] = round((requests - metrics["misses"]) / requests, 4) if requests else 0.0
+        metrics["provider_seconds"] = round(metrics["provider_seconds"], 3)
+        metrics.update({
+            "provider": self.provider,
+            "model": self.model,
+            "batch_size": self.batch_size,
+            "max_concurrency": self.max_concurrency
+        })
+        return metrics
+
+
+def create_cached_embedder(
+    provider: str,
+    model: str = None,
+    cache: Optional[EmbeddingCache] = None
+) -> CachedEmbedder:
+    """
+    创建带缓存的 LLM 向量函数
+    
+    Args:
+        provider: 提供方 (mock/ollama/groq/openai/minimax)
+        model: 模型名称，默认读取 LLM_MODEL
+        cache: 持久化缓存
+    
+    Returns:
+        CachedEmbedder
+    """
+    from integrations.llm_factory import create_llm_client
+    
+    model = model if model is not None else os.getenv("LLM_MODEL", "")
+    client = create_llm_client(provider=provider, model=model)
+    return CachedEmbedder(client.embedding, provider, model, cache)
@@ -0,0 +1,104 @@
+"""
+SuiLight Knowledge Salon - 胶囊全文检索
+胶囊文本上的 BM25 倒排索引 (src.storage.text_index.BM25Index)，随胶囊写入增量维护
+
+- 索引字段: 标题 / 关键词 (权重 3)、摘要 / 洞见 / 分类 (权重 1)、证据 / 行动建议 / 问题 (权重 0.5)
+- 启动时从存储流式加载全部胶囊 (纯内存，不持久化)，之后通过存储监听器增量更新
+- 用于用户兴趣推荐 (CapsuleRecommender.get_recommended_for_user)
+"""
+
+from typing import Dict, List, Optional
+import logging
+
+from src.storage.capsule_storage import CAPSULE_DELETED
+from src.storage.text_index import BM25Index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 各字段的词频权重
+CAPSULE_FIELD_WEIGHTS = {
+    "title": 3.0,
+    "keywords": 3.0,
+    "summary": 1.0,
+    "insight": 1.0,
+    "category": 1.0,
+    "evidence": 0.5,
+    "action_items": 0.5,
+    "questions": 0.5
+}
+
+
+def capsule_fields(capsule: Dict) -> Dict:
+    """胶囊的索引字段"""
+    return {name: capsule.get(name) for name in CAPSULE_FIELD_WEIGHTS}
+
+
+class CapsuleBM25Index(BM25Index):
+    """
+    胶囊 BM25 索引
+    
+    文档 ID 即胶囊 ID；search_capsules 返回完整胶囊数据。
+    """
+    
+    def __init__(self):
+        super().__init__(CAPSULE_FIELD_WEIGHTS)
+        self.storage = None
+    
+    def attach_storage(self, storage, batch_size: int = 5000):
+        """
+        绑定胶囊存储: 加载全部胶囊，之后随胶囊写入增量维护
+        
+        Args:
+            storage: CapsuleStorage / ShardedCapsuleStorage
+            batch_size: 批量加入索引的胶囊数
+        """
+        if self.storage is not None and hasattr(self.storage, "remove_listener"):
+            self.storage.remove_listener(self.on_capsule_event)
+        self.storage = storage
+        
+        self.clear()
+        batch = []
+        for capsule in storage.iter_knowledge_capsules():
+            batch.append((capsule["id"], capsule_fields(capsule)))
+            if len(batch) >= batch_size:
+                self.add_many(batch)
+                batch = []
+        if batch:
+            self.add_many(batch)
+        storage.add_listener(self.on_capsule_event)
+        
+        stats = self.stats()
+        logger.info(f"胶囊全文索引加载完成: {stats['documents']} 个胶囊, {stats['terms']} 个词项")
+    
+    def on_capsule_event(self, event: str, capsule_id: str, capsule: Optional[Dict] = None):
+        """存储变更监听器"""
+        if event == CAPSULE_DELETED:
+            self.remove(capsule_id)
+        elif capsule is not None:
+            self.add(capsule_id, capsule_fields(capsule))
+    
+    def search_capsules(self, query: str, limit: int = 10, exclude: List[str] = None) -> List[Dict]:
+        """
+        全文检索胶囊
+        
+        Args:
+            query: 查询文本
+            limit: 返回数量
+            exclude: 排除的胶囊 ID
+        
+        Returns:
+            胶囊列表 (完整数据，附带 relevance)，按 BM25 得分降序
+        """
+        if self.storage is None:
+            return []
+        matches = self.search(query, k=limit, exclude=exclude)
+        capsules = {c["id"]: c for c in self.storage.get_knowledge_capsules_by_ids([i for i, _ in matches])}
+        return [
+            {**capsules[capsule_id], "relevance": score}
+            for capsule_id, score in matches if capsule_id in capsules
+        ]
+
+
+# 全局实例
+capsule_bm25 = CapsuleBM25Index()
@@ -0,0 +1,433 @@
+"""
+SuiLight Knowledge Salon - 胶囊近重复 / 相似度索引
+基于 MinHash + LSH 分段 (banding) 的胶囊相似度索引，随胶囊写入增量维护
+
+- 签名输入: 标题 / 洞见的字符 3-gram (去除空白与标点，适配中文) + 关键词，哈希在码点数组上向量化计算
+- MinHash: 128 个 multiply-shift 哈希 ((a·x + b) mod 2^64 的高 32 位)，numpy 向量化计算
+- LSH: 32 段 × 4 行，Jaccard 约 0.42 以上的胶囊大概率成为候选；
+  每段的段哈希保存为有序数组 (二分查找) + 未排序的新增尾部，尾部超过阈值时重新排序
+- 签名与其输入文本的校验值持久化在存储的 capsule_minhash 表，启动时只重算过期签名
+"""
+
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from src.storage.capsule_storage import CAPSULE_DELETED
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# MinHash 哈希个数与 LSH 分段数 (每段 NUM_PERM // LSH_BANDS 行)
+NUM_PERM = 128
+LSH_BANDS = 32
+
+# 字符 shingle 长度
+SHINGLE_SIZE = 3
+
+# 估计 Jaccard 达到该值视为近重复
+DUPLICATE_THRESHOLD = 0.8
+
+# 新增尾部超过该行数 (且超过已排序部分的 1/8) 时重建有序段索引
+REBUILD_TAIL = 2048
+
+_EMPTY = np.uint32(0xFFFFFFFF)
+
+# 字符 n-gram 各位置码点的乘数 (奇数)
+_GRAM_MULT = np.array(
+    [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD],
+    dtype=np.uint64
+)
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def capsule_shingles(capsule: Dict, size: int = SHINGLE_SIZE) -> Tuple[np.ndarray, int]:
+    """
+    胶囊 shingle 的 32 位哈希集合
+    
+    字符 n-gram 的哈希在码点数组上向量化计算 (各位置码点乘不同奇数常数后相加)，
+    关键词以 "#关键词" 的 crc32 加入。
+    
+    Returns:
+        (去重后的 shingle 哈希 uint64 数组, 输入文本的校验值)
+    """
+    text = capsule.get("title", "") or ""
+    body = capsule.get("insight") or capsule.get("summary") or ""
+    normalized = _NON_WORD.sub("", f"{text} {body}".lower())
+    keywords = sorted({str(kw).strip().lower() for kw in capsule.get("keywords") or [] if kw})
+    keywords = [kw for kw in keywords if kw]
+    
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    width = min(size, len(codes))
+    count = len(codes) - width + 1 if width else 0
+    grams = np.zeros(count, dtype=np.uint64)
+    for offset in range(width):
+        grams += codes[offset:offset + count] * _GRAM_MULT[offset]
+    grams ^= grams >> np.uint64(32)
+    
+    hashes = np.concatenate([
+        grams & np.uint64(0xFFFFFFFF),
+        np.array([zlib.crc32(f"#{kw}".encode("utf-8")) for kw in keywords], dtype=np.uint64)
+    ])
+    fingerprint = zlib.crc32("\x1f".join([normalized, *keywords]).encode("utf-8"))
+    return np.unique(hashes), fingerprint
+
+
+class CapsuleLSHIndex:
+    """
+    胶囊 MinHash / LSH 索引
+    
+    查询只访问与目标在某一段完全相同的胶囊 (每段一次二分查找 + 扫描新增尾部)，
+    再用签名估计 Jaccard 排序，不与全部胶囊比较。
+    """
+    
+    def __init__(
+        self,
+        num_perm: int = NUM_PERM,
+        bands: int = LSH_BANDS,
+        duplicate_threshold: float = DUPLICATE_THRESHOLD,
+        seed: int = 1
+    ):
+        """
+        初始化索引
+        
+        Args:
+            num_perm: MinHash 哈希个数
+            bands: LSH 分段数 (需整除 num_perm)
+            duplicate_threshold: 近重复的估计 Jaccard 阈值
+            seed: 哈希系数的随机种子 (签名持久化后不可更改)
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm 必须是 bands 的整数倍")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.duplicate_threshold = duplicate_threshold
+        self.storage = None
+        
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._band_mult = rng.integers(1, 2 ** 63, self.rows_per_band, dtype=np.uint64) | np.uint64(1)
+        
+        self._lock = threading.RLock()
+        self._clear()
+    
+    def _clear(self):
+        self._ids: List[str] = []
+        self._row: Dict[str, int] = {}
+        self._size = 0
+        self._sigs = np.empty((0, self.num_perm), dtype=np.uint32)
+        self._keys = np.empty((0, self.bands), dtype=np.uint64)
+        self._alive = np.empty(0, dtype=bool)
+        # 有序段索引: 覆盖前 _sorted_n 行
+        self._sorted_n = 0
+        self._sorted_keys = np.empty((self.bands, 0), dtype=np.uint64)
+        self._sorted_rows = np.empty((self.bands, 0), dtype=np.int32)
+    
+    def __len__(self) -> int:
+        return len(self._row)
+    
+    # ============ 签名 ============
+    
+    def _permute(self, hashes: np.ndarray) -> np.ndarray:
+        """[n] 个 32 位哈希 → [n, num_perm] 个置换后的值 (uint64 自然溢出，取高 32 位)"""
+        values = np.multiply(hashes[:, None], self._a)
+        values += self._b
+        values >>= np.uint64(32)
+        return values
+    
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """shingle 哈希集合的 MinHash 签名 (空集合为全 0xFFFFFFFF)"""
+        if len(hashes) == 0:
+            return np.full(self.num_perm, _EMPTY, dtype=np.uint32)
+        return self._permute(hashes).min(axis=0).astype(np.uint32)
+    
+    def signatures(self, hash_sets: List[np.ndarray], chunk: int = 2048) -> np.ndarray:
+        """
+        批量计算签名: 所有 shingle 哈希拼接后分块计算，按胶囊边界 minimum.reduceat
+        
+        Args:
+            hash_sets: 每个胶囊的 shingle 哈希数组
+            chunk: 每块的 shingle 数 (控制 chunk × num_perm 临时数组的内存)
+        
+        Returns:
+            签名 [n, num_perm]
+        """
+        result = np.full((len(hash_sets), self.num_perm), _EMPTY, dtype=np.uint32)
+        if not hash_sets:
+            return result
+        lengths = np.array([len(h) for h in hash_sets], dtype=np.int64)
+        hashes = np.concatenate(hash_sets).astype(np.uint64)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        
+        # 按 shingle 数切分胶囊区间，每块至少一个胶囊
+        first = 0
+        while first < len(hash_sets):
+            last = max(int(np.searchsorted(starts, starts[first] + chunk, side="left")), first + 1)
+            rows = np.arange(first, last)
+            rows = rows[lengths[rows] > 0]
+            if len(rows):
+                lo, hi = starts[rows[0]], starts[rows[-1]] + lengths[rows[-1]]
+                values = self._permute(hashes[lo:hi])
+                result[rows] = np.minimum.reduceat(values, starts[rows] - lo, axis=0)
+            first = last
+        return result
+    
+    def capsule_signature(self, capsule: Dict) -> Tuple[int, np.ndarray]:
+        """胶囊的 (校验值, 签名)"""
+        shingles, fingerprint = capsule_shingles(capsule)
+        return fingerprint, self.signature(shingles)
+    
+    def _band_keys(self, sigs: np.ndarray) -> np.ndarray:
+        """每段行值的哈希 [n, bands] (uint64 乘加自然溢出 + 移位混合)"""
+        grouped = sigs.reshape(len(sigs), self.bands, self.rows_per_band).astype(np.uint64)
+        keys = (grouped * self._band_mult).sum(axis=2, dtype=np.uint64)
+        return keys ^ (keys >> np.uint64(29))
+    
+    # ============ 增删 ============
+    
+    def add(self, capsule_id: str, signature: np.ndarray) -> bool:
+        """加入 (或替换) 一个胶囊签名；空签名不建索引"""
+        return self.add_many([capsule_id], signature[None, :]) > 0
+    
+    def add_many(self, capsule_ids: List[str], signatures: np.ndarray) -> int:
+        """
+        批量加入签名
+        
+        Returns:
+            加入索引的胶囊数
+        """
+        signatures = np.asarray(signatures, dtype=np.uint32).reshape(-1, self.num_perm)
+        keep = ~(signatures == _EMPTY).all(axis=1)
+        with self._lock:
+            for capsule_id in capsule_ids:
+                self._remove_locked(capsule_id)
+            ids = [capsule_id for capsule_id, k in zip(capsule_ids, keep) if k]
+            signatures = signatures[keep]
+            if not ids:
+                return 0
+            
+            self._reserve(self._size + len(ids))
+            rows = slice(self._size, self._size + len(ids))
+            self._sigs[rows] = signatures
+            self._keys[rows] = self._band_keys(signatures)
+            self._alive[rows] = True
+            for i, capsule_id in enumerate(ids):
+                self._row[capsule_id] = self._size + i
+            self._ids.extend(ids)
+            self._size += len(ids)
+            
+            tail = self._size - self._sorted_n
+            if tail > max(REBUILD_TAIL, self._sorted_n // 8):
+                self._rebuild_locked()
+            return len(ids)
+    
+    def remove(self, capsule_id: str) -> bool:
+        """移除胶囊"""
+        with self._lock:
+            return self._remove_locked(capsule_id)
+    
+    def _remove_locked(self, capsule_id: str) -> bool:
+        row = self._row.pop(capsule_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        return True
+    
+    def _reserve(self, capacity: int):
+        """按倍增扩容底层数组"""
+        if capacity <= len(self._alive):
+            return
+        capacity = max(capacity, 2 * len(self._alive), 1024)
+        for name, width, dtype in (
+            ("_sigs", self.num_perm, np.uint32),
+            ("_keys", self.bands, np.uint64),
+        ):
+            grown = np.empty((capacity, width), dtype=dtype)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+    
+    def _rebuild_locked(self):
+        """压缩已删除的行 (超过 1/4 时) 并重建每段的有序数组"""
+        if self._size - len(self._row) > self._size // 4:
+            live = np.flatnonzero(self._alive[:self._size])
+            self._sigs[:len(live)] = self._sigs[live]
+            self._keys[:len(live)] = self._keys[live]
+            self._alive[:len(live)] = True
+            self._alive[len(live):] = False
+            self._ids = [self._ids[row] for row in live]
+            self._row = {capsule_id: row for row, capsule_id in enumerate(self._ids)}
+            self._size = len(live)
+        
+        keys = self._keys[:self._size].T
+        order = np.argsort(keys, axis=1, kind="stable").astype(np.int32)
+        self._sorted_keys = np.take_along_axis(keys, order, axis=1)
+        self._sorted_rows = order
+        self._sorted_n = self._size
+    
+    # ============ 查询 ============
+    
+    def _candidate_rows(self, signature: np.ndarray) -> np.ndarray:
+        """至少有一段完全相同的行 (已去重、已过滤删除)"""
+        keys = self._band_keys(signature[None, :])[0]
+        parts = []
+        if self._sorted_n:
+            lo = [np.searchsorted(self._sorted_keys[b], keys[b], side="left") for b in range(self.bands)]
+            hi = [np.searchsorted(self._sorted_keys[b], keys[b], side="right") for b in range(self.bands)]
+            parts.extend(self._sorted_rows[b, lo[b]:hi[b]] for b in range(self.bands) if hi[b] > lo[b])
+        if self._size > self._sorted_n:
+            tail = self._keys[self._sorted_n:self._size]
+            parts.append(np.flatnonzero((tail == keys).any(axis=1)) + self._sorted_n)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(parts))
+        return rows[self._alive[rows]]
+    
+    def query(
+        self,
+        signature: np.ndarray,
+        threshold: float = 0.0,
+        limit: int = 20,
+        exclude: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        按签名查询相似胶囊
+        
+        Args:
+            signature: MinHash 签名
+            threshold: 估计 Jaccard 下限
+            limit: 返回数量
+            exclude: 排除的胶囊 ID (通常是查询的胶囊本身)
+        
+        Returns:
+            [(胶囊ID, 估计 Jaccard)]，按相似度降序
+        """
+        if (signature == _EMPTY).all():
+            return []
+        with self._lock:
+            rows = self._candidate_rows(signature)
+            if exclude is not None and exclude in self._row:
+                rows = rows[rows != self._row[exclude]]
+            if len(rows) == 0:
+                return []
+            similarity = (self._sigs[rows] == signature).mean(axis=1)
+            keep = similarity >= threshold
+            rows, similarity = rows[keep], similarity[keep]
+            top = np.argsort(-similarity, kind="stable")[:limit]
+            return [(self._ids[rows[i]], round(float(similarity[i]), 4)) for i in top]
+    
+    def get_signature(self, capsule_id: str) -> Optional[np.ndarray]:
+        """已索引胶囊的签名"""
+        with self._lock:
+            row = self._row.get(capsule_id)
+            return None if row is None else self._sigs[row].copy()
+    
+    def similar(self, capsule_id: str, limit: int = 20, threshold: float = 0.0) -> List[Tuple[str, float]]:
+        """已索引胶囊的相似候选"""
+        signature = self.get_signature(capsule_id)
+        if signature is None:
+            return []
+        return self.query(signature, threshold, limit, exclude=capsule_id)
+    
+    def near_duplicates(self, capsule_id: str, threshold: float = None, limit: int = 20) -> List[Tuple[str, float]]:
+        """已索引胶囊的近重复胶囊"""
+        return self.similar(capsule_id, limit, self.duplicate_threshold if threshold is None else threshold)
+    
+    def find_duplicates(self, capsule: Dict, threshold: float = None, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        查找与 (尚未保存的) 胶囊近重复的已有胶囊，用于生成时去重
+        
+        Args:
+            capsule: 胶囊数据 (title / insight / keywords)
+            threshold: 估计 Jaccard 阈值，默认 duplicate_threshold
+            limit: 返回数量
+        
+        Returns:
+            [(胶囊ID, 估计 Jaccard)]
+        """
+        _, signature = self.capsule_signature(capsule)
+        return self.query(
+            signature,
+            self.duplicate_threshold if threshold is None else threshold,
+            limit,
+            exclude=capsule.get("id")
+        )
+    
+    # ============ 存储绑定 ============
+    
+    def attach_storage(self, storage, batch_size: int = 5000):
+        """
+        绑定胶囊存储: 加载持久化签名 (只重算缺失 / 过期的签名)，之后随胶囊写入增量维护
+        
+        Args:
+            storage: CapsuleStorage / ShardedCapsuleStorage
+            batch_size: 批量加入索引 / 写回签名的胶囊数
+        """
+        if self.storage is not None and hasattr(self.storage, "remove_listener"):
+            self.storage.remove_listener(self.on_capsule_event)
+        self.storage = storage
+        
+        stored = {
+            capsule_id: (fingerprint, signature)
+            for capsule_id, fingerprint, signature in storage.iter_capsule_signatures()
+        }
+        with self._lock:
+            self._clear()
+            computed: Dict[str, Tuple[int, bytes]] = {}
+            batch: List[Dict] = []
+            for capsule in storage.iter_knowledge_capsules():
+                batch.append(capsule)
+                if len(batch) >= batch_size:
+                    self._load_batch(batch, stored, computed)
+                    batch = []
+            if batch:
+                self._load_batch(batch, stored, computed)
+            self._rebuild_locked()
+        
+        if computed:
+            storage.save_capsule_signatures(computed)
+        if stored:
+            storage.delete_capsule_signatures(list(stored))
+        storage.add_listener(self.on_capsule_event)
+        
+        logger.info(f"胶囊 LSH 索引加载完成: {len(self)} 个胶囊, 重算 {len(computed)} 个签名")
+    
+    def _load_batch(self, capsules: List[Dict], stored: Dict, computed: Dict):
+        """加入一批胶囊: 校验值一致的复用持久化签名，其余批量重算"""
+        parsed = [capsule_shingles(capsule) for capsule in capsules]
+        signatures = np.empty((len(capsules), self.num_perm), dtype=np.uint32)
+        stale = []
+        for i, (capsule, (_, fingerprint)) in enumerate(zip(capsules, parsed)):
+            saved = stored.pop(capsule["id"], None)
+            if saved is not None and saved[0] == fingerprint:
+                signatures[i] = np.frombuffer(saved[1], dtype=np.uint32)
+            else:
+                stale.append(i)
+        if stale:
+            signatures[stale] = self.signatures([parsed[i][0] for i in stale])
+            for i in stale:
+                computed[capsules[i]["id"]] = (parsed[i][1], signatures[i].tobytes())
+        self.add_many([capsule["id"] for capsule in capsules], signatures)
+    
+    def on_capsule_event(self, event: str, capsule_id: str, capsule: Optional[Dict] = None):
+        """存储变更监听器"""
+        if event == CAPSULE_DELETED:
+            self.remove(capsule_id)
+            self.storage.delete_capsule_signatures([capsule_id])
+        elif capsule is not None:
+            fingerprint, signature = self.capsule_signature(capsule)
+            self.add(capsule_id, signature)
+            self.storage.save_capsule_signatures({capsule_id: (fingerprint, signature.tobytes())})
+
+
+# 全局实例
+capsule_lsh = CapsuleLSHIndex()
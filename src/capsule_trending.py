@@ -0,0 +1,355 @@
+"""
+SuiLight Knowledge Salon - 热门胶囊
+按浏览 / 分享 / 投票事件计算随时间指数衰减的热度，维护有序的热度排行
+
+- 热度: Σ 事件权重 × 2^(-(现在 - 事件时间) / 半衰期)
+- 前向衰减: 事件按 2^((事件时间 - 基准时间) / 半衰期) 放大后累加，
+  所有胶囊按同一因子衰减，排行顺序只在事件到达时变化，不需要随时间重排；
+  放大因子过大时整体平移基准时间 (等比缩放，顺序不变)
+- 排行为按热度降序的有序列表，事件到达时二分查找删除旧位置、插入新位置，Top-K 为切片 O(k)
+- 绑定存储时从 SQLite (data/trending.db) 加载，之后定期写入变化的胶囊
+"""
+
+import asyncio
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from src.storage.capsule_storage import CAPSULE_DELETED
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 事件类型与热度权重 (投票可为 -1 / +1)
+EVENT_WEIGHTS = {
+    "view": 1.0,
+    "share": 5.0,
+    "vote": 3.0
+}
+
+# 热度半衰期 (秒)
+HALF_LIFE = 24 * 3600
+
+# 放大因子超过 2^REBASE_HALF_LIVES 时平移基准时间
+REBASE_HALF_LIVES = 64
+
+# 衰减到该值以下的胶囊在持久化时移出排行
+PRUNE_SCORE = 0.01
+
+
+class CapsuleTrending:
+    """
+    胶囊热度排行
+    
+    内存中维护 {胶囊ID: 放大后的热度} 与按热度降序的 (-热度, 胶囊ID) 有序列表；
+    读取时乘以当前的衰减因子得到实际热度。
+    """
+    
+    def __init__(self, half_life: float = HALF_LIFE):
+        """
+        初始化 (纯内存，attach_storage 时指定持久化数据库)
+        
+        Args:
+            half_life: 热度半衰期 (秒)
+        """
+        self.db_path = None
+        self.half_life = half_life
+        self.epoch = time.time()
+        self.storage = None
+        self._scores: Dict[str, float] = {}
+        self._order: List[Tuple[float, str]] = []
+        self._counts: Dict[str, List[int]] = {}  # 胶囊ID → [浏览, 分享, 投票]
+        self._dirty = set()
+        self._deleted = set()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._scores)
+    
+    def _ensure_db_exists(self):
+        """确保数据库和表存在"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # score 为以 epoch 为基准放大后的热度
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS trending_scores (
+                    capsule_id TEXT PRIMARY KEY,
+                    score REAL NOT NULL,
+                    epoch REAL NOT NULL,
+                    views INTEGER DEFAULT 0,
+                    shares INTEGER DEFAULT 0,
+                    votes INTEGER DEFAULT 0,
+                    updated_at TEXT
+                )
+            """)
+    
+    @contextmanager
+    def _get_connection(self):
+        """获取数据库连接"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"热度数据库操作失败: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    # ============ 热度 ============
+    
+    def _growth(self, timestamp: float) -> float:
+        """事件时刻相对基准时间的放大因子"""
+        return 2.0 ** ((timestamp - self.epoch) / self.half_life)
+    
+    def _set_score(self, capsule_id: str, score: Optional[float]):
+        """更新热度并调整有序列表中的位置 (score 为 None 时移除)"""
+        old = self._scores.get(capsule_id)
+        if old is not None:
+            del self._order[bisect.bisect_left(self._order, (-old, capsule_id))]
+        if score is None:
+            self._scores.pop(capsule_id, None)
+        else:
+            self._scores[capsule_id] = score
+            bisect.insort(self._order, (-score, capsule_id))
+    
+    def _rebase(self, now: float):
+        """平移基准时间到 now，所有热度等比缩小 (顺序不变)"""
+        factor = 1.0 / self._growth(now)
+        self._scores = {capsule_id: score * factor for capsule_id, score in self._scores.items()}
+        self._order = [(key * factor, capsule_id) for key, capsule_id in self._order]
+        self.epoch = now
+        self._dirty.update(self._scores)
+    
+    def record(self, capsule_id: str, event: str, value: float = 1.0, timestamp: float = None) -> float:
+        """
+        记录一次事件
+        
+        Args:
+            capsule_id: 胶囊 ID
+            event: 事件类型 (view / share / vote)
+            value: 事件次数 (投票为 +1 / -1)
+            timestamp: 事件时间 (Unix 秒)，默认为当前时间
+        
+        Returns:
+            胶囊当前的热度
+        """
+        return self.record_many([(capsule_id, event, value, timestamp)]).get(capsule_id, 0.0)
+    
+    def record_many(self, events: Iterable[tuple]) -> Dict[str, float]:
+        """
+        批量记录事件
+        
+        Args:
+            events: [(胶囊ID, 事件类型, 次数, 时间)]，次数与时间可省略
+        
+        Returns:
+            {胶囊ID: 当前热度}
+        """
+        now = time.time()
+        with self._lock:
+            if (now - self.epoch) / self.half_life > REBASE_HALF_LIVES:
+                self._rebase(now)
+            
+            deltas: Dict[str, float] = {}
+            for capsule_id, event, *rest in events:
+                if event not in EVENT_WEIGHTS:
+                    raise ValueError(f"未知的事件类型: {event}")
+                value = rest[0] if rest and rest[0] is not None else 1.0
+                timestamp = rest[1] if len(rest) > 1 and rest[1] is not None else now
+                deltas[capsule_id] = (
+                    deltas.get(capsule_id, 0.0)
+                    + EVENT_WEIGHTS[event] * value * self._growth(min(timestamp, now))
+                )
+                counts = self._counts.setdefault(capsule_id, [0, 0, 0])
+                counts[("view", "share", "vote").index(event)] += int(value)
+            
+            if len(deltas) * 8 > len(self._order):
+                # 大批量事件: 更新热度后整体重排
+                for capsule_id, delta in deltas.items():
+                    self._scores[capsule_id] = self._scores.get(capsule_id, 0.0) + delta
+                self._order = sorted((-score, capsule_id) for capsule_id, score in self._scores.items())
+            else:
+                for capsule_id, delta in deltas.items():
+                    self._set_score(capsule_id, self._scores.get(capsule_id, 0.0) + delta)
+            self._dirty.update(deltas)
+            self._deleted.difference_update(deltas)
+            
+            decay = 1.0 / self._growth(now)
+            return {capsule_id: self._scores[capsule_id] * decay for capsule_id in deltas}
+    
+    def remove(self, capsule_id: str):
+        """移出排行 (胶囊删除)"""
+        with self._lock:
+            if capsule_id in self._scores:
+                self._set_score(capsule_id, None)
+                self._counts.pop(capsule_id, None)
+                self._dirty.discard(capsule_id)
+                self._deleted.add(capsule_id)
+    
+    def score(self, capsule_id: str) -> float:
+        """胶囊当前的热度"""
+        with self._lock:
+            return self._scores.get(capsule_id, 0.0) / self._growth(time.time())
+    
+    def top(self, k: int = 10, offset: int = 0) -> List[Tuple[str, float]]:
+        """
+        热度最高的胶囊
+        
+        Args:
+            k: 返回数量
+            offset: 偏移量
+        
+        Returns:
+            [(胶囊ID, 当前热度)]，按热度降序
+        """
+        with self._lock:
+            decay = 1.0 / self._growth(time.time())
+            return [(capsule_id, -key * decay) for key, capsule_id in self._order[offset:offset + k]]
+    
+    def get_counts(self, capsule_id: str) -> Dict[str, int]:
+        """胶囊的累计浏览 / 分享 / 投票数"""
+        views, shares, votes = self._counts.get(capsule_id, (0, 0, 0))
+        return {"views": views, "shares": shares, "votes": votes}
+    
+    # ============ 胶囊存储 ============
+    
+    def attach_storage(self, storage, db_path: str):
+        """
+        绑定胶囊存储并加载持久化的热度: 胶囊删除时移出排行，get_trending 从存储读取胶囊数据
+        
+        Args:
+            storage: CapsuleStorage / ShardedCapsuleStorage
+            db_path: 持久化数据库路径
+        """
+        if self.storage is not None and hasattr(self.storage, "remove_listener"):
+            self.storage.remove_listener(self.on_capsule_event)
+        self.storage = storage
+        self.db_path = db_path
+        self._ensure_db_exists()
+        self.load()
+        storage.add_listener(self.on_capsule_event)
+    
+    def on_capsule_event(self, event: str, capsule_id: str, capsule: Optional[Dict] = None):
+        """存储变更监听器"""
+        if event == CAPSULE_DELETED:
+            self.remove(capsule_id)
+    
+    def get_trending(self, limit: int = 10, offset: int = 0) -> List[Dict]:
+        """
+        热门胶囊
+        
+        Returns:
+            胶囊列表 (完整数据，附带 trending_score 与累计浏览 / 分享 / 投票数)，按热度降序
+        """
+        if self.storage is None:
+            return []
+        ranked = self.top(limit, offset)
+        capsules = {c["id"]: c for c in self.storage.get_knowledge_capsules_by_ids([i for i, _ in ranked])}
+        return [
+            {**capsules[capsule_id], "trending_score": round(score, 4), **self.get_counts(capsule_id)}
+            for capsule_id, score in ranked if capsule_id in capsules
+        ]
+    
+    # ============ 持久化 ============
+    
+    def load(self) -> int:
+        """从数据库加载热度 (换算到当前基准时间)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT capsule_id, score, epoch, views, shares, votes FROM trending_scores")
+            rows = cursor.fetchall()
+        
+        with self._lock:
+            self._scores = {
+                capsule_id: score * 2.0 ** ((epoch - self.epoch) / self.half_life)
+                for capsule_id, score, epoch, _, _, _ in rows
+            }
+            self._order = sorted((-score, capsule_id) for capsule_id, score in self._scores.items())
+            self._counts = {row[0]: list(row[3:]) for row in rows}
+            self._dirty.clear()
+            self._deleted.clear()
+        
+        if rows:
+            logger.info(f"热度排行加载完成: {len(rows)} 个胶囊")
+        return len(rows)
+    
+    def save(self) -> int:
+        """
+        写入变化的胶囊，并移出热度已衰减到 PRUNE_SCORE 以下的胶囊
+        
+        Returns:
+            写入的胶囊数 (未绑定数据库时为 0)
+        """
+        if self.db_path is None:
+            return 0
+        now = time.time()
+        with self._lock:
+            decay = 1.0 / self._growth(now)
+            for capsule_id, score in list(self._scores.items()):
+                if abs(score * decay) < PRUNE_SCORE:
+                    self._set_score(capsule_id, None)
+                    self._counts.pop(capsule_id, None)
+                    self._dirty.discard(capsule_id)
+                    self._deleted.add(capsule_id)
+            
+            updated_at = datetime.now().isoformat()
+            rows = [
+                (capsule_id, self._scores[capsule_id], self.epoch, *self._counts.get(capsule_id, (0, 0, 0)), updated_at)
+                for capsule_id in self._dirty
+            ]
+            deleted = [(capsule_id,) for capsule_id in self._deleted]
+            self._dirty.clear()
+            self._deleted.clear()
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany("DELETE FROM trending_scores WHERE capsule_id = ?", deleted)
+            cursor.executemany("""
+                INSERT OR REPLACE INTO trending_scores
+                (capsule_id, score, epoch, views, shares, votes, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+    
+    def stats(self) -> Dict:
+        """统计信息"""
+        with self._lock:
+            return {
+                "capsules": len(self._scores),
+                "pending_writes": len(self._dirty) + len(self._deleted),
+                "half_life": self.half_life,
+                "epoch": datetime.fromtimestamp(self.epoch).isoformat()
+            }
+
+
+async def run_trending_loop(trending: CapsuleTrending, interval: float = 60):
+    """
+    后台定期持久化热度排行
+    
+    Args:
+        trending: 热度排行
+        interval: 写入间隔 (秒)
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(trending.save)
+        except Exception as e:
+            logger.error(f"热度排行持久化失败: {e}")
+
+
+# 全局实例
+capsule_trending = CapsuleTrending()
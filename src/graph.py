@@ -3,17 +3,56 @@ SuiLight Knowledge Salon - 知识图谱模块
 胶囊关系可视化、领域聚类、时间线
 """
 
+import hashlib
+import heapq
 import json
+import random
+import threading
 import uuid
+from bisect import bisect_left, insort
 from datetime import datetime
-from typing import Dict, List, Optional, Set
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
 from dataclasses import dataclass, field
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
+from itertools import islice
 import logging
 
+from src.storage.capsule_storage import CAPSULE_DELETED
+from src.storage.graph_store import MAX_PATH_DEPTH
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 胶囊关联: 参与比较的关键词数、最小重叠比例、每个关键词参与关联的胶囊上限
+RELATED_KEYWORD_LIMIT = 10
+RELATED_MIN_OVERLAP = 0.2
+MAX_KEYWORD_FANOUT = 200
+
+# 社区发现: 胶囊-Agent 边相对关联边的权重、判定跨学科社区时分类的最小占比
+COMMUNITY_AGENT_WEIGHT = 0.5
+CROSS_DISCIPLINARY_SHARE = 0.2
+
+# 分级细节 (LOD) 视图: 默认节点 / 边上限、估计超级节点间连接时每组抽样的胶囊数
+LOD_MAX_NODES = 300
+LOD_MAX_LINKS = 1000
+LOD_GROUP_SAMPLE = 64
+
+
+def _fanout_key(capsule: Dict) -> Tuple[float, str]:
+    """关键词倒排列表的排序键: 质量分数降序，同分按 ID"""
+    return (-(capsule.get("quality_score") or 0), capsule.get("id") or "")
+
+
+def _weighted_sample(items: List, weights: List[float], k: int, seed: int = 0) -> List:
+    """按权重无放回抽样 k 个 (Efraimidis-Spirakis: 键 u^(1/w) 取最大的 k 个)"""
+    if len(items) <= k:
+        return list(items)
+    rng = random.Random(seed)
+    keyed = (
+        (rng.random() ** (1.0 / max(weight, 1e-9)), i) for i, weight in enumerate(weights)
+    )
+    return [items[i] for _, i in sorted(heapq.nlargest(k, keyed), key=lambda x: x[1])]
+
 
 @dataclass
 class GraphNode:
@@ -54,7 +93,12 @@ class GraphEdge:
 
 @dataclass
 class KnowledgeGraph:
-    """知识图谱"""
+    """
+    知识图谱
+    
+    除 nodes / edges 外维护出边、入边邻接索引 (节点 -> 边类型 -> {边ID: 边})，
+    邻居查询为 O(度数)，最短路径使用双向 BFS。
+    """
     id: str = field(default_factory=lambda: str(uuid.uuid4())[:8])
     name: str = ""
     description: str = ""
@@ -62,6 +106,16 @@ class KnowledgeGraph:
     edges: Dict[str, GraphEdge] = field(default_factory=dict)
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
+    out_index: Dict[str, Dict[str, Dict[str, GraphEdge]]] = field(
+        default_factory=lambda: defaultdict(dict), init=False, repr=False
+    )
+    in_index: Dict[str, Dict[str, Dict[str, GraphEdge]]] = field(
+        default_factory=lambda: defaultdict(dict), init=False, repr=False
+    )
+    
+    def __post_init__(self):
+        for edge in self.edges.values():
+            self._index_edge(edge)
     
     def to_dict(self) -> Dict:
         return {
@@ -76,61 +130,192 @@ class KnowledgeGraph:
             }
         }
     
+    def to_compact(self):
+        """转换为 CSR 紧凑图谱 (src.graph_csr.CompactGraph)"""
+        from src.graph_csr import CompactGraph
+        return CompactGraph.from_knowledge_graph(self)
+    
+    # ============ 增删 ============
+    
     def add_node(self, node: GraphNode):
         self.nodes[node.id] = node
         self.updated_at = datetime.now()
     
     def add_edge(self, edge: GraphEdge):
+        old = self.edges.get(edge.id)
+        if old is not None:
+            self._unindex_edge(old)
         self.edges[edge.id] = edge
+        self._index_edge(edge)
         self.updated_at = datetime.now()
     
+    def remove_edge(self, edge_id: str) -> bool:
+        """删除边"""
+        edge = self.edges.pop(edge_id, None)
+        if edge is None:
+            return False
+        self._unindex_edge(edge)
+        self.updated_at = datetime.now()
+        return True
+    
+    def remove_node(self, node_id: str) -> bool:
+        """删除节点及其所有关联边"""
+        if node_id not in self.nodes:
+            return False
+        for edge in list(self.iter_edges(node_id)):
+            self.remove_edge(edge.id)
+        del self.nodes[node_id]
+        self.out_index.pop(node_id, None)
+        self.in_index.pop(node_id, None)
+        self.updated_at = datetime.now()
+        return True
+    
+    def _index_edge(self, edge: GraphEdge):
+        self.out_index[edge.source].setdefault(edge.type, {})[edge.id] = edge
+        self.in_index[edge.target].setdefault(edge.type, {})[edge.id] = edge
+    
+    def _unindex_edge(self, edge: GraphEdge):
+        for index, node_id in ((self.out_index, edge.source), (self.in_index, edge.target)):
+            by_type = index.get(node_id)
+            if not by_type:
+                continue
+            bucket = by_type.get(edge.type)
+            if bucket is not None:
+                bucket.pop(edge.id, None)
+                if not bucket:
+                    del by_type[edge.type]
+            if not by_type:
+                del index[node_id]
+    
+    # ============ 查询 ============
+    
+    def _iter_index(self, index: Dict, node_id: str, edge_type: str = None) -> Iterator[GraphEdge]:
+        by_type = index.get(node_id)
+        if not by_type:
+            return
+        if edge_type is None:
+            for bucket in by_type.values():
+                yield from bucket.values()
+        elif edge_type in by_type:
+            yield from by_type[edge_type].values()
+    
+    def out_edges(self, node_id: str, edge_type: str = None) -> Iterator[GraphEdge]:
+        """出边 (node_id 为 source)"""
+        return self._iter_index(self.out_index, node_id, edge_type)
+    
+    def in_edges(self, node_id: str, edge_type: str = None) -> Iterator[GraphEdge]:
+        """入边 (node_id 为 target)"""
+        return self._iter_index(self.in_index, node_id, edge_type)
+    
+    def iter_edges(self, node_id: str, edge_type: str = None) -> Iterator[GraphEdge]:
+        """与节点相连的所有边 (自环只返回一次)"""
+        yield from self.out_edges(node_id, edge_type)
+        for edge in self.in_edges(node_id, edge_type):
+            if edge.source != node_id:
+                yield edge
+    
+    def neighbor_ids(self, node_id: str, edge_type: str = None) -> Iterator[str]:
+        """邻居节点 ID (不区分方向，自环只返回一次)"""
+        for edge in self.out_edges(node_id, edge_type):
+            yield edge.target
+        for edge in self.in_edges(node_id, edge_type):
+            if edge.source != node_id:
+                yield edge.source
+    
+    def degree(self, node_id: str, edge_type: str = None) -> int:
+        """节点度数"""
+        return sum(1 for _ in self.iter_edges(node_id, edge_type))
+    
     def get_neighbors(self, node_id: str, edge_type: str = None) -> List[Dict]:
         """获取邻居节点"""
         neighbors = []
-        for edge in self.edges.values():
-            if edge.source == node_id:
-                if edge_type is None or edge.type == edge_type:
-                    target = self.nodes.get(edge.target)
-                    if target:
-                        neighbors.append({
-                            "node": target.to_dict(),
-                            "edge": edge.to_dict()
-                        })
-            elif edge.target == node_id:
-                if edge_type is None or edge.type == edge_type:
-                    source = self.nodes.get(edge.source)
-                    if source:
-                        neighbors.append({
-                            "node": source.to_dict(),
-                            "edge": edge.to_dict()
-                        })
+        for edge in self.iter_edges(node_id, edge_type):
+            other = self.nodes.get(edge.target if edge.source == node_id else edge.source)
+            if other:
+                neighbors.append({
+                    "node": other.to_dict(),
+                    "edge": edge.to_dict()
+                })
         return neighbors
     
-    def get_shortest_path(self, start_id: str, end_id: str) -> List[str]:
-        """获取最短路径"""
+    def get_shortest_path(self, start_id: str, end_id: str, edge_type: str = None,
+                          max_depth: int = None) -> List[str]:
+        """
+        获取最短路径 (无向，双向 BFS)
+        
+        两端各维护一个父指针表，每轮扩展较小的一侧的一整层，
+        两侧相遇时沿父指针拼接路径。
+        
+        Args:
+            start_id: 起点
+            end_id: 终点
+            edge_type: 只沿指定类型的边搜索
+            max_depth: 最大跳数，两侧共扩展该层数仍未相遇时停止
+        
+        Returns:
+            节点 ID 列表，不可达 (或超过 max_depth 跳) 时为空列表
+        """
         if start_id not in self.nodes or end_id not in self.nodes:
             return []
+        if start_id == end_id:
+            return [start_id]
         
-        # BFS
-        queue = [[start_id]]
-        visited = {start_id}
+        forward_parents = {start_id: None}
+        backward_parents = {end_id: None}
+        forward_frontier = deque([start_id])
+        backward_frontier = deque([end_id])
         
-        while queue:
-            path = queue.pop(0)
-            node = path[-1]
-            
-            if node == end_id:
-                return path
-            
-            for edge in self.edges.values():
-                if edge.source == node and edge.target not in visited:
-                    visited.add(edge.target)
-                    queue.append(path + [edge.target])
-                elif edge.target == node and edge.source not in visited:
-                    visited.add(edge.source)
-                    queue.append(path + [edge.source])
+        depth = 0
+        while forward_frontier and backward_frontier:
+            if max_depth is not None and depth >= max_depth:
+                break
+            depth += 1
+            if len(forward_frontier) <= len(backward_frontier):
+                meet = self._expand_level(forward_frontier, forward_parents, backward_parents, edge_type)
+            else:
+                meet = self._expand_level(backward_frontier, backward_parents, forward_parents, edge_type)
+            if meet is not None:
+                return self._join_paths(meet, forward_parents, backward_parents)
         
         return []
+    
+    def _expand_level(
+        self,
+        frontier: Deque[str],
+        parents: Dict[str, Optional[str]],
+        other_parents: Dict[str, Optional[str]],
+        edge_type: str = None
+    ) -> Optional[str]:
+        """扩展一整层，返回与另一侧的相遇节点"""
+        for _ in range(len(frontier)):
+            node = frontier.popleft()
+            for neighbor in self.neighbor_ids(node, edge_type):
+                if neighbor in parents:
+                    continue
+                parents[neighbor] = node
+                if neighbor in other_parents:
+                    return neighbor
+                frontier.append(neighbor)
+        return None
+    
+    @staticmethod
+    def _join_paths(
+        meet: str,
+        forward_parents: Dict[str, Optional[str]],
+        backward_parents: Dict[str, Optional[str]]
+    ) -> List[str]:
+        path = []
+        node = meet
+        while node is not None:
+            path.append(node)
+            node = forward_parents[node]
+        path.reverse()
+        
+        node = backward_parents[meet]
+        while node is not None:
+            path.append(node)
+            node = backward_parents[node]
+        return path
 
 
 class KnowledgeGraphManager:
@@ -144,118 +329,1134 @@ class KnowledgeGraphManager:
     - 时间线生成
     """
     
-    def __init__(self, storage=None):
+    def __init__(self, storage=None, max_keyword_fanout: int = MAX_KEYWORD_FANOUT,
+                 graph_store=None, graph_store_name: str = "main"):
         self.storage = storage
+        self.graph_store = graph_store               # 持久化图谱存储 (src/storage/graph_store.py)，可选
+        self.graph_store_name = graph_store_name
+        self.max_keyword_fanout = max_keyword_fanout
         self.graphs: Dict[str, KnowledgeGraph] = {}
         self.main_graph = KnowledgeGraph(name="主图谱", description="SuiLight 知识图谱主图")
         
+        # 主图谱的增量维护状态
+        self._lock = threading.RLock()
+        self._capsules: Dict[str, Dict] = {}             # 胶囊 ID -> 精简胶囊
+        self._recent: List[Tuple[str, str]] = []         # (created_at, 胶囊 ID) 升序
+        self._keyword_index: Dict[str, List[Tuple[Tuple[float, str], str]]] = defaultdict(list)  # 关键词 -> (排序键, 胶囊 ID) 升序
+        self._fingerprints: Dict[str, str] = {}          # 胶囊 ID -> 内容指纹 (随节点写入图谱存储，不进入节点属性)
+        self.version = 0  # 主图谱数据版本，仅胶囊 / 边变更时加一 (后台计算据此跳过，也是响应缓存 / ETag 的基础)
+        self.derived_versions: Dict[str, int] = {  # 派生数据 (中心性 / 社区 / 布局) 各自的写入计数，只计入使用它们的接口缓存键
+            "centrality": 0, "communities": 0, "layout": 0
+        }
+        self.epoch = uuid.uuid4().hex  # 每次加载主图谱时重新生成，区分重启 / 不同进程中重复的版本号
+        self.centrality_computed_at: Optional[str] = None
+        self.capsule_rank: Dict[str, float] = {}         # 胶囊 ID -> PageRank (LOD 视图的重要度)
+        
+        # 社区划分缓存 (由 src/graph_community.py 批量计算，新胶囊增量归入)
+        self.communities: Dict[str, int] = {}             # 胶囊 / Agent 节点 ID -> 社区编号
+        self._community_members: Dict[int, Set[str]] = defaultdict(set)  # 社区编号 -> 胶囊 ID
+        self._next_community = 0
+        self.communities_computed_at: Optional[str] = None
+        
+        # 布局坐标缓存 (由 src/graph_layout.py 计算，新节点先放在邻居质心附近等待细化)
+        self.layout: Dict[str, Tuple[float, float]] = {}  # 节点 ID -> (x, y)
+        self._layout_pending: Dict[str, None] = {}        # 尚未细化的新节点
+        self._layout_rng = random.Random(0)
+        self.layout_computed_at: Optional[str] = None
+        
         logger.info("知识图谱管理器初始化完成")
     
     def build_from_capsules(self, capsules: List[Dict]) -> KnowledgeGraph:
         """从胶囊列表构建图谱"""
         graph = KnowledgeGraph(name="胶囊图谱", description=f"包含 {len(capsules)} 个胶囊")
         
+        for capsule in capsules:
+            self._add_capsule_nodes(graph, capsule)
+        
+        # 胶囊之间的关联 (基于关键词倒排索引)
+        for i, j, weight in self._related_pairs(capsules):
+            edge = GraphEdge(
+                source=capsules[i].get("id"),
+                target=capsules[j].get("id"),
+                type="related",
+                weight=weight
+            )
+            graph.add_edge(edge)
+        
+        logger.info(f"图谱构建完成: {len(graph.nodes)} 节点, {len(graph.edges)} 边")
+        
+        return graph
+    
+    def _add_capsule_nodes(self, graph: KnowledgeGraph, capsule: Dict) -> GraphNode:
+        """添加胶囊节点及其分类 / Agent / 关键词节点和连接"""
         # 添加胶囊节点
-        category_nodes = {}  # 分类节点
+        node = GraphNode(
+            id=capsule.get("id", f"capsule_{uuid.uuid4().hex[:8]}"),
+            type="capsule",
+            label=capsule.get("title", "未命名胶囊"),
+            properties={
+                "quality_score": capsule.get("quality_score", 0),
+                "grade": capsule.get("grade", "C"),
+                "category": capsule.get("category", "general")
+            }
+        )
+        graph.add_node(node)
         
-        for capsule in capsules:
-            # 添加胶囊节点
-            node = GraphNode(
-                id=capsule.get("id", f"capsule_{uuid.uuid4().hex[:8]}"),
-                type="capsule",
-                label=capsule.get("title", "未命名胶囊"),
-                properties={
-                    "quality_score": capsule.get("quality_score", 0),
-                    "grade": capsule.get("grade", "C"),
-                    "category": capsule.get("category", "general")
-                }
+        # 添加/关联分类节点
+        category = capsule.get("category", "general")
+        cat_id = f"category_{category}"
+        cat_node = graph.nodes.get(cat_id)
+        if cat_node is None:
+            cat_node = GraphNode(
+                id=cat_id,
+                type="category",
+                label=self._get_category_label(category),
+                properties={"count": 0}
             )
-            graph.add_node(node)
+            graph.add_node(cat_node)
+        cat_node.properties["count"] += 1
+        
+        # 连接胶囊到分类
+        edge = GraphEdge(
+            source=node.id,
+            target=cat_node.id,
+            type="from_category",
+            weight=0.8
+        )
+        graph.add_edge(edge)
+        
+        # 添加 Agent 节点和连接
+        for agent in capsule.get("source_agents", []):
+            agent_id = f"agent_{agent}"
+            if agent_id not in graph.nodes:
+                agent_node = GraphNode(
+                    id=agent_id,
+                    type="agent",
+                    label=agent,
+                    properties={}
+                )
+                graph.add_node(agent_node)
             
-            # 添加/关联分类节点
-            category = capsule.get("category", "general")
-            if category not in category_nodes:
-                cat_node = GraphNode(
-                    id=f"category_{category}",
-                    type="category",
-                    label=self._get_category_label(category),
-                    properties={"count": 0}
+            edge = GraphEdge(
+                source=node.id,
+                target=agent_id,
+                type="from_agent",
+                weight=1.0
+            )
+            graph.add_edge(edge)
+        
+        # 添加关键词节点
+        for keyword in capsule.get("keywords", [])[:3]:
+            kw_id = f"keyword_{keyword}"
+            if kw_id not in graph.nodes:
+                kw_node = GraphNode(
+                    id=kw_id,
+                    type="keyword",
+                    label=keyword,
+                    properties={}
                 )
-                category_nodes[category] = cat_node
-                graph.add_node(cat_node)
-            else:
-                category_nodes[category].properties["count"] += 1
+                graph.add_node(kw_node)
             
-            # 连接胶囊到分类
             edge = GraphEdge(
                 source=node.id,
-                target=cat_node.id,
-                type="from_category",
-                weight=0.8
+                target=kw_id,
+                type="has_keyword",
+                weight=0.5
             )
             graph.add_edge(edge)
+        
+        return node
+    
+    def _related_pairs(self, capsules: List[Dict]) -> Iterator[Tuple[int, int, float]]:
+        """
+        计算胶囊之间的关键词关联
+        
+        通过 关键词 -> 胶囊下标 的倒排索引只对真正共享关键词的胶囊对打分，
+        复杂度与实际重叠数成正比。每个关键词只在按质量排序的前 max_keyword_fanout 个
+        胶囊之间计入重叠 (与增量维护的规则一致)，热门关键词不会退化为 O(n²)。
+        
+        Returns:
+            (i, j, weight) 迭代器，i < j，weight 为重叠比例 (> 20%)
+        """
+        keyword_sets = [
+            set(c.get("keywords", [])[:RELATED_KEYWORD_LIMIT]) for c in capsules
+        ]
+        
+        postings = defaultdict(list)
+        for i, keywords in enumerate(keyword_sets):
+            for keyword in keywords:
+                postings[keyword].append(i)
+        keys = [_fanout_key(c) for c in capsules]
+        top = {
+            keyword: set(sorted(posting, key=keys.__getitem__)[:self.max_keyword_fanout])
+            for keyword, posting in postings.items()
+        }
+        
+        for i, kw1 in enumerate(keyword_sets):
+            shared = defaultdict(int)
+            for keyword in kw1:
+                members = top[keyword]
+                if i not in members:
+                    continue
+                for j in members:
+                    if j > i:
+                        shared[j] += 1
             
-            # 添加 Agent 节点和连接
-            for agent in capsule.get("source_agents", []):
-                agent_id = f"agent_{agent}"
-                if agent_id not in graph.nodes:
-                    agent_node = GraphNode(
-                        id=agent_id,
-                        type="agent",
-                        label=agent,
-                        properties={}
-                    )
-                    graph.add_node(agent_node)
-                
-                edge = GraphEdge(
-                    source=node.id,
-                    target=agent_id,
-                    type="from_agent",
-                    weight=1.0
-                )
-                graph.add_edge(edge)
-            
-            # 添加关键词节点
-            for keyword in capsule.get("keywords", [])[:3]:
-                kw_id = f"keyword_{keyword}"
-                if kw_id not in graph.nodes:
-                    kw_node = GraphNode(
-                        id=kw_id,
-                        type="keyword",
-                        label=keyword,
-                        properties={}
-                    )
-                    graph.add_node(kw_node)
+            for j in sorted(shared):
+                weight = shared[j] / max(len(kw1), len(keyword_sets[j]), 1)
+                if weight > RELATED_MIN_OVERLAP:  # 至少20%重叠
+                    yield i, j, weight
+    
+    # ============ 主图谱增量维护 ============
+    
+    def attach_storage(self, storage, graph_store=None):
+        """
+        绑定胶囊存储: 全量加载一次主图谱，之后通过存储的变更监听增量更新
+        
+        绑定了图谱存储时，若其中的胶囊节点 (ID 与内容指纹) 与胶囊存储一致，直接加载持久化的图谱 (无需重算关联)；
+        否则重建后整体写入图谱存储。之后的增量变更同步写入图谱存储。
+        
+        Args:
+            storage: CapsuleStorage / ShardedCapsuleStorage
+            graph_store: GraphStore，默认沿用已绑定的图谱存储
+        """
+        if self.storage is not None and hasattr(self.storage, "remove_listener"):
+            self.storage.remove_listener(self.on_capsule_event)
+        
+        self.storage = storage
+        if graph_store is not None:
+            self.graph_store = graph_store
+        with self._lock:
+            self.main_graph = KnowledgeGraph(name="主图谱", description="SuiLight 知识图谱主图")
+            self._capsules.clear()
+            self._recent.clear()
+            self._keyword_index.clear()
+            self._fingerprints.clear()
+            self.communities = {}
+            self._community_members = defaultdict(set)
+            self.communities_computed_at = None
+            self.layout = {}
+            self._layout_pending.clear()
+            self.layout_computed_at = None
+            
+            # 批量构建期间不逐条写入图谱存储
+            graph_store, self.graph_store = self.graph_store, None
+            try:
+                if graph_store is None or not self._load_from_store_locked(storage, graph_store):
+                    for capsule in storage.iter_knowledge_capsules():
+                        self.upsert_capsule(capsule)
+                    if graph_store is not None:
+                        graph_store.save_graph(self.graph_store_name, self.main_graph,
+                                               fingerprints=self._fingerprints)
+            finally:
+                self.graph_store = graph_store
+            self.epoch = uuid.uuid4().hex
+            self.version += 1
+            
+            if hasattr(storage, "get_graph_centrality") and self._capsules:
+                rows = storage.get_graph_centrality(node_type="capsule", limit=len(self._capsules))
+                self.capsule_rank = {row["node_id"]: row["pagerank"] for row in rows}
+                self.centrality_computed_at = rows[0]["computed_at"] if rows else None
+            
+            if hasattr(storage, "get_graph_communities"):
+                assignments, computed_at = storage.get_graph_communities()
+                if assignments:
+                    self.set_communities(assignments, computed_at)
+            
+            if hasattr(storage, "get_graph_layout"):
+                positions, computed_at = storage.get_graph_layout()
+                if positions:
+                    self.set_layout(positions, computed_at)
+        storage.add_listener(self.on_capsule_event)
+        
+        logger.info(
+            f"主图谱加载完成: {len(self.main_graph.nodes)} 节点, {len(self.main_graph.edges)} 边"
+        )
+    
+    def _load_from_store_locked(self, storage, graph_store) -> bool:
+        """
+        从图谱存储加载主图谱 (只重建胶囊摘要与关键词倒排索引)
+        
+        Returns:
+            是否加载成功；图谱存储为空或与胶囊存储不一致时返回 False
+        """
+        if graph_store.count(self.graph_store_name)["nodes"] == 0:
+            return False
+        
+        for capsule in storage.iter_knowledge_capsules():
+            summary = self._summarize_capsule(capsule)
+            if not summary["id"]:
+                continue
+            self._capsules[summary["id"]] = summary
+            self._recent.append((summary["created_at"], summary["id"]))
+            for keyword in set(summary["keywords"][:RELATED_KEYWORD_LIMIT]):
+                self._keyword_index[keyword].append((_fanout_key(summary), summary["id"]))
+        self._recent.sort()
+        for posting in self._keyword_index.values():
+            posting.sort()
+        
+        graph = graph_store.load_graph(self.graph_store_name)
+        stored = {node.id for node in graph.nodes.values() if node.type == "capsule"}
+        self._fingerprints = {
+            capsule_id: self._capsule_fingerprint(summary) for capsule_id, summary in self._capsules.items()
+        }
+        # 胶囊可能在其他进程中被改写 (ID 不变但关键词 / 分类变化)，按指纹比较
+        fingerprints = graph_store.get_fingerprints(self.graph_store_name)
+        changed = sum(
+            1 for capsule_id, fingerprint in self._fingerprints.items()
+            if fingerprints.get(capsule_id) != fingerprint
+        )
+        if stored != self._capsules.keys() or changed:
+            logger.info(
+                f"图谱存储与胶囊存储不一致 ({len(stored)} / {len(self._capsules)} 个胶囊，"
+                f"{changed} 个内容变化)，重建主图谱"
+            )
+            self._capsules.clear()
+            self._recent.clear()
+            self._keyword_index.clear()
+            self._fingerprints.clear()
+            return False
+        
+        graph.name = self.main_graph.name
+        graph.description = self.main_graph.description
+        self.main_graph = graph
+        return True
+    
+    def on_capsule_event(self, event: str, capsule_id: str, capsule: Optional[Dict] = None):
+        """存储变更监听器"""
+        if event == CAPSULE_DELETED:
+            self.remove_capsule(capsule_id)
+        elif capsule is not None:
+            self.upsert_capsule(capsule)
+    
+    def upsert_capsule(self, capsule: Dict):
+        """新增或更新主图谱中的胶囊 (只触及该胶囊及进出热门关键词前列的胶囊的邻域)"""
+        capsule_id = capsule.get("id")
+        if not capsule_id:
+            return
+        
+        with self._lock:
+            changed = set()
+            if capsule_id in self._capsules:
+                changed = self._remove_capsule_locked(capsule_id)
+            
+            summary = self._summarize_capsule(capsule)
+            self._capsules[capsule_id] = summary
+            self._fingerprints[capsule_id] = self._capsule_fingerprint(summary)
+            insort(self._recent, (summary["created_at"], capsule_id))
+            self._add_capsule_nodes(self.main_graph, summary)
+            
+            # 插入倒排索引；挤出关键词前 max_keyword_fanout 名的胶囊需要重算关联
+            key = _fanout_key(summary)
+            for keyword in set(summary["keywords"][:RELATED_KEYWORD_LIMIT]):
+                posting = self._keyword_index[keyword]
+                index = bisect_left(posting, (key, capsule_id))
+                posting.insert(index, (key, capsule_id))
+                if index < self.max_keyword_fanout < len(posting):
+                    changed.add(posting[self.max_keyword_fanout][1])
+            
+            self._relink_capsule_locked(capsule_id)
+            changed.discard(capsule_id)
+            self._relink_changed_locked(changed)
+            
+            if self.communities_computed_at is not None:
+                self._assign_community_locked(capsule_id)
+            if self.layout_computed_at is not None:
+                self._place_capsule_locked(capsule_id)
+            if self.graph_store is not None:
+                self._persist_capsule_locked(capsule_id)
+            self.version += 1
+    
+    def _related_weights_locked(self, capsule_id: str) -> Dict[str, float]:
+        """
+        胶囊的关联边权重 (与 _related_pairs 相同的规则)
+        
+        Returns:
+            {相关胶囊ID: 重叠比例}，只包含超过 RELATED_MIN_OVERLAP 的胶囊
+        """
+        summary = self._capsules[capsule_id]
+        key = (_fanout_key(summary), capsule_id)
+        kw1 = set(summary["keywords"][:RELATED_KEYWORD_LIMIT])
+        shared = defaultdict(int)
+        for keyword in kw1:
+            top = self._keyword_index.get(keyword, [])[:self.max_keyword_fanout]
+            index = bisect_left(top, key)
+            if index == len(top) or top[index] != key:
+                continue
+            for _, other_id in top:
+                if other_id != capsule_id:
+                    shared[other_id] += 1
+        
+        weights = {}
+        for other_id, count in shared.items():
+            kw2 = set(self._capsules[other_id]["keywords"][:RELATED_KEYWORD_LIMIT])
+            weight = count / max(len(kw1), len(kw2), 1)
+            if weight > RELATED_MIN_OVERLAP:
+                weights[other_id] = weight
+        return weights
+    
+    def _relink_capsule_locked(self, capsule_id: str):
+        """按当前倒排索引重算胶囊的关联边"""
+        graph = self.main_graph
+        weights = self._related_weights_locked(capsule_id)
+        for edge in list(graph.iter_edges(capsule_id, "related")):
+            other_id = edge.target if edge.source == capsule_id else edge.source
+            if weights.get(other_id) == edge.weight:
+                del weights[other_id]
+            else:
+                graph.remove_edge(edge.id)
+        
+        for other_id, weight in weights.items():
+            graph.add_edge(GraphEdge(
+                source=capsule_id,
+                target=other_id,
+                type="related",
+                weight=weight
+            ))
+    
+    def _relink_changed_locked(self, capsule_ids: Set[str]):
+        """重算进出热门关键词前列的胶囊的关联边，并同步到图谱存储"""
+        for capsule_id in capsule_ids:
+            if capsule_id in self._capsules:
+                self._relink_capsule_locked(capsule_id)
+                if self.graph_store is not None:
+                    self._persist_capsule_locked(capsule_id)
+    
+    def remove_capsule(self, capsule_id: str) -> bool:
+        """从主图谱移除胶囊"""
+        with self._lock:
+            if capsule_id not in self._capsules:
+                return False
+            self._relink_changed_locked(self._remove_capsule_locked(capsule_id))
+            self.version += 1
+            return True
+    
+    def _remove_capsule_locked(self, capsule_id: str) -> Set[str]:
+        """
+        移除胶囊 (不重算其他胶囊的关联边)
+        
+        Returns:
+            因此进入关键词前 max_keyword_fanout 名的胶囊 ID，由调用方重算关联
+        """
+        summary = self._capsules.pop(capsule_id)
+        self._fingerprints.pop(capsule_id, None)
+        self.layout.pop(capsule_id, None)
+        self._layout_pending.pop(capsule_id, None)
+        
+        community = self.communities.pop(capsule_id, None)
+        if community is not None:
+            members = self._community_members.get(community)
+            if members is not None:
+                members.discard(capsule_id)
+                if not members:
+                    del self._community_members[community]
+        
+        index = bisect_left(self._recent, (summary["created_at"], capsule_id))
+        if index < len(self._recent) and self._recent[index][1] == capsule_id:
+            del self._recent[index]
+        
+        promoted = set()
+        key = (_fanout_key(summary), capsule_id)
+        for keyword in set(summary["keywords"][:RELATED_KEYWORD_LIMIT]):
+            posting = self._keyword_index.get(keyword)
+            if posting is None:
+                continue
+            index = bisect_left(posting, key)
+            if index < len(posting) and posting[index] == key:
+                if index < self.max_keyword_fanout < len(posting):
+                    promoted.add(posting[self.max_keyword_fanout][1])
+                del posting[index]
+            if not posting:
+                del self._keyword_index[keyword]
+        
+        graph = self.main_graph
+        attached = [
+            edge.target for edge in graph.out_edges(capsule_id)
+            if edge.type in ("from_category", "from_agent", "has_keyword")
+        ]
+        graph.remove_node(capsule_id)
+        
+        # 分类计数减一，清理不再被引用的分类 / Agent / 关键词节点
+        for node_id in attached:
+            node = graph.nodes.get(node_id)
+            if node is None:
+                continue
+            if node.type == "category":
+                node.properties["count"] -= 1
+            if graph.degree(node_id) == 0:
+                graph.remove_node(node_id)
+                self.communities.pop(node_id, None)
+                self.layout.pop(node_id, None)
+                self._layout_pending.pop(node_id, None)
+        
+        if self.graph_store is not None:
+            name = self.graph_store_name
+            self.graph_store.delete_node(name, capsule_id)
+            for node_id in attached:
+                node = graph.nodes.get(node_id)
+                if node is None:
+                    self.graph_store.delete_node(name, node_id)
+                elif node.type == "category":
+                    self.graph_store.upsert_nodes(name, [self._store_node(node)])
+        return promoted
+    
+    def _store_node(self, node: GraphNode) -> Dict:
+        return {"id": node.id, "type": node.type, "label": node.label, "properties": node.properties,
+                "fingerprint": self._fingerprints.get(node.id)}
+    
+    def _persist_capsule_locked(self, capsule_id: str):
+        """把胶囊节点、其分类 / Agent / 关键词节点和全部边写入图谱存储"""
+        graph = self.main_graph
+        edges = list(graph.iter_edges(capsule_id))
+        node_ids = {capsule_id} | {
+            edge.target for edge in edges
+            if edge.source == capsule_id and edge.type in ("from_category", "from_agent", "has_keyword")
+        }
+        self.graph_store.replace_node_edges(
+            self.graph_store_name,
+            capsule_id,
+            [self._store_node(graph.nodes[node_id]) for node_id in node_ids],
+            [
+                {"source": edge.source, "target": edge.target, "type": edge.type, "weight": edge.weight}
+                for edge in edges
+            ]
+        )
+    
+    @staticmethod
+    def _summarize_capsule(capsule: Dict) -> Dict:
+        """主图谱及其视图使用的精简胶囊"""
+        return {
+            "id": capsule.get("id"),
+            "title": capsule.get("title", "未命名胶囊"),
+            "summary": capsule.get("summary", ""),
+            "category": capsule.get("category") or "general",
+            "quality_score": capsule.get("quality_score") or 0,
+            "grade": capsule.get("grade", "C"),
+            "keywords": list(capsule.get("keywords") or []),
+            "source_agents": list(capsule.get("source_agents") or []),
+            "created_at": capsule.get("created_at") or ""
+        }
+    
+    @classmethod
+    def _capsule_fingerprint(cls, capsule: Dict) -> str:
+        """胶囊中影响主图谱的字段 (标题、分类、质量、Agent、关键词) 的指纹"""
+        summary = cls._summarize_capsule(capsule)
+        raw = json.dumps(
+            [summary[field] for field in
+             ("title", "category", "quality_score", "grade", "source_agents", "keywords")],
+            ensure_ascii=False
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    
+    def compact_snapshot(self):
+        """主图谱的 CSR 紧凑快照 (用于批量分析)"""
+        from src.graph_csr import CompactGraph
+        with self._lock:
+            return CompactGraph.from_knowledge_graph(self.main_graph, keep_attributes=False)
+    
+    def mark_centrality_updated(self, computed_at: str, scores: Optional[Dict[str, Dict]] = None):
+        """
+        中心性重新计算后调用 (使缓存的统计响应失效)
+        
+        Args:
+            computed_at: 计算时间
+            scores: {节点ID: 中心性}，提供时更新胶囊 PageRank 缓存
+        """
+        with self._lock:
+            self.centrality_computed_at = computed_at
+            if scores is not None:
+                self.capsule_rank = {
+                    node_id: score["pagerank"] for node_id, score in scores.items()
+                    if score["node_type"] == "capsule"
+                }
+            self.derived_versions["centrality"] += 1
+    
+    def get_centrality_summary(self, top_n: int = 10) -> Dict:
+        """已持久化的中心性排名 (胶囊 / Agent / 关键词 各 Top-N)"""
+        summary = {"computed_at": self.centrality_computed_at}
+        if self.storage is None or not hasattr(self.storage, "get_graph_centrality"):
+            return summary
+        for node_type in ("capsule", "agent", "keyword"):
+            summary[f"top_{node_type}s"] = self.storage.get_graph_centrality(node_type=node_type, limit=top_n)
+        return summary
+    
+    # ============ 社区 ============
+    
+    def set_communities(self, assignments: Dict[str, int], computed_at: Optional[str] = None):
+        """
+        替换社区划分缓存 (批量计算完成或从存储加载后调用)
+        
+        快照之后才加入的胶囊按邻居投票补充归入，已删除的节点被忽略。
+        
+        Args:
+            assignments: {节点ID: 社区编号}
+            computed_at: 计算时间
+        """
+        with self._lock:
+            nodes = self.main_graph.nodes
+            self.communities = {
+                node_id: community for node_id, community in assignments.items() if node_id in nodes
+            }
+            self._community_members = defaultdict(set)
+            for node_id, community in self.communities.items():
+                if node_id in self._capsules:
+                    self._community_members[community].add(node_id)
+            self._next_community = max(assignments.values(), default=-1) + 1
+            self.communities_computed_at = computed_at or datetime.now().isoformat()
+            
+            for capsule_id in self._capsules:
+                if capsule_id not in self.communities:
+                    self._assign_community_locked(capsule_id)
+            self.derived_versions["communities"] += 1
+    
+    def _assign_community_locked(self, capsule_id: str) -> int:
+        """
+        按邻居加权投票把胶囊归入社区 (O(度数))
+        
+        关联边按重叠比例计票，Agent 边按 COMMUNITY_AGENT_WEIGHT 计票；
+        没有已归属的邻居时新开一个社区，尚未归属的 Agent 随胶囊归入同一社区。
+        """
+        votes = defaultdict(float)
+        new_agents = []
+        for edge in self.main_graph.iter_edges(capsule_id):
+            if edge.type == "related":
+                other_id = edge.target if edge.source == capsule_id else edge.source
+                weight = edge.weight
+            elif edge.type == "from_agent" and edge.source == capsule_id:
+                other_id = edge.target
+                weight = edge.weight * COMMUNITY_AGENT_WEIGHT
+            else:
+                continue
+            
+            community = self.communities.get(other_id)
+            if community is not None:
+                votes[community] += weight
+            elif edge.type == "from_agent":
+                new_agents.append(other_id)
+        
+        if votes:
+            community = max(votes.items(), key=lambda x: (x[1], -x[0]))[0]
+        else:
+            community = self._next_community
+            self._next_community += 1
+        
+        self.communities[capsule_id] = community
+        self._community_members[community].add(capsule_id)
+        for agent_id in new_agents:
+            self.communities[agent_id] = community
+        return community
+    
+    def get_community(self, capsule_id: str) -> Optional[int]:
+        """胶囊所属社区编号 (尚未划分时为 None)"""
+        return self.communities.get(capsule_id)
+    
+    def get_community_analysis(self, limit: int = 20, min_size: int = 2, top_keywords: int = 5) -> Dict:
+        """
+        社区聚类分析 (规模最大的 limit 个社区)
+        
+        与 get_cluster_analysis 相同的 clusters 结构，并附带社区内的分类构成、
+        高频关键词 / Agent，以及是否跨学科 (至少两个分类占比 >= CROSS_DISCIPLINARY_SHARE)。
+        尚未划分社区时退回按分类聚类。
+        
+        Args:
+            limit: 返回的社区数
+            min_size: 社区最少胶囊数
+            top_keywords: 每个社区返回的关键词数
+        """
+        with self._lock:
+            if self.communities_computed_at is None:
+                result = self.get_cluster_analysis(list(self._capsules.values()))
+                result["method"] = "category"
+                return result
+            
+            eligible = (
+                (len(members), community) for community, members in self._community_members.items()
+                if len(members) >= min_size
+            )
+            largest = heapq.nlargest(limit, eligible, key=lambda x: (x[0], -x[1]))
+            
+            clusters = []
+            for size, community in largest:
+                items = [self._capsules[capsule_id] for capsule_id in self._community_members[community]]
+                categories = Counter(c["category"] for c in items)
+                keywords = Counter(kw for c in items for kw in c["keywords"][:RELATED_KEYWORD_LIMIT])
+                agents = Counter(agent for c in items for agent in c["source_agents"])
+                top = [kw for kw, _ in keywords.most_common(top_keywords)]
+                major = [cat for cat, count in categories.items() if count / size >= CROSS_DISCIPLINARY_SHARE]
                 
-                edge = GraphEdge(
-                    source=node.id,
-                    target=kw_id,
-                    type="has_keyword",
-                    weight=0.5
+                clusters.append({
+                    "id": community,
+                    "label": " / ".join(top[:3]) or self._get_category_label(categories.most_common(1)[0][0]),
+                    "count": size,
+                    "avg_quality": sum(c["quality_score"] for c in items) / size,
+                    "categories": [
+                        {"category": cat, "label": self._get_category_label(cat), "count": count}
+                        for cat, count in categories.most_common()
+                    ],
+                    "keywords": top,
+                    "agents": [agent for agent, _ in agents.most_common(3)],
+                    "cross_disciplinary": len(major) >= 2
+                })
+            
+            return {
+                "clusters": clusters,
+                "total": len(self._capsules),
+                "method": "label_propagation",
+                "community_count": sum(
+                    1 for members in self._community_members.values() if len(members) >= min_size
+                ),
+                "cross_disciplinary_count": sum(1 for c in clusters if c["cross_disciplinary"]),
+                "computed_at": self.communities_computed_at
+            }
+    
+    # ============ 主图谱视图 ============
+    
+    def get_recent_capsules(self, limit: int = 100) -> List[Dict]:
+        """主图谱中最新的 limit 个胶囊 (按创建时间倒序，O(limit))"""
+        if limit <= 0:
+            return []
+        with self._lock:
+            return [self._capsules[capsule_id] for _, capsule_id in reversed(self._recent[-limit:])]
+    
+    def export_view_json(self, limit: int = 100) -> Dict:
+        """
+        导出主图谱中最新 limit 个胶囊的子图 (与 export_graph_json 相同格式)
+        
+        子图包含选中的胶囊、与其相连的分类 / Agent / 关键词节点，以及选中胶囊之间的关联边。
+        """
+        with self._lock:
+            graph = self.main_graph
+            selected = [c["id"] for c in self.get_recent_capsules(limit)]
+            selected_set = set(selected)
+            
+            nodes: Dict[str, GraphNode] = {}
+            edges: List[GraphEdge] = []
+            for capsule_id in selected:
+                nodes[capsule_id] = graph.nodes[capsule_id]
+                for edge in graph.iter_edges(capsule_id):
+                    if edge.type == "related":
+                        # 关联边只在其 source 一侧收集一次
+                        if edge.source == capsule_id and edge.target in selected_set:
+                            edges.append(edge)
+                    elif edge.source == capsule_id and edge.target in graph.nodes:
+                        nodes.setdefault(edge.target, graph.nodes[edge.target])
+                        edges.append(edge)
+            
+            return {
+                "nodes": [
+                    {"id": node.id, "type": node.type, "label": node.label, **node.properties,
+                     **self._position(node.id)}
+                    for node in nodes.values()
+                ],
+                "links": [
+                    {"source": edge.source, "target": edge.target, "type": edge.type, "weight": edge.weight}
+                    for edge in edges
+                ],
+                "stats": {
+                    "node_count": len(nodes),
+                    "edge_count": len(edges)
+                }
+            }
+    
+    def get_related_from_graph(self, capsule_id: str, limit: int = 5) -> List[Dict]:
+        """
+        基于主图谱获取相关胶囊 (与 get_related_capsules 相同的打分: 分类匹配 0.5 + 关键词重叠)
+        
+        只访问该胶囊的关联边和所在分类的前若干成员，不遍历全部胶囊。
+        """
+        with self._lock:
+            target = self._capsules.get(capsule_id)
+            if not target:
+                return []
+            
+            graph = self.main_graph
+            category = target["category"]
+            scores = {}
+            for edge in graph.iter_edges(capsule_id, "related"):
+                other_id = edge.target if edge.source == capsule_id else edge.source
+                scores[other_id] = edge.weight
+            for other_id in scores:
+                if self._capsules[other_id]["category"] == category:
+                    scores[other_id] += 0.5
+            
+            # 同分类胶囊补足数量
+            if len(scores) < limit:
+                same_category = (
+                    edge.source for edge in graph.in_edges(f"category_{category}", "from_category")
+                    if edge.source != capsule_id and edge.source not in scores
                 )
-                graph.add_edge(edge)
-        
-        # 胶囊之间的关联 (基于关键词)
-        for i, c1 in enumerate(capsules):
-            for j, c2 in enumerate(capsules[i+1:], i+1):
-                kw1 = set(c1.get("keywords", [])[:10])
-                kw2 = set(c2.get("keywords", [])[:10])
-                intersection = kw1 & kw2
-                
-                if intersection:
-                    weight = len(intersection) / max(len(kw1), len(kw2), 1)
-                    if weight > 0.2:  # 至少20%重叠
-                        edge = GraphEdge(
-                            source=c1.get("id"),
-                            target=c2.get("id"),
-                            type="related",
-                            weight=weight
-                        )
-                        graph.add_edge(edge)
+                for other_id in islice(same_category, limit - len(scores)):
+                    scores[other_id] = 0.5
+            
+            ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+            return [self._capsules[other_id] for other_id, _ in ranked]
+    
+    # ============ 邻域与路径 ============
+    
+    def get_neighborhood(
+        self,
+        node_id: str,
+        k: int = 2,
+        edge_type: str = None,
+        direction: str = "both",
+        limit: int = 200
+    ) -> Optional[List[Dict]]:
+        """
+        k 跳邻域 (绑定图谱存储时由存储的递归 CTE 查询，否则在主图谱上 BFS)
         
-        logger.info(f"图谱构建完成: {len(graph.nodes)} 节点, {len(graph.edges)} 边")
+        Args:
+            node_id: 起点
+            k: 最大跳数
+            edge_type: 只沿该类型的边
+            direction: out / in / both
+            limit: 返回数量上限
         
-        return graph
+        Returns:
+            [{"id", "depth", "type", "label", "properties"}]，按距离升序；起点不存在时为 None
+        """
+        if self.graph_store is not None:
+            if self.graph_store.get_node(self.graph_store_name, node_id) is None:
+                return None
+            return self.graph_store.k_hop(self.graph_store_name, node_id, k, edge_type, direction, limit)
+        
+        with self._lock:
+            graph = self.main_graph
+            if node_id not in graph.nodes:
+                return None
+            step = {
+                "out": lambda n: (edge.target for edge in graph.out_edges(n, edge_type)),
+                "in": lambda n: (edge.source for edge in graph.in_edges(n, edge_type)),
+                "both": lambda n: graph.neighbor_ids(n, edge_type)
+            }[direction]
+            
+            depths = {node_id: 0}
+            frontier = [node_id]
+            for depth in range(1, k + 1):
+                next_frontier = []
+                for current in frontier:
+                    for neighbor in step(current):
+                        if neighbor not in depths:
+                            depths[neighbor] = depth
+                            next_frontier.append(neighbor)
+                frontier = next_frontier
+            
+            ranked = sorted((depth, other_id) for other_id, depth in depths.items() if other_id != node_id)
+            return [
+                {"depth": depth, **graph.nodes[other_id].to_dict()}
+                for depth, other_id in ranked[:limit]
+            ]
+    
+    def find_path(self, start_id: str, end_id: str, edge_type: str = None,
+                  max_depth: int = MAX_PATH_DEPTH) -> List[str]:
+        """
+        两节点间的最短路径 (无向，在内存中的主图谱上双向 BFS，找到即停止)
+        
+        Returns:
+            节点 ID 列表，不可达或超过 max_depth 跳时为空列表
+        """
+        with self._lock:
+            return self.main_graph.get_shortest_path(start_id, end_id, edge_type, max_depth)
+    
+    # ============ 布局 ============
+    
+    def set_layout(self, positions: Dict[str, Tuple[float, float]], computed_at: Optional[str] = None):
+        """
+        替换布局坐标缓存 (全量布局完成或从存储加载后调用)
+        
+        快照之后才加入的节点重新放置并等待细化，已删除的节点被忽略。
+        """
+        with self._lock:
+            nodes = self.main_graph.nodes
+            self.layout = {
+                node_id: (float(x), float(y)) for node_id, (x, y) in positions.items() if node_id in nodes
+            }
+            self._layout_pending = {
+                node_id: None for node_id in self._layout_pending if node_id not in positions
+            }
+            self.layout_computed_at = computed_at or datetime.now().isoformat()
+            
+            for capsule_id in self._capsules:
+                if capsule_id not in self.layout:
+                    self._place_capsule_locked(capsule_id)
+            self.derived_versions["layout"] += 1
+    
+    def update_layout(self, positions: Dict[str, Tuple[float, float]]):
+        """写入增量细化后的坐标"""
+        with self._lock:
+            for node_id, position in positions.items():
+                if node_id in self.layout:
+                    self.layout[node_id] = position
+                    self._layout_pending.pop(node_id, None)
+            self.derived_versions["layout"] += 1
+    
+    def get_layout(self) -> Dict[str, Tuple[float, float]]:
+        """当前布局坐标 (副本)"""
+        with self._lock:
+            return dict(self.layout)
+    
+    def get_layout_batch(self, limit: int = 10000) -> Tuple[List[str], List[Tuple[str, str, float]], Dict]:
+        """
+        待细化的节点及其邻接边
+        
+        Returns:
+            (待细化节点, [(节点, 已布局邻居, 权重)], 全部坐标副本)
+        """
+        with self._lock:
+            pending = list(islice(self._layout_pending, limit))
+            edges = []
+            for node_id in pending:
+                for edge in self.main_graph.iter_edges(node_id):
+                    other_id = edge.target if edge.source == node_id else edge.source
+                    if other_id != node_id and other_id in self.layout:
+                        edges.append((node_id, other_id, edge.weight))
+            return pending, edges, dict(self.layout)
+    
+    def _place_capsule_locked(self, capsule_id: str):
+        """把新胶囊放在已布局邻居的质心附近，新出现的分类 / Agent / 关键词节点放在胶囊附近"""
+        graph = self.main_graph
+        neighbors = [other_id for other_id in graph.neighbor_ids(capsule_id) if other_id in self.layout]
+        jitter = 0.02
+        if neighbors:
+            x = sum(self.layout[n][0] for n in neighbors) / len(neighbors)
+            y = sum(self.layout[n][1] for n in neighbors) / len(neighbors)
+        else:
+            x, y, jitter = 0.0, 0.0, 1.0
+        
+        for node_id in [capsule_id] + [n for n in graph.neighbor_ids(capsule_id) if n not in self.layout]:
+            self.layout[node_id] = (
+                x + self._layout_rng.uniform(-jitter, jitter),
+                y + self._layout_rng.uniform(-jitter, jitter)
+            )
+            self._layout_pending[node_id] = None
+    
+    def _position(self, node_id: str) -> Dict:
+        position = self.layout.get(node_id)
+        if position is None:
+            return {}
+        return {"x": round(position[0], 5), "y": round(position[1], 5)}
+    
+    # ============ 分级细节 (LOD) 视图 ============
+    
+    def export_lod_json(
+        self,
+        max_nodes: int = LOD_MAX_NODES,
+        max_links: int = LOD_MAX_LINKS,
+        group_by: str = "auto",
+        focus: Optional[str] = None,
+        depth: int = 1,
+        expand: Optional[List[str]] = None,
+        seed: int = 0
+    ) -> Dict:
+        """
+        分级细节视图 (与 export_graph_json 相同格式，节点数 <= max_nodes，边数 <= max_links)
+        
+        - 只展开最重要的胶囊 (PageRank，其次质量分)，其余胶囊折叠为所在社区 / 分类的超级节点
+        - 视口缩放时通过 focus 展开某个胶囊的 depth 跳邻域，通过 expand 展开指定超级节点的成员
+        - 超级节点之间的连接由每组最多 LOD_GROUP_SAMPLE 个成员的关联边估计
+        - 候选边超过 max_links 时按权重抽样
+        
+        Args:
+            max_nodes: 节点上限 (含超级节点)
+            max_links: 边上限
+            group_by: 折叠方式 community / category / auto (已划分社区时用社区)
+            focus: 展开邻域的胶囊 ID
+            depth: 邻域跳数
+            expand: 展开的超级节点 ID 列表
+            seed: 边抽样随机种子
+        """
+        with self._lock:
+            if group_by == "auto":
+                group_by = "community" if self.communities_computed_at is not None else "category"
+            
+            def group_of(capsule_id: str) -> str:
+                if group_by == "community":
+                    community = self.communities.get(capsule_id)
+                    return f"community_{community}" if community is not None else "community_none"
+                return f"category_{self._capsules[capsule_id]['category']}"
+            
+            def importance(capsule_id: str) -> Tuple[float, float]:
+                return self.capsule_rank.get(capsule_id, 0.0), self._capsules[capsule_id]["quality_score"]
+            
+            # 1. 分组统计 (超级节点数上限为 max_nodes 的 1/5，其余组合并为 "其他")
+            group_counts = Counter()
+            group_quality = defaultdict(float)
+            group_categories: Dict[str, Counter] = defaultdict(Counter)
+            group_samples: Dict[str, List[str]] = defaultdict(list)
+            expand_set = set(expand or [])
+            expanded_members: Dict[str, List[str]] = defaultdict(list)
+            group_xy: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0, 0])
+            capsule_groups: Dict[str, str] = {}
+            for capsule_id, capsule in self._capsules.items():
+                group = capsule_groups[capsule_id] = group_of(capsule_id)
+                group_counts[group] += 1
+                position = self.layout.get(capsule_id)
+                if position is not None:
+                    xy = group_xy[group]
+                    xy[0] += position[0]
+                    xy[1] += position[1]
+                    xy[2] += 1
+                group_quality[group] += capsule["quality_score"]
+                group_categories[group][capsule["category"]] += 1
+                if len(group_samples[group]) < LOD_GROUP_SAMPLE:
+                    group_samples[group].append(capsule_id)
+                if group in expand_set:
+                    expanded_members[group].append(capsule_id)
+            
+            max_groups = max(1, max_nodes // 5)
+            kept_groups = {group for group, _ in group_counts.most_common(max_groups - 1)}
+            if len(group_counts) <= max_groups:
+                kept_groups = set(group_counts)
+            
+            def super_id(capsule_id: str) -> str:
+                group = capsule_groups[capsule_id]
+                return group if group in kept_groups else "group_other"
+            
+            # 2. 选择展开的胶囊: 焦点邻域 > 展开的超级节点 > 全局重要度
+            budget = max(1, max_nodes - min(len(group_counts), max_groups))
+            visible: Dict[str, None] = {}
+            
+            if focus in self._capsules:
+                visible[focus] = None
+                frontier = [focus]
+                for _ in range(max(depth, 0)):
+                    candidates = {}
+                    for node_id in frontier:
+                        for edge in self.main_graph.iter_edges(node_id, "related"):
+                            other_id = edge.target if edge.source == node_id else edge.source
+                            if other_id not in visible:
+                                candidates[other_id] = max(candidates.get(other_id, 0), edge.weight)
+                    ranked = sorted(candidates, key=lambda x: candidates[x], reverse=True)
+                    frontier = ranked[:budget - len(visible)]
+                    visible.update(dict.fromkeys(frontier))
+                    if not frontier:
+                        break
+            
+            for group in expand or []:
+                members = heapq.nlargest(
+                    max(budget - len(visible), 0), expanded_members.get(group, []), key=importance
+                )
+                visible.update(dict.fromkeys(members))
+            
+            remaining = budget - len(visible)
+            if remaining > 0:
+                top = heapq.nlargest(
+                    remaining + len(visible), self._capsules, key=importance
+                )
+                visible.update(dict.fromkeys(c for c in top if c not in visible))
+                visible = dict.fromkeys(islice(visible, budget))
+            
+            # 3. 超级节点 (只保留仍有折叠成员的组)
+            hidden_counts = Counter()
+            visible_counts = Counter(super_id(capsule_id) for capsule_id in visible)
+            for group, count in group_counts.items():
+                hidden_counts[group if group in kept_groups else "group_other"] += count
+            for group, count in visible_counts.items():
+                hidden_counts[group] -= count
+            
+            nodes = []
+            super_nodes = {}
+            for group, hidden in hidden_counts.items():
+                if hidden <= 0:
+                    continue
+                members = [group] if group in kept_groups else [g for g in group_counts if g not in kept_groups]
+                total = sum(group_counts[g] for g in members)
+                categories = sum((group_categories[g] for g in members), Counter())
+                super_nodes[group] = {
+                    "id": group,
+                    "type": "cluster",
+                    "label": self._get_group_label(group, categories),
+                    "count": hidden,
+                    "total": total,
+                    "avg_quality": sum(group_quality[g] for g in members) / total,
+                    "collapsed": True
+                }
+                # 超级节点位于成员坐标的质心
+                sums = [group_xy[g] for g in members if g in group_xy]
+                placed = sum(xy[2] for xy in sums)
+                if placed:
+                    super_nodes[group]["x"] = round(sum(xy[0] for xy in sums) / placed, 5)
+                    super_nodes[group]["y"] = round(sum(xy[1] for xy in sums) / placed, 5)
+            nodes.extend(super_nodes.values())
+            
+            for capsule_id in visible:
+                capsule = self._capsules[capsule_id]
+                nodes.append({
+                    "id": capsule_id,
+                    "type": "capsule",
+                    "label": capsule["title"],
+                    "quality_score": capsule["quality_score"],
+                    "grade": capsule["grade"],
+                    "category": capsule["category"],
+                    "group": super_id(capsule_id),
+                    "importance": self.capsule_rank.get(capsule_id, 0.0),
+                    **self._position(capsule_id)
+                })
+            
+            # 4. 候选边: 胶囊之间、胶囊 -> 超级节点、超级节点之间 (抽样估计)
+            links: Dict[Tuple[str, str, str], float] = defaultdict(float)
+            for capsule_id in visible:
+                group = super_id(capsule_id)
+                if group in super_nodes:
+                    links[(capsule_id, group, "member_of")] = 1.0
+                for edge in self.main_graph.iter_edges(capsule_id, "related"):
+                    other_id = edge.target if edge.source == capsule_id else edge.source
+                    if other_id in visible:
+                        if capsule_id < other_id:
+                            links[(capsule_id, other_id, "related")] = edge.weight
+                    else:
+                        links[(capsule_id, super_id(other_id), "aggregated")] += edge.weight
+            
+            for group, node in super_nodes.items():
+                members = group_samples[group] if group in kept_groups else [
+                    c for g in group_counts if g not in kept_groups for c in group_samples[g]
+                ][:LOD_GROUP_SAMPLE]
+                sampled = [c for c in members if c not in visible]
+                if not sampled:
+                    continue
+                scale = node["count"] / len(sampled)
+                for capsule_id in sampled:
+                    for edge in self.main_graph.iter_edges(capsule_id, "related"):
+                        other_id = edge.target if edge.source == capsule_id else edge.source
+                        if other_id in visible:
+                            continue
+                        other_group = super_id(other_id)
+                        if other_group != group and group < other_group:
+                            links[(group, other_group, "aggregated")] += edge.weight * scale
+            
+            candidates = list(links.items())
+            sampled_links = _weighted_sample(candidates, [w for _, w in candidates], max_links, seed)
+            
+            return {
+                "nodes": nodes,
+                "links": [
+                    {"source": source, "target": target, "type": edge_type, "weight": weight}
+                    for (source, target, edge_type), weight in sampled_links
+                ],
+                "stats": {
+                    "node_count": len(nodes),
+                    "edge_count": len(sampled_links)
+                },
+                "lod": {
+                    "group_by": group_by,
+                    "focus": focus if focus in self._capsules else None,
+                    "expand": list(expand or []),
+                    "total_capsules": len(self._capsules),
+                    "visible_capsules": len(visible),
+                    "collapsed_capsules": len(self._capsules) - len(visible),
+                    "candidate_links": len(candidates),
+                    "max_nodes": max_nodes,
+                    "max_links": max_links
+                }
+            }
+    
+    def _get_group_label(self, group: str, categories: Counter) -> str:
+        """超级节点标签"""
+        if group == "group_other":
+            return "📦 其他"
+        if group.startswith("category_"):
+            return self._get_category_label(group[len("category_"):])
+        main_category = categories.most_common(1)[0][0] if categories else "general"
+        return f"{self._get_category_label(main_category)} 社区 {group[len('community_'):]}"
     
     def _get_category_label(self, category: str) -> str:
         """获取分类标签"""
@@ -372,23 +1573,13 @@ class KnowledgeGraphManager:
         return [r["capsule"] for r in related[:limit]]
     
     def get_statistics(self, capsules: List[Dict]) -> Dict:
-        """获取图谱统计"""
-        return {
-            "total_capsules": len(capsules),
-            "total_keywords": len(set(
-                kw for c in capsules 
-                for kw in c.get("keywords", [])[:10]
-            )),
-            "total_agents": len(set(
-                agent for c in capsules 
-                for agent in c.get("source_agents", [])
-            )),
-            "categories": len(set(c.get("category", "general") for c in capsules)),
-            "avg_quality": sum(c.get("quality_score", 0) for c in capsules) / len(capsules) if capsules else 0,
-            "a_grade_count": len([c for c in capsules if c.get("grade") == "A"]),
-            "b_grade_count": len([c for c in capsules if c.get("grade") == "B"]),
-            "c_grade_count": len([c for c in capsules if c.get("grade") == "C"])
-        }
+        """获取图谱统计 (在列式快照上向量化计算，关键词只计每个胶囊的前 10 个)"""
+        from src.analytics import CapsuleAnalytics
+        from src.storage.columnar import ColumnarSnapshot
+        snapshot = ColumnarSnapshot.from_capsules(
+            {**c, "keywords": (c.get("keywords") or [])[:10]} for c in capsules
+        )
+        return CapsuleAnalytics(snapshot).get_statistics()
     
     def export_graph_json(self, capsules: List[Dict]) -> Dict:
         """导出图谱 JSON (D3.js 可用格式)"""
@@ -400,7 +1591,8 @@ class KnowledgeGraphManager:
                 "id": node.id,
                 "type": node.type,
                 "label": node.label,
-                **node.properties
+                **node.properties,
+                **self._position(node.id)
             })
         
         edges = []
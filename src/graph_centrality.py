@@ -0,0 +1,292 @@
+"""
+SuiLight Knowledge Salon - 图谱中心性
+在 胶囊 / Agent / 关键词 图上批量计算 PageRank、度数与近似介数中心性
+
+- 基于 CSR 紧凑图谱 (src/graph_csr.py) 的向量化计算
+- PageRank: 加权幂迭代
+- 介数: 抽样源点的 Brandes 算法 (逐层向量化 BFS)
+- 结果写入存储的 graph_centrality 表，供胶囊列表排序与 /api/graph/statistics 使用
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+import logging
+
+import numpy as np
+
+from src.graph import KnowledgeGraph
+from src.graph_csr import CompactGraph, expand_frontier
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 参与中心性计算的节点 / 边类型 (分类节点是超级枢纽，不参与)
+CENTRALITY_NODE_TYPES = ("capsule", "agent", "keyword")
+CENTRALITY_EDGE_TYPES = ("related", "from_agent", "has_keyword")
+
+
+def undirected_csr(
+    compact: CompactGraph,
+    edge_types=CENTRALITY_EDGE_TYPES,
+    node_types=CENTRALITY_NODE_TYPES,
+    type_weights: Dict[str, float] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    按节点 / 边类型取子图并转为无向 CSR (去掉自环)，节点重新编号为 0..k-1
+    
+    Args:
+        compact: 紧凑图谱
+        edge_types: 保留的边类型
+        node_types: 保留的节点类型
+        type_weights: 按边类型对边权加权 {边类型: 系数}
+    
+    Returns:
+        (indptr, indices, weights, nodes)，nodes[i] 为子图第 i 个节点在 compact 中的下标
+    """
+    type_codes = [i for i, t in enumerate(compact.node_type_vocab) if t in node_types]
+    nodes = np.flatnonzero(np.isin(compact.node_types, type_codes))
+    remap = np.full(compact.node_count, -1, dtype=np.int64)
+    remap[nodes] = np.arange(len(nodes))
+    
+    sources = remap[np.repeat(np.arange(compact.node_count), np.diff(compact.out_indptr))]
+    targets = remap[compact.out_indices]
+    codes = [compact.edge_type_codes[t] for t in edge_types if t in compact.edge_type_codes]
+    mask = (
+        np.isin(compact.out_types, codes)
+        & (sources >= 0) & (targets >= 0)
+        & (sources != targets)
+    )
+    
+    src, dst, w = sources[mask], targets[mask], compact.out_weights[mask].astype(np.float64)
+    if type_weights:
+        factors = np.ones(len(compact.edge_type_vocab))
+        for edge_type, factor in type_weights.items():
+            if edge_type in compact.edge_type_codes:
+                factors[compact.edge_type_codes[edge_type]] = factor
+        w = w * factors[compact.out_types[mask]]
+    rows = np.concatenate([src, dst])
+    cols = np.concatenate([dst, src])
+    weights = np.concatenate([w, w])
+    
+    n = len(nodes)
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order], weights[order], nodes
+
+
+def pagerank(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    damping: float = 0.85,
+    tol: float = 1e-8,
+    max_iter: int = 100
+) -> Tuple[np.ndarray, int]:
+    """
+    加权 PageRank (幂迭代)
+    
+    Returns:
+        (得分, 迭代次数)，得分之和为 1
+    """
+    n = len(indptr) - 1
+    if n == 0:
+        return np.zeros(0), 0
+    
+    sources = np.repeat(np.arange(n), np.diff(indptr))
+    out_weight = np.bincount(sources, weights=weights, minlength=n)
+    dangling = out_weight == 0
+    # 每条边的转移概率
+    transition = weights / np.where(dangling, 1, out_weight)[sources]
+    
+    rank = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iter + 1):
+        spread = np.bincount(indices, weights=rank[sources] * transition, minlength=n)
+        new_rank = (1 - damping) / n + damping * (spread + rank[dangling].sum() / n)
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < tol:
+            break
+    return rank, iteration
+
+
+def approximate_betweenness(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    samples: int = 64,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    近似介数中心性 (无权)
+    
+    从 samples 个随机源点执行 Brandes 算法，按 n / samples 放大后
+    归一化到 [0, 1] (除以 (n-1)(n-2)/2)。
+    """
+    n = len(indptr) - 1
+    if n < 3:
+        return np.zeros(n)
+    
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(n, size=min(samples, n), replace=False)
+    centrality = np.zeros(n)
+    
+    for source in sources:
+        dist = np.full(n, -1, dtype=np.int64)
+        sigma = np.zeros(n)
+        dist[source] = 0
+        sigma[source] = 1.0
+        
+        frontier = np.array([source], dtype=np.int64)
+        level_edges = []
+        depth = 0
+        while frontier.size:
+            neighbors, parents = expand_frontier(indptr, indices, frontier)
+            undiscovered = dist[neighbors] < 0
+            dist[neighbors[undiscovered]] = depth + 1
+            
+            # 位于最短路径上的边 (u 在当前层, v 在下一层)
+            on_path = dist[neighbors] == depth + 1
+            u, v = parents[on_path], neighbors[on_path]
+            sigma += np.bincount(v, weights=sigma[u], minlength=n)
+            level_edges.append((u, v))
+            
+            frontier = np.flatnonzero(dist == depth + 1)
+            depth += 1
+        
+        delta = np.zeros(n)
+        for u, v in reversed(level_edges):
+            delta += np.bincount(u, weights=sigma[u] / sigma[v] * (1 + delta[v]), minlength=n)
+        delta[source] = 0
+        centrality += delta
+    
+    # 无向图每对节点被计算两次
+    centrality *= n / len(sources) / 2
+    return centrality / ((n - 1) * (n - 2) / 2)
+
+
+class GraphCentrality:
+    """
+    图谱中心性计算器
+    
+    对主图谱做一次快照，计算后整体写入存储。
+    """
+    
+    def __init__(
+        self,
+        damping: float = 0.85,
+        tol: float = 1e-8,
+        max_iter: int = 100,
+        betweenness_samples: int = 64,
+        seed: int = 0
+    ):
+        """
+        初始化计算器
+        
+        Args:
+            damping: PageRank 阻尼系数
+            tol: PageRank 收敛阈值 (L1)
+            max_iter: PageRank 最大迭代次数
+            betweenness_samples: 介数近似的抽样源点数
+            seed: 抽样随机种子
+        """
+        self.damping = damping
+        self.tol = tol
+        self.max_iter = max_iter
+        self.betweenness_samples = betweenness_samples
+        self.seed = seed
+        self.last_report: Dict = {}
+    
+    def compute_compact(self, compact: CompactGraph) -> Dict[str, Dict]:
+        """
+        在紧凑图谱上计算中心性
+        
+        Returns:
+            {节点ID: {"node_type", "pagerank", "degree", "betweenness"}}
+        """
+        started = time.perf_counter()
+        indptr, indices, weights, nodes = undirected_csr(compact)
+        
+        ranks, iterations = pagerank(indptr, indices, weights, self.damping, self.tol, self.max_iter)
+        degrees = np.diff(indptr)
+        betweenness = approximate_betweenness(indptr, indices, self.betweenness_samples, self.seed)
+        # 归一化 PageRank，使平均得分为 1，便于跨规模比较
+        ranks = ranks * len(nodes)
+        
+        scores = {
+            compact.node_ids[node]: {
+                "node_type": compact.node_type_vocab[compact.node_types[node]],
+                "pagerank": float(ranks[i]),
+                "degree": int(degrees[i]),
+                "betweenness": float(betweenness[i])
+            }
+            for i, node in enumerate(nodes)
+        }
+        
+        self.last_report = {
+            "nodes": len(scores),
+            "edges": int(len(indices) // 2),
+            "pagerank_iterations": iterations,
+            "betweenness_samples": min(self.betweenness_samples, len(nodes)),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        return scores
+    
+    def compute(self, graph: KnowledgeGraph) -> Dict[str, Dict]:
+        """在字典形式的图谱上计算中心性"""
+        return self.compute_compact(CompactGraph.from_knowledge_graph(graph, keep_attributes=False))
+    
+    def run(self, manager, storage=None) -> Dict:
+        """
+        计算主图谱的中心性并持久化
+        
+        Args:
+            manager: KnowledgeGraphManager
+            storage: 胶囊存储，默认为 manager.storage
+        
+        Returns:
+            计算报告
+        """
+        storage = storage or manager.storage
+        scores = self.compute_compact(manager.compact_snapshot())
+        computed_at = datetime.now().isoformat()
+        if storage is not None:
+            storage.save_graph_centrality(scores, computed_at)
+        manager.mark_centrality_updated(computed_at, scores)
+        
+        report = {**self.last_report, "computed_at": computed_at}
+        logger.info(
+            f"图谱中心性计算完成: {report['nodes']} 节点, {report['edges']} 边, "
+            f"耗时 {report['duration_ms']}ms"
+        )
+        return report
+
+
+async def run_centrality_loop(
+    centrality: GraphCentrality,
+    manager,
+    interval: float = 3600,
+    initial_delay: float = 30
+):
+    """
+    后台定期重新计算中心性 (在线程中运行，不阻塞事件循环)
+    
+    Args:
+        centrality: 计算器
+        manager: KnowledgeGraphManager
+        interval: 计算间隔 (秒)
+        initial_delay: 服务启动后的首次延迟 (秒)
+    """
+    await asyncio.sleep(initial_delay)
+    last_version = None
+    while True:
+        try:
+            # 主图谱胶囊 / 边没有变化时跳过 (派生数据的写入不改变数据版本)
+            version = manager.version
+            if version != last_version:
+                await asyncio.to_thread(centrality.run, manager)
+                last_version = version
+        except Exception as e:
+            logger.error(f"图谱中心性计算失败: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,215 @@
+"""
+SuiLight Knowledge Salon - 图谱社区发现
+在 胶囊关键词关联 + 胶囊-Agent 图上做标签传播 (Label Propagation)，
+发现跨越分类的知识社区
+
+- 基于 CSR 紧凑图谱的向量化标签传播，每轮一次 int64 键排序 (O(E log E))，10 万胶囊级别数秒完成
+- 半同步更新 (每轮随机更新一部分节点)，避免同步标签传播在二部结构上振荡
+- 结果写入存储的 graph_communities 表；新胶囊由 KnowledgeGraphManager 按邻居投票增量归入社区
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+import logging
+
+import numpy as np
+
+from src.graph import COMMUNITY_AGENT_WEIGHT, KnowledgeGraph
+from src.graph_centrality import undirected_csr
+from src.graph_csr import CompactGraph
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 参与社区发现的节点 / 边类型 (分类节点会把社区直接切成分类，不参与)
+COMMUNITY_NODE_TYPES = ("capsule", "agent")
+COMMUNITY_EDGE_TYPES = ("related", "from_agent")
+
+
+def label_propagation(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    max_iter: int = 20,
+    update_fraction: float = 0.5,
+    tol: float = 1e-3,
+    seed: int = 0
+) -> Tuple[np.ndarray, int]:
+    """
+    加权标签传播
+    
+    每轮对所有 (节点, 邻居标签) 对的边权求和，取权重最大的标签；
+    平局时随机打破，并优先保留节点当前标签。
+    
+    Args:
+        indptr, indices, weights: 无向 CSR
+        max_iter: 最大轮数
+        update_fraction: 每轮实际更新的节点比例
+        tol: 待变化节点比例低于该值时停止
+        seed: 随机种子
+    
+    Returns:
+        (每个节点的标签, 轮数)
+    """
+    n = len(indptr) - 1
+    labels = np.arange(n, dtype=np.int64)
+    if n == 0 or len(indices) == 0:
+        return labels, 0
+    
+    rng = np.random.default_rng(seed)
+    sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        # 按 (节点, 标签) 分组求边权之和: 节点已按 CSR 排序，组合成单个 int64 键排序
+        keys = sources * n + labels[indices]
+        order = np.argsort(keys)
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        group_nodes, group_labels = keys[starts] // n, keys[starts] % n
+        scores = np.add.reduceat(weights[order], starts)
+        
+        # 平局: 当前标签优先，其余随机
+        scores = scores + (group_labels == labels[group_nodes]) * 1e-9 + rng.random(len(scores)) * 1e-12
+        
+        # 每个节点取得分最高的标签 (组已按节点连续排列)
+        node_starts = np.flatnonzero(np.concatenate([[True], group_nodes[1:] != group_nodes[:-1]]))
+        node_best = np.repeat(
+            np.maximum.reduceat(scores, node_starts), np.diff(np.append(node_starts, len(scores)))
+        )
+        first = np.flatnonzero(scores == node_best)
+        first = first[np.concatenate([[True], group_nodes[first][1:] != group_nodes[first][:-1]])]
+        nodes, best = group_nodes[first], group_labels[first]
+        
+        changing = best != labels[nodes]
+        if changing.sum() <= tol * n:
+            break
+        update = changing & (rng.random(len(nodes)) < update_fraction)
+        labels[nodes[update]] = best[update]
+    
+    return labels, iteration
+
+
+class CommunityDetector:
+    """
+    社区发现器
+    
+    对主图谱做一次快照，标签传播后整体写入存储，并替换管理器中的社区缓存。
+    """
+    
+    def __init__(
+        self,
+        agent_weight: float = COMMUNITY_AGENT_WEIGHT,
+        max_iter: int = 20,
+        update_fraction: float = 0.5,
+        seed: int = 0
+    ):
+        """
+        初始化社区发现器
+        
+        Args:
+            agent_weight: 胶囊-Agent 边相对关键词关联边的权重
+            max_iter: 标签传播最大轮数
+            update_fraction: 每轮更新的节点比例
+            seed: 随机种子
+        """
+        self.agent_weight = agent_weight
+        self.max_iter = max_iter
+        self.update_fraction = update_fraction
+        self.seed = seed
+        self.last_report: Dict = {}
+    
+    def compute_compact(self, compact: CompactGraph) -> Dict[str, int]:
+        """
+        在紧凑图谱上划分社区
+        
+        Returns:
+            {节点ID: 社区编号}，社区按胶囊数从大到小编号 (0 为最大社区)
+        """
+        started = time.perf_counter()
+        indptr, indices, weights, nodes = undirected_csr(
+            compact, COMMUNITY_EDGE_TYPES, COMMUNITY_NODE_TYPES,
+            type_weights={"from_agent": self.agent_weight}
+        )
+        labels, iterations = label_propagation(
+            indptr, indices, weights, self.max_iter, self.update_fraction, seed=self.seed
+        )
+        
+        # 按社区内胶囊数重新编号
+        capsule_codes = [i for i, t in enumerate(compact.node_type_vocab) if t == "capsule"]
+        is_capsule = np.isin(compact.node_types[nodes], capsule_codes)
+        unique_labels, inverse = np.unique(labels, return_inverse=True)
+        sizes = np.bincount(inverse, weights=is_capsule, minlength=len(unique_labels))
+        rank = np.empty(len(unique_labels), dtype=np.int64)
+        rank[np.argsort(-sizes, kind="stable")] = np.arange(len(unique_labels))
+        communities = rank[inverse]
+        
+        assignments = {compact.node_ids[node]: int(communities[i]) for i, node in enumerate(nodes)}
+        
+        self.last_report = {
+            "nodes": len(assignments),
+            "edges": int(len(indices) // 2),
+            "communities": int(np.count_nonzero(sizes)),
+            "largest": int(sizes.max()) if len(sizes) else 0,
+            "iterations": iterations,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        return assignments
+    
+    def compute(self, graph: KnowledgeGraph) -> Dict[str, int]:
+        """在字典形式的图谱上划分社区"""
+        return self.compute_compact(CompactGraph.from_knowledge_graph(graph, keep_attributes=False))
+    
+    def run(self, manager, storage=None) -> Dict:
+        """
+        划分主图谱的社区并持久化
+        
+        Args:
+            manager: KnowledgeGraphManager
+            storage: 胶囊存储，默认为 manager.storage
+        
+        Returns:
+            计算报告
+        """
+        storage = storage or manager.storage
+        assignments = self.compute_compact(manager.compact_snapshot())
+        computed_at = datetime.now().isoformat()
+        if storage is not None:
+            storage.save_graph_communities(assignments, computed_at)
+        manager.set_communities(assignments, computed_at)
+        
+        report = {**self.last_report, "computed_at": computed_at}
+        logger.info(
+            f"图谱社区发现完成: {report['nodes']} 节点, {report['communities']} 个社区, "
+            f"{report['iterations']} 轮, 耗时 {report['duration_ms']}ms"
+        )
+        return report
+
+
+async def run_community_loop(
+    detector: CommunityDetector,
+    manager,
+    interval: float = 6 * 3600,
+    initial_delay: float = 60
+):
+    """
+    后台定期重新划分社区 (两次全量之间由管理器增量归入新胶囊)
+    
+    Args:
+        detector: 社区发现器
+        manager: KnowledgeGraphManager
+        interval: 计算间隔 (秒)
+        initial_delay: 服务启动后的首次延迟 (秒)
+    """
+    await asyncio.sleep(initial_delay)
+    last_version = None
+    while True:
+        try:
+            version = manager.version
+            if version != last_version:
+                await asyncio.to_thread(detector.run, manager)
+                last_version = version
+        except Exception as e:
+            logger.error(f"图谱社区发现失败: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,358 @@
+"""
+SuiLight Knowledge Salon - 紧凑图谱 (CSR)
+面向大规模分析的 KnowledgeGraph 替代表示
+
+- 节点 ID 驻留为连续整数，节点 / 边类型字典编码
+- 出边、入边各一份 CSR 邻接数组 (indptr + indices)，边权 float32、边类型 uint8
+- 不为每条边生成 uuid / 对象，单边约 18 字节
+- 与 KnowledgeGraph (字典形式) 双向转换
+
+用法:
+    from src.graph_csr import CompactGraph
+    compact = CompactGraph.from_knowledge_graph(graph)
+    compact.neighbors("capsule_1", edge_type="related")
+    graph = compact.to_knowledge_graph()
+"""
+
+import json
+import os
+from typing import Dict, List, Sequence, Tuple
+import logging
+
+import numpy as np
+
+from src.graph import GraphEdge, GraphNode, KnowledgeGraph
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARRAY_NAMES = [
+    "node_types", "out_indptr", "out_indices", "out_weights", "out_types",
+    "in_indptr", "in_indices", "in_weights", "in_types"
+]
+
+
+def _build_csr(
+    node_count: int,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    weights: np.ndarray,
+    types: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """按 rows 分组构建 CSR (组内保持原始边顺序)"""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=node_count), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32), weights[order], types[order]
+
+
+def expand_frontier(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    frontier: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """向量化地取出 frontier 中所有节点的 CSR 邻居，返回 (邻居, 来源节点)"""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+    return indices[offsets].astype(np.int64), np.repeat(frontier, counts)
+
+
+class CompactGraph:
+    """
+    CSR 紧凑图谱
+    
+    节点按下标 0..n-1 编号，node_ids[i] 为原字符串 ID。
+    出边 CSR: out_indices[out_indptr[i]:out_indptr[i+1]] 为节点 i 的出边目标，
+    入边 CSR 同理 (用于无向邻居查询)。
+    """
+    
+    def __init__(
+        self,
+        node_ids: List[str],
+        node_types: np.ndarray,
+        node_type_vocab: List[str],
+        edge_type_vocab: List[str],
+        out_csr: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        in_csr: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        labels: List[str] = None,
+        properties: List[Dict] = None,
+        name: str = "",
+        description: str = ""
+    ):
+        self.node_ids = node_ids
+        self.node_index: Dict[str, int] = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.node_types = node_types
+        self.node_type_vocab = node_type_vocab
+        self.edge_type_vocab = edge_type_vocab
+        self.edge_type_codes: Dict[str, int] = {t: i for i, t in enumerate(edge_type_vocab)}
+        self.out_indptr, self.out_indices, self.out_weights, self.out_types = out_csr
+        self.in_indptr, self.in_indices, self.in_weights, self.in_types = in_csr
+        self.labels = labels
+        self.properties = properties
+        self.name = name
+        self.description = description
+    
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+    
+    @property
+    def edge_count(self) -> int:
+        return len(self.out_indices)
+    
+    # ============ 构建 ============
+    
+    @classmethod
+    def from_edges(
+        cls,
+        node_ids: Sequence[str],
+        sources: np.ndarray,
+        targets: np.ndarray,
+        edge_types: np.ndarray,
+        edge_type_vocab: List[str],
+        weights: np.ndarray = None,
+        node_types: np.ndarray = None,
+        node_type_vocab: List[str] = None,
+        **kwargs
+    ) -> "CompactGraph":
+        """
+        从整数边数组构建
+        
+        Args:
+            node_ids: 节点字符串 ID (下标即整数 ID)
+            sources / targets: 边的起点 / 终点下标
+            edge_types: 边类型编码 (edge_type_vocab 下标)
+            edge_type_vocab: 边类型词表
+            weights: 边权，默认 1.0
+            node_types / node_type_vocab: 节点类型编码与词表
+        """
+        n = len(node_ids)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        edge_types = np.asarray(edge_types, dtype=np.uint8)
+        if weights is None:
+            weights = np.ones(len(sources), dtype=np.float32)
+        weights = np.asarray(weights, dtype=np.float32)
+        if node_types is None:
+            node_types = np.zeros(n, dtype=np.uint8)
+            node_type_vocab = node_type_vocab or [""]
+        
+        return cls(
+            list(node_ids),
+            np.asarray(node_types, dtype=np.uint8),
+            list(node_type_vocab),
+            list(edge_type_vocab),
+            _build_csr(n, sources, targets, weights, edge_types),
+            _build_csr(n, targets, sources, weights, edge_types),
+            **kwargs
+        )
+    
+    @classmethod
+    def from_knowledge_graph(cls, graph: KnowledgeGraph, keep_attributes: bool = True) -> "CompactGraph":
+        """
+        从字典形式的 KnowledgeGraph 转换 (边 ID 不保留)
+        
+        Args:
+            graph: 知识图谱
+            keep_attributes: 是否保留节点标签与属性 (用于还原)
+        """
+        node_ids = list(graph.nodes)
+        node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        node_type_vocab: List[str] = []
+        node_type_codes: Dict[str, int] = {}
+        
+        def intern_type(vocab: List[str], codes: Dict[str, int], value: str) -> int:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(vocab)
+                vocab.append(value)
+            return code
+        
+        node_types = [intern_type(node_type_vocab, node_type_codes, node.type) for node in graph.nodes.values()]
+        
+        def intern_node(node_id: str) -> int:
+            # 边引用了不存在的节点时补一个无类型节点
+            index = node_index.get(node_id)
+            if index is None:
+                index = node_index[node_id] = len(node_ids)
+                node_ids.append(node_id)
+                node_types.append(intern_type(node_type_vocab, node_type_codes, ""))
+            return index
+        
+        edge_type_vocab: List[str] = []
+        edge_type_codes: Dict[str, int] = {}
+        m = len(graph.edges)
+        sources = np.empty(m, dtype=np.int64)
+        targets = np.empty(m, dtype=np.int64)
+        types = np.empty(m, dtype=np.uint8)
+        weights = np.empty(m, dtype=np.float32)
+        for k, edge in enumerate(graph.edges.values()):
+            sources[k] = intern_node(edge.source)
+            targets[k] = intern_node(edge.target)
+            types[k] = intern_type(edge_type_vocab, edge_type_codes, edge.type)
+            weights[k] = edge.weight
+        
+        labels = properties = None
+        if keep_attributes:
+            labels = [graph.nodes[n].label if n in graph.nodes else n for n in node_ids]
+            properties = [graph.nodes[n].properties if n in graph.nodes else {} for n in node_ids]
+        
+        return cls.from_edges(
+            node_ids, sources, targets, types, edge_type_vocab, weights,
+            np.array(node_types, dtype=np.uint8), node_type_vocab,
+            labels=labels, properties=properties,
+            name=graph.name, description=graph.description
+        )
+    
+    def to_knowledge_graph(self) -> KnowledgeGraph:
+        """还原为字典形式的 KnowledgeGraph (边 ID 重新编号)"""
+        graph = KnowledgeGraph(name=self.name, description=self.description)
+        for i, node_id in enumerate(self.node_ids):
+            graph.add_node(GraphNode(
+                id=node_id,
+                type=self.node_type_vocab[self.node_types[i]],
+                label=self.labels[i] if self.labels is not None else node_id,
+                properties=dict(self.properties[i]) if self.properties is not None else {}
+            ))
+        
+        sources = np.repeat(np.arange(self.node_count), np.diff(self.out_indptr))
+        for k in range(self.edge_count):
+            graph.add_edge(GraphEdge(
+                id=f"e{k}",
+                source=self.node_ids[sources[k]],
+                target=self.node_ids[self.out_indices[k]],
+                type=self.edge_type_vocab[self.out_types[k]],
+                weight=float(self.out_weights[k])
+            ))
+        return graph
+    
+    # ============ 查询 ============
+    
+    def _slice(self, index: int, direction: str, edge_type: str = None) -> Tuple[np.ndarray, np.ndarray]:
+        if direction == "out":
+            indptr, indices, weights, types = self.out_indptr, self.out_indices, self.out_weights, self.out_types
+        else:
+            indptr, indices, weights, types = self.in_indptr, self.in_indices, self.in_weights, self.in_types
+        start, end = indptr[index], indptr[index + 1]
+        targets, w = indices[start:end], weights[start:end]
+        if edge_type is not None:
+            mask = types[start:end] == self.edge_type_codes.get(edge_type, -1)
+            targets, w = targets[mask], w[mask]
+        return targets, w
+    
+    def neighbors(self, node_id: str, edge_type: str = None, direction: str = "both") -> List[str]:
+        """
+        邻居节点 ID
+        
+        Args:
+            node_id: 节点 ID
+            edge_type: 边类型过滤
+            direction: "out" / "in" / "both"
+        """
+        index = self.node_index.get(node_id)
+        if index is None:
+            return []
+        return [self.node_ids[i] for i in self.neighbor_indices(index, edge_type, direction)]
+    
+    def neighbor_indices(self, index: int, edge_type: str = None, direction: str = "both") -> np.ndarray:
+        """邻居节点下标"""
+        parts = []
+        if direction in ("out", "both"):
+            parts.append(self._slice(index, "out", edge_type)[0])
+        if direction in ("in", "both"):
+            targets = self._slice(index, "in", edge_type)[0]
+            # 自环已在出边中出现
+            parts.append(targets[targets != index] if direction == "both" else targets)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+    
+    def degrees(self, edge_type: str = None) -> np.ndarray:
+        """所有节点的度数 (无向，自环计一次，与 KnowledgeGraph.degree 一致)"""
+        sources = np.repeat(np.arange(self.node_count), np.diff(self.out_indptr))
+        targets = self.out_indices
+        if edge_type is not None:
+            mask = self.out_types == self.edge_type_codes.get(edge_type, -1)
+            sources, targets = sources[mask], targets[mask]
+        loops = sources == targets
+        return (np.bincount(sources, minlength=self.node_count)
+                + np.bincount(targets[~loops], minlength=self.node_count))
+    
+    def get_shortest_path(self, start_id: str, end_id: str) -> List[str]:
+        """最短路径 (无向，逐层向量化 BFS)"""
+        start = self.node_index.get(start_id)
+        end = self.node_index.get(end_id)
+        if start is None or end is None:
+            return []
+        
+        parents = np.full(self.node_count, -1, dtype=np.int64)
+        parents[start] = start
+        frontier = np.array([start], dtype=np.int64)
+        while frontier.size and parents[end] < 0:
+            out_nodes, out_from = expand_frontier(self.out_indptr, self.out_indices, frontier)
+            in_nodes, in_from = expand_frontier(self.in_indptr, self.in_indices, frontier)
+            nodes = np.concatenate([out_nodes, in_nodes])
+            sources = np.concatenate([out_from, in_from])
+            
+            fresh = parents[nodes] < 0
+            nodes, first = np.unique(nodes[fresh], return_index=True)
+            parents[nodes] = sources[fresh][first]
+            frontier = nodes
+        
+        if parents[end] < 0:
+            return []
+        path = [end]
+        while path[-1] != start:
+            path.append(int(parents[path[-1]]))
+        return [self.node_ids[i] for i in reversed(path)]
+    
+    # ============ 统计 / 持久化 ============
+    
+    def memory_usage(self) -> Dict[str, int]:
+        """数组占用的字节数 (不含节点 ID / 属性等 Python 对象)"""
+        arrays = sum(getattr(self, name).nbytes for name in ARRAY_NAMES)
+        return {
+            "arrays": int(arrays),
+            "per_edge": round(arrays / max(self.edge_count, 1), 2)
+        }
+    
+    def save(self, out_dir: str):
+        """保存为 .npy 数组 + meta.json"""
+        os.makedirs(out_dir, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(out_dir, f"{name}.npy"), getattr(self, name), allow_pickle=False)
+        meta = {
+            "name": self.name,
+            "description": self.description,
+            "node_ids": self.node_ids,
+            "node_type_vocab": self.node_type_vocab,
+            "edge_type_vocab": self.edge_type_vocab,
+            "labels": self.labels,
+            "properties": self.properties
+        }
+        with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, default=str)
+    
+    @classmethod
+    def load(cls, graph_dir: str, mmap: bool = True) -> "CompactGraph":
+        """加载 (mmap=True 时数组为只读内存映射)"""
+        with open(os.path.join(graph_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(graph_dir, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in ARRAY_NAMES
+        }
+        return cls(
+            meta["node_ids"],
+            arrays["node_types"],
+            meta["node_type_vocab"],
+            meta["edge_type_vocab"],
+            (arrays["out_indptr"], arrays["out_indices"], arrays["out_weights"], arrays["out_types"]),
+            (arrays["in_indptr"], arrays["in_indices"], arrays["in_weights"], arrays["in_types"]),
+            labels=meta["labels"],
+            properties=meta["properties"],
+            name=meta["name"],
+            description=meta["description"]
+        )
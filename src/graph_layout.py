@@ -0,0 +1,320 @@
+"""
+SuiLight Knowledge Salon - 图谱布局
+服务端预计算的力导向布局，前端直接使用坐标渲染，无需在浏览器中模拟
+
+- Fruchterman-Reingold 力导向布局，在边数组上向量化计算
+- 斥力用网格质心近似 (每轮 O(N · 网格数))，引力沿边计算 (每轮 O(E))
+- 全量布局定期计算并写入存储的 graph_layout 表；两次全量之间，新节点放在已布局邻居的
+  质心附近，再只对新节点做少量局部迭代
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import logging
+
+import numpy as np
+
+from src.graph import KnowledgeGraph
+from src.graph_csr import CompactGraph
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 斥力矩阵分块行数 (控制 N x 网格数 临时数组的内存)
+REPULSION_CHUNK = 8192
+
+
+def _grid_field(points: np.ndarray, grid_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    把点按网格分桶，返回非空格子的质心与点数
+    
+    Returns:
+        (质心 [G, 2], 点数 [G])
+    """
+    low = points.min(axis=0)
+    span = np.maximum(points.max(axis=0) - low, 1e-9)
+    cells = np.minimum((points - low) / span * grid_size, grid_size - 1).astype(np.int64)
+    keys = cells[:, 0] * grid_size + cells[:, 1]
+    
+    mass = np.bincount(keys, minlength=grid_size * grid_size)
+    occupied = np.flatnonzero(mass)
+    centroids = np.stack([
+        np.bincount(keys, weights=points[:, 0], minlength=grid_size * grid_size)[occupied],
+        np.bincount(keys, weights=points[:, 1], minlength=grid_size * grid_size)[occupied]
+    ], axis=1) / mass[occupied, None]
+    return centroids, mass[occupied].astype(np.float64)
+
+
+def force_layout(
+    positions: np.ndarray,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    weights: np.ndarray,
+    movable: Optional[np.ndarray] = None,
+    iterations: int = 50,
+    grid_size: int = 16,
+    field: Optional[np.ndarray] = None,
+    temperature: float = 0.1
+) -> np.ndarray:
+    """
+    向量化 Fruchterman-Reingold 布局
+    
+    Args:
+        positions: 初始坐标 [N, 2]
+        sources, targets, weights: 边 (节点下标与权重)
+        movable: 可移动节点的布尔掩码，默认全部可移动
+        iterations: 迭代轮数
+        grid_size: 斥力近似的网格边长 (格子数 grid_size²)
+        field: 产生斥力的点 [M, 2] (局部迭代时传入全部已布局节点)，默认为 positions 本身
+        temperature: 初始最大步长，线性降温到 0
+    
+    Returns:
+        新坐标 [N, 2]
+    """
+    pos = np.array(positions, dtype=np.float64)
+    n = len(pos)
+    if n == 0:
+        return pos
+    movable_idx = np.arange(n) if movable is None else np.flatnonzero(movable)
+    if len(movable_idx) == 0:
+        return pos
+    
+    sources = np.asarray(sources, dtype=np.intp)
+    targets = np.asarray(targets, dtype=np.intp)
+    weights = np.asarray(weights, dtype=np.float64)
+    total = n if field is None else len(field)
+    k = np.sqrt(4.0 / max(total, 1))  # 理想边长: 面积 4 ([-1, 1]²) 平均分给每个节点
+    softening = (k / 10) ** 2
+    
+    for iteration in range(iterations):
+        step = temperature * (1 - iteration / iterations)
+        centroids, mass = _grid_field(pos if field is None else field, grid_size)
+        
+        # 斥力: k² / d，来自各网格质心
+        # Σ_c f_ic (p_i - c) = p_i Σ_c f_ic - f @ C，距离平方同样用矩阵乘法展开
+        disp = np.zeros((n, 2))
+        centroid_norms = (centroids ** 2).sum(axis=1)
+        for start in range(0, len(movable_idx), REPULSION_CHUNK):
+            idx = movable_idx[start:start + REPULSION_CHUNK]
+            points = pos[idx]
+            dist2 = (
+                (points ** 2).sum(axis=1)[:, None] + centroid_norms[None, :] - 2 * points @ centroids.T
+            )
+            np.maximum(dist2, 0, out=dist2)
+            force = mass * (k * k) / (dist2 + softening)
+            disp[idx] = points * force.sum(axis=1)[:, None] - force @ centroids
+        
+        # 引力: d² / k，沿边 (x / y 分列计算，避免 [E, 2] 数组上的按行归约)
+        xs, ys = pos[:, 0].copy(), pos[:, 1].copy()
+        dx = xs[sources] - xs[targets]
+        dy = ys[sources] - ys[targets]
+        pull = weights * np.sqrt(dx * dx + dy * dy) / k
+        dx *= pull
+        dy *= pull
+        for axis, pulled in ((0, dx), (1, dy)):
+            disp[:, axis] += np.bincount(targets, weights=pulled, minlength=n)
+            disp[:, axis] -= np.bincount(sources, weights=pulled, minlength=n)
+        
+        # 步长不超过当前温度
+        moved = disp[movable_idx]
+        length = np.maximum(np.sqrt((moved ** 2).sum(axis=1)), 1e-12)
+        pos[movable_idx] += moved * (np.minimum(length, step) / length)[:, None]
+    
+    return pos
+
+
+def normalize_positions(positions: np.ndarray) -> np.ndarray:
+    """平移缩放到 [-1, 1]² (保持纵横比)"""
+    if len(positions) == 0:
+        return positions
+    center = (positions.max(axis=0) + positions.min(axis=0)) / 2
+    scale = max(float(np.abs(positions - center).max()), 1e-9)
+    return (positions - center) / scale
+
+
+class GraphLayout:
+    """
+    图谱布局引擎
+    
+    全量布局在主图谱的 CSR 快照上计算 (以已有坐标热启动)；
+    增量细化只移动待布局节点，邻居与其余节点保持不动。
+    """
+    
+    def __init__(
+        self,
+        iterations: int = 50,
+        refine_iterations: int = 20,
+        grid_size: int = 16,
+        seed: int = 0
+    ):
+        """
+        初始化布局引擎
+        
+        Args:
+            iterations: 全量布局迭代轮数
+            refine_iterations: 增量细化迭代轮数
+            grid_size: 斥力近似网格边长
+            seed: 初始坐标随机种子
+        """
+        self.iterations = iterations
+        self.refine_iterations = refine_iterations
+        self.grid_size = grid_size
+        self.seed = seed
+        self.last_report: Dict = {}
+    
+    def compute_compact(
+        self,
+        compact: CompactGraph,
+        initial: Optional[Dict[str, Tuple[float, float]]] = None
+    ) -> Dict[str, Tuple[float, float]]:
+        """
+        在紧凑图谱上计算布局
+        
+        Args:
+            compact: 紧凑图谱
+            initial: 已有坐标 (热启动)，缺失的节点随机初始化
+        
+        Returns:
+            {节点ID: (x, y)}，坐标位于 [-1, 1]²
+        """
+        started = time.perf_counter()
+        n = compact.node_count
+        rng = np.random.default_rng(self.seed)
+        positions = rng.uniform(-1, 1, (n, 2))
+        warm = 0
+        if initial:
+            for i, node_id in enumerate(compact.node_ids):
+                position = initial.get(node_id)
+                if position is not None:
+                    positions[i] = position
+                    warm += 1
+        
+        sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(compact.out_indptr))
+        # 热启动时降低初始温度，只做局部调整
+        temperature = 0.1 if warm < n / 2 else 0.02
+        positions = force_layout(
+            positions, sources, compact.out_indices, compact.out_weights,
+            iterations=self.iterations, grid_size=self.grid_size, temperature=temperature
+        )
+        positions = normalize_positions(positions)
+        
+        self.last_report = {
+            "nodes": n,
+            "edges": int(len(sources)),
+            "warm_start": warm,
+            "iterations": self.iterations,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        return {
+            node_id: (float(positions[i, 0]), float(positions[i, 1]))
+            for i, node_id in enumerate(compact.node_ids)
+        }
+    
+    def compute(self, graph: KnowledgeGraph) -> Dict[str, Tuple[float, float]]:
+        """在字典形式的图谱上计算布局"""
+        return self.compute_compact(CompactGraph.from_knowledge_graph(graph, keep_attributes=False))
+    
+    def run(self, manager, storage=None) -> Dict:
+        """
+        全量计算主图谱布局并持久化
+        
+        Args:
+            manager: KnowledgeGraphManager
+            storage: 胶囊存储，默认为 manager.storage
+        
+        Returns:
+            计算报告
+        """
+        storage = storage or manager.storage
+        positions = self.compute_compact(manager.compact_snapshot(), manager.get_layout())
+        computed_at = datetime.now().isoformat()
+        if storage is not None:
+            storage.save_graph_layout(positions, computed_at)
+        manager.set_layout(positions, computed_at)
+        
+        report = {**self.last_report, "computed_at": computed_at}
+        logger.info(
+            f"图谱布局计算完成: {report['nodes']} 节点, {report['edges']} 边, "
+            f"耗时 {report['duration_ms']}ms"
+        )
+        return report
+    
+    def refine(self, manager, limit: int = 10000) -> int:
+        """
+        增量细化待布局节点 (新加入主图谱、只有初始放置坐标的节点)
+        
+        Args:
+            manager: KnowledgeGraphManager
+            limit: 单次最多细化的节点数
+        
+        Returns:
+            细化的节点数
+        """
+        pending, edges, layout = manager.get_layout_batch(limit)
+        if not pending:
+            return 0
+        
+        # 局部子图: 待布局节点 + 其邻居 (邻居固定)
+        local_ids = list(pending)
+        index = {node_id: i for i, node_id in enumerate(local_ids)}
+        for _, other_id, _ in edges:
+            if other_id not in index:
+                index[other_id] = len(local_ids)
+                local_ids.append(other_id)
+        
+        positions = np.array([layout[node_id] for node_id in local_ids], dtype=np.float64)
+        sources = np.array([index[a] for a, _, _ in edges], dtype=np.int64)
+        targets = np.array([index[b] for _, b, _ in edges], dtype=np.int64)
+        weights = np.array([w for _, _, w in edges], dtype=np.float64)
+        movable = np.zeros(len(local_ids), dtype=bool)
+        movable[:len(pending)] = True
+        
+        field = np.array(list(layout.values()), dtype=np.float64)
+        positions = force_layout(
+            positions, sources, targets, weights, movable,
+            iterations=self.refine_iterations, grid_size=self.grid_size,
+            field=field, temperature=0.02
+        )
+        manager.update_layout({
+            node_id: (float(positions[i, 0]), float(positions[i, 1]))
+            for i, node_id in enumerate(pending)
+        })
+        return len(pending)
+
+
+async def run_layout_loop(
+    layout: GraphLayout,
+    manager,
+    interval: float = 6 * 3600,
+    refine_interval: float = 60,
+    initial_delay: float = 90
+):
+    """
+    后台维护主图谱布局: 每 refine_interval 秒细化新节点，每 interval 秒全量重算一次
+    
+    Args:
+        layout: 布局引擎
+        manager: KnowledgeGraphManager
+        interval: 全量布局间隔 (秒)
+        refine_interval: 增量细化间隔 (秒)
+        initial_delay: 服务启动后的首次延迟 (秒)
+    """
+    await asyncio.sleep(initial_delay)
+    last_version = None
+    last_full = None
+    while True:
+        try:
+            now = time.monotonic()
+            version = manager.version
+            if last_full is None or now - last_full >= interval:
+                if version != last_version:
+                    await asyncio.to_thread(layout.run, manager)
+                last_full = now
+            else:
+                await asyncio.to_thread(layout.refine, manager)
+            last_version = version
+        except Exception as e:
+            logger.error(f"图谱布局计算失败: {e}")
+        await asyncio.sleep(refine_interval)
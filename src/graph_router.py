@@ -1,66 +1,215 @@
 """
 SuiLight Knowledge Salon - 知识图谱 API
 FastAPI 路由
+
+所有接口都基于增量维护的主图谱 (graph_manager.main_graph) 返回子视图，
+不再按请求从存储读取胶囊并重建图谱。
+
+导出 / 聚类 / 时间线 / 统计 / 可视化接口的响应按 (接口, 参数, 主图谱版本) 缓存，
+并返回 ETag；客户端带 If-None-Match 且图谱未变化时直接返回 304。
+版本包含主图谱每次加载时随机生成的 epoch，重启或其他进程重复的计数不会误匹配旧 ETag；
+中心性 / 社区 / 布局的写入计数只计入返回它们的接口，后台重算不会让其余接口的缓存失效。
 """
 
-from fastapi import APIRouter, HTTPException, Query
-from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from typing import Callable, Dict, List, Optional, Tuple
 
-from src.graph import graph_manager
+from src.graph import graph_manager, KnowledgeGraphManager
+from src.storage.graph_store import MAX_PATH_DEPTH
+from src.related_capsules import related_index
+from src.capsule_lsh import capsule_lsh
+from src.semantic_index import semantic_index
 
 router = APIRouter(prefix="/api/graph", tags=["知识图谱"])
 
 
+class GraphResponseCache:
+    """
+    图谱响应缓存
+    
+    键为 ETag (由接口、参数、主图谱版本 (epoch, 数据版本) 和接口用到的派生数据版本计算)，
+    主图谱版本变化时整体失效，派生数据的旧条目按 LRU 淘汰。
+    """
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+    
+    @staticmethod
+    def make_etag(endpoint: str, params: Dict, version: Tuple[str, int],
+                  derived: Tuple[int, ...] = ()) -> str:
+        raw = json.dumps([endpoint, params, version, derived], sort_keys=True, ensure_ascii=False)
+        return f'"{hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]}"'
+    
+    def get(self, etag: str, version: Tuple[str, int]) -> Optional[Dict]:
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+            payload = self._entries.get(etag)
+            if payload is not None:
+                self._entries.move_to_end(etag)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return payload
+    
+    def put(self, etag: str, version: Tuple[str, int], payload: Dict):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[etag] = payload
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+    
+    def get_stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified
+        }
+
+
+# 全局实例
+response_cache = GraphResponseCache()
+
+
+def get_graph_manager() -> KnowledgeGraphManager:
+    """获取已绑定胶囊存储的图谱管理器 (应用启动时已绑定，这里兜底)"""
+    if graph_manager.storage is None:
+        from src.main import init_storage
+        graph_manager.attach_storage(init_storage())
+    return graph_manager
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+async def cached_response(
+    request: Request,
+    endpoint: str,
+    params: Dict,
+    compute: Callable[[KnowledgeGraphManager], Dict],
+    derived: Tuple[str, ...] = ()
+) -> Response:
+    """
+    带缓存与 ETag 的响应 (缓存未命中时在线程池中计算，不阻塞事件循环)
+    
+    Args:
+        request: 请求 (读取 If-None-Match)
+        endpoint: 接口名称
+        params: 影响结果的参数
+        compute: 缓存未命中时计算响应内容
+        derived: 响应用到的派生数据 ("centrality" / "communities" / "layout")
+    """
+    manager = get_graph_manager()
+    version = (manager.epoch, manager.version)
+    etag = response_cache.make_etag(
+        endpoint, params, version, tuple(manager.derived_versions[name] for name in derived)
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    if _etag_matches(request, etag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    
+    payload = response_cache.get(etag, version)
+    if payload is None:
+        payload = await asyncio.to_thread(compute, manager)
+        response_cache.put(etag, version, payload)
+    return JSONResponse(payload, headers=headers)
+
+
 @router.get("/export")
-async def export_graph(limit: int = 100) -> Dict:
+async def export_graph(request: Request, limit: int = 100) -> Response:
     """导出图谱 JSON (D3.js 格式)"""
-    # 从存储获取胶囊
-    from src.main import storage
-    capsules = storage.list_capsules(limit=limit)
-    
-    graph_json = graph_manager.export_graph_json(capsules)
+    def compute(manager: KnowledgeGraphManager) -> Dict:
+        graph_json = manager.export_view_json(limit)
+        
+        return {
+            "success": True,
+            "data": graph_json
+        }
     
-    return {
-        "success": True,
-        "data": graph_json
-    }
+    return await cached_response(request, "export", {"limit": limit}, compute, derived=("layout",))
 
 
 @router.get("/clusters")
-async def get_clusters(limit: int = 100) -> Dict:
-    """获取聚类分析"""
-    from src.main import storage
-    capsules = storage.list_capsules(limit=limit)
+async def get_clusters(
+    request: Request,
+    limit: int = 100,
+    method: str = Query("community", pattern="^(community|category)$"),
+    min_size: int = Query(2, ge=1)
+) -> Response:
+    """
+    获取聚类分析
     
-    clusters = graph_manager.get_cluster_analysis(capsules)
+    - method=community: 标签传播社区 (全部胶囊中规模最大的 limit 个社区，含跨学科标记)
+    - method=category: 最新 limit 个胶囊按分类聚类
+    """
+    def compute(manager: KnowledgeGraphManager) -> Dict:
+        if method == "community":
+            clusters = manager.get_community_analysis(limit=limit, min_size=min_size)
+        else:
+            capsules = manager.get_recent_capsules(limit)
+            clusters = manager.get_cluster_analysis(capsules)
+        
+        return {
+            "success": True,
+            "data": clusters
+        }
     
-    return {
-        "success": True,
-        "data": clusters
-    }
+    params = {"limit": limit, "method": method, "min_size": min_size}
+    derived = ("communities",) if method == "community" else ()
+    return await cached_response(request, "clusters", params, compute, derived=derived)
 
 
 @router.get("/timeline")
-async def get_timeline(limit: int = 100) -> Dict:
+async def get_timeline(request: Request, limit: int = 100) -> Response:
     """获取时间线"""
-    from src.main import storage
-    capsules = storage.list_capsules(limit=limit)
-    
-    timeline = graph_manager.get_timeline(capsules)
+    def compute(manager: KnowledgeGraphManager) -> Dict:
+        capsules = manager.get_recent_capsules(limit)
+        
+        timeline = manager.get_timeline(capsules)
+        
+        return {
+            "success": True,
+            "data": timeline
+        }
     
-    return {
-        "success": True,
-        "data": timeline
-    }
+    return await cached_response(request, "timeline", {"limit": limit}, compute)
 
 
 @router.get("/capsules/{capsule_id}/related")
-async def get_related_capsules(capsule_id: str, limit: int = 5) -> Dict:
-    """获取相关胶囊"""
-    from src.main import storage
-    capsules = storage.list_capsules(limit=100)
-    
-    related = graph_manager.get_related_capsules(capsule_id, capsules, limit)
+async def get_related_capsules(capsule_id: str, limit: int = Query(5, ge=1, le=20)) -> Dict:
+    """获取相关胶囊 (预计算的相关胶囊表，未绑定存储时在主图谱上计算)"""
+    if related_index.storage is not None:
+        related = await asyncio.to_thread(related_index.get_related, capsule_id, limit)
+    else:
+        related = await asyncio.to_thread(get_graph_manager().get_related_from_graph, capsule_id, limit)
     
     return {
         "success": True,
@@ -72,44 +221,251 @@ async def get_related_capsules(capsule_id: str, limit: int = 5) -> Dict:
     }
 
 
-@router.get("/statistics")
-async def get_statistics(limit: int = 100) -> Dict:
-    """获取图谱统计"""
-    from src.main import storage
-    capsules = storage.list_capsules(limit=limit)
-    
-    stats = graph_manager.get_statistics(capsules)
-    
+def _similar_response(capsule_id: str, matches: List) -> Dict:
+    """把 (胶囊ID, 估计 Jaccard) 列表展开为胶囊"""
+    capsules = {c["id"]: c for c in capsule_lsh.storage.get_knowledge_capsules_by_ids([i for i, _ in matches])}
+    similar = [
+        {**capsules[other_id], "similarity": similarity}
+        for other_id, similarity in matches if other_id in capsules
+    ]
     return {
         "success": True,
-        "data": stats
+        "data": {
+            "capsule_id": capsule_id,
+            "count": len(similar),
+            "capsules": similar
+        }
     }
 
 
-@router.get("/visualization")
-async def get_visualization_data(limit: int = 50) -> Dict:
-    """获取可视化数据 (前端直接使用)"""
-    from src.main import storage
-    capsules = storage.list_capsules(limit=limit)
-    
-    # 导出图谱
-    graph = graph_manager.export_graph_json(capsules)
-    
-    # 获取聚类
-    clusters = graph_manager.get_cluster_analysis(capsules)
+@router.get("/capsules/{capsule_id}/duplicates")
+async def get_duplicate_capsules(
+    capsule_id: str,
+    threshold: float = Query(0.8, ge=0.1, le=1.0),
+    limit: int = Query(10, ge=1, le=100)
+) -> Dict:
+    """获取近重复胶囊 (MinHash/LSH 索引，估计 Jaccard 不低于 threshold)"""
+    if capsule_lsh.storage is None or capsule_lsh.get_signature(capsule_id) is None:
+        raise HTTPException(status_code=404, detail="胶囊不存在或未建索引")
+    matches = capsule_lsh.near_duplicates(capsule_id, threshold, limit)
+    return await asyncio.to_thread(_similar_response, capsule_id, matches)
+
+
+@router.get("/capsules/{capsule_id}/similar")
+async def get_similar_capsules(capsule_id: str, limit: int = Query(10, ge=1, le=100)) -> Dict:
+    """获取文本相似的候选胶囊 (MinHash/LSH 索引，按估计 Jaccard 降序)"""
+    if capsule_lsh.storage is None or capsule_lsh.get_signature(capsule_id) is None:
+        raise HTTPException(status_code=404, detail="胶囊不存在或未建索引")
+    return await asyncio.to_thread(_similar_response, capsule_id, capsule_lsh.similar(capsule_id, limit))
+
+
+@router.get("/capsules/{capsule_id}/semantic")
+async def get_semantic_similar_capsules(
+    capsule_id: str,
+    k: int = Query(10, ge=1, le=100),
+    nprobe: Optional[int] = Query(None, ge=1, le=4096),
+    exact: bool = False
+) -> Dict:
+    """获取语义相似的胶囊 (向量索引上的余弦 Top-K；nprobe 调节近似索引的召回 / 延迟，exact 强制暴力检索)"""
+    similar = await asyncio.to_thread(
+        semantic_index.similar_capsules, capsule_id=capsule_id, k=k, nprobe=nprobe, exact=exact
+    )
+    if similar is None:
+        raise HTTPException(status_code=404, detail="胶囊不存在或未建索引")
+    return {
+        "success": True,
+        "data": {
+            "capsule_id": capsule_id,
+            "count": len(similar),
+            "capsules": similar
+        }
+    }
+
+
+@router.get("/semantic/stats")
+async def get_semantic_stats() -> Dict:
+    """语义索引统计 (向量数、近似索引、向量缓存命中率)"""
+    return {
+        "success": True,
+        "data": semantic_index.stats()
+    }
+
+
+@router.get("/semantic")
+async def search_semantic(
+    text: str = Query(..., min_length=1),
+    k: int = Query(10, ge=1, le=100),
+    nprobe: Optional[int] = Query(None, ge=1, le=4096),
+    exact: bool = False
+) -> Dict:
+    """按文本检索语义相似的胶囊"""
+    similar = await asyncio.to_thread(
+        semantic_index.similar_capsules, text=text, k=k, nprobe=nprobe, exact=exact
+    )
+    if similar is None:
+        raise HTTPException(status_code=503, detail="语义索引未启用")
+    return {
+        "success": True,
+        "data": {
+            "text": text,
+            "count": len(similar),
+            "capsules": similar
+        }
+    }
+
+
+@router.get("/nodes/{node_id}/neighborhood")
+async def get_node_neighborhood(
+    node_id: str,
+    k: int = Query(2, ge=1, le=4),
+    edge_type: Optional[str] = None,
+    direction: str = Query("both", pattern="^(out|in|both)$"),
+    limit: int = Query(200, ge=1, le=5000)
+) -> Dict:
+    """获取节点的 k 跳邻域 (绑定图谱存储时由 SQLite 递归查询，在线程池中执行)"""
+    manager = get_graph_manager()
+    nodes = await asyncio.to_thread(manager.get_neighborhood, node_id, k, edge_type, direction, limit)
+    if nodes is None:
+        raise HTTPException(status_code=404, detail="节点不存在")
     
-    # 获取时间线
-    timeline = graph_manager.get_timeline(capsules)
+    return {
+        "success": True,
+        "data": {
+            "node_id": node_id,
+            "k": k,
+            "count": len(nodes),
+            "nodes": nodes
+        }
+    }
+
+
+@router.get("/path")
+async def get_path(
+    source: str,
+    target: str,
+    edge_type: Optional[str] = None,
+    max_depth: int = Query(MAX_PATH_DEPTH, ge=1, le=MAX_PATH_DEPTH)
+) -> Dict:
+    """获取两节点间的最短路径 (主图谱上的双向 BFS，在线程池中执行)"""
+    manager = get_graph_manager()
+    path = await asyncio.to_thread(manager.find_path, source, target, edge_type, max_depth)
     
-    # 获取统计
-    stats = graph_manager.get_statistics(capsules)
+    return {
+        "success": True,
+        "data": {
+            "source": source,
+            "target": target,
+            "found": bool(path),
+            "length": max(len(path) - 1, 0),
+            "path": path
+        }
+    }
+
+
+@router.get("/capsules")
+async def list_capsules(
+    category: Optional[str] = None,
+    sort: str = Query("created_at", pattern="^(created_at|quality|pagerank|degree|betweenness)$"),
+    limit: int = 20,
+    offset: int = 0
+) -> Dict:
+    """胶囊列表 (sort 支持按图谱中心性 pagerank / degree / betweenness 排序)"""
+    manager = get_graph_manager()
+    capsules = await asyncio.to_thread(
+        manager.storage.list_knowledge_capsules,
+        category=category, limit=limit, offset=offset, sort=sort
+    )
     
     return {
         "success": True,
         "data": {
-            "graph": graph,
-            "clusters": clusters,
-            "timeline": timeline,
-            "statistics": stats
+            "sort": sort,
+            "count": len(capsules),
+            "capsules": capsules
         }
     }
+
+
+@router.get("/statistics")
+async def get_statistics(request: Request, limit: int = 100, top_n: int = 10) -> Response:
+    """获取图谱统计"""
+    def compute(manager: KnowledgeGraphManager) -> Dict:
+        capsules = manager.get_recent_capsules(limit)
+        
+        stats = manager.get_statistics(capsules)
+        
+        # 图谱中心性 (PageRank / 度数 / 介数) 排名
+        stats["centrality"] = manager.get_centrality_summary(top_n)
+        
+        return {
+            "success": True,
+            "data": stats
+        }
+    
+    return await cached_response(
+        request, "statistics", {"limit": limit, "top_n": top_n}, compute, derived=("centrality",)
+    )
+
+
+@router.get("/visualization")
+async def get_visualization_data(
+    request: Request,
+    limit: int = 50,
+    lod: bool = False,
+    max_nodes: int = Query(300, ge=10, le=5000),
+    max_links: int = Query(1000, ge=0, le=20000),
+    group_by: str = Query("auto", pattern="^(auto|community|category)$"),
+    focus: Optional[str] = None,
+    depth: int = Query(1, ge=0, le=3),
+    expand: Optional[List[str]] = Query(None)
+) -> Response:
+    """
+    获取可视化数据 (前端直接使用)
+    
+    lod=true 时图谱为分级细节视图: 全部胶囊折叠为社区 / 分类超级节点，只展开最重要的胶囊，
+    节点数与边数分别不超过 max_nodes / max_links；前端缩放时用 focus (胶囊邻域) 与
+    expand (超级节点 ID，可多个) 请求局部展开。
+    """
+    if lod and focus and focus not in get_graph_manager().main_graph.nodes:
+        raise HTTPException(status_code=404, detail="节点不存在")
+    
+    def compute(manager: KnowledgeGraphManager) -> Dict:
+        capsules = manager.get_recent_capsules(limit)
+        
+        # 导出图谱
+        if lod:
+            graph = manager.export_lod_json(
+                max_nodes=max_nodes, max_links=max_links, group_by=group_by,
+                focus=focus, depth=depth, expand=expand
+            )
+        else:
+            graph = manager.export_view_json(limit)
+        
+        # 获取聚类
+        clusters = manager.get_cluster_analysis(capsules)
+        
+        # 获取时间线
+        timeline = manager.get_timeline(capsules)
+        
+        # 获取统计
+        stats = manager.get_statistics(capsules)
+        
+        return {
+            "success": True,
+            "data": {
+                "graph": graph,
+                "clusters": clusters,
+                "timeline": timeline,
+                "statistics": stats
+            }
+        }
+    
+    params = {"limit": limit}
+    derived = ("layout",)
+    if lod:
+        params.update({
+            "max_nodes": max_nodes, "max_links": max_links, "group_by": group_by,
+            "focus": focus, "depth": depth, "expand": expand
+        })
+        derived = ("centrality", "communities", "layout")
+    return await cached_response(request, "visualization", params, compute, derived=derived)
@@ -132,6 +132,7 @@ class KnowledgeCapsule:
     source_agents: List[str] = field(default_factory=list)  # 参与的 Agent
     keywords: List[str] = field(default_factory=list)       # 关键词
     category: str = ""                                      # 分类
+    duplicate_of: str = ""                                  # 近重复的已有胶囊 ID (生成时去重)
     
     # 状态
     status: CapsuleStatus = CapsuleStatus.DRAFT
@@ -154,6 +155,7 @@ class KnowledgeCapsule:
             "source_agents": self.source_agents,
             "keywords": self.keywords,
             "category": self.category,
+            "duplicate_of": self.duplicate_of,
             "status": self.status.value,
             "confidence": self.confidence,
             "created_at": self.created_at.isoformat(),
@@ -173,7 +175,14 @@ class CapsuleGenerator:
     从讨论内容中提取和生成知识胶囊
     """
     
-    def __init__(self):
+    def __init__(self, dedup_index=None):
+        """
+        初始化生成器
+        
+        Args:
+            dedup_index: 近重复索引 (CapsuleLSHIndex)，生成时标记与已有胶囊近重复的胶囊
+        """
+        self.dedup_index = dedup_index
         logger.info("胶囊生成器初始化完成")
     
     def generate_from_discussion(
@@ -228,6 +237,13 @@ class CapsuleGenerator:
             capsule.dimensions.total_score
         )
         
+        # 近重复检测
+        if self.dedup_index is not None:
+            duplicates = self.dedup_index.find_duplicates(capsule.to_dict(), limit=1)
+            if duplicates:
+                capsule.duplicate_of = duplicates[0][0]
+                logger.info(f"胶囊 {capsule.id} 与已有胶囊 {capsule.duplicate_of} 近重复 (相似度 {duplicates[0][1]})")
+        
         logger.info(f"生成知识胶囊: {capsule.id}, 质量分数: {capsule.quality_score:.1f}")
         
         return capsule
@@ -765,18 +781,53 @@ class CapsuleRecommender:
     基于内容相似度和用户行为推荐胶囊
     """
     
-    def __init__(self, storage):
+    def __init__(self, storage, semantic_index=None, text_index=None, trending=None, profiles=None):
         self.storage = storage
+        self.semantic_index = semantic_index  # SemanticIndex，语义相似推荐
+        self.text_index = text_index  # CapsuleBM25Index，按兴趣的全文检索推荐
+        self.trending = trending  # CapsuleTrending，按浏览 / 分享 / 投票热度的排行
+        self.profiles = profiles  # UserProfiles，按用户兴趣画像预计算的推荐
         logger.info("推荐器初始化完成")
     
+    def get_semantic_similar(self, capsule_id: str = None, text: str = None, k: int = 5) -> List[Dict]:
+        """
+        获取语义相似的胶囊 (向量索引余弦 Top-K)
+        
+        Args:
+            capsule_id: 以胶囊为查询
+            text: 以文本为查询 (capsule_id 为空时使用)
+            k: 返回数量
+        
+        Returns:
+            胶囊列表，附带 similarity；未配置语义索引或胶囊未建索引时返回空列表
+        """
+        if self.semantic_index is None:
+            return []
+        return self.semantic_index.similar_capsules(capsule_id, text, k) or []
+    
     def get_similar_capsules(self, capsule_id: str, limit: int = 5) -> List[Dict]:
         """获取相似胶囊"""
+        # 预计算的相关胶囊表: 一次主键查询
+        if hasattr(self.storage, "get_related_knowledge_capsules"):
+            related = self.storage.get_related_knowledge_capsules(capsule_id, limit)
+            if related is not None:
+                return related
+        
         capsule = self.storage.get_capsule(capsule_id)
         if not capsule:
             return []
         
-        # 获取所有胶囊
-        all_capsules = self.storage.list_capsules(limit=100)
+        # 候选集: 共享关键词的胶囊 (索引查询) + 同分类胶囊
+        if hasattr(self.storage, "get_capsules_sharing_keywords"):
+            shared = self.storage.get_capsules_sharing_keywords(capsule_id, limit=limit * 4)
+            candidate_ids = [s["capsule_id"] for s in shared]
+            same_category = self.storage.list_capsules(
+                category=capsule.get("category"), limit=limit + 1
+            )
+            candidate_ids.extend(c["id"] for c in same_category if c["id"] not in candidate_ids)
+            all_capsules = self.storage.get_knowledge_capsules_by_ids(candidate_ids)
+        else:
+            all_capsules = self.storage.list_capsules(limit=100)
         
         # 基于关键词和分类计算相似度
         capsule_keywords = set(capsule.get("keywords", []))
@@ -809,16 +860,49 @@ class CapsuleRecommender:
         capsules = self.storage.get_capsules_by_topic(topic_id)
         return capsules[:limit]
     
-    def get_trending(self, limit: int = 10) -> List[Dict]:
-        """获取热门胶囊 (高质量 + 最新)"""
+    def get_trending(self, limit: int = 10, sort: str = "engagement") -> List[Dict]:
+        """
+        获取热门胶囊
+        
+        sort 为 engagement 时按时间衰减的浏览 / 分享 / 投票热度 (无热度数据时按质量)，
+        quality 为高质量 + 最新，pagerank / degree / betweenness 为图谱中心性
+        """
+        if sort == "engagement":
+            trending = []
+            if self.trending is not None and len(self.trending):
+                trending = self.trending.get_trending(limit)
+            if len(trending) >= limit:
+                return trending
+            # 热度数据不足时用高质量胶囊补齐
+            seen = {c["id"] for c in trending}
+            top = self.storage.get_top_capsules(limit=limit + len(seen))
+            return (trending + [c for c in top if c["id"] not in seen])[:limit]
+        if sort != "quality":
+            return self.storage.get_top_capsules(limit=limit, sort=sort)
         return self.storage.get_top_capsules(limit=limit)
     
     def get_recommended_for_user(
         self,
         user_interests: List[str] = None,
-        limit: int = 5
+        limit: int = 5,
+        user_id: str = None
     ) -> List[Dict]:
-        """为用户推荐胶囊 (基于兴趣)"""
+        """为用户推荐胶囊 (有 user_id 且已预计算时按兴趣画像，否则基于兴趣词)"""
+        if user_id and self.profiles is not None:
+            recommended = self.profiles.get_recommendations(user_id, limit=limit)
+            if recommended:
+                return recommended
+        
+        if user_interests and self.text_index is not None and len(self.text_index):
+            # BM25 倒排索引: 兴趣词分词后检索胶囊全文，按相关度排序 (中文按单字 / 二字匹配)
+            recommended = self.text_index.search_capsules(" ".join(user_interests), limit=limit)
+            if recommended:
+                return recommended
+        
+        if user_interests and hasattr(self.storage, "get_capsules_by_keywords"):
+            # 关键词索引查询，覆盖全部胶囊
+            return self.storage.get_capsules_by_keywords(user_interests, limit=limit)
+        
         # 获取高质量胶囊
         capsules = self.storage.get_top_capsules(limit=20)
         
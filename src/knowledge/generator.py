@@ -15,6 +15,7 @@ import logging
 from pathlib import Path
 
 from ..agents.base import Agent, AgentConfig, DATM
+from ..storage.text_index import BM25Index, tokenize
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -353,24 +354,42 @@ class KnowledgeGraph:
     """
     知识图谱
     
-    存储和管理知识的关联关系
+    存储和管理知识的关联关系。
+    传入 store (src.storage.graph_store.GraphStore) 时实体与关系直接写入 SQLite，
+    查询、邻域与路径都在存储中完成，图谱大小不受内存限制；
+    内存模式下实体属性写入 BM25 倒排索引，关键词查询按相关度排序。
     """
     
-    def __init__(self):
+    def __init__(self, store=None, name: str = "knowledge"):
+        self.store = store
+        self.name = name
         self.entities: Dict[str, Dict] = {}  # 实体
         self.relations: List[Dict] = []     # 关系
         self.vectors: Dict[str, List[float]] = {}  # 向量 (简化版)
+        self.text_index = BM25Index()  # 实体属性的全文索引
     
     def add_entity(self, entity_id: str, entity_type: str, properties: Dict):
         """添加实体"""
+        if self.store is not None:
+            self.store.upsert_node(
+                self.name, entity_id, entity_type,
+                label=str(properties.get("name", entity_id)), properties=properties
+            )
+            return
+        
         self.entities[entity_id] = {
             "type": entity_type,
             "properties": properties,
             "created_at": datetime.now().isoformat()
         }
+        self.text_index.add(entity_id, properties)
     
     def add_relation(self, from_id: str, to_id: str, relation_type: str, weight: float = 1.0):
         """添加关系"""
+        if self.store is not None:
+            self.store.upsert_edge(self.name, from_id, to_id, relation_type, weight)
+            return
+        
         self.relations.append({
             "from": from_id,
             "to": to_id,
@@ -381,13 +400,27 @@ class KnowledgeGraph:
     
     def query(self, entity_type: str = None, keyword: str = None) -> List[Dict]:
         """查询"""
+        if self.store is not None:
+            return [
+                {"id": node["id"], "type": node["type"], "properties": node["properties"]}
+                for node in self.store.find_nodes(self.name, entity_type, keyword)
+            ]
+        
+        if keyword and tokenize(keyword):
+            # 倒排索引: 属性包含全部查询词项的实体，按 BM25 相关度排序
+            return [
+                {"id": eid, **self.entities[eid]}
+                for eid, _ in self.text_index.search(keyword, k=None, require_all=True)
+                if not entity_type or self.entities[eid]['type'] == entity_type
+            ]
+        
         results = []
         
         for eid, entity in self.entities.items():
             if entity_type and entity['type'] != entity_type:
                 continue
             
-            # 简单关键词匹配
+            # 无可分词字符的关键词 (如纯符号) 按子串匹配
             if keyword:
                 properties_str = json.dumps(entity.get('properties', {}))
                 if keyword.lower() not in properties_str.lower():
@@ -400,7 +433,102 @@ class KnowledgeGraph:
         
         return results
     
+    def neighborhood(self, entity_id: str, k: int = 2, relation_type: str = None) -> List[Dict]:
+        """
+        k 跳内的相关实体 (不区分关系方向)
+        
+        Returns:
+            [{"id", "depth", "type", "properties"}]，按距离升序
+        """
+        if self.store is not None:
+            return [
+                {"id": node["id"], "depth": node["depth"], "type": node["type"],
+                 "properties": node["properties"]}
+                for node in self.store.k_hop(self.name, entity_id, k, relation_type)
+            ]
+        
+        adjacency = self._adjacency(relation_type)
+        depths = {entity_id: 0}
+        frontier = [entity_id]
+        for depth in range(1, k + 1):
+            next_frontier = []
+            for current in frontier:
+                for n in adjacency.get(current, ()):
+                    if n not in depths:
+                        depths[n] = depth
+                        next_frontier.append(n)
+            frontier = next_frontier
+        
+        results = []
+        for eid, depth in depths.items():
+            if eid == entity_id:
+                continue
+            entity = self.entities.get(eid, {})
+            results.append({
+                "id": eid,
+                "depth": depth,
+                "type": entity.get("type"),
+                "properties": entity.get("properties", {})
+            })
+        return results
+    
+    def find_path(self, from_id: str, to_id: str, relation_type: str = None, max_depth: int = 6) -> List[str]:
+        """
+        两个实体之间的最短关系链 (不区分关系方向)
+        
+        Returns:
+            实体 ID 列表，不可达时为空列表
+        """
+        if self.store is not None:
+            return self.store.shortest_path(self.name, from_id, to_id, relation_type, max_depth=max_depth)
+        
+        adjacency = self._adjacency(relation_type)
+        parents = {from_id: None}
+        frontier = [from_id]
+        for _ in range(max_depth):
+            if to_id in parents:
+                break
+            next_frontier = []
+            for current in frontier:
+                for n in adjacency.get(current, ()):
+                    if n not in parents:
+                        parents[n] = current
+                        next_frontier.append(n)
+            frontier = next_frontier
+        
+        if to_id not in parents:
+            return []
+        path = [to_id]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        return path[::-1]
+    
+    def _adjacency(self, relation_type: str = None) -> Dict[str, List[str]]:
+        """内存模式下的无向邻接表"""
+        adjacency: Dict[str, List[str]] = {}
+        for relation in self.relations:
+            if relation_type and relation["type"] != relation_type:
+                continue
+            adjacency.setdefault(relation["from"], []).append(relation["to"])
+            adjacency.setdefault(relation["to"], []).append(relation["from"])
+        return adjacency
+    
     def to_dict(self) -> Dict:
+        if self.store is not None:
+            counts = self.store.count(self.name)
+            return {
+                "entity_count": counts["nodes"],
+                "relation_count": counts["edges"],
+                "entities": {
+                    node["id"]: {"type": node["type"], "properties": node["properties"]}
+                    for node in self.store.find_nodes(self.name)
+                },
+                "relations": [
+                    {"from": row["source"], "to": row["target"], "type": row["type"], "weight": row["weight"]}
+                    for row in self.store.iter_edges(self.name)
+                ]
+            }
+        
         return {
             "entity_count": len(self.entities),
             "relation_count": len(self.relations),
@@ -1,38 +1,80 @@
-
 """
 SuiLight Knowledge Salon - 主应用入口
 """
 
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-
-# ============ FastAPI 应用 ============
-app = FastAPI(title="SuiLight Knowledge Salon")
-
-# ============ 讨论系统 ============
-from src.discussions import router as discussions_router
-
-app.include_router(discussions_router, prefix="/api")
+import asyncio
 
 
 # ============ 胶囊存储初始化 ============
 from src.storage.capsule_storage import CapsuleStorage
+from src.storage.sharded_storage import ShardedCapsuleStorage
+from src.storage.graph_store import GraphStore
+from src.storage.backup import DEFAULT_DATABASES
+from src.storage.maintenance import DatabaseMaintenance, run_maintenance_loop
+from src.graph import graph_manager
+from src.graph_centrality import GraphCentrality, run_centrality_loop
+from src.graph_community import CommunityDetector, run_community_loop
+from src.graph_layout import GraphLayout, run_layout_loop
+from src.related_capsules import related_index, run_related_loop
+from src.capsule_lsh import capsule_lsh
+from src.capsule_bm25 import capsule_bm25
+from src.capsule_trending import capsule_trending, run_trending_loop
+from src.share import share_manager
+from src.semantic_index import run_ann_loop, semantic_index
+from src.user_profiles import run_profile_loop, user_profiles
 import os
 
 # 创建全局存储实例
 CAPSULE_STORAGE = None
 
+# 是否按分类分片存储胶囊
+SHARDED_STORAGE = os.getenv("SUILIGHT_SHARDED_STORAGE", "").lower() in ("1", "true", "yes")
+
+# 是否把主图谱持久化到 SQLite 图谱存储 (启动时直接加载，邻域 / 路径查询走递归 CTE)
+GRAPH_STORE = os.getenv("SUILIGHT_GRAPH_STORE", "1").lower() in ("1", "true", "yes")
+
+# 定期维护间隔 (秒)，设为 0 关闭
+MAINTENANCE_INTERVAL = float(os.getenv("SUILIGHT_MAINTENANCE_INTERVAL", 6 * 3600))
+
+# 图谱中心性重新计算间隔 (秒)，设为 0 关闭
+CENTRALITY_INTERVAL = float(os.getenv("SUILIGHT_CENTRALITY_INTERVAL", 3600))
+
+# 图谱社区全量重新划分间隔 (秒)，设为 0 关闭 (两次之间新胶囊增量归入社区)
+COMMUNITY_INTERVAL = float(os.getenv("SUILIGHT_COMMUNITY_INTERVAL", 6 * 3600))
+
+# 图谱布局全量重算间隔 (秒)，设为 0 关闭 (两次之间每分钟细化新节点)
+LAYOUT_INTERVAL = float(os.getenv("SUILIGHT_LAYOUT_INTERVAL", 6 * 3600))
+
+# 相关胶囊全量重算间隔 (秒)，设为 0 关闭 (两次之间每分钟增量刷新变更的胶囊)
+RELATED_INTERVAL = float(os.getenv("SUILIGHT_RELATED_INTERVAL", 24 * 3600))
+
+# 是否维护胶囊语义向量索引 (向量模型见 SUILIGHT_EMBEDDING_PROVIDER，默认本地特征哈希向量)
+SEMANTIC_INDEX = os.getenv("SUILIGHT_SEMANTIC_INDEX", "1").lower() in ("1", "true", "yes")
+
+# 语义近似索引 (IVF) 检查 / 重建间隔 (秒)，设为 0 关闭 (始终暴力检索)
+ANN_INTERVAL = float(os.getenv("SUILIGHT_ANN_INTERVAL", 3600))
+
+# 热门胶囊排行持久化间隔 (秒)，设为 0 时只在关闭时写入
+TRENDING_INTERVAL = float(os.getenv("SUILIGHT_TRENDING_INTERVAL", 60))
+
+# 用户推荐增量刷新 / 全量计算间隔 (秒)，设为 0 关闭 (需要语义索引)
+PROFILE_INTERVAL = float(os.getenv("SUILIGHT_PROFILE_INTERVAL", 600))
+PROFILE_FULL_INTERVAL = float(os.getenv("SUILIGHT_PROFILE_FULL_INTERVAL", 24 * 3600))
+
 
 def init_storage():
     """初始化胶囊存储"""
     global CAPSULE_STORAGE
     if CAPSULE_STORAGE is None:
-        db_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),
-            "data",
-            "capsules.db"
-        )
-        CAPSULE_STORAGE = CapsuleStorage(db_path)
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+        if SHARDED_STORAGE:
+            db_path = os.path.join(data_dir, "capsule_shards")
+            CAPSULE_STORAGE = ShardedCapsuleStorage(db_path)
+        else:
+            db_path = os.path.join(data_dir, "capsules.db")
+            CAPSULE_STORAGE = CapsuleStorage(db_path)
         print(f"✅ 胶囊存储初始化完成: {db_path}")
     return CAPSULE_STORAGE
 
@@ -40,9 +82,102 @@ def init_storage():
 # 应用启动时初始化存储
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_storage()
+    storage = init_storage()
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+    
+    # 加载主知识图谱，之后随胶囊写入增量更新
+    graph_store = GraphStore(os.path.join(data_dir, "graph.db")) if GRAPH_STORE else None
+    await asyncio.to_thread(graph_manager.attach_storage, storage, graph_store)
+    related_index.attach_storage(storage)
+    await asyncio.to_thread(capsule_lsh.attach_storage, storage)
+    await asyncio.to_thread(capsule_bm25.attach_storage, storage)
+    if SEMANTIC_INDEX:
+        await asyncio.to_thread(semantic_index.attach_storage, storage, os.path.join(data_dir, "vectors"))
+        user_profiles.attach(storage, semantic_index, os.path.join(data_dir, DEFAULT_DATABASES["user_profiles"]))
+    
+    # 热门胶囊排行 (分享链接的浏览 / 分享计入热度)
+    await asyncio.to_thread(capsule_trending.attach_storage, storage, os.path.join(data_dir, DEFAULT_DATABASES["trending"]))
+    share_manager.add_listener(capsule_trending.record)
+    
+    loops = []
+    
+    # 后台定期维护数据库 (ANALYZE / VACUUM / FTS optimize)
+    if MAINTENANCE_INTERVAL > 0:
+        loops.append(run_maintenance_loop(DatabaseMaintenance(), interval=MAINTENANCE_INTERVAL))
+    
+    # 后台定期计算图谱中心性 (PageRank / 度数 / 介数)
+    if CENTRALITY_INTERVAL > 0:
+        loops.append(run_centrality_loop(GraphCentrality(), graph_manager, interval=CENTRALITY_INTERVAL))
+    
+    # 后台定期划分图谱社区 (标签传播)
+    if COMMUNITY_INTERVAL > 0:
+        loops.append(run_community_loop(CommunityDetector(), graph_manager, interval=COMMUNITY_INTERVAL))
+    
+    # 后台维护图谱布局坐标 (力导向布局)
+    if LAYOUT_INTERVAL > 0:
+        loops.append(run_layout_loop(GraphLayout(), graph_manager, interval=LAYOUT_INTERVAL))
+    
+    # 后台维护预计算的相关胶囊
+    if RELATED_INTERVAL > 0:
+        loops.append(run_related_loop(related_index, interval=RELATED_INTERVAL))
+    
+    # 后台构建语义近似索引 (IVF-flat)
+    if SEMANTIC_INDEX and ANN_INTERVAL > 0:
+        loops.append(run_ann_loop(semantic_index, interval=ANN_INTERVAL))
+    
+    # 后台维护用户兴趣画像与预计算推荐
+    if SEMANTIC_INDEX and PROFILE_INTERVAL > 0:
+        loops.append(
+            run_profile_loop(user_profiles, interval=PROFILE_INTERVAL, full_interval=PROFILE_FULL_INTERVAL)
+        )
+    
+    # 后台定期持久化热门胶囊排行
+    if TRENDING_INTERVAL > 0:
+        loops.append(run_trending_loop(capsule_trending, interval=TRENDING_INTERVAL))
+    
+    tasks = [asyncio.create_task(loop) for loop in loops]
+    
     yield
-    # 应用关闭时清理
+    
+    # 应用关闭时清理: 等待后台任务退出后再写入最终的热度排行
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.to_thread(capsule_trending.save)
+
+
+# ============ FastAPI 应用 ============
+app = FastAPI(title="SuiLight Knowledge Salon", lifespan=lifespan)
+
+# ============ 讨论系统 ============
+from src.discussions import router as discussions_router
+
+app.include_router(discussions_router, prefix="/api")
+
+# ============ 知识图谱 ============
+from src.graph_router import router as graph_router
+
+app.include_router(graph_router)
+
+# ============ 知识分享 ============
+from src.share_router import router as share_router
+
+app.include_router(share_router)
+
+# ============ 搜索 ============
+from src.search_router import router as search_router
+
+app.include_router(search_router)
+
+# ============ 热门胶囊 ============
+from src.trending_router import router as trending_router
+
+app.include_router(trending_router)
+
+# ============ 用户推荐 ============
+from src.user_router import router as user_router
+
+app.include_router(user_router)
 
 
 # ============ 启动 ============
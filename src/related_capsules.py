@@ -0,0 +1,441 @@
+"""
+SuiLight Knowledge Salon - 相关胶囊预计算
+为每个胶囊离线计算 Top-K 相关胶囊并写入存储的 related_capsules 表，
+相关胶囊接口与推荐器只做一次主键查询
+
+- 打分与 KnowledgeGraphManager.get_related_capsules 一致: 分类相同 0.5 + 关键词重叠比例
+- 全量计算: 胶囊 × 关键词稀疏矩阵上按批次做倒排展开，(行, 候选) 组合成 int64 键排序求重叠数，
+  再把 (行, 整数分数, 质量名次) 组合成一个 int64 键排序取每行 Top-K；
+  热门关键词的倒排表按质量截断到 max_posting
+- 增量刷新: 变更的胶囊通过存储的关键词索引计算候选，用堆维护自身与候选胶囊的 Top-K 列表；
+  失去条目 (删除或分数下降) 的列表整体重算
+- 相关胶囊不足时，用 MinHash/LSH 索引找出的文本相似胶囊补足
+"""
+
+import asyncio
+import heapq
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+import numpy as np
+
+from src.graph import MAX_KEYWORD_FANOUT, RELATED_KEYWORD_LIMIT
+from src.capsule_lsh import capsule_lsh
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 每个胶囊保存的相关胶囊数
+RELATED_TOP_K = 20
+
+# 分类相同的加分
+CATEGORY_MATCH_SCORE = 0.5
+
+# 单个关键词参与比较的胶囊上限 (按质量截断热门关键词的倒排表，与主图谱的关联扇出一致)
+MAX_POSTING = MAX_KEYWORD_FANOUT
+
+# 分数的整数刻度: 重叠比例的分母不超过 RELATED_KEYWORD_LIMIT，乘以 1..LIMIT 的最小公倍数后为整数
+SCORE_SCALE = math.lcm(*range(1, RELATED_KEYWORD_LIMIT + 1))
+
+
+def _terms(values) -> List[str]:
+    """关键词去重 / 去空白 (与存储的 capsule_keywords 规范化一致)，取前 RELATED_KEYWORD_LIMIT 个"""
+    if not isinstance(values, (list, tuple)):
+        return []
+    terms = dict.fromkeys(str(v).strip() for v in values if v is not None)
+    terms.pop("", None)
+    return list(terms)[:RELATED_KEYWORD_LIMIT]
+
+
+def related_score(kw1: Set[str], category1: Optional[str], kw2: Set[str], category2: Optional[str]) -> float:
+    """两个胶囊的相关度: 分类相同 0.5 + 关键词重叠数 / 较大的关键词数"""
+    score = CATEGORY_MATCH_SCORE if category1 and category1 == category2 else 0.0
+    if kw1 or kw2:
+        score += len(kw1 & kw2) / max(len(kw1), len(kw2))
+    return score
+
+
+def _gather(indptr: np.ndarray, indices: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    拼接 CSR 中若干行的内容
+    
+    Returns:
+        (每个元素所属的 rows 下标, 元素)
+    """
+    lengths = indptr[rows + 1] - indptr[rows]
+    total = int(lengths.sum())
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.repeat(indptr[rows] - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+    return owner, indices[offsets]
+
+
+def _truncated_csr(groups: np.ndarray, members: np.ndarray, rank: np.ndarray, n_groups: int,
+                   limit: int) -> Tuple[np.ndarray, np.ndarray]:
+    """按 rank 升序为每组保留前 limit 个成员，返回 CSR (indptr, indices)"""
+    order = np.lexsort((rank[members], groups))
+    groups, members = groups[order], members[order]
+    starts = np.concatenate([[0], np.cumsum(np.bincount(groups, minlength=n_groups))])
+    keep = np.arange(len(groups)) - starts[groups] < limit
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(groups[keep], minlength=n_groups))])
+    return indptr, members[keep]
+
+
+def compute_related(
+    capsules: Iterable[Dict],
+    top_k: int = RELATED_TOP_K,
+    max_posting: int = MAX_POSTING,
+    batch_size: int = 1000
+) -> Dict[str, List[Tuple[str, float]]]:
+    """
+    批量计算所有胶囊的 Top-K 相关胶囊
+    
+    Args:
+        capsules: 胶囊 (需要 id / category / keywords / quality_score)
+        top_k: 每个胶囊保留的相关胶囊数
+        max_posting: 单个关键词参与比较的胶囊上限
+        batch_size: 每批展开的胶囊数 (控制临时数组大小)
+    
+    Returns:
+        {胶囊ID: [(相关胶囊ID, 分数), ...]}，按分数 (同分按质量) 降序
+    """
+    ids: List[str] = []
+    categories: Dict[str, int] = {}
+    category_codes: List[int] = []
+    quality: List[float] = []
+    vocab: Dict[str, int] = {}
+    kw_indptr = [0]
+    kw_indices: List[int] = []
+    for capsule in capsules:
+        ids.append(capsule["id"])
+        category = capsule.get("category")
+        category_codes.append(categories.setdefault(category, len(categories)) if category else -1)
+        quality.append(capsule.get("quality_score") or 0)
+        kw_indices.extend(vocab.setdefault(kw, len(vocab)) for kw in _terms(capsule.get("keywords")))
+        kw_indptr.append(len(kw_indices))
+    
+    n = len(ids)
+    if n == 0:
+        return {}
+    cat = np.array(category_codes, dtype=np.int64)
+    qual = np.array(quality, dtype=np.float64)
+    kw_indptr = np.array(kw_indptr, dtype=np.int64)
+    kw_indices = np.array(kw_indices, dtype=np.int64)
+    kw_len = np.diff(kw_indptr)
+    
+    # 质量名次 (0 为最高)，倒排表与分类候选都按它截断
+    quality_rank = np.empty(n, dtype=np.int64)
+    quality_rank[np.lexsort((np.arange(n), -qual))] = np.arange(n)
+    
+    # 关键词倒排表
+    owners = np.repeat(np.arange(n, dtype=np.int64), kw_len)
+    post_indptr, post_indices = _truncated_csr(kw_indices, owners, quality_rank, len(vocab), max_posting)
+    
+    # 每个分类质量最高的 top_k + 1 个胶囊 (只有分类相同、无关键词重叠的候选分数都是 0.5)
+    has_category = np.flatnonzero(cat >= 0)
+    cat_indptr, cat_indices = _truncated_csr(
+        cat[has_category], has_category, quality_rank, len(categories), top_k + 1
+    )
+    
+    related: Dict[str, List[Tuple[str, float]]] = {}
+    for start in range(0, n, batch_size):
+        rows = np.arange(start, min(start + batch_size, n), dtype=np.int64)
+        
+        # 关键词展开: 行的每个关键词 -> 倒排表中的胶囊，每次命中计重叠数 1
+        kw_owner, kws = _gather(kw_indptr, kw_indices, rows)
+        hit_owner, hits = _gather(post_indptr, post_indices, kws)
+        hit_rows = rows[kw_owner[hit_owner]]
+        
+        # 同分类候选，重叠数 0
+        with_category = rows[cat[rows] >= 0]
+        fill_owner, fills = _gather(cat_indptr, cat_indices, cat[with_category])
+        fill_rows = with_category[fill_owner]
+        
+        # 按 (行, 候选) 分组求重叠数
+        keys = np.concatenate([hit_rows * n + hits, fill_rows * n + fills])
+        counts = np.concatenate([np.ones(len(hits)), np.zeros(len(fills))])
+        order = np.argsort(keys)
+        keys = keys[order]
+        if len(keys) == 0:
+            continue
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        overlap = np.add.reduceat(counts[order], starts).astype(np.int64)
+        pair_rows, pair_cands = keys[starts] // n, keys[starts] % n
+        
+        valid = pair_rows != pair_cands
+        pair_rows, pair_cands, overlap = pair_rows[valid], pair_cands[valid], overlap[valid]
+        score = overlap * SCORE_SCALE // np.maximum(np.maximum(kw_len[pair_rows], kw_len[pair_cands]), 1)
+        score += int(CATEGORY_MATCH_SCORE * SCORE_SCALE) * (
+            (cat[pair_rows] == cat[pair_cands]) & (cat[pair_rows] >= 0)
+        )
+        
+        # 每行按分数、质量降序取前 top_k: (行, 分数倒序, 质量名次) 组合为一个 int64 键
+        max_score = int((1 + CATEGORY_MATCH_SCORE) * SCORE_SCALE)
+        order = np.argsort(((pair_rows - start) * (max_score + 1) + (max_score - score)) * n + quality_rank[pair_cands])
+        pair_rows, pair_cands, score = pair_rows[order], pair_cands[order], score[order]
+        row_starts = np.searchsorted(pair_rows, pair_rows, side="left")
+        keep = (np.arange(len(pair_rows)) - row_starts < top_k) & (score > 0)
+        values = score[keep] / SCORE_SCALE
+        for row, cand, value in zip(pair_rows[keep].tolist(), pair_cands[keep].tolist(), values.tolist()):
+            related.setdefault(ids[row], []).append((ids[cand], value))
+    
+    return related
+
+
+class RelatedCapsuleIndex:
+    """
+    相关胶囊索引
+    
+    全量结果由后台任务定期计算；两次全量之间，存储的变更监听把新增 / 修改的胶囊标记为待刷新，
+    后台任务或首次查询时增量刷新。
+    """
+    
+    def __init__(self, storage=None, top_k: int = RELATED_TOP_K, max_posting: int = MAX_POSTING,
+                 batch_size: int = 1000, similarity_index=None):
+        """
+        初始化相关胶囊索引
+        
+        Args:
+            storage: 胶囊存储
+            top_k: 每个胶囊保存的相关胶囊数
+            max_posting: 单个关键词参与比较的胶囊上限
+            batch_size: 全量计算每批展开的胶囊数
+            similarity_index: 文本相似度索引 (CapsuleLSHIndex)，相关胶囊不足时用文本相似的胶囊补足
+        """
+        self.storage = storage
+        self.top_k = top_k
+        self.max_posting = max_posting
+        self.batch_size = batch_size
+        self.similarity_index = similarity_index
+        self._dirty: Dict[str, None] = {}  # 待刷新的胶囊 (保持插入顺序)
+        self._lock = threading.Lock()
+        self.last_report: Dict = {}
+    
+    def attach_storage(self, storage):
+        """绑定胶囊存储并监听胶囊变更"""
+        if self.storage is not None and hasattr(self.storage, "remove_listener"):
+            self.storage.remove_listener(self.on_capsule_event)
+        self.storage = storage
+        storage.add_listener(self.on_capsule_event)
+    
+    def on_capsule_event(self, event: str, capsule_id: str, capsule: Optional[Dict] = None):
+        """
+        存储变更监听器: 新增 / 修改 / 删除都标记为待刷新
+        
+        已删除的胶囊在读取时自然被过滤 (按 ID 批量取胶囊时忽略)，刷新时再重算引用它的列表。
+        """
+        with self._lock:
+            self._dirty[capsule_id] = None
+    
+    # ============ 全量计算 ============
+    
+    def run(self, storage=None) -> Dict:
+        """
+        全量计算并整体替换 related_capsules 表
+        
+        Returns:
+            计算报告
+        """
+        storage = storage or self.storage
+        started = time.perf_counter()
+        with self._lock:
+            self._dirty.clear()  # 计算期间的变更仍会重新标记
+        
+        related = compute_related(
+            storage.iter_knowledge_capsules(), self.top_k, self.max_posting, self.batch_size
+        )
+        computed_at = datetime.now().isoformat()
+        rows = storage.save_related_capsules(related, computed_at, replace=True)
+        
+        self.last_report = {
+            "capsules": len(related),
+            "rows": rows,
+            "computed_at": computed_at,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        logger.info(
+            f"相关胶囊计算完成: {len(related)} 个胶囊, {rows} 行, 耗时 {self.last_report['duration_ms']}ms"
+        )
+        return self.last_report
+    
+    # ============ 增量刷新 ============
+    
+    def _score_candidates(self, capsule: Dict) -> Dict[str, Tuple[float, float]]:
+        """通过关键词索引与同分类高质量胶囊计算候选分数: {胶囊ID: (分数, 质量)}"""
+        storage = self.storage
+        capsule_id = capsule["id"]
+        category = capsule.get("category")
+        
+        shared = storage.get_capsules_sharing_keywords(
+            capsule_id, limit=self.max_posting, max_position=RELATED_KEYWORD_LIMIT
+        )
+        candidates = {
+            c["id"]: c for c in storage.get_knowledge_capsules_by_ids([s["capsule_id"] for s in shared])
+        }
+        if category:
+            for c in storage.list_knowledge_capsules(category=category, limit=self.top_k + 1, sort="quality"):
+                candidates.setdefault(c["id"], c)
+        candidates.pop(capsule_id, None)
+        
+        kw1 = set(_terms(capsule.get("keywords")))
+        scored = {}
+        for other_id, other in candidates.items():
+            score = related_score(kw1, category, set(_terms(other.get("keywords"))), other.get("category"))
+            if score > 0:
+                scored[other_id] = (score, other.get("quality_score") or 0)
+        return scored
+    
+    def _top_k(self, scored: Dict[str, Tuple[float, float]]) -> List[Tuple[str, float]]:
+        """候选中按分数 (同分按质量) 取前 top_k"""
+        return [
+            (other_id, score)
+            for other_id, (score, _) in heapq.nlargest(self.top_k, scored.items(), key=lambda x: x[1])
+        ]
+    
+    def refresh_capsules(self, capsule_ids: List[str]) -> int:
+        """
+        增量刷新指定胶囊的相关列表，并同步候选胶囊的列表
+        
+        - 该胶囊的新分数进入候选胶囊的 Top-K 时用堆插入 (只更新已有列表的胶囊，
+          没有列表的胶囊在首次查询或下次全量时完整计算)
+        - 列表中该胶囊被删除或分数下降的胶囊，空位无法从列表本身补齐，整体重算
+        
+        Returns:
+            更新的列表数
+        """
+        storage = self.storage
+        capsules = {c["id"]: c for c in storage.get_knowledge_capsules_by_ids(list(capsule_ids))}
+        updates: Dict[str, List[Tuple[str, float]]] = {}
+        stale: Set[str] = set()
+        
+        for capsule_id in capsule_ids:
+            capsule = capsules.get(capsule_id)
+            referrers = storage.get_related_referrers(capsule_id)
+            if capsule is None:
+                storage.delete_related_capsules(capsule_id)
+                stale.update(referrers)
+                continue
+            
+            scored = self._score_candidates(capsule)
+            updates[capsule_id] = self._top_k(scored)
+            
+            # 反向更新: 候选胶囊及原先引用它的胶囊
+            affected = (set(scored) | set(referrers)) - {capsule_id}
+            lists = storage.get_related_capsule_ids([a for a in affected if a not in updates])
+            for other_id in affected:
+                current = updates.get(other_id, lists.get(other_id))
+                if current is None:
+                    continue
+                old = dict(current).get(capsule_id)
+                new = scored[other_id][0] if other_id in scored else None
+                if old is not None and (new is None or new < old):
+                    stale.add(other_id)
+                    continue
+                if new is not None and (len(current) < self.top_k or new > current[-1][1]):
+                    kept = [item for item in current if item[0] != capsule_id]
+                    updates[other_id] = heapq.nlargest(self.top_k, kept + [(capsule_id, new)], key=lambda x: x[1])
+        
+        stale -= set(capsule_ids)
+        for capsule in storage.get_knowledge_capsules_by_ids(list(stale)):
+            updates[capsule["id"]] = self._top_k(self._score_candidates(capsule))
+        
+        if updates:
+            storage.save_related_capsules(updates)
+        return len(updates)
+    
+    def refresh(self, limit: int = 1000) -> int:
+        """
+        刷新待刷新的胶囊
+        
+        Args:
+            limit: 单次最多刷新的胶囊数
+        
+        Returns:
+            刷新的胶囊数
+        """
+        with self._lock:
+            capsule_ids = list(self._dirty)[:limit]
+            for capsule_id in capsule_ids:
+                del self._dirty[capsule_id]
+        if capsule_ids:
+            self.refresh_capsules(capsule_ids)
+        return len(capsule_ids)
+    
+    # ============ 查询 ============
+    
+    def get_related(self, capsule_id: str, limit: int = 5) -> List[Dict]:
+        """
+        获取相关胶囊 (一次主键查询；待刷新或尚无结果的胶囊先增量计算)
+        
+        关键词 / 分类相关的胶囊不足 limit 个时，用文本相似 (MinHash 估计 Jaccard) 的胶囊补足，
+        补足的胶囊 related_score 为 0，附带 similarity。
+        
+        Args:
+            capsule_id: 胶囊 ID
+            limit: 返回数量 (最多 top_k)
+        
+        Returns:
+            胶囊列表，附带 related_score
+        """
+        with self._lock:
+            dirty = capsule_id in self._dirty
+            self._dirty.pop(capsule_id, None)
+        related = None if dirty else self.storage.get_related_knowledge_capsules(capsule_id, limit)
+        if related is None:
+            self.refresh_capsules([capsule_id])
+            related = self.storage.get_related_knowledge_capsules(capsule_id, limit) or []
+        if len(related) < limit and self.similarity_index is not None:
+            related.extend(self._similar_fill(capsule_id, limit - len(related), {c["id"] for c in related}))
+        return related
+    
+    def _similar_fill(self, capsule_id: str, count: int, seen: set) -> List[Dict]:
+        """文本相似的胶囊 (排除已有结果)"""
+        similar = [
+            (other_id, similarity)
+            for other_id, similarity in self.similarity_index.similar(capsule_id, count + len(seen))
+            if other_id not in seen
+        ][:count]
+        capsules = {c["id"]: c for c in self.storage.get_knowledge_capsules_by_ids([i for i, _ in similar])}
+        return [
+            {**capsules[other_id], "related_score": 0.0, "similarity": similarity}
+            for other_id, similarity in similar if other_id in capsules
+        ]
+
+
+async def run_related_loop(
+    index: RelatedCapsuleIndex,
+    interval: float = 24 * 3600,
+    refresh_interval: float = 60,
+    initial_delay: float = 120
+):
+    """
+    后台维护相关胶囊: 每 refresh_interval 秒增量刷新变更的胶囊，每 interval 秒全量重算一次
+    
+    Args:
+        index: 相关胶囊索引
+        interval: 全量计算间隔 (秒)
+        refresh_interval: 增量刷新间隔 (秒)
+        initial_delay: 服务启动后的首次延迟 (秒)
+    """
+    await asyncio.sleep(initial_delay)
+    # 已有结果时不在启动时立即全量计算
+    computed = await asyncio.to_thread(index.storage.count_related_capsules)
+    last_full = time.monotonic() if computed else None
+    while True:
+        try:
+            now = time.monotonic()
+            if last_full is None or now - last_full >= interval:
+                await asyncio.to_thread(index.run)
+                last_full = now
+            else:
+                await asyncio.to_thread(index.refresh)
+        except Exception as e:
+            logger.error(f"相关胶囊计算失败: {e}")
+        await asyncio.sleep(refresh_interval)
+
+
+# 全局实例
+related_index = RelatedCapsuleIndex(similarity_index=capsule_lsh)
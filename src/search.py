@@ -0,0 +1,375 @@
+"""
+SuiLight Knowledge Salon - 统一搜索
+一次请求同时检索胶囊、对话、Agent 与讨论主题，返回统一排序、分页的结果与各阶段耗时
+
+- 胶囊: BM25 倒排索引 (capsule_bm25) 与语义向量索引 (semantic_index) 并行检索，
+  语义检索只保留余弦相似度不低于阈值的胶囊
+- 对话 / 讨论主题: SQLite 中按查询词项 LIKE 取最近的候选，在候选集上计算 BM25 排序
+- Agent: 预设 Agent 的 BM25 索引 (首次检索时构建)
+- 融合: 各来源的排名列表做倒数排名融合 (RRF: Σ 1 / (60 + 排名))，
+  同时被 BM25 与语义检索命中的胶囊排名更靠前
+- 重排 (可选): 融合结果中前 N 个胶囊按融合得分、质量分与 PageRank 重新排序，
+  重排只在胶囊占据的位置之间调整顺序 (每个胶囊保留自己的融合得分)
+"""
+
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+from src.capsule_bm25 import capsule_bm25
+from src.semantic_index import semantic_index
+from src.storage.backup import DATA_DIR, DEFAULT_DATABASES
+from src.storage.text_index import BM25Index, tokenize
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 结果类型
+SEARCH_TYPES = ("capsule", "chat", "agent", "discussion")
+
+# RRF 常数
+RRF_K = 60
+
+# 每个来源取的候选数 (至少覆盖到请求的页)
+CANDIDATES = 100
+MAX_CANDIDATES = 1000
+
+# 语义检索结果的最小余弦相似度 (低于该值视为不相关，不参与融合)
+SEMANTIC_MIN_SIMILARITY = 0.2
+
+# 重排的胶囊数与质量分 / PageRank 所占权重
+RERANK_TOP_N = 50
+RERANK_WEIGHT = 0.3
+
+# SQL LIKE 取候选时使用的词项数
+LIKE_TERMS = 8
+
+
+def reciprocal_rank_fusion(rankings: List[List[Any]], k: int = RRF_K) -> List[Tuple[Any, float]]:
+    """
+    倒数排名融合
+    
+    Args:
+        rankings: 多个排名列表 (元素按相关度降序)
+        k: RRF 常数
+    
+    Returns:
+        [(元素, 融合得分)]，按得分降序 (同分保持首次出现的顺序)
+    """
+    scores: Dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: -x[1])
+
+
+def like_terms(query: str) -> List[str]:
+    """SQL LIKE 候选词: 英文单词与中文二字词 (查询只有单字时使用单字)"""
+    tokens = tokenize(query)
+    terms = [t for t in tokens if len(t) > 1] or tokens
+    return list(dict.fromkeys(terms))[:LIKE_TERMS]
+
+
+def rank_candidates(query: str, candidates: List[Tuple[str, Dict]], limit: int) -> List[str]:
+    """在候选集上计算 BM25 (文档频率取自候选集)，返回排序后的 ID"""
+    index = BM25Index()
+    index.add_many(candidates)
+    return [doc_id for doc_id, _ in index.search(query, k=limit)]
+
+
+class SearchService:
+    """
+    统一搜索服务
+    
+    各来源在线程池中并行检索；某个来源失败或未启用时跳过，不影响其他来源。
+    """
+    
+    def __init__(
+        self,
+        text_index=None,
+        semantic_index=None,
+        chat_db: str = None,
+        topic_db: str = None,
+        max_workers: int = 6,
+        min_similarity: float = SEMANTIC_MIN_SIMILARITY
+    ):
+        """
+        初始化
+        
+        Args:
+            text_index: CapsuleBM25Index
+            semantic_index: SemanticIndex
+            chat_db: 对话历史数据库，默认为 data/suilight.db
+            topic_db: 讨论主题数据库，默认为 TopicStorage 的数据库
+            max_workers: 并行检索的线程数
+            min_similarity: 语义检索结果的最小余弦相似度
+        """
+        if topic_db is None:
+            from src.discussions.topic_manager import topic_storage
+            topic_db = str(topic_storage.db_path)
+        
+        self.text_index = text_index
+        self.semantic_index = semantic_index
+        self.chat_db = chat_db or os.path.join(DATA_DIR, DEFAULT_DATABASES["suilight"])
+        self.topic_db = topic_db
+        self.min_similarity = min_similarity
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._agent_index: Optional[BM25Index] = None
+        self._agents: Dict[str, Dict] = {}
+    
+    @property
+    def storage(self):
+        """胶囊存储 (取自已绑定存储的索引)"""
+        for index in (self.text_index, self.semantic_index):
+            if index is not None and getattr(index, "storage", None) is not None:
+                return index.storage
+        return None
+    
+    # ============ 各来源检索 ============
+    
+    def _search_lexical(self, query: str, limit: int) -> List[str]:
+        if self.text_index is None or not len(self.text_index):
+            return []
+        return [capsule_id for capsule_id, _ in self.text_index.search(query, k=limit)]
+    
+    def _search_semantic(self, query: str, limit: int, nprobe: Optional[int]) -> List[str]:
+        if self.semantic_index is None:
+            return []
+        matches = self.semantic_index.get_semantic_similar(text=query, k=limit, nprobe=nprobe)
+        return [capsule_id for capsule_id, similarity in matches or [] if similarity >= self.min_similarity]
+    
+    def _like_candidates(self, db_path: str, sql: str, columns: List[str], query: str, limit: int) -> List[tuple]:
+        """按 LIKE 词项取候选行 (任一词项命中任一列)"""
+        terms = like_terms(query)
+        if not terms or not os.path.exists(db_path):
+            return []
+        conditions = " OR ".join(f"{column} LIKE ?" for column in columns for _ in terms)
+        params = [f"%{term}%" for _ in columns for term in terms]
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute(sql.format(conditions=conditions), params + [limit]).fetchall()
+        except sqlite3.OperationalError as e:
+            # 数据库存在但尚未建表
+            logger.warning(f"候选查询失败 ({db_path}): {e}")
+            return []
+        finally:
+            conn.close()
+    
+    def _search_chats(self, query: str, limit: int) -> Tuple[List[str], Dict[str, Dict]]:
+        rows = self._like_candidates(
+            self.chat_db,
+            """
+            SELECT id, agent_id, agent_name, user_message, bot_response, timestamp FROM chat_history
+            WHERE {conditions}
+            ORDER BY timestamp DESC
+            LIMIT ?
+            """,
+            ["user_message", "bot_response"], query, limit * 2
+        )
+        chats = {
+            row[0]: {"id": row[0], "agent_id": row[1], "agent_name": row[2],
+                     "user_message": row[3], "bot_response": row[4], "timestamp": row[5]}
+            for row in rows
+        }
+        ranked = rank_candidates(query, [
+            (chat_id, {"user_message": c["user_message"], "bot_response": c["bot_response"]})
+            for chat_id, c in chats.items()
+        ], limit)
+        return ranked, chats
+    
+    def _search_discussions(self, query: str, limit: int) -> Tuple[List[str], Dict[str, Dict]]:
+        rows = self._like_candidates(
+            self.topic_db,
+            "SELECT id, data FROM topics WHERE {conditions} ORDER BY updated_at DESC LIMIT ?",
+            ["data"], query, limit * 2
+        )
+        topics = {}
+        for topic_id, data in rows:
+            try:
+                topic = json.loads(data)
+            except (TypeError, ValueError):
+                continue
+            topics[topic_id] = {
+                "id": topic_id,
+                "title": topic.get("title", ""),
+                "description": topic.get("description", ""),
+                "tags": topic.get("tags", []),
+                "topic_type": topic.get("topic_type"),
+                "status": topic.get("status"),
+                "created_at": topic.get("created_at")
+            }
+        ranked = rank_candidates(query, [
+            (topic_id, {"title": t["title"], "description": t["description"], "tags": t["tags"]})
+            for topic_id, t in topics.items()
+        ], limit)
+        return ranked, topics
+    
+    def _search_agents(self, query: str, limit: int) -> Tuple[List[str], Dict[str, Dict]]:
+        if self._agent_index is None:
+            from src.agents.presets import GREAT_MINDS
+            
+            index = BM25Index({"name": 3.0, "domain": 2.0, "expertise": 2.0, "description": 1.0})
+            agents = {
+                name: {"name": name, "domain": info["domain"], "description": info["description"],
+                       "expertise": info["expertise"]}
+                for name, info in GREAT_MINDS.items()
+            }
+            index.add_many(agents.items())
+            self._agents, self._agent_index = agents, index
+        ranked = [name for name, _ in self._agent_index.search(query, k=limit)]
+        return ranked, self._agents
+    
+    # ============ 重排 ============
+    
+    def _rerank(self, fused: List[Tuple[Tuple[str, str], float]], capsules: Dict[str, Dict]) -> Dict[str, float]:
+        """
+        重排融合结果中的前 RERANK_TOP_N 个胶囊 (原地调整胶囊之间的顺序，融合得分随胶囊移动)
+        
+        Returns:
+            {胶囊ID: 重排得分}
+        """
+        slots = [i for i, ((kind, _), _) in enumerate(fused) if kind == "capsule"][:RERANK_TOP_N]
+        if len(slots) < 2:
+            return {}
+        ids = [fused[i][0][1] for i in slots]
+        centrality = {}
+        if hasattr(self.storage, "get_graph_centrality_by_ids"):
+            centrality = self.storage.get_graph_centrality_by_ids(ids)
+        pageranks = [centrality.get(capsule_id, {}).get("pagerank") or 0.0 for capsule_id in ids]
+        max_pagerank = max(pageranks) or 1.0
+        max_fused = fused[slots[0]][1]
+        
+        scores = {}
+        for i, capsule_id, pagerank in zip(slots, ids, pageranks):
+            quality = (capsules.get(capsule_id, {}).get("quality_score") or 0.0) / 100
+            prior = (min(quality, 1.0) + pagerank / max_pagerank) / 2
+            scores[capsule_id] = round((1 - RERANK_WEIGHT) * fused[i][1] / max_fused + RERANK_WEIGHT * prior, 4)
+        
+        fused_scores = {capsule_id: fused[i][1] for i, capsule_id in zip(slots, ids)}
+        reordered = sorted(ids, key=lambda capsule_id: -scores[capsule_id])
+        for i, capsule_id in zip(slots, reordered):
+            fused[i] = (("capsule", capsule_id), fused_scores[capsule_id])
+        return scores
+    
+    # ============ 检索 ============
+    
+    def search(
+        self,
+        query: str,
+        types: List[str] = None,
+        page: int = 1,
+        page_size: int = 20,
+        rerank: bool = False,
+        nprobe: Optional[int] = None
+    ) -> Dict:
+        """
+        统一搜索
+        
+        Args:
+            query: 查询文本
+            types: 结果类型 (capsule / chat / agent / discussion)，默认全部
+            page: 页码 (从 1 开始)
+            page_size: 每页数量
+            rerank: 是否按质量分 / PageRank 重排胶囊
+            nprobe: 语义近似索引扫描的簇数
+        
+        Returns:
+            {"results", "total", "page", "page_size", "counts", "latency_ms"}
+        """
+        started = time.perf_counter()
+        types = [t for t in SEARCH_TYPES if types is None or t in types]
+        limit = min(max(CANDIDATES, page * page_size), MAX_CANDIDATES)
+        latency: Dict[str, float] = {}
+        
+        def timed(stage: str, fn: Callable, *args):
+            stage_started = time.perf_counter()
+            try:
+                return fn(*args)
+            except Exception as e:
+                logger.error(f"搜索阶段 {stage} 失败: {e}")
+                return None
+            finally:
+                latency[stage] = round((time.perf_counter() - stage_started) * 1000, 2)
+        
+        # 各来源并行检索
+        jobs = {}
+        if "capsule" in types:
+            jobs["lexical"] = self._executor.submit(timed, "lexical", self._search_lexical, query, limit)
+            jobs["semantic"] = self._executor.submit(timed, "semantic", self._search_semantic, query, limit, nprobe)
+        if "chat" in types:
+            jobs["chat"] = self._executor.submit(timed, "chat", self._search_chats, query, limit)
+        if "agent" in types:
+            jobs["agent"] = self._executor.submit(timed, "agent", self._search_agents, query, limit)
+        if "discussion" in types:
+            jobs["discussion"] = self._executor.submit(timed, "discussion", self._search_discussions, query, limit)
+        found = {stage: job.result() for stage, job in jobs.items()}
+        
+        # 融合
+        fusion_started = time.perf_counter()
+        lexical = found.get("lexical") or []
+        semantic = found.get("semantic") or []
+        rankings = [[("capsule", i) for i in lexical], [("capsule", i) for i in semantic]]
+        items: Dict[Tuple[str, str], Dict] = {}
+        for kind in ("chat", "agent", "discussion"):
+            ranked, by_id = found.get(kind) or ([], {})
+            rankings.append([(kind, i) for i in ranked])
+            items.update({(kind, i): by_id[i] for i in ranked})
+        fused = reciprocal_rank_fusion(rankings)
+        latency["fusion"] = round((time.perf_counter() - fusion_started) * 1000, 2)
+        
+        # 读取胶囊数据 (重排需要前 N 个胶囊的质量分)，之后重排
+        offset = (page - 1) * page_size
+        hydrate_started = time.perf_counter()
+        window = fused[:max(offset + page_size, RERANK_TOP_N if rerank else 0)]
+        capsule_ids = [i for (kind, i), _ in window if kind == "capsule"]
+        capsules = {}
+        if capsule_ids and self.storage is not None:
+            capsules = {c["id"]: c for c in self.storage.get_knowledge_capsules_by_ids(capsule_ids)}
+        latency["hydrate"] = round((time.perf_counter() - hydrate_started) * 1000, 2)
+        
+        rerank_scores = {}
+        if rerank:
+            rerank_started = time.perf_counter()
+            rerank_scores = timed("rerank", self._rerank, fused, capsules) or {}
+            latency["rerank"] = round((time.perf_counter() - rerank_started) * 1000, 2)
+        
+        lexical_rank = {capsule_id: rank for rank, capsule_id in enumerate(lexical, 1)}
+        semantic_rank = {capsule_id: rank for rank, capsule_id in enumerate(semantic, 1)}
+        results = []
+        for (kind, item_id), score in fused[offset:offset + page_size]:
+            entry = {"type": kind, "id": item_id, "score": round(score, 6)}
+            if kind == "capsule":
+                if item_id not in capsules:
+                    continue
+                entry.update({
+                    "lexical_rank": lexical_rank.get(item_id),
+                    "semantic_rank": semantic_rank.get(item_id),
+                    "item": capsules[item_id]
+                })
+                if item_id in rerank_scores:
+                    entry["rerank_score"] = rerank_scores[item_id]
+            else:
+                entry["item"] = items[(kind, item_id)]
+            results.append(entry)
+        
+        counts = {kind: 0 for kind in types}
+        for (kind, _), _ in fused:
+            counts[kind] += 1
+        latency["total"] = round((time.perf_counter() - started) * 1000, 2)
+        return {
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+            "total": len(fused),
+            "counts": counts,
+            "results": results,
+            "latency_ms": latency
+        }
+
+
+# 全局实例
+search_service = SearchService(capsule_bm25, semantic_index)
@@ -0,0 +1,77 @@
+"""
+SuiLight Knowledge Salon - 搜索 API
+FastAPI 路由
+
+- 统一搜索: 胶囊 (BM25 + 语义)、对话、Agent、讨论主题按 RRF 融合排序
+- 胶囊分面搜索: 一页结果 + 按分类 / 等级 / 来源 Agent / 关键词 / 时间的数量
+"""
+
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Optional
+import asyncio
+
+from src.search import SEARCH_TYPES, search_service
+
+router = APIRouter(prefix="/api/search", tags=["搜索"])
+
+
+@router.get("")
+async def unified_search(
+    q: str = Query(..., min_length=1),
+    types: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    rerank: bool = False,
+    nprobe: Optional[int] = Query(None, ge=1, le=4096)
+) -> Dict:
+    """统一搜索: 胶囊 (BM25 + 语义)、对话、Agent、讨论主题按 RRF 融合排序 (types 以逗号分隔，rerank 按质量分 / PageRank 重排胶囊)"""
+    type_list = None
+    if types:
+        type_list = [t.strip() for t in types.split(",") if t.strip()]
+        unknown = set(type_list) - set(SEARCH_TYPES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知的结果类型: {', '.join(sorted(unknown))}")
+    
+    data = await asyncio.to_thread(
+        search_service.search, q, type_list, page, page_size, rerank, nprobe
+    )
+    return {
+        "success": True,
+        "data": data
+    }
+
+
+@router.get("/capsules")
+async def search_capsules_faceted(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    grade: Optional[str] = Query(None, pattern="^[ABC]$"),
+    agent: Optional[str] = None,
+    keyword: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    sort: str = Query("quality", pattern="^(created_at|quality|pagerank|degree|betweenness)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    facet_limit: int = Query(10, ge=1, le=100),
+    bucket: str = Query("month", pattern="^(year|month|day)$")
+) -> Dict:
+    """分面搜索胶囊: 一页结果 + 当前查询与过滤条件下按分类 / 等级 / 来源 Agent / 关键词 / 时间的数量"""
+    from src.main import init_storage
+    result = await asyncio.to_thread(
+        init_storage().search_capsules_faceted,
+        query=q, category=category, grade=grade, agent=agent, keyword=keyword,
+        since=since, until=until, sort=sort, limit=limit, offset=offset,
+        facet_limit=facet_limit, bucket=bucket
+    )
+    
+    return {
+        "success": True,
+        "data": {
+            "query": q,
+            "total": result["total"],
+            "count": len(result["capsules"]),
+            "capsules": result["capsules"],
+            "facets": result["facets"]
+        }
+    }
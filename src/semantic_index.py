@@ -0,0 +1,311 @@
+"""
+SuiLight Knowledge Salon - 语义相似胶囊
+胶囊文本向量化后写入内存映射向量存储 (VectorStore)，按余弦相似度检索语义相近的胶囊
+
+- 向量来源: 配置 SUILIGHT_EMBEDDING_PROVIDER 时使用 LLMClient.embedding
+  (ollama / groq / openai / minimax，经 CachedEmbedder 按内容缓存)；
+  默认使用本地的字符 n-gram 特征哈希向量，无需外部服务
+- 胶囊写入 / 删除时通过存储监听器增量追加向量、墓碑删除
+- 每个向量记录输入文本的校验值，启动时只重新向量化缺失或内容已变化的胶囊
+- 向量数达到 ANN_MIN_VECTORS 后由后台任务离线构建 IVF-flat 近似索引 (持久化在向量目录)，
+  查询默认走近似索引，nprobe 调节召回 / 延迟；exact=True 时仍为暴力检索
+"""
+
+import asyncio
+import os
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from src.cached_embedder import create_cached_embedder
+from src.storage.capsule_storage import CAPSULE_DELETED
+from src.storage.ivf_index import DEFAULT_NPROBE, IVFIndex
+from src.storage.vector_store import VectorStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 向量维度 (与 LLMClient 各后端的默认 embedding 维度一致)
+EMBEDDING_DIM = 384
+
+# 单次向量化的胶囊数
+EMBED_BATCH_SIZE = 256
+
+# 墓碑占比超过该值时压缩向量文件
+COMPACT_RATIO = 0.25
+
+# 向量数达到该值时构建 IVF 近似索引 (以下暴力检索已足够快)
+ANN_MIN_VECTORS = 50000
+
+# 构建之后新增的尾部超过索引规模的该比例时重新构建
+ANN_REBUILD_RATIO = 0.1
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+# 特征哈希中 n-gram 各位置的乘数 (奇数)
+_HASH_MULT = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+
+def capsule_text(capsule: Dict) -> str:
+    """胶囊用于向量化的文本: 标题 + 洞见 (或摘要) + 关键词"""
+    body = capsule.get("insight") or capsule.get("summary") or ""
+    keywords = " ".join(str(kw) for kw in capsule.get("keywords") or [])
+    return f"{capsule.get('title') or ''}\n{body}\n{keywords}".strip()
+
+
+def text_version(text: str) -> int:
+    """文本校验值 (向量版本)"""
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def hash_embedding(texts: List[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    本地特征哈希向量: 字符 1/2/3-gram 按哈希分桶计数 (带符号)，再做次线性缩放
+    
+    对中文按字切分即可工作，作为未配置向量模型时的默认实现。
+    
+    Returns:
+        向量 [len(texts), dim]
+    """
+    result = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        codes = np.frombuffer(_NON_WORD.sub("", text.lower()).encode("utf-32-le"), dtype=np.uint32)
+        codes = codes.astype(np.uint64)
+        hashes = []
+        for size in (1, 2, 3):
+            count = len(codes) - size + 1
+            if count <= 0:
+                break
+            gram = np.full(count, size, dtype=np.uint64)
+            for offset in range(size):
+                gram = gram * _HASH_MULT[offset] + codes[offset:offset + count]
+            hashes.append(gram)
+        if not hashes:
+            continue
+        hashes = np.concatenate(hashes)
+        hashes ^= hashes >> np.uint64(31)
+        buckets = (hashes % np.uint64(dim)).astype(np.int64)
+        signs = np.where((hashes >> np.uint64(63)) == 1, -1.0, 1.0)
+        counts = np.bincount(buckets, weights=signs, minlength=dim)
+        result[i] = np.sign(counts) * np.log1p(np.abs(counts))
+    return result
+
+
+def default_embedder() -> Tuple[Callable[[List[str]], np.ndarray], str]:
+    """
+    按环境变量选择向量函数
+    
+    Returns:
+        (向量函数, 模型名称)
+    """
+    provider = os.getenv("SUILIGHT_EMBEDDING_PROVIDER", "").lower()
+    if provider and provider != "hash":
+        try:
+            embedder = create_cached_embedder(provider)
+            return embedder, f"llm:{provider}:{embedder.model}"
+        except Exception as e:
+            logger.error(f"向量模型 {provider} 初始化失败，使用本地特征哈希向量: {e}")
+    return hash_embedding, f"hash-ngram-{EMBEDDING_DIM}"
+
+
+class SemanticIndex:
+    """
+    胶囊语义相似度索引
+    
+    向量存于 VectorStore (内存映射矩阵)，检索为分块矩阵乘法的暴力余弦 Top-K。
+    """
+    
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+        model: str = None,
+        batch_size: int = EMBED_BATCH_SIZE
+    ):
+        """
+        初始化语义索引
+        
+        Args:
+            embed_fn: 向量函数 (文本列表 → [n, dim])，默认按环境变量选择
+            model: 模型名称 (写入向量存储元数据，变化时重建)
+            batch_size: 单次向量化的胶囊数
+        """
+        if embed_fn is None:
+            embed_fn, default_model = default_embedder()
+            model = model or default_model
+        self.embed_fn = embed_fn
+        self.model = model or getattr(embed_fn, "__name__", "custom")
+        self.batch_size = batch_size
+        self.storage = None
+        self.store: Optional[VectorStore] = None
+        self.ann: Optional[IVFIndex] = None
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """批量向量化"""
+        return np.asarray(self.embed_fn(texts), dtype=np.float32).reshape(len(texts), -1)
+    
+    def attach_storage(self, storage, directory: str):
+        """
+        绑定胶囊存储与向量目录: 向量化缺失 / 内容变化的胶囊，删除已不存在的胶囊，之后随胶囊写入增量维护
+        
+        Args:
+            storage: CapsuleStorage / ShardedCapsuleStorage
+            directory: 向量存储目录
+        """
+        if self.storage is not None and hasattr(self.storage, "remove_listener"):
+            self.storage.remove_listener(self.on_capsule_event)
+        dim = self.embed(["维度"]).shape[1]
+        self.store = VectorStore(directory, dim, self.model)
+        self.storage = storage
+        
+        known = self.store.versions()
+        pending: List[Tuple[str, str, int]] = []
+        embedded = 0
+        for capsule in storage.iter_knowledge_capsules():
+            text = capsule_text(capsule)
+            version = text_version(text)
+            if known.pop(capsule["id"], None) != version:
+                pending.append((capsule["id"], text, version))
+            if len(pending) >= self.batch_size:
+                embedded += self._add_batch(pending)
+                pending = []
+        if pending:
+            embedded += self._add_batch(pending)
+        if known:
+            self.store.delete(list(known))
+        if self.store.tombstone_ratio() > COMPACT_RATIO:
+            self.store.compact()
+        self.ann = IVFIndex.load(self.store)
+        storage.add_listener(self.on_capsule_event)
+        
+        logger.info(
+            f"语义索引加载完成: {len(self.store)} 个胶囊, 新向量化 {embedded} 个, "
+            f"近似索引 {'已加载' if self.ann else '未构建'}"
+        )
+    
+    # ============ 近似索引 ============
+    
+    def ann_stale(self, min_vectors: int = ANN_MIN_VECTORS) -> bool:
+        """是否需要 (重新) 构建近似索引"""
+        if self.store is None or len(self.store) < min_vectors:
+            return False
+        if self.ann is None or not self.ann.is_valid():
+            return True
+        return self.ann.tail_rows() > ANN_REBUILD_RATIO * max(self.ann.built_rows, 1)
+    
+    def stats(self) -> Dict:
+        """向量数、近似索引与向量缓存指标"""
+        ann = self.ann
+        return {
+            "model": self.model,
+            "vectors": len(self.store) if self.store is not None else 0,
+            "tombstone_ratio": round(self.store.tombstone_ratio(), 4) if self.store is not None else 0.0,
+            "ann": {
+                "nlist": ann.nlist,
+                "indexed": len(ann.rows),
+                "tail_rows": ann.tail_rows(),
+                "valid": ann.is_valid()
+            } if ann is not None else None,
+            "embedding_cache": self.embed_fn.stats() if hasattr(self.embed_fn, "stats") else None
+        }
+    
+    def build_ann(self, nlist: int = None) -> IVFIndex:
+        """离线构建并持久化 IVF 近似索引 (构建期间查询仍使用旧索引或暴力检索)"""
+        self.ann = IVFIndex.build(self.store, nlist)
+        return self.ann
+    
+    def _add_batch(self, items: List[Tuple[str, str, int]]) -> int:
+        vectors = self.embed([text for _, text, _ in items])
+        return self.store.add([capsule_id for capsule_id, _, _ in items], vectors, [v for _, _, v in items])
+    
+    def on_capsule_event(self, event: str, capsule_id: str, capsule: Optional[Dict] = None):
+        """存储变更监听器"""
+        if event == CAPSULE_DELETED:
+            self.store.delete([capsule_id])
+        elif capsule is not None:
+            text = capsule_text(capsule)
+            version = text_version(text)
+            if self.store.version(capsule_id) != version:
+                self._add_batch([(capsule_id, text, version)])
+    
+    def get_semantic_similar(
+        self,
+        capsule_id: Optional[str] = None,
+        text: Optional[str] = None,
+        k: int = 10,
+        nprobe: Optional[int] = None,
+        exact: bool = False
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        语义相似的胶囊
+        
+        Args:
+            capsule_id: 以已索引胶囊为查询 (结果排除其本身)
+            text: 以任意文本为查询 (capsule_id 为空时使用)
+            k: 返回数量
+            nprobe: 近似索引扫描的簇数，默认 DEFAULT_NPROBE
+            exact: 是否强制暴力检索
+        
+        Returns:
+            [(胶囊ID, 余弦相似度)]；胶囊未建索引时返回 None
+        """
+        if self.store is None:
+            return None
+        if capsule_id is not None:
+            query = self.store.get(capsule_id)
+            if query is None:
+                return None
+        elif text:
+            query = self.embed([text])[0]
+        else:
+            return []
+        
+        exclude = [capsule_id]
+        ann = self.ann
+        if not exact and ann is not None and ann.is_valid():
+            return ann.search(query[None, :], k, nprobe or DEFAULT_NPROBE, exclude)[0]
+        return self.store.search(query[None, :], k, exclude=exclude)[0]
+    
+    def similar_capsules(
+        self,
+        capsule_id: Optional[str] = None,
+        text: Optional[str] = None,
+        k: int = 10,
+        nprobe: Optional[int] = None,
+        exact: bool = False
+    ) -> Optional[List[Dict]]:
+        """语义相似的胶囊 (完整数据，附带 similarity)"""
+        matches = self.get_semantic_similar(capsule_id, text, k, nprobe, exact)
+        if matches is None:
+            return None
+        capsules = {c["id"]: c for c in self.storage.get_knowledge_capsules_by_ids([i for i, _ in matches])}
+        return [
+            {**capsules[other_id], "similarity": similarity}
+            for other_id, similarity in matches if other_id in capsules
+        ]
+
+
+
+async def run_ann_loop(index: SemanticIndex, interval: float = 3600, initial_delay: float = 180):
+    """
+    后台维护近似索引: 每 interval 秒检查一次，向量数达到阈值且索引缺失 / 过期时在线程中重新构建
+    
+    Args:
+        index: 语义索引
+        interval: 检查间隔 (秒)
+        initial_delay: 服务启动后的首次延迟 (秒)
+    """
+    await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            if index.ann_stale():
+                await asyncio.to_thread(index.build_ann)
+        except Exception as e:
+            logger.error(f"近似索引构建失败: {e}")
+        await asyncio.sleep(interval)
+
+
+# 全局实例
+semantic_index = SemanticIndex()
@@ -7,7 +7,7 @@ import json
 import uuid
 import hashlib
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from dataclasses import dataclass, field
 import logging
 
@@ -58,8 +58,22 @@ class ShareManager:
         self.share_links: Dict[str, ShareLink] = {}
         self.url_prefix = "https://suilight.vercel.app/share"  # 部署后的前缀
         
+        # 访问事件监听器: fn(胶囊ID, 事件类型 view/share)
+        self.listeners: List[Callable[[str, str], None]] = []
+        
         logger.info("分享管理器初始化完成")
     
+    def add_listener(self, listener: Callable[[str, str], None]):
+        """注册访问事件监听器 (如热度排行)"""
+        self.listeners.append(listener)
+    
+    def _notify(self, capsule_id: str, event: str):
+        for listener in self.listeners:
+            try:
+                listener(capsule_id, event)
+            except Exception as e:
+                logger.error(f"分享事件监听器失败: {e}")
+    
     def create_share_link(
         self,
         capsule_id: str,
@@ -82,14 +96,21 @@ class ShareManager:
         return share
     
     def get_share_link(self, share_id: str) -> Optional[ShareLink]:
-        """获取分享链接"""
+        """获取分享链接 (不计入浏览)"""
         # 支持短 ID
         for share in self.share_links.values():
             if share.short_id == share_id or share.id == share_id:
-                share.view_count += 1
                 return share
         return None
     
+    def record_view(self, share_id: str) -> Optional[ShareLink]:
+        """打开分享页面: 获取分享链接并记录一次浏览"""
+        share = self.get_share_link(share_id)
+        if share:
+            share.view_count += 1
+            self._notify(share.capsule_id, "view")
+        return share
+    
     def get_shares_by_capsule(self, capsule_id: str) -> List[ShareLink]:
         """获取胶囊的所有分享链接"""
         return [s for s in self.share_links.values() if s.capsule_id == capsule_id]
@@ -99,6 +120,7 @@ class ShareManager:
         share = self.get_share_link(share_id)
         if share:
             share.share_count += 1
+            self._notify(share.capsule_id, "share")
             return True
         return False
     
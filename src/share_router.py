@@ -5,9 +5,11 @@ FastAPI 路由
 
 from fastapi import APIRouter, HTTPException, Query
 from typing import Dict, Optional
+import asyncio
 import urllib.parse
 
 from src.share import share_manager
+from src.user_profiles import user_profiles
 
 router = APIRouter(prefix="/api/share", tags=["知识分享"])
 
@@ -17,12 +19,21 @@ async def create_share_link(
     capsule_id: str,
     title: str,
     content: str = "",
-    format: str = "link"
+    format: str = "link",
+    user_id: Optional[str] = None
 ) -> Dict:
-    """创建分享链接"""
+    """创建分享链接 (带 user_id 时计入用户兴趣画像)"""
     if not capsule_id or not title:
         raise HTTPException(status_code=400, detail="缺少必要参数")
     
+    # 分享链接的浏览 / 分享计入热度排行，只允许为已存在的胶囊创建
+    from src.main import init_storage
+    if await asyncio.to_thread(init_storage().get_knowledge_capsule, capsule_id) is None:
+        raise HTTPException(status_code=404, detail="胶囊不存在")
+    
+    if user_id:
+        user_profiles.record_activity(user_id, capsule_id, "share")
+    
     share = share_manager.create_share_link(
         capsule_id=capsule_id,
         title=title,
@@ -45,8 +56,8 @@ async def create_share_link(
 
 @router.get("/links/{share_id}")
 async def get_share_link(share_id: str) -> Dict:
-    """获取分享链接详情"""
-    share = share_manager.get_share_link(share_id)
+    """获取分享链接详情 (打开分享页面，计入浏览)"""
+    share = share_manager.record_view(share_id)
     if not share:
         raise HTTPException(status_code=404, detail="分享链接不存在")
     
@@ -204,7 +215,10 @@ async def export_html(
     insight: str = "",
     evidence: list = Query(default=[]),
     action_items: list = Query(default=[]),
-    dimensions: dict = Query(default={"truth": 0, "goodness": 0, "beauty": 0, "intelligence": 0})
+    truth: float = 0,
+    goodness: float = 0,
+    beauty: float = 0,
+    intelligence: float = 0
 ) -> Dict:
     """导出为 HTML"""
     capsule = {
@@ -212,7 +226,7 @@ async def export_html(
         "insight": insight,
         "evidence": evidence,
         "action_items": action_items,
-        "dimensions": dimensions,
+        "dimensions": {"truth": truth, "goodness": goodness, "beauty": beauty, "intelligence": intelligence},
         "quality_score": 0,
         "grade": "C",
         "id": "export"
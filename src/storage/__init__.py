@@ -3,9 +3,22 @@ SuiLight Storage Module
 """
 
 from .capsule_storage import CapsuleStorage, get_storage
+from .sharded_storage import ShardedCapsuleStorage, get_sharded_storage
+from .backup import SnapshotManager
+from .maintenance import DatabaseMaintenance
+from .columnar import ColumnarSnapshot, export_columnar
+from .graph_store import GraphStore, get_graph_store
+from .vector_store import VectorStore, get_vector_store
+from .ivf_index import IVFIndex, build_ivf_index
+from .embedding_cache import EmbeddingCache, get_embedding_cache
+from .text_index import BM25Index, tokenize
 from . import capsule_storage  # 导出旧版 StorageManager
 
 # 为了向后兼容
 StorageManager = capsule_storage.CapsuleStorage
 
-__all__ = ["CapsuleStorage", "get_storage", "StorageManager"]
+__all__ = ["CapsuleStorage", "get_storage", "StorageManager", "ShardedCapsuleStorage",
+           "get_sharded_storage", "SnapshotManager", "DatabaseMaintenance",
+           "ColumnarSnapshot", "export_columnar", "GraphStore", "get_graph_store",
+           "VectorStore", "get_vector_store", "IVFIndex", "build_ivf_index",
+           "EmbeddingCache", "get_embedding_cache", "BM25Index", "tokenize"]
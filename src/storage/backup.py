@@ -0,0 +1,468 @@
+"""
+SuiLight Knowledge Salon - 在线备份与快照模块
+
+功能:
+- 基于 sqlite3.Connection.backup 的在线增量备份 (按页分步，不长时间阻塞写入)
+- 覆盖所有存储类的数据库 (胶囊 / 对话 / 讨论 / 主题 / Agent 配置)
+- 可选 gzip 压缩，生成带校验和的快照清单
+- 快照恢复与备份吞吐量基准测试
+
+用法:
+    python -m src.storage.backup create --compress
+    python -m src.storage.backup list
+    python -m src.storage.backup restore <snapshot_id>
+    python -m src.storage.backup benchmark
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 项目数据目录
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+
+# 各存储类使用的数据库文件
+DEFAULT_DATABASES = {
+    "capsules": "capsules.db",            # CapsuleStorage
+    "suilight": "suilight.db",            # StorageManager (对话历史)
+    "discussions": "discussions.db",      # DiscussionStorage
+    "topics": "topics.db",                # TopicStorage
+    "agent_configs": "agent_configs.db",  # AgentConfigStorage
+    "trending": "trending.db",            # CapsuleTrending (热度排行)
+    "user_profiles": "user_profiles.db",  # UserProfiles (用户行为与兴趣画像)
+}
+
+MANIFEST_NAME = "manifest.json"
+
+
+def default_databases(data_dir: str = DATA_DIR) -> Dict[str, str]:
+    """各存储类的数据库路径，包括分片存储 (data/capsule_shards) 的所有分片"""
+    databases = {
+        name: os.path.join(data_dir, filename)
+        for name, filename in DEFAULT_DATABASES.items()
+    }
+    
+    shard_dir = os.path.join(data_dir, "capsule_shards")
+    if os.path.isdir(shard_dir):
+        for filename in sorted(os.listdir(shard_dir)):
+            if filename.endswith(".db"):
+                databases[f"shard_{filename[:-3]}"] = os.path.join(shard_dir, filename)
+    
+    return databases
+
+
+class _BackupRestarted(Exception):
+    """备份过程中源库被频繁修改，分步备份反复重启"""
+
+
+class SnapshotManager:
+    """
+    快照管理器
+    
+    每次备份按 pages_per_step 页为一步复制，步与步之间让出 step_sleep 秒，
+    写入方最多只会被阻塞一个步长的时间。
+    """
+    
+    def __init__(
+        self,
+        snapshot_dir: str = None,
+        databases: Dict[str, str] = None,
+        pages_per_step: int = 256,
+        step_sleep: float = 0.005,
+        max_restarts: int = 5
+    ):
+        """
+        初始化快照管理器
+        
+        Args:
+            snapshot_dir: 快照根目录，默认为 data/snapshots
+            databases: {名称: 数据库路径}，默认为 data 目录下各存储类的数据库
+            pages_per_step: 每步复制的页数
+            step_sleep: 每步之间的休眠时间 (秒)
+            max_restarts: 源库被并发修改导致备份重启的最大次数，超过后退化为一次性复制
+        """
+        self.snapshot_dir = snapshot_dir or os.path.join(DATA_DIR, "snapshots")
+        self.databases = databases if databases is not None else default_databases()
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+    
+    @classmethod
+    def from_storages(cls, *storages, **kwargs) -> "SnapshotManager":
+        """根据存储实例 (带 db_path 属性) 创建快照管理器"""
+        databases = {}
+        for storage in storages:
+            db_path = str(storage.db_path)
+            name = os.path.splitext(os.path.basename(db_path))[0]
+            databases[name] = db_path
+        return cls(databases=databases, **kwargs)
+    
+    # ============ 备份 ============
+    
+    def backup_database(self, source_path: str, target_path: str) -> Dict:
+        """
+        在线备份单个数据库
+        
+        Args:
+            source_path: 源数据库路径
+            target_path: 目标文件路径
+        
+        Returns:
+            备份统计 (页数、步数、最长单步耗时、总耗时)
+        """
+        stats = {"pages": 0, "steps": 0, "restarts": 0, "max_step_ms": 0.0}
+        state = {"remaining": None, "step_started": 0.0}
+        
+        def progress(status, remaining, total):
+            now = time.perf_counter()
+            stats["max_step_ms"] = max(stats["max_step_ms"], (now - state["step_started"]) * 1000)
+            stats["pages"] = total
+            stats["steps"] += 1
+            
+            # 剩余页数回升说明源库被其他连接修改，备份从头开始
+            if state["remaining"] is not None and remaining > state["remaining"]:
+                stats["restarts"] += 1
+                if stats["restarts"] > self.max_restarts:
+                    raise _BackupRestarted()
+            state["remaining"] = remaining
+            
+            if remaining and self.step_sleep:
+                time.sleep(self.step_sleep)
+            state["step_started"] = time.perf_counter()
+        
+        started = time.perf_counter()
+        source = sqlite3.connect(source_path)
+        try:
+            try:
+                target = sqlite3.connect(target_path)
+                try:
+                    state["step_started"] = time.perf_counter()
+                    source.backup(target, pages=self.pages_per_step, progress=progress)
+                finally:
+                    target.close()
+            except _BackupRestarted:
+                # 写入过于频繁，退化为一次性复制以保证完成
+                logger.warning(f"备份多次重启，改为一次性复制: {source_path}")
+                os.unlink(target_path)
+                target = sqlite3.connect(target_path)
+                try:
+                    step_started = time.perf_counter()
+                    source.backup(target)
+                    stats["max_step_ms"] = max(
+                        stats["max_step_ms"], (time.perf_counter() - step_started) * 1000
+                    )
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        
+        stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        stats["max_step_ms"] = round(stats["max_step_ms"], 2)
+        return stats
+    
+    def create_snapshot(self, compress: bool = False, label: str = None) -> Dict:
+        """
+        创建一组数据库快照
+        
+        Args:
+            compress: 是否使用 gzip 压缩
+            label: 快照备注
+        
+        Returns:
+            快照清单
+        """
+        snapshot_id = self._new_snapshot_id()
+        snapshot_path = os.path.join(self.snapshot_dir, snapshot_id)
+        os.makedirs(snapshot_path)
+        
+        manifest = {
+            "id": snapshot_id,
+            "label": label,
+            "created_at": datetime.now().isoformat(),
+            "compressed": compress,
+            "databases": {}
+        }
+        
+        for name, source_path in self.databases.items():
+            if not os.path.exists(source_path):
+                logger.info(f"跳过不存在的数据库: {source_path}")
+                continue
+            
+            filename = f"{name}.db"
+            target_path = os.path.join(snapshot_path, filename)
+            stats = self.backup_database(source_path, target_path)
+            
+            raw_size = os.path.getsize(target_path)
+            if compress:
+                filename += ".gz"
+                with open(target_path, "rb") as src, gzip.open(
+                    os.path.join(snapshot_path, filename), "wb", compresslevel=6
+                ) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.unlink(target_path)
+            
+            file_path = os.path.join(snapshot_path, filename)
+            manifest["databases"][name] = {
+                "file": filename,
+                "source": source_path,
+                "size": raw_size,
+                "stored_size": os.path.getsize(file_path),
+                "sha256": self._sha256(file_path),
+                **stats
+            }
+        
+        with open(os.path.join(snapshot_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        
+        logger.info(f"快照已创建: {snapshot_id} ({len(manifest['databases'])} 个数据库)")
+        return manifest
+    
+    # ============ 查询 ============
+    
+    def list_snapshots(self) -> List[Dict]:
+        """列出所有快照清单 (最新在前)"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        
+        manifests = []
+        for entry in sorted(os.listdir(self.snapshot_dir), reverse=True):
+            manifest = self.get_snapshot(entry)
+            if manifest:
+                manifests.append(manifest)
+        return manifests
+    
+    def get_snapshot(self, snapshot_id: str) -> Optional[Dict]:
+        """读取快照清单"""
+        manifest_path = os.path.join(self.snapshot_dir, snapshot_id, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    
+    def delete_snapshot(self, snapshot_id: str) -> bool:
+        """删除快照"""
+        snapshot_path = os.path.join(self.snapshot_dir, snapshot_id)
+        if not os.path.exists(os.path.join(snapshot_path, MANIFEST_NAME)):
+            return False
+        shutil.rmtree(snapshot_path)
+        logger.info(f"快照已删除: {snapshot_id}")
+        return True
+    
+    # ============ 恢复 ============
+    
+    def restore_snapshot(
+        self,
+        snapshot_id: str,
+        names: List[str] = None,
+        target_paths: Dict[str, str] = None
+    ) -> Dict[str, str]:
+        """
+        从快照恢复数据库
+        
+        恢复同样通过 backup API 写入目标库，运行中的服务无需重启即可看到恢复后的数据。
+        
+        Args:
+            snapshot_id: 快照 ID
+            names: 只恢复指定的数据库，默认全部
+            target_paths: {名称: 目标路径}，默认恢复到清单中记录的源路径
+        
+        Returns:
+            {名称: 恢复到的路径}
+        """
+        manifest = self.get_snapshot(snapshot_id)
+        if manifest is None:
+            raise ValueError(f"快照不存在: {snapshot_id}")
+        
+        snapshot_path = os.path.join(self.snapshot_dir, snapshot_id)
+        target_paths = target_paths or {}
+        restored = {}
+        
+        for name, info in manifest["databases"].items():
+            if names and name not in names:
+                continue
+            
+            file_path = os.path.join(snapshot_path, info["file"])
+            if self._sha256(file_path) != info["sha256"]:
+                raise ValueError(f"快照文件校验失败: {file_path}")
+            
+            target_path = target_paths.get(name, info["source"])
+            with _open_snapshot_db(file_path) as snapshot_db:
+                source = sqlite3.connect(snapshot_db)
+                try:
+                    result = source.execute("PRAGMA integrity_check").fetchone()[0]
+                    if result != "ok":
+                        raise ValueError(f"快照数据库损坏: {name} ({result})")
+                    
+                    os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+                    target = sqlite3.connect(target_path)
+                    try:
+                        source.backup(target, pages=self.pages_per_step)
+                    finally:
+                        target.close()
+                finally:
+                    source.close()
+            
+            restored[name] = target_path
+            logger.info(f"已恢复数据库: {name} -> {target_path}")
+        
+        return restored
+    
+    # ============ 内部工具 ============
+    
+    def _new_snapshot_id(self) -> str:
+        """生成快照 ID (同一秒内多次创建时追加序号)"""
+        base = f"snap_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        snapshot_id = base
+        suffix = 1
+        while os.path.exists(os.path.join(self.snapshot_dir, snapshot_id)):
+            snapshot_id = f"{base}_{suffix}"
+            suffix += 1
+        return snapshot_id
+    
+    @staticmethod
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+@contextmanager
+def _open_snapshot_db(file_path: str):
+    """返回可直接打开的快照数据库路径 (压缩文件解压到临时文件)"""
+    if not file_path.endswith(".gz"):
+        yield file_path
+        return
+    
+    fd, temp_path = tempfile.mkstemp(suffix=".db")
+    try:
+        with os.fdopen(fd, "wb") as dst, gzip.open(file_path, "rb") as src:
+            shutil.copyfileobj(src, dst)
+        yield temp_path
+    finally:
+        os.unlink(temp_path)
+
+
+# ============ 基准测试 ============
+
+def benchmark_backup(
+    db_path: str = None,
+    page_steps: List[int] = None,
+    rows: int = 20000,
+    step_sleep: float = 0.0
+) -> List[Dict]:
+    """
+    备份吞吐量基准测试
+    
+    Args:
+        db_path: 要备份的数据库，为 None 时生成一个包含 rows 行的测试库
+        page_steps: 要比较的每步页数 (-1 表示一次性复制)
+        rows: 生成测试库的行数
+        step_sleep: 每步之间的休眠时间
+    
+    Returns:
+        每种步长的吞吐量 (MB/s) 与最长单步耗时 (写入方最长阻塞时间)
+    """
+    page_steps = page_steps or [64, 256, 1024, -1]
+    work_dir = tempfile.mkdtemp(prefix="suilight_backup_bench_")
+    
+    try:
+        if db_path is None:
+            db_path = os.path.join(work_dir, "bench_source.db")
+            conn = sqlite3.connect(db_path)
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, payload TEXT)")
+            conn.executemany(
+                "INSERT INTO items (payload) VALUES (?)",
+                ((f"capsule-{i}-" + "x" * 200,) for i in range(rows))
+            )
+            conn.commit()
+            conn.close()
+        
+        size_mb = os.path.getsize(db_path) / (1 << 20)
+        results = []
+        for pages in page_steps:
+            manager = SnapshotManager(
+                snapshot_dir=work_dir,
+                databases={},
+                pages_per_step=pages,
+                step_sleep=step_sleep
+            )
+            target_path = os.path.join(work_dir, f"bench_target_{pages}.db")
+            stats = manager.backup_database(db_path, target_path)
+            seconds = max(stats["duration_ms"] / 1000, 1e-9)
+            results.append({
+                "pages_per_step": pages,
+                "size_mb": round(size_mb, 2),
+                "throughput_mb_s": round(size_mb / seconds, 2),
+                "steps": stats["steps"],
+                "max_step_ms": stats["max_step_ms"],
+                "duration_ms": stats["duration_ms"]
+            })
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# ============ 命令行 ============
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="SuiLight 数据库快照工具")
+    parser.add_argument("--snapshot-dir", default=None, help="快照目录 (默认: data/snapshots)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    create = subparsers.add_parser("create", help="创建快照")
+    create.add_argument("--compress", action="store_true", help="gzip 压缩")
+    create.add_argument("--label", default=None, help="快照备注")
+    create.add_argument("--pages", type=int, default=256, help="每步复制页数")
+    
+    subparsers.add_parser("list", help="列出快照")
+    
+    restore = subparsers.add_parser("restore", help="从快照恢复")
+    restore.add_argument("snapshot_id")
+    restore.add_argument("--only", nargs="*", default=None, help="只恢复指定数据库")
+    
+    bench = subparsers.add_parser("benchmark", help="备份吞吐量基准测试")
+    bench.add_argument("--db", default=None, help="要测试的数据库 (默认生成测试库)")
+    bench.add_argument("--rows", type=int, default=20000)
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "benchmark":
+        for result in benchmark_backup(args.db, rows=args.rows):
+            print(json.dumps(result, ensure_ascii=False))
+        return
+    
+    manager = SnapshotManager(
+        snapshot_dir=args.snapshot_dir,
+        pages_per_step=getattr(args, "pages", 256)
+    )
+    
+    if args.command == "create":
+        manifest = manager.create_snapshot(compress=args.compress, label=args.label)
+        print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    elif args.command == "list":
+        for manifest in manager.list_snapshots():
+            print(f"{manifest['id']}  {manifest['created_at']}  "
+                  f"{len(manifest['databases'])} dbs  {manifest.get('label') or ''}")
+    elif args.command == "restore":
+        restored = manager.restore_snapshot(args.snapshot_id, names=args.only)
+        for name, path in restored.items():
+            print(f"✅ {name} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
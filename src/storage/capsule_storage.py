@@ -11,7 +11,7 @@ SuiLight Knowledge Salon - SQLite 胶囊存储模块
 import sqlite3
 import json
 import os
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Tuple, Any
 from datetime import datetime
 from contextlib import contextmanager
 import logging
@@ -19,6 +19,32 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 知识胶囊变更事件 (监听器回调的 event 参数)
+CAPSULE_SAVED = "saved"
+CAPSULE_DELETED = "deleted"
+
+# 图谱中心性指标 (由 src/graph_centrality.py 批量计算后写入 graph_centrality 表)
+CENTRALITY_METRICS = ("pagerank", "degree", "betweenness")
+
+# 胶囊等级 (按质量分数推断，与 src.storage.columnar.infer_grade 一致)
+GRADE_SQL = "CASE WHEN k.quality_score >= 80 THEN 'A' WHEN k.quality_score >= 60 THEN 'B' ELSE 'C' END"
+
+# 单条 SQL 中 IN (...) 的参数上限 (低版本 SQLite 限制为 999)
+QUERY_CHUNK = 500
+
+# 时间分面的粒度 -> created_at (ISO 字符串) 的前缀长度
+TIME_BUCKETS = {"year": 4, "month": 7, "day": 10}
+
+# 胶囊列表支持的排序方式 -> ORDER BY 子句
+CAPSULE_SORTS = {
+    "created_at": "k.created_at DESC",
+    "quality": "k.quality_score DESC, k.created_at DESC",
+    **{
+        metric: f"COALESCE(g.{metric}, 0) DESC, k.quality_score DESC, k.created_at DESC"
+        for metric in CENTRALITY_METRICS
+    }
+}
+
 
 class CapsuleStorage:
     """
@@ -44,6 +70,7 @@ class CapsuleStorage:
             db_path = os.path.join(base_dir, "data", "capsules.db")
         
         self.db_path = db_path
+        self._listeners: List[Callable[[str, str, Optional[Dict]], None]] = []
         self._ensure_db_exists()
         logger.info(f"胶囊存储初始化完成: {db_path}")
     
@@ -54,6 +81,9 @@ class CapsuleStorage:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
+            # 新建库使用增量 VACUUM，便于定期维护回收空间 (对已有表的库无效)
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            
             # 知识胶囊表
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS knowledge_capsules (
@@ -133,9 +163,131 @@ class CapsuleStorage:
                 )
             """)
             
+            # 胶囊关键词映射表 (由 knowledge_capsules.keywords 派生)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS capsule_keywords (
+                    capsule_id TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    position INTEGER DEFAULT 0,  -- 关键词在原数组中的位置
+                    PRIMARY KEY (capsule_id, keyword)
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_capsule_keywords_keyword
+                ON capsule_keywords(keyword, capsule_id)
+            """)
+            
+            # 胶囊来源 Agent 映射表 (由 knowledge_capsules.source_agents 派生)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS capsule_agents (
+                    capsule_id TEXT NOT NULL,
+                    agent TEXT NOT NULL,
+                    position INTEGER DEFAULT 0,
+                    PRIMARY KEY (capsule_id, agent)
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_capsule_agents_agent
+                ON capsule_agents(agent, capsule_id)
+            """)
+            
+            # 分面统计的覆盖索引 (分类 / 等级 / 时间分面只扫描索引)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_knowledge_capsules_facets
+                ON knowledge_capsules(category, quality_score, created_at)
+            """)
+            
+            # 图谱中心性表 (胶囊 / Agent / 关键词节点)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS graph_centrality (
+                    node_id TEXT PRIMARY KEY,
+                    node_type TEXT NOT NULL,
+                    pagerank REAL DEFAULT 0,
+                    degree INTEGER DEFAULT 0,
+                    betweenness REAL DEFAULT 0,
+                    computed_at TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_graph_centrality_type_pagerank
+                ON graph_centrality(node_type, pagerank DESC)
+            """)
+            
+            # 图谱社区划分表 (胶囊 / Agent 节点 -> 社区编号)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS graph_communities (
+                    node_id TEXT PRIMARY KEY,
+                    community INTEGER NOT NULL,
+                    computed_at TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_graph_communities_community
+                ON graph_communities(community)
+            """)
+            
+            # 图谱布局坐标表 (服务端预计算的力导向布局)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS graph_layout (
+                    node_id TEXT PRIMARY KEY,
+                    x REAL NOT NULL,
+                    y REAL NOT NULL,
+                    computed_at TEXT
+                )
+            """)
+            
+            # 相关胶囊表 (预计算的每个胶囊的 Top-K 相关胶囊)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS related_capsules (
+                    capsule_id TEXT NOT NULL,
+                    rank INTEGER NOT NULL,
+                    related_id TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    computed_at TEXT,
+                    PRIMARY KEY (capsule_id, rank)
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_related_capsules_related
+                ON related_capsules(related_id)
+            """)
+            
+            # 胶囊 MinHash 签名表 (近重复 / 相似度 LSH 索引的持久化)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS capsule_minhash (
+                    capsule_id TEXT PRIMARY KEY,
+                    fingerprint INTEGER NOT NULL,  -- 签名输入文本的校验值，用于发现过期签名
+                    signature BLOB NOT NULL
+                )
+            """)
+            
+            self._backfill_capsule_links(cursor)
+            
             conn.commit()
             logger.info("数据库表初始化完成")
     
+    def _backfill_capsule_links(self, cursor: sqlite3.Cursor):
+        """为旧数据库补建关键词 / Agent 映射 (仅在映射表为空时执行)"""
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM capsule_keywords)")
+        has_keywords = cursor.fetchone()[0]
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM capsule_agents)")
+        has_agents = cursor.fetchone()[0]
+        if has_keywords or has_agents:
+            return
+        
+        cursor.execute("SELECT id, keywords, source_agents FROM knowledge_capsules")
+        rows = cursor.fetchall()
+        for row in rows:
+            self._sync_capsule_links(
+                cursor,
+                row[0],
+                self._json_loads(row[1]),
+                self._json_loads(row[2])
+            )
+        
+        if rows:
+            logger.info(f"补建胶囊映射: {len(rows)} 个胶囊")
+    
     @contextmanager
     def _get_connection(self):
         """获取数据库连接"""
@@ -169,6 +321,69 @@ class CapsuleStorage:
         except (json.JSONDecodeError, TypeError):
             return str(json_str)
     
+    @staticmethod
+    def _normalize_terms(values: Any) -> List[str]:
+        """将关键词 / Agent 列表规范化为去重后的非空字符串列表 (保持顺序)"""
+        if not isinstance(values, (list, tuple)):
+            return []
+        
+        terms = []
+        seen = set()
+        for value in values:
+            if value is None:
+                continue
+            term = str(value).strip()
+            if term and term not in seen:
+                seen.add(term)
+                terms.append(term)
+        return terms
+    
+    def _sync_capsule_links(
+        self,
+        cursor: sqlite3.Cursor,
+        capsule_id: str,
+        keywords: Any,
+        source_agents: Any
+    ):
+        """重写单个胶囊的关键词 / Agent 映射 (与胶囊写入在同一事务内)"""
+        cursor.execute("DELETE FROM capsule_keywords WHERE capsule_id = ?", (capsule_id,))
+        cursor.execute("DELETE FROM capsule_agents WHERE capsule_id = ?", (capsule_id,))
+        
+        cursor.executemany(
+            "INSERT INTO capsule_keywords (capsule_id, keyword, position) VALUES (?, ?, ?)",
+            [(capsule_id, kw, i) for i, kw in enumerate(self._normalize_terms(keywords))]
+        )
+        cursor.executemany(
+            "INSERT INTO capsule_agents (capsule_id, agent, position) VALUES (?, ?, ?)",
+            [(capsule_id, agent, i) for i, agent in enumerate(self._normalize_terms(source_agents))]
+        )
+    
+    # ============= 变更监听 =============
+    
+    def add_listener(self, listener: Callable[[str, str, Optional[Dict]], None]):
+        """
+        注册知识胶囊变更监听器
+        
+        Args:
+            listener: 回调 listener(event, capsule_id, capsule)，
+                event 为 CAPSULE_SAVED / CAPSULE_DELETED，删除时 capsule 为 None
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[str, str, Optional[Dict]], None]):
+        """移除变更监听器"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def _notify(self, event: str, capsule_id: str, capsule: Optional[Dict] = None):
+        """通知监听器 (监听器异常不影响写入)"""
+        for listener in list(self._listeners):
+            try:
+                listener(event, capsule_id, capsule)
+            except Exception as e:
+                logger.error(f"胶囊变更监听器执行失败: {event} {capsule_id} ({e})")
+    
     # ============= 知识胶囊 CRUD =============
     
     def save_knowledge_capsule(self, capsule: Dict) -> bool:
@@ -181,11 +396,23 @@ class CapsuleStorage:
         Returns:
             是否保存成功
         """
+        saved = self._write_knowledge_capsule(capsule)
+        self._notify(CAPSULE_SAVED, capsule["id"], capsule)
+        return saved
+    
+    @staticmethod
+    def _ensure_capsule_id(capsule: Dict) -> str:
+        """缺少 ID 的胶囊按时间生成 ID (写入胶囊字典)"""
+        if "id" not in capsule:
+            capsule["id"] = f"kc_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        return capsule["id"]
+    
+    def _write_knowledge_capsule(self, capsule: Dict) -> bool:
+        """写入知识胶囊 (不通知监听器)"""
         now = datetime.now().isoformat()
         
         # 确保必要字段
-        if "id" not in capsule:
-            capsule["id"] = f"kc_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        self._ensure_capsule_id(capsule)
         if "created_at" not in capsule:
             capsule["created_at"] = now
         capsule["updated_at"] = now
@@ -220,6 +447,13 @@ class CapsuleStorage:
                 capsule.get("updated_at")
             ))
             
+            self._sync_capsule_links(
+                cursor,
+                capsule.get("id"),
+                capsule.get("keywords"),
+                capsule.get("source_agents")
+            )
+            
             logger.info(f"保存知识胶囊: {capsule.get('id')}")
             return True
     
@@ -252,7 +486,8 @@ class CapsuleStorage:
         category: str = None,
         status: str = None,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        sort: str = "created_at"
     ) -> List[Dict]:
         """
         列出知识胶囊
@@ -262,30 +497,81 @@ class CapsuleStorage:
             status: 状态过滤
             limit: 返回数量限制
             offset: 偏移量
+            sort: 排序方式 (created_at / quality / pagerank / degree / betweenness)
             
         Returns:
             胶囊列表
         """
-        query = "SELECT * FROM knowledge_capsules WHERE 1=1"
+        conditions = []
         params = []
         
         if category:
-            query += " AND category = ?"
+            conditions.append("k.category = ?")
             params.append(category)
         if status:
-            query += " AND status = ?"
+            conditions.append("k.status = ?")
             params.append(status)
         
-        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        return self._query_capsules(conditions, params, sort, limit, offset)
+    
+    def _query_capsules(
+        self,
+        conditions: List[str],
+        params: List[Any],
+        sort: str,
+        limit: int,
+        offset: int = 0
+    ) -> List[Dict]:
+        """按条件与排序方式查询知识胶囊 (按中心性排序时附带 centrality 字段)"""
+        if sort not in CAPSULE_SORTS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        
+        with_centrality = sort in CENTRALITY_METRICS
+        if with_centrality:
+            query = (
+                "SELECT k.*, g.pagerank, g.degree, g.betweenness FROM knowledge_capsules k "
+                "LEFT JOIN graph_centrality g ON g.node_id = k.id"
+            )
+        else:
+            query = "SELECT k.* FROM knowledge_capsules k"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {CAPSULE_SORTS[sort]} LIMIT ? OFFSET ?"
         
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute(query, params)
+            cursor.execute(query, [*params, limit, offset])
             rows = cursor.fetchall()
             
-            return [self._row_to_capsule_dict(row) for row in rows]
+            capsules = []
+            for row in rows:
+                capsule = self._row_to_capsule_dict(row)
+                if with_centrality:
+                    capsule["centrality"] = {metric: row[metric] or 0 for metric in CENTRALITY_METRICS}
+                capsules.append(capsule)
+            return capsules
+    
+    def iter_knowledge_capsules(self, batch_size: int = 1000):
+        """
+        逐批遍历全部知识胶囊 (用于导出 / 批处理，不一次性加载到内存)
+        
+        Args:
+            batch_size: 每批从数据库读取的行数
+            
+        Yields:
+            胶囊数据字典
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM knowledge_capsules ORDER BY rowid")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_to_capsule_dict(row)
     
     def delete_knowledge_capsule(self, capsule_id: str) -> bool:
         """
@@ -297,6 +583,13 @@ class CapsuleStorage:
         Returns:
             是否删除成功
         """
+        deleted = self._remove_knowledge_capsule(capsule_id)
+        if deleted:
+            self._notify(CAPSULE_DELETED, capsule_id)
+        return deleted
+    
+    def _remove_knowledge_capsule(self, capsule_id: str) -> bool:
+        """删除知识胶囊 (不通知监听器)"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
@@ -304,9 +597,13 @@ class CapsuleStorage:
                 "DELETE FROM knowledge_capsules WHERE id = ?",
                 (capsule_id,)
             )
+            deleted = cursor.rowcount > 0
+            
+            cursor.execute("DELETE FROM capsule_keywords WHERE capsule_id = ?", (capsule_id,))
+            cursor.execute("DELETE FROM capsule_agents WHERE capsule_id = ?", (capsule_id,))
             
             logger.info(f"删除知识胶囊: {capsule_id}")
-            return cursor.rowcount > 0
+            return deleted
     
     def _row_to_capsule_dict(self, row: sqlite3.Row) -> Dict:
         """将数据库行转换为胶囊字典"""
@@ -584,6 +881,157 @@ class CapsuleStorage:
             else:
                 return [self._row_to_capsule_dict(row) for row in rows]
     
+    @staticmethod
+    def _facet_conditions(
+        query: str = None,
+        category: str = None,
+        grade: str = None,
+        agent: str = None,
+        keyword: str = None,
+        since: str = None,
+        until: str = None
+    ) -> Tuple[List[str], List[Any]]:
+        """分面搜索的过滤条件 (文本匹配与 search_capsules 相同的列)"""
+        conditions = []
+        params = []
+        if query:
+            conditions.append("(k.title LIKE ? OR k.insight LIKE ? OR k.category LIKE ? OR k.keywords LIKE ?)")
+            params.extend([f"%{query}%"] * 4)
+        if category:
+            conditions.append("k.category = ?")
+            params.append(category)
+        if grade:
+            conditions.append(f"{GRADE_SQL} = ?")
+            params.append(grade)
+        if agent:
+            conditions.append("k.id IN (SELECT capsule_id FROM capsule_agents WHERE agent = ?)")
+            params.append(agent)
+        if keyword:
+            conditions.append("k.id IN (SELECT capsule_id FROM capsule_keywords WHERE keyword = ?)")
+            params.append(keyword)
+        if since:
+            conditions.append("k.created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("k.created_at < ?")
+            params.append(until)
+        return conditions, params
+    
+    def get_capsule_facets(
+        self,
+        conditions: List[str],
+        params: List[Any],
+        facet_limit: int = 10,
+        bucket: str = "month"
+    ) -> Dict[str, List[Dict]]:
+        """
+        一条 SQL 统计满足条件的胶囊在各分面上的数量
+        
+        命中的胶囊物化一次 (只含 ID / 分类 / 等级 / 时间桶)，分类 / 等级 / 时间桶直接分组；
+        Agent / 关键词以命中的胶囊为外层按主键前缀连接映射表后分组，
+        没有过滤条件时直接分组映射表 (覆盖索引扫描)。
+        
+        Args:
+            conditions: 过滤条件 (见 _facet_conditions)
+            params: 条件参数
+            facet_limit: Agent / 关键词分面返回的数量 (-1 为全部)
+            bucket: 时间分面的粒度 (year / month / day)
+        
+        Returns:
+            {"category", "grade", "agent", "keyword", "time": [{"value", "count"}]}；
+            时间桶按时间升序，其余按数量降序
+        """
+        if bucket not in TIME_BUCKETS:
+            raise ValueError(f"不支持的时间粒度: {bucket}")
+        
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        if conditions:
+            agents = "matched m CROSS JOIN capsule_agents a ON a.capsule_id = m.id"
+            keywords = "matched m CROSS JOIN capsule_keywords kw ON kw.capsule_id = m.id"
+        else:
+            agents, keywords = "capsule_agents a", "capsule_keywords kw"
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"""
+                WITH matched AS MATERIALIZED (
+                    SELECT k.id, k.category, {GRADE_SQL} AS grade,
+                           substr(k.created_at, 1, {TIME_BUCKETS[bucket]}) AS bucket
+                    FROM knowledge_capsules k{where}
+                )
+                SELECT 'category', category, COUNT(*) FROM matched GROUP BY category
+                UNION ALL
+                SELECT 'grade', grade, COUNT(*) FROM matched GROUP BY grade
+                UNION ALL
+                SELECT 'time', bucket, COUNT(*) FROM matched GROUP BY bucket
+                UNION ALL
+                SELECT * FROM (
+                    SELECT 'agent', a.agent, COUNT(*) AS count
+                    FROM {agents}
+                    GROUP BY a.agent ORDER BY count DESC, a.agent LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT 'keyword', kw.keyword, COUNT(*) AS count
+                    FROM {keywords}
+                    GROUP BY kw.keyword ORDER BY count DESC, kw.keyword LIMIT ?
+                )
+            """, [*params, facet_limit, facet_limit])
+            
+            facets: Dict[str, List[Dict]] = {name: [] for name in ("category", "grade", "agent", "keyword", "time")}
+            for facet, value, count in cursor.fetchall():
+                facets[facet].append({"value": value, "count": count})
+        
+        for facet, items in facets.items():
+            if facet == "time":
+                items.sort(key=lambda x: x["value"] or "")
+            else:
+                items.sort(key=lambda x: (-x["count"], x["value"] or ""))
+        return facets
+    
+    def search_capsules_faceted(
+        self,
+        query: str = None,
+        category: str = None,
+        grade: str = None,
+        agent: str = None,
+        keyword: str = None,
+        since: str = None,
+        until: str = None,
+        sort: str = "quality",
+        limit: int = 20,
+        offset: int = 0,
+        facet_limit: int = 10,
+        bucket: str = "month"
+    ) -> Dict:
+        """
+        分面搜索知识胶囊: 一页结果 + 当前查询与过滤条件下的分面数量
+        
+        Args:
+            query: 搜索关键词 (匹配标题 / 洞见 / 分类 / 关键词)
+            category: 分类过滤
+            grade: 等级过滤 (A / B / C，按质量分数推断)
+            agent: 来源 Agent 过滤
+            keyword: 关键词过滤
+            since: 创建时间下限 (含，ISO 格式)
+            until: 创建时间上限 (不含，ISO 格式)
+            sort: 排序方式 (同 list_knowledge_capsules)
+            limit: 返回数量限制
+            offset: 偏移量
+            facet_limit: Agent / 关键词分面返回的数量
+            bucket: 时间分面的粒度 (year / month / day)
+        
+        Returns:
+            {"total", "capsules", "facets"}
+        """
+        conditions, params = self._facet_conditions(query, category, grade, agent, keyword, since, until)
+        facets = self.get_capsule_facets(conditions, params, facet_limit, bucket)
+        return {
+            "total": sum(item["count"] for item in facets["grade"]),
+            "capsules": self._query_capsules(conditions, params, sort, limit, offset),
+            "facets": facets
+        }
+    
     def get_capsules_by_topic(self, topic_id: str) -> List[Dict]:
         """获取指定话题的所有胶囊"""
         with self._get_connection() as conn:
@@ -597,21 +1045,584 @@ class CapsuleStorage:
             
             return [self._row_to_capsule_dict(row) for row in rows]
     
-    def get_top_capsules(self, limit: int = 10, min_quality: float = 0) -> List[Dict]:
-        """获取高质量胶囊"""
+    def get_top_capsules(self, limit: int = 10, min_quality: float = 0, sort: str = "quality") -> List[Dict]:
+        """获取高质量胶囊 (sort 可选 pagerank / degree / betweenness 按图谱中心性排序)"""
+        return self._query_capsules(["k.quality_score >= ?"], [min_quality], sort, limit)
+    
+    # ============= 关键词 / Agent 索引查询 =============
+    
+    def get_knowledge_capsules_by_ids(self, capsule_ids: List[str]) -> List[Dict]:
+        """
+        批量获取知识胶囊
+        
+        Args:
+            capsule_ids: 胶囊 ID 列表
+            
+        Returns:
+            胶囊列表 (顺序与传入的 ID 一致，不存在的 ID 被忽略)
+        """
+        if not capsule_ids:
+            return []
+        
+        capsule_ids = list(capsule_ids)
+        by_id = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            for start in range(0, len(capsule_ids), QUERY_CHUNK):
+                chunk = capsule_ids[start:start + QUERY_CHUNK]
+                cursor.execute(
+                    f"SELECT * FROM knowledge_capsules WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                by_id.update((row["id"], self._row_to_capsule_dict(row)) for row in cursor.fetchall())
+        
+        return [by_id[cid] for cid in capsule_ids if cid in by_id]
+    
+    def get_capsule_ids_by_keyword(self, keyword: str) -> List[str]:
+        """获取包含指定关键词的胶囊 ID (索引查询)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "SELECT capsule_id FROM capsule_keywords WHERE keyword = ?",
+                (keyword,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_capsule_ids_by_agent(self, agent: str) -> List[str]:
+        """获取指定 Agent 参与的胶囊 ID (索引查询)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "SELECT capsule_id FROM capsule_agents WHERE agent = ?",
+                (agent,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_capsules_by_keyword(self, keyword: str, limit: int = 100) -> List[Dict]:
+        """获取包含指定关键词的胶囊 (按质量排序)"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
-                SELECT * FROM knowledge_capsules
-                WHERE quality_score >= ?
-                ORDER BY quality_score DESC, created_at DESC
+                SELECT c.* FROM capsule_keywords k
+                JOIN knowledge_capsules c ON c.id = k.capsule_id
+                WHERE k.keyword = ?
+                ORDER BY c.quality_score DESC, c.created_at DESC
                 LIMIT ?
-            """, (min_quality, limit))
+            """, (keyword, limit))
             
+            return [self._row_to_capsule_dict(row) for row in cursor.fetchall()]
+    
+    def get_capsules_by_agent(self, agent: str, limit: int = 100) -> List[Dict]:
+        """获取指定 Agent 参与的胶囊 (按质量排序)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT c.* FROM capsule_agents a
+                JOIN knowledge_capsules c ON c.id = a.capsule_id
+                WHERE a.agent = ?
+                ORDER BY c.quality_score DESC, c.created_at DESC
+                LIMIT ?
+            """, (agent, limit))
+            
+            return [self._row_to_capsule_dict(row) for row in cursor.fetchall()]
+    
+    def get_capsules_by_keywords(self, keywords: List[str], limit: int = 20) -> List[Dict]:
+        """
+        获取匹配任一关键词的胶囊
+        
+        Args:
+            keywords: 关键词列表
+            limit: 返回数量限制
+            
+        Returns:
+            胶囊列表，按命中关键词数量、质量分数排序
+        """
+        terms = self._normalize_terms(keywords)
+        if not terms:
+            return []
+        
+        placeholders = ",".join("?" * len(terms))
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"""
+                SELECT c.*, m.hits FROM (
+                    SELECT capsule_id, COUNT(*) AS hits
+                    FROM capsule_keywords
+                    WHERE keyword IN ({placeholders})
+                    GROUP BY capsule_id
+                ) m
+                JOIN knowledge_capsules c ON c.id = m.capsule_id
+                ORDER BY m.hits DESC, c.quality_score DESC
+                LIMIT ?
+            """, terms + [limit])
+            
+            return [self._row_to_capsule_dict(row) for row in cursor.fetchall()]
+    
+    def get_capsules_sharing_keywords(
+        self,
+        capsule_id: str,
+        limit: int = 20,
+        max_position: int = None
+    ) -> List[Dict]:
+        """
+        获取与指定胶囊共享关键词的胶囊 ID 及共享数量
+        
+        Args:
+            capsule_id: 胶囊 ID
+            limit: 返回数量限制
+            max_position: 仅考虑前 N 个关键词 (与图谱构建的截断保持一致)
+            
+        Returns:
+            [{"capsule_id": ..., "shared": 共享关键词数}, ...]
+        """
+        position_filter = ""
+        params: List[Any] = [capsule_id]
+        if max_position is not None:
+            position_filter = "AND a.position < ? AND b.position < ?"
+            params.extend([max_position, max_position])
+        params.extend([capsule_id, limit])
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"""
+                SELECT b.capsule_id, COUNT(*) AS shared
+                FROM capsule_keywords a
+                JOIN capsule_keywords b ON b.keyword = a.keyword
+                WHERE a.capsule_id = ? {position_filter}
+                  AND b.capsule_id != ?
+                GROUP BY b.capsule_id
+                ORDER BY shared DESC
+                LIMIT ?
+            """, params)
+            
+            return [{"capsule_id": row[0], "shared": row[1]} for row in cursor.fetchall()]
+    
+    def get_keyword_frequencies(self, limit: int = 50) -> List[Dict]:
+        """获取关键词频次 (按出现次数降序)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT keyword, COUNT(*) AS count
+                FROM capsule_keywords
+                GROUP BY keyword
+                ORDER BY count DESC, keyword
+                LIMIT ?
+            """, (limit,))
+            
+            return [{"keyword": row[0], "count": row[1]} for row in cursor.fetchall()]
+    
+    def get_agent_frequencies(self, limit: int = 50) -> List[Dict]:
+        """获取 Agent 参与胶囊数量 (按数量降序)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT agent, COUNT(*) AS count
+                FROM capsule_agents
+                GROUP BY agent
+                ORDER BY count DESC, agent
+                LIMIT ?
+            """, (limit,))
+            
+            return [{"agent": row[0], "count": row[1]} for row in cursor.fetchall()]
+    
+    def get_keyword_cooccurrence(self, keyword: str = None, limit: int = 50) -> List[Dict]:
+        """
+        获取关键词共现次数
+        
+        Args:
+            keyword: 指定关键词时只返回与它共现的关键词，否则返回全局共现对
+            limit: 返回数量限制
+            
+        Returns:
+            [{"keyword_a": ..., "keyword_b": ..., "count": ...}, ...]
+        """
+        if keyword is not None:
+            sql = """
+                SELECT a.keyword, b.keyword, COUNT(*) AS count
+                FROM capsule_keywords a
+                JOIN capsule_keywords b
+                  ON b.capsule_id = a.capsule_id AND b.keyword != a.keyword
+                WHERE a.keyword = ?
+                GROUP BY b.keyword
+                ORDER BY count DESC, b.keyword
+                LIMIT ?
+            """
+            params = (keyword, limit)
+        else:
+            sql = """
+                SELECT a.keyword, b.keyword, COUNT(*) AS count
+                FROM capsule_keywords a
+                JOIN capsule_keywords b
+                  ON b.capsule_id = a.capsule_id AND b.keyword > a.keyword
+                GROUP BY a.keyword, b.keyword
+                ORDER BY count DESC, a.keyword, b.keyword
+                LIMIT ?
+            """
+            params = (limit,)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(sql, params)
+            return [
+                {"keyword_a": row[0], "keyword_b": row[1], "count": row[2]}
+                for row in cursor.fetchall()
+            ]
+    
+    # ============= 图谱中心性 =============
+    
+    def save_graph_centrality(self, scores: Dict[str, Dict], computed_at: str = None) -> int:
+        """
+        整体替换图谱中心性结果
+        
+        Args:
+            scores: {节点ID: {"node_type", "pagerank", "degree", "betweenness"}}
+            computed_at: 计算时间
+            
+        Returns:
+            写入的节点数
+        """
+        computed_at = computed_at or datetime.now().isoformat()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM graph_centrality")
+            cursor.executemany(
+                """
+                INSERT INTO graph_centrality
+                (node_id, node_type, pagerank, degree, betweenness, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (node_id, s["node_type"], s["pagerank"], s["degree"], s["betweenness"], computed_at)
+                    for node_id, s in scores.items()
+                ]
+            )
+            return len(scores)
+    
+    def get_graph_centrality(
+        self,
+        node_type: str = None,
+        sort: str = "pagerank",
+        limit: int = 20
+    ) -> List[Dict]:
+        """
+        按中心性排名的节点
+        
+        Args:
+            node_type: 节点类型过滤 (capsule / agent / keyword)
+            sort: 排序指标 (pagerank / degree / betweenness)
+            limit: 返回数量
+        """
+        if sort not in CENTRALITY_METRICS:
+            raise ValueError(f"不支持的中心性指标: {sort}")
+        
+        query = "SELECT * FROM graph_centrality"
+        params: List[Any] = []
+        if node_type:
+            query += " WHERE node_type = ?"
+            params.append(node_type)
+        query += f" ORDER BY {sort} DESC LIMIT ?"
+        params.append(limit)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_graph_centrality_by_ids(self, node_ids: List[str]) -> Dict[str, Dict]:
+        """
+        批量读取节点的中心性
+        
+        Returns:
+            {节点ID: {"node_type", "pagerank", "degree", "betweenness", ...}}，未计算的节点不在结果中
+        """
+        if not node_ids:
+            return {}
+        
+        node_ids = list(node_ids)
+        centrality = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            for start in range(0, len(node_ids), QUERY_CHUNK):
+                chunk = node_ids[start:start + QUERY_CHUNK]
+                cursor.execute(
+                    f"SELECT * FROM graph_centrality WHERE node_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                centrality.update((row["node_id"], dict(row)) for row in cursor.fetchall())
+        return centrality
+    
+    # ============= 图谱社区 =============
+    
+    def save_graph_communities(self, assignments: Dict[str, int], computed_at: str = None) -> int:
+        """
+        整体替换图谱社区划分
+        
+        Args:
+            assignments: {节点ID: 社区编号}
+            computed_at: 计算时间
+            
+        Returns:
+            写入的节点数
+        """
+        computed_at = computed_at or datetime.now().isoformat()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM graph_communities")
+            cursor.executemany(
+                "INSERT INTO graph_communities (node_id, community, computed_at) VALUES (?, ?, ?)",
+                [(node_id, int(community), computed_at) for node_id, community in assignments.items()]
+            )
+            return len(assignments)
+    
+    def get_graph_communities(self) -> Tuple[Dict[str, int], Optional[str]]:
+        """
+        读取已持久化的社区划分
+        
+        Returns:
+            ({节点ID: 社区编号}, 计算时间)，没有划分时为 ({}, None)
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT node_id, community, computed_at FROM graph_communities")
+            assignments = {}
+            computed_at = None
+            for row in cursor.fetchall():
+                assignments[row["node_id"]] = row["community"]
+                computed_at = row["computed_at"]
+            return assignments, computed_at
+    
+    # ============= 图谱布局 =============
+    
+    def save_graph_layout(self, positions: Dict[str, Tuple[float, float]], computed_at: str = None) -> int:
+        """
+        整体替换图谱布局坐标
+        
+        Args:
+            positions: {节点ID: (x, y)}
+            computed_at: 计算时间
+            
+        Returns:
+            写入的节点数
+        """
+        computed_at = computed_at or datetime.now().isoformat()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM graph_layout")
+            cursor.executemany(
+                "INSERT INTO graph_layout (node_id, x, y, computed_at) VALUES (?, ?, ?, ?)",
+                [(node_id, float(x), float(y), computed_at) for node_id, (x, y) in positions.items()]
+            )
+            return len(positions)
+    
+    def get_graph_layout(self) -> Tuple[Dict[str, Tuple[float, float]], Optional[str]]:
+        """
+        读取已持久化的布局坐标
+        
+        Returns:
+            ({节点ID: (x, y)}, 计算时间)，没有布局时为 ({}, None)
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT node_id, x, y, computed_at FROM graph_layout")
+            positions = {}
+            computed_at = None
+            for row in cursor.fetchall():
+                positions[row["node_id"]] = (row["x"], row["y"])
+                computed_at = row["computed_at"]
+            return positions, computed_at
+    
+    # ============= 相关胶囊 =============
+    
+    def save_related_capsules(
+        self,
+        related: Dict[str, List[Tuple[str, float]]],
+        computed_at: str = None,
+        replace: bool = False
+    ) -> int:
+        """
+        写入预计算的相关胶囊 (覆盖给定胶囊原有的列表)
+        
+        Args:
+            related: {胶囊ID: [(相关胶囊ID, 分数), ...]}，按分数降序
+            computed_at: 计算时间
+            replace: 是否先清空整张表 (全量计算)
+            
+        Returns:
+            写入的行数
+        """
+        computed_at = computed_at or datetime.now().isoformat()
+        rows = [
+            (capsule_id, rank, related_id, float(score), computed_at)
+            for capsule_id, items in related.items()
+            for rank, (related_id, score) in enumerate(items)
+        ]
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            if replace:
+                cursor.execute("DELETE FROM related_capsules")
+            else:
+                cursor.executemany(
+                    "DELETE FROM related_capsules WHERE capsule_id = ?",
+                    [(capsule_id,) for capsule_id in related]
+                )
+            cursor.executemany(
+                """
+                INSERT INTO related_capsules (capsule_id, rank, related_id, score, computed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            return len(rows)
+    
+    def get_related_capsule_ids(self, capsule_ids: List[str]) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        批量读取相关胶囊列表
+        
+        Returns:
+            {胶囊ID: [(相关胶囊ID, 分数), ...]}，没有预计算结果的胶囊不在结果中
+        """
+        if not capsule_ids:
+            return {}
+        
+        capsule_ids = list(capsule_ids)
+        related: Dict[str, List[Tuple[str, float]]] = {}
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            for start in range(0, len(capsule_ids), QUERY_CHUNK):
+                chunk = capsule_ids[start:start + QUERY_CHUNK]
+                cursor.execute(
+                    f"""
+                    SELECT capsule_id, related_id, score FROM related_capsules
+                    WHERE capsule_id IN ({','.join('?' * len(chunk))})
+                    ORDER BY capsule_id, rank
+                    """,
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    related.setdefault(row["capsule_id"], []).append((row["related_id"], row["score"]))
+        return related
+    
+    def get_related_knowledge_capsules(self, capsule_id: str, limit: int = 5) -> Optional[List[Dict]]:
+        """
+        读取预计算的相关胶囊 (主键查询)
+        
+        Returns:
+            胶囊列表 (附带 related_score)；该胶囊尚无预计算结果时返回 None
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "SELECT related_id, score FROM related_capsules WHERE capsule_id = ? ORDER BY rank LIMIT ?",
+                (capsule_id, limit)
+            )
             rows = cursor.fetchall()
+        if not rows:
+            return None
+        
+        scores = {row["related_id"]: row["score"] for row in rows}
+        capsules = self.get_knowledge_capsules_by_ids(list(scores))
+        for capsule in capsules:
+            capsule["related_score"] = round(scores[capsule["id"]], 4)
+        return capsules
+    
+    def get_related_referrers(self, capsule_id: str) -> List[str]:
+        """列表中包含指定胶囊的胶囊 ID (反向索引查询)"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            return [self._row_to_capsule_dict(row) for row in rows]
+            cursor.execute(
+                "SELECT DISTINCT capsule_id FROM related_capsules WHERE related_id = ?",
+                (capsule_id,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def delete_related_capsules(self, capsule_id: str) -> int:
+        """删除胶囊自身的相关列表，并把它从其他胶囊的列表中移除"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM related_capsules WHERE capsule_id = ?", (capsule_id,))
+            deleted = cursor.rowcount
+            cursor.execute("DELETE FROM related_capsules WHERE related_id = ?", (capsule_id,))
+            return deleted + cursor.rowcount
+    
+    def count_related_capsules(self) -> int:
+        """已有预计算结果的胶囊数"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT COUNT(DISTINCT capsule_id) FROM related_capsules")
+            return cursor.fetchone()[0]
+    
+    # ============= MinHash 签名 =============
+    
+    def save_capsule_signatures(self, signatures: Dict[str, Tuple[int, bytes]]) -> int:
+        """
+        写入胶囊 MinHash 签名
+        
+        Args:
+            signatures: {胶囊ID: (校验值, 签名字节)}
+            
+        Returns:
+            写入的签名数
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany(
+                "INSERT OR REPLACE INTO capsule_minhash (capsule_id, fingerprint, signature) VALUES (?, ?, ?)",
+                [(capsule_id, fingerprint, signature) for capsule_id, (fingerprint, signature) in signatures.items()]
+            )
+            return len(signatures)
+    
+    def iter_capsule_signatures(self, batch_size: int = 5000):
+        """
+        逐批遍历胶囊 MinHash 签名
+        
+        Yields:
+            (胶囊ID, 校验值, 签名字节)
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT capsule_id, fingerprint, signature FROM capsule_minhash")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row["capsule_id"], row["fingerprint"], row["signature"]
+    
+    def delete_capsule_signatures(self, capsule_ids: List[str]) -> int:
+        """删除胶囊 MinHash 签名"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany(
+                "DELETE FROM capsule_minhash WHERE capsule_id = ?",
+                [(capsule_id,) for capsule_id in capsule_ids]
+            )
+            return cursor.rowcount
     
     # ============= 统计功能 =============
     
@@ -0,0 +1,271 @@
+"""
+SuiLight Knowledge Salon - 胶囊列式快照
+
+将胶囊语料导出为紧凑的列式格式，供向量化分析使用:
+- 每列一个 .npy 文件，可通过 mmap 零拷贝加载
+- 分类 / 等级 / 状态使用字典编码 (整数编码 + 词表)
+- 关键词 / Agent 使用 CSR 形式 (offsets + codes) 存储变长列表
+- 安装 pyarrow 时可额外导出 Parquet
+
+用法:
+    from src.storage.columnar import ColumnarSnapshot
+    snapshot = ColumnarSnapshot.from_storage(storage)
+    snapshot.save("data/columnar")
+    snapshot = ColumnarSnapshot.load("data/columnar")
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import logging
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet 导出为可选功能
+    pa = None
+    pq = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+META_NAME = "meta.json"
+
+# 字典编码的标量列
+DICT_COLUMNS = ["category", "grade", "status"]
+
+# 数值列
+FLOAT_COLUMNS = [
+    "quality_score", "confidence",
+    "truth_score", "goodness_score", "beauty_score", "intelligence_score"
+]
+
+# CSR 形式的列表列
+LIST_COLUMNS = {"keyword": "keywords", "agent": "source_agents"}
+
+GRADES = ["A", "B", "C", "D"]
+
+
+def infer_grade(quality_score: float) -> str:
+    """按质量分数推断等级 (与批量生成脚本、图谱统计保持一致)"""
+    if quality_score >= 80:
+        return "A"
+    if quality_score >= 60:
+        return "B"
+    return "C"
+
+
+def _parse_timestamp(value: Optional[str]) -> np.datetime64:
+    if not value:
+        return np.datetime64("NaT", "s")
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return np.datetime64("NaT", "s")
+    return np.datetime64(parsed.replace(tzinfo=None), "s")
+
+
+class _Encoder:
+    """字符串 -> 整数编码"""
+    
+    def __init__(self, vocab: List[str] = None):
+        self.vocab: List[str] = list(vocab or [])
+        self.codes: Dict[str, int] = {v: i for i, v in enumerate(self.vocab)}
+    
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.vocab)
+            self.codes[value] = code
+            self.vocab.append(value)
+        return code
+
+
+class ColumnarSnapshot:
+    """胶囊语料的列式快照"""
+    
+    def __init__(self, columns: Dict[str, np.ndarray], vocab: Dict[str, List[str]], meta: Dict = None):
+        self.columns = columns
+        self.vocab = vocab
+        self.meta = meta or {}
+    
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+    
+    # ============ 构建 ============
+    
+    @classmethod
+    def from_capsules(cls, capsules: Iterable[Dict]) -> "ColumnarSnapshot":
+        """从胶囊字典序列构建快照 (单次遍历)"""
+        encoders = {name: _Encoder(GRADES if name == "grade" else None) for name in DICT_COLUMNS}
+        list_encoders = {name: _Encoder() for name in LIST_COLUMNS}
+        
+        ids: List[str] = []
+        codes = {name: [] for name in DICT_COLUMNS}
+        floats = {name: [] for name in FLOAT_COLUMNS}
+        created: List[np.datetime64] = []
+        list_codes = {name: [] for name in LIST_COLUMNS}
+        list_offsets = {name: [0] for name in LIST_COLUMNS}
+        
+        for capsule in capsules:
+            ids.append(str(capsule.get("id", "")))
+            
+            quality = float(capsule.get("quality_score") or 0)
+            dimensions = capsule.get("dimensions") or {}
+            if not isinstance(dimensions, dict):
+                dimensions = {}
+            
+            codes["category"].append(encoders["category"].encode(capsule.get("category") or "general"))
+            codes["grade"].append(encoders["grade"].encode(capsule.get("grade") or infer_grade(quality)))
+            codes["status"].append(encoders["status"].encode(capsule.get("status") or "draft"))
+            
+            floats["quality_score"].append(quality)
+            floats["confidence"].append(float(capsule.get("confidence") or 0))
+            for name in FLOAT_COLUMNS[2:]:
+                floats[name].append(float(dimensions.get(name) or 0))
+            
+            created.append(_parse_timestamp(capsule.get("created_at")))
+            
+            for name, field_name in LIST_COLUMNS.items():
+                values = capsule.get(field_name) or []
+                if isinstance(values, list):
+                    list_codes[name].extend(list_encoders[name].encode(str(v)) for v in values)
+                list_offsets[name].append(len(list_codes[name]))
+        
+        columns = {
+            "id": np.array(ids, dtype=str),
+            "created_at": np.array(created, dtype="datetime64[s]"),
+        }
+        for name in DICT_COLUMNS:
+            columns[f"{name}_code"] = np.array(codes[name], dtype=np.int32)
+        for name in FLOAT_COLUMNS:
+            columns[name] = np.array(floats[name], dtype=np.float32)
+        for name in LIST_COLUMNS:
+            columns[f"{name}_offsets"] = np.array(list_offsets[name], dtype=np.int64)
+            columns[f"{name}_codes"] = np.array(list_codes[name], dtype=np.int32)
+        
+        vocab = {name: encoders[name].vocab for name in DICT_COLUMNS}
+        vocab.update({name: list_encoders[name].vocab for name in LIST_COLUMNS})
+        
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "rows": len(ids),
+            "created_at": datetime.now().isoformat()
+        }
+        return cls(columns, vocab, meta)
+    
+    @classmethod
+    def from_storage(cls, storage, batch_size: int = 1000) -> "ColumnarSnapshot":
+        """从胶囊存储流式构建快照"""
+        return cls.from_capsules(storage.iter_knowledge_capsules(batch_size=batch_size))
+    
+    # ============ 读写 ============
+    
+    def save(self, out_dir: str, parquet: bool = None) -> Dict[str, str]:
+        """
+        保存快照
+        
+        Args:
+            out_dir: 输出目录
+            parquet: 是否额外导出 Parquet，默认在 pyarrow 可用时导出
+        
+        Returns:
+            {列名: 文件路径}
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        files = {}
+        for name, array in self.columns.items():
+            path = os.path.join(out_dir, f"{name}.npy")
+            np.save(path, array, allow_pickle=False)
+            files[name] = path
+        
+        with open(os.path.join(out_dir, META_NAME), "w", encoding="utf-8") as f:
+            json.dump({**self.meta, "vocab": self.vocab, "columns": list(self.columns)},
+                      f, ensure_ascii=False)
+        
+        if parquet is None:
+            parquet = pa is not None
+        if parquet:
+            path = os.path.join(out_dir, "capsules.parquet")
+            pq.write_table(self.to_arrow(), path, compression="zstd")
+            files["parquet"] = path
+        
+        logger.info(f"列式快照已保存: {out_dir} ({len(self)} 行)")
+        return files
+    
+    @classmethod
+    def load(cls, snapshot_dir: str, mmap: bool = True) -> "ColumnarSnapshot":
+        """加载快照 (mmap=True 时各列为只读内存映射)"""
+        with open(os.path.join(snapshot_dir, META_NAME), encoding="utf-8") as f:
+            meta = json.load(f)
+        
+        mmap_mode = "r" if mmap else None
+        columns = {
+            name: np.load(os.path.join(snapshot_dir, f"{name}.npy"), mmap_mode=mmap_mode,
+                          allow_pickle=False)
+            for name in meta.pop("columns")
+        }
+        vocab = meta.pop("vocab")
+        return cls(columns, vocab, meta)
+    
+    # ============ 访问 ============
+    
+    def decode(self, name: str) -> np.ndarray:
+        """将字典编码列解码为字符串数组"""
+        vocab = np.array(self.vocab[name], dtype=object)
+        return vocab[self.columns[f"{name}_code"]]
+    
+    def list_column(self, name: str, row: int) -> List[str]:
+        """获取第 row 行的关键词 / Agent 列表"""
+        offsets = self.columns[f"{name}_offsets"]
+        codes = self.columns[f"{name}_codes"][offsets[row]:offsets[row + 1]]
+        return [self.vocab[name][c] for c in codes]
+    
+    def list_row_index(self, name: str) -> np.ndarray:
+        """CSR 列中每个元素所属的行号 (与 {name}_codes 等长)"""
+        offsets = self.columns[f"{name}_offsets"]
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(offsets))
+    
+    def to_arrow(self):
+        """转换为 pyarrow.Table (需要 pyarrow)"""
+        if pa is None:
+            raise ImportError("Parquet / Arrow 导出需要 pyarrow: pip install pyarrow")
+        
+        arrays = {"id": pa.array(self.columns["id"])}
+        for name in DICT_COLUMNS:
+            arrays[name] = pa.DictionaryArray.from_arrays(
+                pa.array(self.columns[f"{name}_code"]), pa.array(self.vocab[name])
+            )
+        for name in FLOAT_COLUMNS:
+            arrays[name] = pa.array(self.columns[name])
+        arrays["created_at"] = pa.array(self.columns["created_at"])
+        for name in LIST_COLUMNS:
+            values = pa.DictionaryArray.from_arrays(
+                pa.array(self.columns[f"{name}_codes"]), pa.array(self.vocab[name])
+            )
+            arrays[LIST_COLUMNS[name]] = pa.ListArray.from_arrays(
+                pa.array(self.columns[f"{name}_offsets"].astype(np.int32)), values
+            )
+        return pa.table(arrays)
+    
+    def memory_usage(self) -> int:
+        """各列占用的字节数"""
+        return int(sum(array.nbytes for array in self.columns.values()))
+
+
+def export_columnar(storage, out_dir: str = None, parquet: bool = None) -> ColumnarSnapshot:
+    """从存储导出列式快照到 out_dir (默认 data/columnar)"""
+    if out_dir is None:
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        out_dir = os.path.join(base_dir, "data", "columnar")
+    
+    snapshot = ColumnarSnapshot.from_storage(storage)
+    snapshot.save(out_dir, parquet=parquet)
+    return snapshot
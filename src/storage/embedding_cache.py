@@ -0,0 +1,219 @@
+"""
+SuiLight Knowledge Salon - 向量缓存
+
+按内容寻址的 embedding 持久化缓存:
+- 键为 (provider, model, 内容哈希)，同一段文本在任意功能中只向量化一次
+- 向量以 float32 BLOB 存储在 SQLite (默认 data/embeddings.db)
+- 进程内 LRU 作为热数据层，命中时不访问数据库
+"""
+
+import hashlib
+import sqlite3
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 进程内 LRU 的条目数
+MEMORY_CACHE_SIZE = 10000
+
+# 单条 SQL 中 IN (...) 的参数上限
+QUERY_CHUNK = 500
+
+
+def content_hash(text: str) -> str:
+    """文本内容哈希 (sha256 十六进制)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding 持久化缓存
+    
+    读取先查进程内 LRU，再批量查 SQLite；写入同时更新两层。
+    """
+    
+    def __init__(self, db_path: str = None, memory_size: int = MEMORY_CACHE_SIZE):
+        """
+        初始化向量缓存
+        
+        Args:
+            db_path: 数据库路径，默认为 data/embeddings.db
+            memory_size: 进程内 LRU 条目数
+        """
+        if db_path is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+            db_path = os.path.join(base_dir, "data", "embeddings.db")
+        
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[Tuple[str, str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ensure_db_exists()
+        logger.info(f"向量缓存初始化完成: {db_path}")
+    
+    def _ensure_db_exists(self):
+        """确保数据库和表存在"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at TEXT,
+                    PRIMARY KEY (provider, model, content_hash)
+                ) WITHOUT ROWID
+            """)
+    
+    @contextmanager
+    def _get_connection(self):
+        """获取数据库连接"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"向量缓存数据库操作失败: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    # ============= 进程内 LRU =============
+    
+    def _remember(self, key: Tuple[str, str, str], vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+    
+    def _recall(self, key: Tuple[str, str, str]):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            return vector
+    
+    # ============= 读写 =============
+    
+    def get_many(self, provider: str, model: str, hashes: Iterable[str]) -> Tuple[Dict[str, np.ndarray], int]:
+        """
+        批量读取
+        
+        Args:
+            provider: 向量提供方
+            model: 模型名称
+            hashes: 内容哈希
+        
+        Returns:
+            ({内容哈希: 向量}, 其中来自进程内 LRU 的条目数)
+        """
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for digest in dict.fromkeys(hashes):
+            vector = self._recall((provider, model, digest))
+            if vector is None:
+                missing.append(digest)
+            else:
+                found[digest] = vector
+        memory_hits = len(found)
+        
+        if missing:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                
+                for start in range(0, len(missing), QUERY_CHUNK):
+                    chunk = missing[start:start + QUERY_CHUNK]
+                    cursor.execute(f"""
+                        SELECT content_hash, vector FROM embedding_cache
+                        WHERE provider = ? AND model = ? AND content_hash IN ({",".join("?" * len(chunk))})
+                    """, (provider, model, *chunk))
+                    for digest, blob in cursor.fetchall():
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[digest] = vector
+                        self._remember((provider, model, digest), vector)
+        return found, memory_hits
+    
+    def put_many(self, provider: str, model: str, vectors: Dict[str, np.ndarray]) -> int:
+        """
+        批量写入
+        
+        Args:
+            provider: 向量提供方
+            model: 模型名称
+            vectors: {内容哈希: 向量}
+        
+        Returns:
+            写入的条目数
+        """
+        now = datetime.now().isoformat()
+        rows = []
+        for digest, vector in vectors.items():
+            vector = np.asarray(vector, dtype=np.float32)
+            self._remember((provider, model, digest), vector)
+            rows.append((provider, model, digest, len(vector), vector.tobytes(), now))
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany("""
+                INSERT OR REPLACE INTO embedding_cache
+                (provider, model, content_hash, dim, vector, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+    
+    def count(self, provider: str = None, model: str = None) -> int:
+        """缓存条目数"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            if provider is None:
+                cursor.execute("SELECT COUNT(*) FROM embedding_cache")
+            else:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM embedding_cache WHERE provider = ? AND model = ?",
+                    (provider, model or "")
+                )
+            return cursor.fetchone()[0]
+    
+    def clear(self, provider: str = None, model: str = None) -> int:
+        """清除缓存 (指定 provider / model 时只清除该模型)"""
+        with self._lock:
+            if provider is None:
+                self._memory.clear()
+            else:
+                for key in [key for key in self._memory if key[:2] == (provider, model or "")]:
+                    del self._memory[key]
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            if provider is None:
+                cursor.execute("DELETE FROM embedding_cache")
+            else:
+                cursor.execute(
+                    "DELETE FROM embedding_cache WHERE provider = ? AND model = ?",
+                    (provider, model or "")
+                )
+            return cursor.rowcount
+
+
+def get_embedding_cache(db_path: str = None) -> EmbeddingCache:
+    """获取向量缓存实例"""
+    return EmbeddingCache(db_path)
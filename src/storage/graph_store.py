@@ -0,0 +1,628 @@
+"""
+SuiLight Knowledge Salon - SQLite 图谱存储
+
+功能:
+- 节点 / 边持久化 (多个图谱共用一个库，按 graph 列区分)
+- 边表在 (graph, source, type) 与 (graph, target, type) 上建索引
+- k 跳邻域与最短路径用递归 CTE 在 SQLite 内完成，无需把整张图加载到内存
+- 与 src/graph.py 的 KnowledgeGraph 互相转换 (save_graph / load_graph)
+- 节点内容指纹单独存放 (graph_fingerprints)，不进入节点属性，供加载时检查与胶囊存储是否一致
+"""
+
+import sqlite3
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Any
+from datetime import datetime
+from contextlib import contextmanager
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 遍历方向: out 沿边方向, in 逆边方向, both 视为无向
+DIRECTIONS = ("out", "in", "both")
+
+# 最短路径默认最大深度 (递归 CTE 会展开该深度内的全部可达节点)
+MAX_PATH_DEPTH = 6
+
+
+class GraphStore:
+    """
+    SQLite 图谱存储
+    
+    边以 (graph, source, target, type) 为主键，重复写入同一条边时更新权重与属性。
+    """
+    
+    def __init__(self, db_path: str = None):
+        """
+        初始化图谱存储
+        
+        Args:
+            db_path: 数据库路径，默认为 data/graph.db
+        """
+        if db_path is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+            db_path = os.path.join(base_dir, "data", "graph.db")
+        
+        self.db_path = db_path
+        self._ensure_db_exists()
+        logger.info(f"图谱存储初始化完成: {db_path}")
+    
+    def _ensure_db_exists(self):
+        """确保数据库和表存在"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS graph_nodes (
+                    graph TEXT NOT NULL,
+                    node_id TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    label TEXT,
+                    properties TEXT,
+                    created_at TEXT,
+                    PRIMARY KEY (graph, node_id)
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_graph_nodes_type
+                ON graph_nodes(graph, type)
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS graph_edges (
+                    graph TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    weight REAL DEFAULT 1.0,
+                    properties TEXT,
+                    created_at TEXT,
+                    PRIMARY KEY (graph, source, target, type)
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_graph_edges_source_type
+                ON graph_edges(graph, source, type)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_graph_edges_target_type
+                ON graph_edges(graph, target, type)
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS graph_fingerprints (
+                    graph TEXT NOT NULL,
+                    node_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    PRIMARY KEY (graph, node_id)
+                )
+            """)
+    
+    @contextmanager
+    def _get_connection(self):
+        """获取数据库连接"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"图谱数据库操作失败: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _json_dumps(obj: Any) -> Optional[str]:
+        if not obj:
+            return None
+        return json.dumps(obj, ensure_ascii=False, default=str)
+    
+    @staticmethod
+    def _json_loads(json_str: Optional[str]) -> Dict:
+        if not json_str:
+            return {}
+        try:
+            return json.loads(json_str)
+        except (TypeError, ValueError):
+            return {}
+    
+    def _row_to_node(self, row: sqlite3.Row) -> Dict:
+        return {
+            "id": row["node_id"],
+            "type": row["type"],
+            "label": row["label"],
+            "properties": self._json_loads(row["properties"])
+        }
+    
+    def _row_to_edge(self, row: sqlite3.Row) -> Dict:
+        return {
+            "source": row["source"],
+            "target": row["target"],
+            "type": row["type"],
+            "weight": row["weight"],
+            "properties": self._json_loads(row["properties"])
+        }
+    
+    # ============= 写入 =============
+    
+    @staticmethod
+    def _write_fingerprints(cursor: sqlite3.Cursor, graph: str, nodes: List[Dict]):
+        """写入带 fingerprint 的节点的指纹"""
+        cursor.executemany(
+            "INSERT OR REPLACE INTO graph_fingerprints (graph, node_id, fingerprint) VALUES (?, ?, ?)",
+            [(graph, n["id"], n["fingerprint"]) for n in nodes if n.get("fingerprint")]
+        )
+    
+    def upsert_nodes(self, graph: str, nodes: Iterable[Dict]) -> int:
+        """
+        批量新增 / 更新节点
+        
+        Args:
+            graph: 图谱名称
+            nodes: [{"id", "type", "label", "properties", "fingerprint" (可选)}]
+        
+        Returns:
+            写入的节点数
+        """
+        now = datetime.now().isoformat()
+        nodes = list(nodes)
+        rows = [
+            (graph, n["id"], n.get("type", ""), n.get("label", ""),
+             self._json_dumps(n.get("properties")), n.get("created_at") or now)
+            for n in nodes
+        ]
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO graph_nodes
+                (graph, node_id, type, label, properties, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            self._write_fingerprints(cursor, graph, nodes)
+        return len(rows)
+    
+    def upsert_node(self, graph: str, node_id: str, node_type: str, label: str = "",
+                    properties: Dict = None) -> bool:
+        """新增 / 更新单个节点"""
+        self.upsert_nodes(graph, [{"id": node_id, "type": node_type, "label": label,
+                                   "properties": properties}])
+        return True
+    
+    def upsert_edges(self, graph: str, edges: Iterable[Dict]) -> int:
+        """
+        批量新增 / 更新边
+        
+        Args:
+            graph: 图谱名称
+            edges: [{"source", "target", "type", "weight", "properties"}]
+        
+        Returns:
+            写入的边数
+        """
+        now = datetime.now().isoformat()
+        rows = [
+            (graph, e["source"], e["target"], e.get("type", "related"), e.get("weight", 1.0),
+             self._json_dumps(e.get("properties")), e.get("created_at") or now)
+            for e in edges
+        ]
+        with self._get_connection() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO graph_edges
+                (graph, source, target, type, weight, properties, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+        return len(rows)
+    
+    def upsert_edge(self, graph: str, source: str, target: str, edge_type: str = "related",
+                    weight: float = 1.0, properties: Dict = None) -> bool:
+        """新增 / 更新单条边"""
+        self.upsert_edges(graph, [{"source": source, "target": target, "type": edge_type,
+                                   "weight": weight, "properties": properties}])
+        return True
+    
+    def delete_edge(self, graph: str, source: str, target: str, edge_type: str = None) -> int:
+        """删除 source -> target 的边 (edge_type 为 None 时删除所有类型)"""
+        query = "DELETE FROM graph_edges WHERE graph = ? AND source = ? AND target = ?"
+        params: List[Any] = [graph, source, target]
+        if edge_type:
+            query += " AND type = ?"
+            params.append(edge_type)
+        with self._get_connection() as conn:
+            return conn.execute(query, params).rowcount
+    
+    def delete_node(self, graph: str, node_id: str) -> bool:
+        """删除节点及其所有边"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM graph_edges WHERE graph = ? AND source = ?", (graph, node_id))
+            cursor.execute("DELETE FROM graph_edges WHERE graph = ? AND target = ?", (graph, node_id))
+            cursor.execute("DELETE FROM graph_nodes WHERE graph = ? AND node_id = ?", (graph, node_id))
+            deleted = cursor.rowcount > 0
+            cursor.execute("DELETE FROM graph_fingerprints WHERE graph = ? AND node_id = ?", (graph, node_id))
+            return deleted
+    
+    def replace_node_edges(self, graph: str, node_id: str, nodes: List[Dict], edges: List[Dict]) -> int:
+        """
+        在一个事务中替换某节点的全部边 (并写入相关节点)，用于增量同步
+        
+        Args:
+            graph: 图谱名称
+            node_id: 节点 ID
+            nodes: 需要写入的节点 (该节点及其邻居)
+            edges: 该节点的全部边
+        
+        Returns:
+            写入的边数
+        """
+        now = datetime.now().isoformat()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM graph_edges WHERE graph = ? AND source = ?", (graph, node_id))
+            cursor.execute("DELETE FROM graph_edges WHERE graph = ? AND target = ?", (graph, node_id))
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO graph_nodes
+                (graph, node_id, type, label, properties, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (graph, n["id"], n.get("type", ""), n.get("label", ""),
+                     self._json_dumps(n.get("properties")), now)
+                    for n in nodes
+                ]
+            )
+            self._write_fingerprints(cursor, graph, nodes)
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO graph_edges
+                (graph, source, target, type, weight, properties, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (graph, e["source"], e["target"], e.get("type", "related"), e.get("weight", 1.0),
+                     self._json_dumps(e.get("properties")), now)
+                    for e in edges
+                ]
+            )
+            return len(edges)
+    
+    def clear(self, graph: str):
+        """清空图谱"""
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM graph_edges WHERE graph = ?", (graph,))
+            conn.execute("DELETE FROM graph_nodes WHERE graph = ?", (graph,))
+            conn.execute("DELETE FROM graph_fingerprints WHERE graph = ?", (graph,))
+    
+    # ============= 与 KnowledgeGraph 互转 =============
+    
+    def save_graph(self, name: str, graph, batch_size: int = 50000,
+                   fingerprints: Dict[str, str] = None) -> Tuple[int, int]:
+        """
+        整体替换持久化的图谱
+        
+        Args:
+            name: 图谱名称
+            graph: src.graph.KnowledgeGraph
+            batch_size: 每批写入的行数
+            fingerprints: {节点ID: 内容指纹}
+        
+        Returns:
+            (节点数, 边数)
+        """
+        self.clear(name)
+        fingerprints = fingerprints or {}
+        nodes = [
+            {"id": n.id, "type": n.type, "label": n.label, "properties": n.properties,
+             "fingerprint": fingerprints.get(n.id)}
+            for n in graph.nodes.values()
+        ]
+        for start in range(0, len(nodes), batch_size):
+            self.upsert_nodes(name, nodes[start:start + batch_size])
+        
+        edges = [
+            {"source": e.source, "target": e.target, "type": e.type, "weight": e.weight}
+            for e in graph.edges.values()
+        ]
+        for start in range(0, len(edges), batch_size):
+            self.upsert_edges(name, edges[start:start + batch_size])
+        
+        logger.info(f"图谱已持久化: {name} ({len(nodes)} 节点, {len(edges)} 边)")
+        return len(nodes), len(edges)
+    
+    def load_graph(self, name: str):
+        """
+        加载持久化的图谱为 src.graph.KnowledgeGraph
+        
+        Returns:
+            KnowledgeGraph；图谱不存在时节点和边为空
+        """
+        from src.graph import GraphEdge, GraphNode, KnowledgeGraph
+        
+        graph = KnowledgeGraph(name=name)
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM graph_nodes WHERE graph = ?", (name,))
+            for row in cursor:
+                graph.add_node(GraphNode(
+                    id=row["node_id"],
+                    type=row["type"],
+                    label=row["label"] or "",
+                    properties=self._json_loads(row["properties"])
+                ))
+            
+            # 边 ID 用非十六进制前缀，避免与新建边的 uuid 前缀冲突
+            cursor.execute("SELECT * FROM graph_edges WHERE graph = ?", (name,))
+            for i, row in enumerate(cursor):
+                graph.add_edge(GraphEdge(
+                    id=f"g{i}",
+                    source=row["source"],
+                    target=row["target"],
+                    type=row["type"],
+                    weight=row["weight"]
+                ))
+        return graph
+    
+    def get_fingerprints(self, graph: str) -> Dict[str, str]:
+        """图谱中全部节点的内容指纹 {节点ID: 指纹}"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT node_id, fingerprint FROM graph_fingerprints WHERE graph = ?", (graph,))
+            return {row["node_id"]: row["fingerprint"] for row in cursor.fetchall()}
+    
+    # ============= 查询 =============
+    
+    def get_node(self, graph: str, node_id: str) -> Optional[Dict]:
+        """获取节点"""
+        with self._get_connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM graph_nodes WHERE graph = ? AND node_id = ?", (graph, node_id)
+            ).fetchone()
+            return self._row_to_node(row) if row else None
+    
+    def find_nodes(self, graph: str, node_type: str = None, keyword: str = None,
+                   limit: int = None) -> List[Dict]:
+        """
+        按类型 / 关键词 (匹配标签与属性 JSON) 查找节点
+        """
+        query = "SELECT * FROM graph_nodes WHERE graph = ?"
+        params: List[Any] = [graph]
+        if node_type:
+            query += " AND type = ?"
+            params.append(node_type)
+        if keyword:
+            query += " AND (label LIKE ? OR properties LIKE ?)"
+            params.extend([f"%{keyword}%", f"%{keyword}%"])
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self._get_connection() as conn:
+            return [self._row_to_node(row) for row in conn.execute(query, params).fetchall()]
+    
+    def get_edges(self, graph: str, node_id: str, edge_type: str = None,
+                  direction: str = "both") -> List[Dict]:
+        """获取节点的边"""
+        self._check_direction(direction)
+        clauses = []
+        if direction in ("out", "both"):
+            clauses.append("SELECT * FROM graph_edges WHERE graph = ? AND source = ?")
+        if direction in ("in", "both"):
+            clauses.append("SELECT * FROM graph_edges WHERE graph = ? AND target = ?")
+        params: List[Any] = []
+        if edge_type:
+            clauses = [c + " AND type = ?" for c in clauses]
+            for _ in clauses:
+                params.extend([graph, node_id, edge_type])
+        else:
+            for _ in clauses:
+                params.extend([graph, node_id])
+        
+        with self._get_connection() as conn:
+            rows = conn.execute(" UNION ALL ".join(clauses), params).fetchall()
+            return [self._row_to_edge(row) for row in rows]
+    
+    def iter_edges(self, graph: str) -> Iterator[Dict]:
+        """遍历图谱的全部边"""
+        with self._get_connection() as conn:
+            for row in conn.execute("SELECT * FROM graph_edges WHERE graph = ?", (graph,)):
+                yield self._row_to_edge(row)
+    
+    def count(self, graph: str) -> Dict:
+        """节点数与边数"""
+        with self._get_connection() as conn:
+            nodes = conn.execute("SELECT COUNT(*) FROM graph_nodes WHERE graph = ?", (graph,)).fetchone()[0]
+            edges = conn.execute("SELECT COUNT(*) FROM graph_edges WHERE graph = ?", (graph,)).fetchone()[0]
+            return {"nodes": nodes, "edges": edges}
+    
+    # ============= 递归遍历 =============
+    
+    @staticmethod
+    def _check_direction(direction: str):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"不支持的遍历方向: {direction}")
+    
+    @staticmethod
+    def _steps(direction: str, current: str) -> List[Tuple[str, str]]:
+        """
+        从 current 节点沿一条边走一步 (无向时拆成正反两步，各自走索引)
+        
+        Returns:
+            [(下一节点列, 边表 (指定索引), 连接条件)]
+        """
+        steps = []
+        if direction in ("out", "both"):
+            steps.append((
+                "e.target", "graph_edges e INDEXED BY idx_graph_edges_source_type",
+                f"e.source = {current}"
+            ))
+        if direction in ("in", "both"):
+            steps.append((
+                "e.source", "graph_edges e INDEXED BY idx_graph_edges_target_type",
+                f"e.target = {current}"
+            ))
+        return steps
+    
+    def _hop_cte(self, direction: str, edge_type: Optional[str]) -> Tuple[str, int]:
+        """
+        k 跳可达节点的递归 CTE: hop(node_id, depth)
+        
+        每个方向一个递归 SELECT (SQLite >= 3.34)，参数依次为
+        起点，然后每个方向 (图谱, [类型], 最大深度)。
+        
+        Returns:
+            (CTE 语句, 递归 SELECT 数)
+        """
+        type_filter = " AND e.type = ?" if edge_type else ""
+        steps = self._steps(direction, "h.node_id")
+        recursive = "\n                UNION\n".join(
+            f"""
+                SELECT {next_node}, h.depth + 1
+                FROM hop h
+                JOIN {edges} ON e.graph = ? AND {condition}{type_filter}
+                WHERE h.depth < ?"""
+            for next_node, edges, condition in steps
+        )
+        return f"""
+            hop(node_id, depth) AS (
+                SELECT ?, 0
+                UNION
+                {recursive}
+            )
+        """, len(steps)
+    
+    def _hop_params(self, start_id: str, graph: str, edge_type: Optional[str], depth: int,
+                    steps: int) -> List[Any]:
+        params: List[Any] = [start_id]
+        for _ in range(steps):
+            params += [graph] + ([edge_type] if edge_type else []) + [depth]
+        return params
+    
+    def k_hop(
+        self,
+        graph: str,
+        node_id: str,
+        k: int = 2,
+        edge_type: str = None,
+        direction: str = "both",
+        limit: int = 1000
+    ) -> List[Dict]:
+        """
+        k 跳邻域 (不含起点)，按距离升序
+        
+        Args:
+            graph: 图谱名称
+            node_id: 起点
+            k: 最大跳数
+            edge_type: 只沿该类型的边
+            direction: out / in / both
+            limit: 返回数量上限
+        
+        Returns:
+            [{"id", "depth", "type", "label", "properties"}]
+        """
+        self._check_direction(direction)
+        hop_cte, steps = self._hop_cte(direction, edge_type)
+        params = self._hop_params(node_id, graph, edge_type, k, steps)
+        query = f"""
+            WITH RECURSIVE {hop_cte}
+            SELECT h.node_id, MIN(h.depth) AS depth, n.type, n.label, n.properties
+            FROM hop h
+            LEFT JOIN graph_nodes n ON n.graph = ? AND n.node_id = h.node_id
+            WHERE h.node_id != ?
+            GROUP BY h.node_id
+            ORDER BY depth, h.node_id
+            LIMIT ?
+        """
+        params += [graph, node_id, limit]
+        
+        with self._get_connection() as conn:
+            return [
+                {
+                    "id": row["node_id"],
+                    "depth": row["depth"],
+                    "type": row["type"],
+                    "label": row["label"],
+                    "properties": self._json_loads(row["properties"])
+                }
+                for row in conn.execute(query, params).fetchall()
+            ]
+    
+    def shortest_path(
+        self,
+        graph: str,
+        start_id: str,
+        end_id: str,
+        edge_type: str = None,
+        direction: str = "both",
+        max_depth: int = MAX_PATH_DEPTH
+    ) -> List[str]:
+        """
+        最短路径 (无权)
+        
+        第一个递归 CTE 计算起点 max_depth 跳内各节点的距离，
+        第二个递归 CTE 从终点沿距离递减的边回溯出路径。
+        
+        Returns:
+            节点 ID 列表 (起点到终点)，不可达或超过 max_depth 时为空列表
+        """
+        self._check_direction(direction)
+        if start_id == end_id:
+            return [start_id] if self.get_node(graph, start_id) else []
+        
+        # 回溯: p 的前驱是沿边能走到 p 的节点，即反方向走一步
+        reverse = {"out": "in", "in": "out", "both": "both"}[direction]
+        type_filter = " AND e.type = ?" if edge_type else ""
+        predecessors = " UNION ALL ".join(
+            f"SELECT {prev_node} FROM {edges} WHERE e.graph = ? AND {condition}{type_filter}"
+            for prev_node, edges, condition in self._steps(reverse, "p.node_id")
+        )
+        hop_cte, steps = self._hop_cte(direction, edge_type)
+        
+        query = f"""
+            WITH RECURSIVE {hop_cte},
+            dist(node_id, depth) AS (
+                SELECT node_id, MIN(depth) FROM hop GROUP BY node_id
+            ),
+            path(node_id, depth) AS (
+                SELECT node_id, depth FROM dist WHERE node_id = ?
+                UNION ALL
+                SELECT (
+                    SELECT d.node_id
+                    FROM dist d
+                    WHERE d.depth = p.depth - 1 AND d.node_id IN ({predecessors})
+                    ORDER BY d.node_id
+                    LIMIT 1
+                ), p.depth - 1
+                FROM path p
+                WHERE p.depth > 0
+            )
+            SELECT node_id FROM path ORDER BY depth
+        """
+        params = self._hop_params(start_id, graph, edge_type, max_depth, steps) + [end_id]
+        for _ in range(len(self._steps(reverse, "p.node_id"))):
+            params += [graph] + ([edge_type] if edge_type else [])
+        
+        with self._get_connection() as conn:
+            return [row["node_id"] for row in conn.execute(query, params).fetchall()]
+
+
+def get_graph_store(db_path: str = None) -> GraphStore:
+    """获取图谱存储实例"""
+    return GraphStore(db_path)
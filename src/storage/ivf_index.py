@@ -0,0 +1,310 @@
+"""
+SuiLight Knowledge Salon - IVF-flat 近似最近邻索引
+在向量存储 (VectorStore) 之上的倒排文件索引，用于大规模语义检索
+
+- 离线构建: 在抽样向量上做球面 k-means (numpy 矩阵乘法分配 + 按簇求和)，
+  再把全部有效向量分配到最近的质心，按簇连续写入 ivf_vectors.npy (mmap 加载)
+- 查询: 先与全部质心做内积，扫描最近的 nprobe 个簇；nprobe 越大召回越高、延迟越高
+- 构建之后追加的向量位于向量存储的尾部行，查询时暴力扫描这部分尾部；
+  删除 / 替换通过向量存储的墓碑过滤，尾部过长或向量存储压缩后需重新构建
+
+文件 (与向量存储同目录):
+- ivf_meta.json: 簇数、构建时的行数与向量存储代数
+- ivf_centroids.npy / ivf_offsets.npy / ivf_rows.npy / ivf_vectors.npy
+"""
+
+import json
+import math
+import os
+import time
+from typing import List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from .vector_store import SEARCH_BLOCK_ROWS, VectorStore, normalize_rows
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IVF_META_NAME = "ivf_meta.json"
+
+# 默认扫描的簇数 (基准测试中 1M 向量、1000 簇时 recall@10 约 0.9)
+DEFAULT_NPROBE = 32
+
+# 每个簇参与 k-means 训练的平均抽样数
+TRAIN_SAMPLES_PER_LIST = 40
+
+
+def default_nlist(count: int) -> int:
+    """默认簇数: 约 sqrt(N)"""
+    return max(1, min(int(math.sqrt(count)), 65536))
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    球面 k-means (单位向量，按内积分配，质心求和后单位化)
+    
+    Args:
+        vectors: 单位化的训练向量 [n, dim]
+        nlist: 簇数
+        iterations: 迭代轮数
+        seed: 随机种子
+    
+    Returns:
+        质心 [nlist, dim]
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_lists(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        occupied = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[occupied]
+        sums[occupied] = np.add.reduceat(vectors[order], starts, axis=0)
+        # 空簇重新取随机样本
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(n, len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 16384) -> np.ndarray:
+    """每个向量内积最大的质心"""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_rows):
+        assign[start:start + block_rows] = np.argmax(vectors[start:start + block_rows] @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    """
+    IVF-flat 索引
+    
+    簇内向量按簇连续存储，查询只计算 nprobe 个簇的内积；
+    结果格式与 VectorStore.search 相同。
+    """
+    
+    def __init__(
+        self,
+        store: VectorStore,
+        centroids: np.ndarray,
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        vectors: np.ndarray,
+        built_rows: int,
+        generation: int
+    ):
+        self.store = store
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+        self.built_rows = built_rows
+        self.generation = generation
+    
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+    
+    def is_valid(self) -> bool:
+        """向量存储未压缩 / 重建时索引的行号仍然有效"""
+        return self.generation == self.store.generation
+    
+    def tail_rows(self) -> int:
+        """构建之后追加、只能暴力扫描的行数"""
+        return self.store.row_count - self.built_rows
+    
+    # ============= 构建 / 持久化 =============
+    
+    @classmethod
+    def build(
+        cls,
+        store: VectorStore,
+        nlist: int = None,
+        iterations: int = 10,
+        seed: int = 0,
+        save: bool = True
+    ) -> "IVFIndex":
+        """
+        在向量存储的全部有效向量上构建索引
+        
+        Args:
+            store: 向量存储
+            nlist: 簇数，默认约 sqrt(N)
+            iterations: k-means 迭代轮数
+            seed: 随机种子
+            save: 是否写入磁盘
+        
+        Returns:
+            IVFIndex
+        """
+        started = time.perf_counter()
+        built_rows = store.row_count
+        generation = store.generation
+        live = store.live_rows()
+        live = live[live < built_rows]
+        nlist = min(nlist or default_nlist(len(live)), max(len(live), 1))
+        
+        # 抽样训练质心
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(live), nlist * TRAIN_SAMPLES_PER_LIST)
+        sample = np.sort(rng.choice(live, sample_size, replace=False)) if len(live) else live
+        if len(sample):
+            centroids = spherical_kmeans(store.rows(sample), nlist, iterations, seed)
+        else:
+            centroids = np.zeros((0, store.dim), dtype=np.float32)
+        
+        # 分配全部有效向量
+        assign = np.empty(len(live), dtype=np.int64)
+        for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+            block = live[start:start + SEARCH_BLOCK_ROWS]
+            assign[start:start + len(block)] = assign_lists(store.rows(block), centroids)
+        order = np.argsort(assign, kind="stable")
+        rows = live[order]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))]).astype(np.int64)
+        
+        directory = store.directory
+        vectors_path = os.path.join(directory, "ivf_vectors.npy")
+        if save:
+            vectors = np.lib.format.open_memmap(
+                vectors_path + ".tmp", mode="w+", dtype=np.float32, shape=(len(rows), store.dim)
+            )
+        else:
+            vectors = np.empty((len(rows), store.dim), dtype=np.float32)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            # 按行号排序读取 (顺序访问 mmap)，再放回簇内顺序
+            block_order = np.argsort(block, kind="stable")
+            chunk = np.empty((len(block), store.dim), dtype=np.float32)
+            chunk[block_order] = store.rows(block[block_order])
+            vectors[start:start + len(block)] = chunk
+        
+        index = cls(store, centroids, offsets, rows, vectors, built_rows, generation)
+        if save:
+            vectors.flush()
+            del vectors
+            # 先删除旧元数据，替换过程中断时旧索引整体失效而不是与新文件混用
+            meta_path = os.path.join(directory, IVF_META_NAME)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            os.replace(vectors_path + ".tmp", vectors_path)
+            index.vectors = np.load(vectors_path, mmap_mode="r")
+            index.save()
+        logger.info(
+            f"IVF 索引构建完成: {len(rows)} 个向量, {len(centroids)} 个簇, "
+            f"耗时 {time.perf_counter() - started:.1f}s"
+        )
+        return index
+    
+    def save(self):
+        """写入质心 / 倒排表与元数据 (向量文件在构建时已写入)"""
+        directory = self.store.directory
+        np.save(os.path.join(directory, "ivf_centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "ivf_offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "ivf_rows.npy"), self.rows)
+        with open(os.path.join(directory, IVF_META_NAME), "w", encoding="utf-8") as f:
+            json.dump({
+                "nlist": self.nlist,
+                "built_rows": self.built_rows,
+                "generation": self.generation,
+                "dim": self.store.dim,
+                "model": self.store.model
+            }, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, store: VectorStore) -> Optional["IVFIndex"]:
+        """
+        加载磁盘上的索引
+        
+        Returns:
+            IVFIndex；不存在或与向量存储不匹配 (维度 / 模型 / 代数变化) 时返回 None
+        """
+        directory = store.directory
+        meta_path = os.path.join(directory, IVF_META_NAME)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("dim"), meta.get("model"), meta.get("generation")) != (
+            store.dim, store.model, store.generation
+        ):
+            return None
+        return cls(
+            store,
+            np.load(os.path.join(directory, "ivf_centroids.npy")),
+            np.load(os.path.join(directory, "ivf_offsets.npy")),
+            np.load(os.path.join(directory, "ivf_rows.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "ivf_vectors.npy"), mmap_mode="r"),
+            meta["built_rows"],
+            meta["generation"]
+        )
+    
+    # ============= 查询 =============
+    
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        nprobe: int = DEFAULT_NPROBE,
+        exclude: Optional[List[Optional[str]]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        近似余弦 Top-K
+        
+        Args:
+            queries: 查询向量 [q, dim]
+            k: 每个查询返回的数量
+            nprobe: 扫描的簇数 (召回 / 延迟权衡)
+            exclude: 每个查询排除的 ID
+        
+        Returns:
+            每个查询的 [(ID, 余弦相似度)]，按相似度降序
+        """
+        queries = normalize_rows(queries)
+        exclude = exclude or [None] * len(queries)
+        # 构建之后追加的尾部暴力扫描
+        tails = self.store.search(queries, k, exclude, start_row=self.built_rows)
+        if self.nlist == 0:
+            return tails
+        
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = queries @ self.centroids.T
+        results = []
+        for j, query in enumerate(queries):
+            lists = np.sort(np.argpartition(-centroid_scores[j], nprobe - 1)[:nprobe])
+            # 簇内向量连续存储，按簇切片计算 (不做花式索引拷贝)
+            spans = [(self.offsets[c], self.offsets[c + 1]) for c in lists if self.offsets[c + 1] > self.offsets[c]]
+            if spans:
+                scores = np.concatenate([self.vectors[lo:hi] @ query for lo, hi in spans])
+                rows = np.concatenate([self.rows[lo:hi] for lo, hi in spans])
+            else:
+                scores = np.empty(0, dtype=np.float32)
+                rows = np.empty(0, dtype=np.int64)
+            valid = self.store.alive_mask(rows)
+            excluded = self.store.row_of(exclude[j]) if exclude[j] is not None else -1
+            valid &= rows != excluded
+            rows, scores = rows[valid], scores[valid]
+            
+            take = min(k, len(rows))
+            if take:
+                top = np.argpartition(-scores, take - 1)[:take]
+                found = list(zip(self.store.row_ids(rows[top]), (round(float(s), 4) for s in scores[top])))
+            else:
+                found = []
+            merged = sorted(found + tails[j], key=lambda item: -item[1])
+            results.append(merged[:k])
+        return results
+
+
+def build_ivf_index(store: VectorStore, nlist: int = None) -> IVFIndex:
+    """构建并持久化 IVF 索引"""
+    return IVFIndex.build(store, nlist)
@@ -0,0 +1,304 @@
+"""
+SuiLight Knowledge Salon - 数据库定期维护模块
+
+功能:
+- ANALYZE / PRAGMA optimize 更新查询规划器统计信息
+- 增量 VACUUM 回收空闲页 (必要时一次性转换为 auto_vacuum=INCREMENTAL)
+- FTS5 索引段合并 (optimize)
+- 每个数据库都有时间预算，超时的步骤会被中断并记录
+- 报告回收空间与代表性查询的执行计划变化
+
+用法:
+    python -m src.storage.maintenance --budget 10
+    或在 FastAPI lifespan 中通过 run_maintenance_loop() 后台运行
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+
+from .backup import default_databases
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 代表性查询，用于对比维护前后的执行计划
+PLAN_PROBES = {
+    "capsules": [
+        "SELECT * FROM knowledge_capsules WHERE category = '自然科学' "
+        "ORDER BY created_at DESC LIMIT 10",
+        "SELECT * FROM knowledge_capsules WHERE quality_score >= 60 "
+        "ORDER BY quality_score DESC LIMIT 10",
+        "SELECT capsule_id FROM capsule_keywords WHERE keyword = '物理学'",
+    ],
+    "suilight": [
+        "SELECT * FROM chat_history WHERE agent_id = 'newton' "
+        "ORDER BY timestamp DESC LIMIT 50",
+        "SELECT * FROM capsules WHERE category = '自然科学' "
+        "ORDER BY quality_score DESC LIMIT 10",
+    ],
+}
+
+# auto_vacuum 模式
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class DatabaseMaintenance:
+    """
+    数据库维护器
+    
+    对每个数据库依次执行 ANALYZE、PRAGMA optimize、FTS optimize 与增量 VACUUM，
+    所有步骤共享一个时间预算，超过预算后剩余步骤被跳过。
+    """
+    
+    def __init__(
+        self,
+        databases: Dict[str, str] = None,
+        time_budget: float = 5.0,
+        analysis_limit: int = 1000,
+        vacuum_pages_per_step: int = 512,
+        allow_full_vacuum: bool = False,
+        full_vacuum_max_bytes: int = 64 * 1024 * 1024,
+        min_free_ratio: float = 0.1
+    ):
+        """
+        初始化维护器
+        
+        Args:
+            databases: {名称: 数据库路径}，默认为 data 目录下各存储类的数据库
+            time_budget: 每个数据库的时间预算 (秒)
+            analysis_limit: ANALYZE 每个索引采样的行数上限
+            vacuum_pages_per_step: 增量 VACUUM 每步回收的页数
+            allow_full_vacuum: 非增量模式的库是否允许执行一次全量 VACUUM (会切换为增量模式)
+            full_vacuum_max_bytes: 允许全量 VACUUM 的最大文件大小
+            min_free_ratio: 空闲页占比超过该阈值才进行全量 VACUUM
+        """
+        self.databases = databases if databases is not None else default_databases()
+        self.time_budget = time_budget
+        self.analysis_limit = analysis_limit
+        self.vacuum_pages_per_step = vacuum_pages_per_step
+        self.allow_full_vacuum = allow_full_vacuum
+        self.full_vacuum_max_bytes = full_vacuum_max_bytes
+        self.min_free_ratio = min_free_ratio
+    
+    # ============ 入口 ============
+    
+    def run_all(self) -> Dict:
+        """维护所有数据库"""
+        started = time.perf_counter()
+        reports = {}
+        for name, db_path in self.databases.items():
+            if not os.path.exists(db_path):
+                continue
+            try:
+                reports[name] = self.run_database(db_path, name)
+            except sqlite3.Error as e:
+                logger.error(f"数据库维护失败: {name} ({e})")
+                reports[name] = {"db_path": db_path, "error": str(e)}
+        
+        return {
+            "started_at": datetime.now().isoformat(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "reclaimed_bytes": sum(r.get("reclaimed_bytes", 0) for r in reports.values()),
+            "databases": reports
+        }
+    
+    def run_database(self, db_path: str, name: str = None) -> Dict:
+        """
+        维护单个数据库
+        
+        Args:
+            db_path: 数据库路径
+            name: 数据库名称 (用于选择代表性查询)
+        
+        Returns:
+            维护报告
+        """
+        name = name or os.path.splitext(os.path.basename(db_path))[0]
+        probes = PLAN_PROBES.get("capsules" if name.startswith("shard_") else name, [])
+        deadline = time.perf_counter() + self.time_budget
+        report = {"db_path": db_path, "steps": {}}
+        
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            # 超过时间预算时中断正在执行的语句
+            conn.set_progress_handler(lambda: int(time.perf_counter() > deadline), 1000)
+            
+            before = self._file_stats(conn, db_path)
+            plans_before = self._query_plans(conn, probes)
+            
+            self._run_step(report, "analyze", deadline, lambda: self._analyze(conn))
+            self._run_step(report, "optimize", deadline, lambda: conn.execute("PRAGMA optimize"))
+            self._run_step(report, "fts_optimize", deadline, lambda: self._optimize_fts(conn))
+            self._run_step(report, "vacuum", deadline, lambda: self._vacuum(conn, deadline, before))
+            conn.set_progress_handler(None, 0)
+            
+            after = self._file_stats(conn, db_path)
+            plans_after = self._query_plans(conn, probes)
+        finally:
+            conn.close()
+        
+        report["before"] = before
+        report["after"] = after
+        report["reclaimed_bytes"] = max(0, before["file_size"] - after["file_size"])
+        report["plan_changes"] = [
+            {"query": query, "before": plans_before[query], "after": plans_after[query]}
+            for query in plans_before
+            if plans_before[query] != plans_after.get(query)
+        ]
+        
+        logger.info(
+            f"数据库维护完成: {name} 回收 {report['reclaimed_bytes']} 字节, "
+            f"{len(report['plan_changes'])} 个执行计划变化"
+        )
+        return report
+    
+    # ============ 维护步骤 ============
+    
+    def _run_step(self, report: Dict, step: str, deadline: float, action):
+        """执行单个步骤并记录耗时 / 结果"""
+        if time.perf_counter() > deadline:
+            report["steps"][step] = {"status": "skipped"}
+            return
+        
+        started = time.perf_counter()
+        try:
+            detail = action()
+            status = {"status": "ok"}
+            if isinstance(detail, dict):
+                status.update(detail)
+        except sqlite3.OperationalError as e:
+            if "interrupt" not in str(e):
+                raise
+            status = {"status": "timeout"}
+        status["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        report["steps"][step] = status
+    
+    def _analyze(self, conn: sqlite3.Connection) -> Dict:
+        """采样 ANALYZE，更新 sqlite_stat1"""
+        conn.execute(f"PRAGMA analysis_limit = {int(self.analysis_limit)}")
+        conn.execute("ANALYZE")
+        return {}
+    
+    def _optimize_fts(self, conn: sqlite3.Connection) -> Dict:
+        """合并所有 FTS5 表的索引段"""
+        tables = [
+            row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'table' AND sql LIKE '%USING fts5%'"
+            )
+        ]
+        for table in tables:
+            conn.execute(f"INSERT INTO \"{table}\"(\"{table}\") VALUES ('optimize')")
+        return {"tables": tables}
+    
+    def _vacuum(self, conn: sqlite3.Connection, deadline: float, before: Dict) -> Dict:
+        """回收空闲页: 增量模式分步回收，否则按条件执行一次全量 VACUUM"""
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        
+        if mode == AUTO_VACUUM_INCREMENTAL:
+            freed = 0
+            while time.perf_counter() < deadline:
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if free_pages == 0:
+                    break
+                step = min(free_pages, self.vacuum_pages_per_step)
+                # execute() 只单步执行该 PRAGMA (每步释放一页)，executescript 会执行到底
+                conn.executescript(f"PRAGMA incremental_vacuum({step});")
+                freed += step
+            return {"mode": "incremental", "freed_pages": freed}
+        
+        free_ratio = before["freelist_count"] / max(before["page_count"], 1)
+        if (
+            not self.allow_full_vacuum
+            or free_ratio < self.min_free_ratio
+            or before["file_size"] > self.full_vacuum_max_bytes
+        ):
+            return {"mode": "none", "free_ratio": round(free_ratio, 4)}
+        
+        # 全量 VACUUM 的同时切换为增量模式，以后只需增量回收
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return {"mode": "full", "free_ratio": round(free_ratio, 4)}
+    
+    # ============ 统计 ============
+    
+    @staticmethod
+    def _file_stats(conn: sqlite3.Connection, db_path: str) -> Dict:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        return {
+            "file_size": os.path.getsize(db_path),
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        }
+    
+    @staticmethod
+    def _query_plans(conn: sqlite3.Connection, queries: List[str]) -> Dict[str, Optional[str]]:
+        plans = {}
+        for query in queries:
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+                plans[query] = " | ".join(row[-1] for row in rows)
+            except sqlite3.OperationalError:
+                # 该库中不存在对应的表
+                continue
+        return plans
+
+
+# ============ 后台调度 ============
+
+async def run_maintenance_loop(
+    maintenance: DatabaseMaintenance = None,
+    interval: float = 6 * 3600,
+    initial_delay: float = 300
+):
+    """
+    后台定期执行数据库维护 (在线程中运行，不阻塞事件循环)
+    
+    Args:
+        maintenance: 维护器实例
+        interval: 两次维护之间的间隔 (秒)
+        initial_delay: 服务启动后的首次延迟 (秒)
+    """
+    maintenance = maintenance or DatabaseMaintenance()
+    await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            report = await asyncio.to_thread(maintenance.run_all)
+            logger.info(
+                f"定期维护完成: 回收 {report['reclaimed_bytes']} 字节, "
+                f"耗时 {report['duration_ms']}ms"
+            )
+        except Exception as e:
+            logger.error(f"定期维护失败: {e}")
+        await asyncio.sleep(interval)
+
+
+# ============ 命令行 ============
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="SuiLight 数据库维护工具")
+    parser.add_argument("--budget", type=float, default=5.0, help="每个数据库的时间预算 (秒)")
+    parser.add_argument("--db", nargs="*", default=None, help="只维护指定名称的数据库")
+    parser.add_argument("--full-vacuum", action="store_true", help="允许全量 VACUUM")
+    args = parser.parse_args(argv)
+    
+    maintenance = DatabaseMaintenance(time_budget=args.budget, allow_full_vacuum=args.full_vacuum)
+    if args.db:
+        maintenance.databases = {
+            name: path for name, path in maintenance.databases.items() if name in args.db
+        }
+    
+    print(json.dumps(maintenance.run_all(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,549 @@
+"""
+SuiLight Knowledge Salon - 按分类分片的胶囊存储
+
+功能:
+- 知识胶囊按分类 (自然科学 / 社会科学 / 人文科学 / 交叉科学 ...) 写入独立的数据库文件
+- 列表 / 搜索 / Top-K 查询并行扇出到各分片，再做 K 路归并
+- 与 CapsuleStorage 相同的公共接口，可直接替换
+
+默认分片 (shard "default") 同时保存:
+- 无分类的知识胶囊
+- 历史复现胶囊、模板、版本历史
+- 分片目录与胶囊 ID -> 分片 的路由表
+"""
+
+import hashlib
+import heapq
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
+import logging
+
+from .capsule_storage import CapsuleStorage, CAPSULE_DELETED, CAPSULE_SAVED, CENTRALITY_METRICS, QUERY_CHUNK
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD = "default"
+
+# 已知分类的分片名称 (文件名使用 ASCII)
+CATEGORY_SHARDS = {
+    "自然科学": "natural_science",
+    "社会科学": "social_science",
+    "人文科学": "humanities",
+    "交叉科学": "interdisciplinary",
+    "ai": "ai",
+    "philosophy": "philosophy",
+    "general": "general",
+}
+
+
+def shard_name_for_category(category: Optional[str]) -> str:
+    """分类 -> 分片名称"""
+    if not category:
+        return DEFAULT_SHARD
+    if category in CATEGORY_SHARDS:
+        return CATEGORY_SHARDS[category]
+    slug = re.sub(r"[^a-z0-9_]+", "_", category.lower()).strip("_")
+    if slug and slug != DEFAULT_SHARD:
+        return slug
+    return f"cat_{hashlib.md5(category.encode('utf-8')).hexdigest()[:8]}"
+
+
+class ShardedCapsuleStorage(CapsuleStorage):
+    """
+    分片胶囊存储
+    
+    知识胶囊相关方法按分类路由到分片，其余方法 (历史胶囊、模板、版本) 继承自
+    CapsuleStorage，作用于默认分片。
+    """
+    
+    def __init__(self, shard_dir: str = None, max_workers: int = 8):
+        """
+        初始化分片存储
+        
+        Args:
+            shard_dir: 分片目录，默认为 data/capsule_shards
+            max_workers: 扇出查询的并发线程数
+        """
+        if shard_dir is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+            shard_dir = os.path.join(base_dir, "data", "capsule_shards")
+        
+        self.shard_dir = shard_dir
+        self.shards: Dict[str, CapsuleStorage] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+        
+        os.makedirs(shard_dir, exist_ok=True)
+        super().__init__(os.path.join(shard_dir, f"{DEFAULT_SHARD}.db"))
+        self.shards[DEFAULT_SHARD] = self
+        
+        self._ensure_shard_directory()
+        for shard, _ in self._list_registered_shards():
+            self._open_shard(shard)
+        
+        logger.info(f"分片存储初始化完成: {shard_dir} ({len(self.shards)} 个分片)")
+    
+    # ============= 分片目录 =============
+    
+    def _ensure_shard_directory(self):
+        """在默认分片中创建分片目录表与路由表"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS capsule_shards (
+                    shard TEXT PRIMARY KEY,
+                    category TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS capsule_routes (
+                    capsule_id TEXT PRIMARY KEY,
+                    shard TEXT NOT NULL
+                )
+            """)
+    
+    def _list_registered_shards(self) -> List[tuple]:
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT shard, category FROM capsule_shards")
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+    
+    def _open_shard(self, shard: str) -> CapsuleStorage:
+        if shard not in self.shards:
+            self.shards[shard] = CapsuleStorage(os.path.join(self.shard_dir, f"{shard}.db"))
+        return self.shards[shard]
+    
+    def _shard_for_category(self, category: Optional[str]) -> CapsuleStorage:
+        """获取分类对应的分片 (不存在则创建并登记)"""
+        shard = shard_name_for_category(category)
+        if shard not in self.shards:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO capsule_shards (shard, category) VALUES (?, ?)",
+                    (shard, category)
+                )
+            self._open_shard(shard)
+        return self.shards[shard]
+    
+    def _route(self, capsule_id: str) -> Optional[str]:
+        with self._get_connection() as conn:
+            row = conn.execute(
+                "SELECT shard FROM capsule_routes WHERE capsule_id = ?", (capsule_id,)
+            ).fetchone()
+            return row[0] if row else None
+    
+    def _routes(self, capsule_ids: List[str]) -> Dict[str, str]:
+        if not capsule_ids:
+            return {}
+        capsule_ids = list(capsule_ids)
+        routes = {}
+        with self._get_connection() as conn:
+            for start in range(0, len(capsule_ids), QUERY_CHUNK):
+                chunk = capsule_ids[start:start + QUERY_CHUNK]
+                rows = conn.execute(
+                    f"SELECT capsule_id, shard FROM capsule_routes WHERE capsule_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                routes.update((row[0], row[1]) for row in rows)
+        return routes
+    
+    # ============= 扇出 / 归并 =============
+    
+    def _fan_out(self, call: Callable[[CapsuleStorage], Any]) -> List[Any]:
+        """在所有分片上并行执行 call"""
+        shards = list(self.shards.values())
+        if len(shards) == 1:
+            return [call(shards[0])]
+        return list(self._executor.map(call, shards))
+    
+    def _shard_call(self, shard: CapsuleStorage, method: str, *args, **kwargs):
+        """调用分片上 CapsuleStorage 版本的方法 (避免默认分片递归进入本类的覆盖实现)"""
+        return getattr(CapsuleStorage, method)(shard, *args, **kwargs)
+    
+    @staticmethod
+    def _merge(results: List[List[Dict]], key: Callable[[Dict], Any], limit: int = None,
+               offset: int = 0) -> List[Dict]:
+        """K 路归并各分片已排序 (降序) 的结果"""
+        merged = heapq.merge(*results, key=key, reverse=True)
+        items = []
+        for i, item in enumerate(merged):
+            if i < offset:
+                continue
+            if limit is not None and len(items) >= limit:
+                break
+            items.append(item)
+        return items
+    
+    @staticmethod
+    def _created_key(capsule: Dict):
+        return capsule.get("created_at") or ""
+    
+    @staticmethod
+    def _quality_key(capsule: Dict):
+        return (capsule.get("quality_score") or 0, capsule.get("created_at") or "")
+    
+    def _sort_key(self, sort: str) -> Callable[[Dict], Any]:
+        """与 CapsuleStorage 排序方式对应的归并键"""
+        if sort in CENTRALITY_METRICS:
+            return lambda c: (
+                c["centrality"][sort],
+                c.get("quality_score") or 0,
+                c.get("created_at") or ""
+            )
+        if sort == "quality":
+            return self._quality_key
+        return self._created_key
+    
+    # ============= 知识胶囊 CRUD =============
+    
+    def save_knowledge_capsule(self, capsule: Dict) -> bool:
+        """
+        保存知识胶囊到其分类所在分片
+        
+        先写新分片，再更新路由，最后 (分类变更时) 从旧分片移除；
+        分片未变时不写默认分片中的路由表。
+        """
+        capsule_id = self._ensure_capsule_id(capsule)
+        target = self._shard_for_category(capsule.get("category"))
+        target_name = shard_name_for_category(capsule.get("category"))
+        previous = self._route(capsule_id)
+        
+        self._shard_call(target, "_write_knowledge_capsule", capsule)
+        
+        if previous != target_name:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO capsule_routes (capsule_id, shard) VALUES (?, ?)",
+                    (capsule["id"], target_name)
+                )
+            # 分类变更时从旧分片移除
+            if previous and previous in self.shards:
+                self._shard_call(self.shards[previous], "_remove_knowledge_capsule", capsule["id"])
+        
+        self._notify(CAPSULE_SAVED, capsule["id"], capsule)
+        return True
+    
+    def get_knowledge_capsule(self, capsule_id: str) -> Optional[Dict]:
+        shard = self._route(capsule_id)
+        if shard is None or shard not in self.shards:
+            return None
+        return self._shard_call(self.shards[shard], "get_knowledge_capsule", capsule_id)
+    
+    def delete_knowledge_capsule(self, capsule_id: str) -> bool:
+        shard = self._route(capsule_id)
+        if shard is None or shard not in self.shards:
+            return False
+        
+        deleted = self._shard_call(self.shards[shard], "_remove_knowledge_capsule", capsule_id)
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM capsule_routes WHERE capsule_id = ?", (capsule_id,))
+        
+        if deleted:
+            self._notify(CAPSULE_DELETED, capsule_id)
+        return deleted
+    
+    def list_knowledge_capsules(
+        self,
+        category: str = None,
+        status: str = None,
+        limit: int = 100,
+        offset: int = 0,
+        sort: str = "created_at"
+    ) -> List[Dict]:
+        """列出知识胶囊 (指定分类时只查询单个分片)"""
+        if category:
+            shard = shard_name_for_category(category)
+            if shard not in self.shards:
+                return []
+            return self._shard_call(
+                self.shards[shard], "list_knowledge_capsules",
+                category=category, status=status, limit=limit, offset=offset, sort=sort
+            )
+        
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "list_knowledge_capsules", status=status, limit=limit + offset, offset=0, sort=sort
+        ))
+        return self._merge(results, self._sort_key(sort), limit, offset)
+    
+    def iter_knowledge_capsules(self, batch_size: int = 1000):
+        """依次遍历所有分片的知识胶囊"""
+        for shard in list(self.shards.values()):
+            yield from self._shard_call(shard, "iter_knowledge_capsules", batch_size)
+    
+    def get_knowledge_capsules_by_ids(self, capsule_ids: List[str]) -> List[Dict]:
+        routes = self._routes(capsule_ids)
+        by_shard: Dict[str, List[str]] = {}
+        for cid in capsule_ids:
+            if cid in routes:
+                by_shard.setdefault(routes[cid], []).append(cid)
+        
+        by_id = {}
+        for shard, ids in by_shard.items():
+            if shard in self.shards:
+                for capsule in self._shard_call(
+                    self.shards[shard], "get_knowledge_capsules_by_ids", ids
+                ):
+                    by_id[capsule["id"]] = capsule
+        return [by_id[cid] for cid in capsule_ids if cid in by_id]
+    
+    # ============= 搜索 / Top-K =============
+    
+    def search_capsules(
+        self,
+        query: str,
+        capsule_type: str = "knowledge",
+        limit: int = 20
+    ) -> List[Dict]:
+        if capsule_type == "historical":
+            return super().search_capsules(query, capsule_type, limit)
+        
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "search_capsules", query, capsule_type, limit
+        ))
+        return self._merge(results, lambda c: c.get("quality_score") or 0, limit)
+    
+    def get_capsules_by_topic(self, topic_id: str) -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(s, "get_capsules_by_topic", topic_id))
+        return self._merge(results, self._created_key)
+    
+    def search_capsules_faceted(
+        self,
+        query: str = None,
+        category: str = None,
+        grade: str = None,
+        agent: str = None,
+        keyword: str = None,
+        since: str = None,
+        until: str = None,
+        sort: str = "quality",
+        limit: int = 20,
+        offset: int = 0,
+        facet_limit: int = 10,
+        bucket: str = "month"
+    ) -> Dict:
+        """分面搜索 (指定分类时只查询单个分片；否则各分片统计全部 Agent / 关键词后合并取 Top-N)"""
+        filters = dict(query=query, category=category, grade=grade, agent=agent,
+                       keyword=keyword, since=since, until=until, sort=sort, bucket=bucket)
+        if category:
+            shard = shard_name_for_category(category)
+            if shard not in self.shards:
+                return {"total": 0, "capsules": [], "facets": {
+                    name: [] for name in ("category", "grade", "agent", "keyword", "time")
+                }}
+            return self._shard_call(
+                self.shards[shard], "search_capsules_faceted",
+                limit=limit, offset=offset, facet_limit=facet_limit, **filters
+            )
+        
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "search_capsules_faceted", limit=limit + offset, offset=0, facet_limit=-1, **filters
+        ))
+        facets = {}
+        for name in ("category", "grade", "agent", "keyword", "time"):
+            counts = Counter()
+            for r in results:
+                counts.update({item["value"]: item["count"] for item in r["facets"][name]})
+            if name == "time":
+                items = sorted(counts.items(), key=lambda x: x[0] or "")
+            else:
+                items = sorted(counts.items(), key=lambda x: (-x[1], x[0] or ""))
+                if name in ("agent", "keyword") and facet_limit >= 0:
+                    items = items[:facet_limit]
+            facets[name] = [{"value": value, "count": count} for value, count in items]
+        return {
+            "total": sum(r["total"] for r in results),
+            "capsules": self._merge([r["capsules"] for r in results], self._sort_key(sort), limit, offset),
+            "facets": facets
+        }
+    
+    def get_top_capsules(self, limit: int = 10, min_quality: float = 0, sort: str = "quality") -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "get_top_capsules", limit=limit, min_quality=min_quality, sort=sort
+        ))
+        return self._merge(results, self._sort_key(sort), limit)
+    
+    # ============= 关键词 / Agent 索引查询 =============
+    
+    def get_capsule_ids_by_keyword(self, keyword: str) -> List[str]:
+        results = self._fan_out(lambda s: self._shard_call(s, "get_capsule_ids_by_keyword", keyword))
+        return [cid for ids in results for cid in ids]
+    
+    def get_capsule_ids_by_agent(self, agent: str) -> List[str]:
+        results = self._fan_out(lambda s: self._shard_call(s, "get_capsule_ids_by_agent", agent))
+        return [cid for ids in results for cid in ids]
+    
+    def get_capsules_by_keyword(self, keyword: str, limit: int = 100) -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "get_capsules_by_keyword", keyword, limit
+        ))
+        return self._merge(results, self._quality_key, limit)
+    
+    def get_capsules_by_agent(self, agent: str, limit: int = 100) -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "get_capsules_by_agent", agent, limit
+        ))
+        return self._merge(results, self._quality_key, limit)
+    
+    def get_capsules_by_keywords(self, keywords: List[str], limit: int = 20) -> List[Dict]:
+        terms = set(self._normalize_terms(keywords))
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "get_capsules_by_keywords", keywords, limit
+        ))
+        
+        def key(capsule: Dict):
+            hits = len(terms & set(self._normalize_terms(capsule.get("keywords"))))
+            return (hits, capsule.get("quality_score") or 0)
+        
+        return self._merge(results, key, limit)
+    
+    def get_capsules_sharing_keywords(
+        self,
+        capsule_id: str,
+        limit: int = 20,
+        max_position: int = None
+    ) -> List[Dict]:
+        target = self.get_knowledge_capsule(capsule_id)
+        if not target:
+            return []
+        
+        terms = self._normalize_terms(target.get("keywords"))
+        if max_position is not None:
+            terms = terms[:max_position]
+        if not terms:
+            return []
+        
+        # 各分片返回全部候选，在此统一计算共享数量
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "get_capsules_by_keywords", terms, -1
+        ))
+        term_set = set(terms)
+        shared = []
+        for capsules in results:
+            for capsule in capsules:
+                if capsule["id"] == capsule_id:
+                    continue
+                other = self._normalize_terms(capsule.get("keywords"))
+                if max_position is not None:
+                    other = other[:max_position]
+                count = len(term_set & set(other))
+                if count:
+                    shared.append({"capsule_id": capsule["id"], "shared": count})
+        
+        shared.sort(key=lambda x: x["shared"], reverse=True)
+        return shared[:limit]
+    
+    def get_keyword_frequencies(self, limit: int = 50) -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(s, "get_keyword_frequencies", -1))
+        counts = Counter()
+        for rows in results:
+            for row in rows:
+                counts[row["keyword"]] += row["count"]
+        ranked = sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [{"keyword": kw, "count": count} for kw, count in ranked]
+    
+    def get_agent_frequencies(self, limit: int = 50) -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(s, "get_agent_frequencies", -1))
+        counts = Counter()
+        for rows in results:
+            for row in rows:
+                counts[row["agent"]] += row["count"]
+        ranked = sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [{"agent": agent, "count": count} for agent, count in ranked]
+    
+    def get_keyword_cooccurrence(self, keyword: str = None, limit: int = 50) -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "get_keyword_cooccurrence", keyword, -1
+        ))
+        counts = Counter()
+        for rows in results:
+            for row in rows:
+                counts[(row["keyword_a"], row["keyword_b"])] += row["count"]
+        ranked = sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [{"keyword_a": a, "keyword_b": b, "count": count} for (a, b), count in ranked]
+    
+    # ============= 图谱中心性 =============
+    
+    def save_graph_centrality(self, scores: Dict[str, Dict], computed_at: str = None) -> int:
+        """胶囊节点的中心性写入其所在分片，其余节点写入默认分片"""
+        routes = self._routes([
+            node_id for node_id, s in scores.items() if s["node_type"] == "capsule"
+        ])
+        by_shard: Dict[str, Dict[str, Dict]] = {name: {} for name in self.shards}
+        for node_id, score in scores.items():
+            shard = routes.get(node_id, DEFAULT_SHARD)
+            by_shard.setdefault(shard, {})[node_id] = score
+        
+        computed_at = computed_at or datetime.now().isoformat()
+        return sum(
+            self._shard_call(self.shards[shard], "save_graph_centrality", shard_scores, computed_at)
+            for shard, shard_scores in by_shard.items() if shard in self.shards
+        )
+    
+    def get_graph_centrality(
+        self,
+        node_type: str = None,
+        sort: str = "pagerank",
+        limit: int = 20
+    ) -> List[Dict]:
+        results = self._fan_out(lambda s: self._shard_call(
+            s, "get_graph_centrality", node_type=node_type, sort=sort, limit=limit
+        ))
+        return self._merge(results, lambda row: row[sort], limit)
+    
+    def get_graph_centrality_by_ids(self, node_ids: List[str]) -> Dict[str, Dict]:
+        """胶囊节点到其所在分片读取，其余节点读取默认分片"""
+        routes = self._routes(node_ids)
+        by_shard: Dict[str, List[str]] = {}
+        for node_id in node_ids:
+            by_shard.setdefault(routes.get(node_id, DEFAULT_SHARD), []).append(node_id)
+        
+        centrality: Dict[str, Dict] = {}
+        for shard, ids in by_shard.items():
+            if shard in self.shards:
+                centrality.update(self._shard_call(self.shards[shard], "get_graph_centrality_by_ids", ids))
+        return centrality
+    
+    # ============= 统计功能 =============
+    
+    def get_stats(self) -> Dict:
+        """汇总所有分片的统计信息"""
+        results = self._fan_out(lambda s: self._shard_call(s, "get_stats"))
+        
+        knowledge_count = sum(r["knowledge_capsules_count"] for r in results)
+        weighted_quality = sum(
+            r["average_quality_score"] * r["knowledge_capsules_count"] for r in results
+        )
+        categories = Counter()
+        for r in results:
+            categories.update({k: v for k, v in r["category_distribution"].items()})
+        
+        historical_count = sum(r["historical_capsules_count"] for r in results)
+        return {
+            "knowledge_capsules_count": knowledge_count,
+            "historical_capsules_count": historical_count,
+            "total_capsules": knowledge_count + historical_count,
+            "average_quality_score": round(weighted_quality / knowledge_count, 2)
+            if knowledge_count else 0,
+            "category_distribution": dict(categories),
+            "db_path": self.db_path,
+            "shards": {
+                name: r["knowledge_capsules_count"]
+                for name, r in zip(self.shards.keys(), results)
+            }
+        }
+    
+    def close(self):
+        """关闭扇出线程池"""
+        self._executor.shutdown(wait=False)
+
+
+# ============ 便捷函数 ============
+
+def get_sharded_storage(shard_dir: str = None) -> ShardedCapsuleStorage:
+    """获取分片存储实例"""
+    return ShardedCapsuleStorage(shard_dir)
@@ -0,0 +1,387 @@
+"""
+SuiLight Knowledge Salon - BM25 倒排索引
+进程内的 BM25 全文检索，不依赖 SQLite FTS；胶囊、知识文档与知识图谱实体共用
+
+- 分词: NFKC 归一化并转小写；拉丁 / 希腊 / 西里尔字母与数字按单词切分，
+  中日韩文字的连续段切分为单字 + 相邻二字 (bigram)，无需词典
+- 多字段: 各字段的词频按权重相加 (BM25F 简化形式)，如标题 / 关键词权重高于正文
+- 倒排表: 每个词项的文档序号 (array('i')) 与加权词频 (array('f')) 按序号递增追加；
+  更新 = 旧序号墓碑 + 追加新序号，墓碑超过 1/4 时压缩重排
+- Top-K: 词项按得分上界从高到低累加 (numpy 向量化)；剩余词项上界之和低于当前第 K 名时
+  不再接纳新文档，之后只在候选文档上二分查找剩余倒排表并逐步剪枝 (MaxScore 提前终止)
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 墓碑超过该比例 (且不少于 COMPACT_MIN 个) 时压缩倒排表
+COMPACT_RATIO = 0.25
+COMPACT_MIN = 1024
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN = re.compile(f"[{_CJK}]+|[0-9a-z\u00df-\u024f\u0370-\u03ff\u0400-\u04ff]+")
+_CJK_CHAR = re.compile(f"[{_CJK}]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词
+    
+    Args:
+        text: 文本
+    
+    Returns:
+        词项列表 (保留重复以统计词频)；中日韩文字段输出全部单字与相邻二字
+    """
+    tokens: List[str] = []
+    for run in _TOKEN.findall(unicodedata.normalize("NFKC", text).lower()):
+        if _CJK_CHAR.match(run):
+            tokens.extend(run)
+            tokens.extend(map(str.__add__, run, run[1:]))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def field_text(value: Any) -> str:
+    """字段值转为文本 (列表 / 字典逐项拼接，各项之间不产生跨项的二字词)"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return " ".join(field_text(v) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return " ".join(field_text(v) for v in value)
+    return str(value)
+
+
+class BM25Index:
+    """
+    BM25 倒排索引
+    
+    文档为 {字段名: 文本 / 文本列表}，字段权重由 field_weights 指定 (未列出的字段权重为 1)；
+    读写线程安全。
+    """
+    
+    def __init__(self, field_weights: Dict[str, float] = None, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        初始化索引
+        
+        Args:
+            field_weights: 字段权重 (权重为 0 的字段不建索引)
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.field_weights = field_weights or {}
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._clear()
+    
+    def _clear(self):
+        self._ids: List[Optional[str]] = []  # 序号 → 文档 ID (已删除为 None)
+        self._ordinals: Dict[str, int] = {}
+        self._doc_terms: List[Optional[Tuple[str, ...]]] = []  # 序号 → 文档的词项 (删除时更新文档频率)
+        self._lengths = array("f")
+        self._alive = bytearray()
+        # 词项 → [文档序号 array('i'), 加权词频 array('f'), 最大词频, 最短文档长度]
+        self._postings: Dict[str, list] = {}
+        self._df: Dict[str, int] = {}
+        self._total_length = 0.0
+        self._dead = 0
+    
+    def __len__(self) -> int:
+        return len(self._ordinals)
+    
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._ordinals
+    
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._clear()
+    
+    # ============= 写入 =============
+    
+    def _field_counts(self, fields: Dict[str, Any]) -> Dict[str, float]:
+        """加权词频: 同权重字段的词项合并计数，再按权重相加"""
+        groups: Dict[float, List[str]] = {}
+        for name, value in fields.items():
+            weight = self.field_weights.get(name, 1.0)
+            if weight > 0:
+                groups.setdefault(weight, []).extend(tokenize(field_text(value)))
+        counts: Dict[str, float] = {}
+        for weight, tokens in sorted(groups.items(), key=lambda item: -len(item[1])):
+            if not counts:
+                counts = {token: n * weight for token, n in Counter(tokens).items()}
+                continue
+            for token, n in Counter(tokens).items():
+                counts[token] = counts.get(token, 0.0) + n * weight
+        return counts
+    
+    def add(self, doc_id: str, fields: Dict[str, Any]):
+        """
+        加入 / 更新文档
+        
+        Args:
+            doc_id: 文档 ID
+            fields: {字段名: 文本或文本列表}
+        """
+        self.add_many([(doc_id, fields)])
+    
+    def add_many(self, documents: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """批量加入 / 更新文档 (分词在锁外完成)，返回文档数"""
+        parsed = {doc_id: self._field_counts(fields) for doc_id, fields in documents}
+        with self._lock:
+            for doc_id in parsed:
+                self._remove_locked(doc_id)
+            self._append_locked(list(parsed), list(parsed.values()))
+            self._maybe_compact_locked()
+        return len(parsed)
+    
+    def remove(self, doc_id: str) -> bool:
+        """删除文档"""
+        with self._lock:
+            removed = self._remove_locked(doc_id)
+            self._maybe_compact_locked()
+        return removed
+    
+    def _append_locked(self, doc_ids: List[str], counts: List[Dict[str, float]]):
+        """追加一批文档: 倒排项按词项分组后整段写入各词项的 array"""
+        if not doc_ids:
+            return
+        start = len(self._ids)
+        doc_lengths = [float(sum(c.values())) for c in counts]
+        for ordinal, (doc_id, c) in enumerate(zip(doc_ids, counts), start):
+            self._ids.append(doc_id)
+            self._ordinals[doc_id] = ordinal
+            self._doc_terms.append(tuple(c))
+        self._lengths.extend(doc_lengths)
+        self._alive.extend(b"\x01" * len(doc_ids))
+        self._total_length += sum(doc_lengths)
+        
+        # 本批词项编号，倒排项按词项稳定排序 (同一词项内序号递增)
+        sizes = [len(c) for c in counts]
+        vocab: Dict[str, int] = {}
+        term_ids = np.fromiter(
+            (vocab.setdefault(term, len(vocab)) for c in counts for term in c),
+            dtype=np.int64, count=sum(sizes)
+        )
+        if not vocab:
+            return
+        tfs = np.fromiter((tf for c in counts for tf in c.values()), dtype=np.float32, count=len(term_ids))
+        ordinals = np.repeat(np.arange(start, start + len(doc_ids), dtype=np.int32), sizes)
+        lengths = np.repeat(np.asarray(doc_lengths, dtype=np.float32), sizes)
+        
+        order = np.argsort(term_ids, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(vocab)))])
+        tfs, ordinals, lengths = tfs[order], ordinals[order], lengths[order]
+        max_tfs = np.maximum.reduceat(tfs, bounds[:-1]).tolist()
+        min_lengths = np.minimum.reduceat(lengths, bounds[:-1]).tolist()
+        ordinal_bytes = memoryview(ordinals.tobytes())
+        tf_bytes = memoryview(tfs.tobytes())
+        bounds = bounds.tolist()
+        
+        for term, u in vocab.items():
+            lo, hi = bounds[u], bounds[u + 1]
+            entry = self._postings.get(term)
+            if entry is None:
+                entry = self._postings[term] = [array("i"), array("f"), 0.0, math.inf]
+            entry[0].frombytes(ordinal_bytes[lo * 4:hi * 4])
+            entry[1].frombytes(tf_bytes[lo * 4:hi * 4])
+            entry[2] = max(entry[2], max_tfs[u])
+            entry[3] = min(entry[3], min_lengths[u])
+            self._df[term] = self._df.get(term, 0) + hi - lo
+    
+    def _remove_locked(self, doc_id: str) -> bool:
+        ordinal = self._ordinals.pop(doc_id, None)
+        if ordinal is None:
+            return False
+        self._ids[ordinal] = None
+        self._alive[ordinal] = 0
+        self._total_length -= self._lengths[ordinal]
+        for term in self._doc_terms[ordinal]:
+            df = self._df[term] - 1
+            if df:
+                self._df[term] = df
+            else:
+                # 词项已无有效文档，整条倒排表删除
+                del self._df[term]
+                del self._postings[term]
+        self._doc_terms[ordinal] = None
+        self._dead += 1
+        return True
+    
+    def _maybe_compact_locked(self):
+        if self._dead >= COMPACT_MIN and self._dead > COMPACT_RATIO * len(self._ids):
+            self._compact_locked()
+    
+    def compact(self) -> int:
+        """压缩: 去掉墓碑并重新编号 (保持相对顺序)，返回清理的文档数"""
+        with self._lock:
+            return self._compact_locked()
+    
+    def _compact_locked(self) -> int:
+        dead = self._dead
+        if not dead:
+            return 0
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        remap = (np.cumsum(alive) - 1).astype(np.int32)
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)[alive]
+        
+        for entry in self._postings.values():
+            docs = np.frombuffer(entry[0], dtype=np.int32)
+            keep = alive[docs]
+            docs = remap[docs[keep]]
+            tfs = np.frombuffer(entry[1], dtype=np.float32)[keep]
+            entry[0] = array("i", docs.tobytes())
+            entry[1] = array("f", tfs.tobytes())
+            # 收紧得分上界
+            entry[2] = float(tfs.max())
+            entry[3] = float(lengths[docs].min())
+        
+        self._ids = [doc_id for doc_id in self._ids if doc_id is not None]
+        self._ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(self._ids)}
+        self._doc_terms = [terms for terms in self._doc_terms if terms is not None]
+        self._lengths = array("f", lengths.tobytes())
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._dead = 0
+        return dead
+    
+    # ============= 查询 =============
+    
+    def search(
+        self,
+        query: str,
+        k: Optional[int] = 10,
+        require_all: bool = False,
+        exclude: Iterable[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+        
+        Args:
+            query: 查询文本 (分词后各词项得分相加)
+            k: 返回数量，None 返回全部命中的文档
+            require_all: 只返回包含全部查询词项的文档
+            exclude: 排除的文档 ID
+        
+        Returns:
+            [(文档 ID, BM25 得分)]，按得分降序
+        """
+        terms = Counter(tokenize(query))
+        if not terms or k == 0:
+            return []
+        with self._lock:
+            return self._search_locked(terms, k, require_all, exclude or ())
+    
+    def _search_locked(
+        self,
+        terms: Counter,
+        k: Optional[int],
+        require_all: bool,
+        exclude: Iterable[str]
+    ) -> List[Tuple[str, float]]:
+        # 倒排表以 numpy 视图读取，视图只在本函数内存活 (之后 array 才能继续追加)
+        live = len(self._ordinals)
+        if not live:
+            return []
+        k1, b = self.k1, self.b
+        norm_base = k1 * (1 - b)
+        norm_scale = k1 * b / max(self._total_length / live, 1e-9)
+        
+        valid = np.frombuffer(self._alive, dtype=np.bool_).copy()
+        for doc_id in exclude:
+            ordinal = self._ordinals.get(doc_id)
+            if ordinal is not None:
+                valid[ordinal] = False
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        
+        plan = []
+        for term, qtf in terms.items():
+            entry = self._postings.get(term)
+            if entry is None:
+                if require_all:
+                    return []
+                continue
+            df = self._df[term]
+            weight = qtf * math.log(1 + (live - df + 0.5) / (df + 0.5))
+            bound = weight * entry[2] * (k1 + 1) / (entry[2] + norm_base + norm_scale * entry[3])
+            plan.append((bound, weight, entry))
+        if not plan:
+            return []
+        plan.sort(key=lambda item: -item[0])
+        
+        def term_scores(weight: float, tfs: np.ndarray, doc_lengths: np.ndarray) -> np.ndarray:
+            return weight * tfs * (k1 + 1) / (tfs + norm_base + norm_scale * doc_lengths)
+        
+        acc = np.zeros(len(self._ids), dtype=np.float64)
+        hits = np.zeros(len(self._ids), dtype=np.int32) if require_all else None
+        prune = k is not None and not require_all
+        remaining = sum(item[0] for item in plan)
+        candidates = scores = None
+        
+        for bound, weight, entry in plan:
+            docs = np.frombuffer(entry[0], dtype=np.int32)
+            tfs = np.frombuffer(entry[1], dtype=np.float32)
+            remaining = max(remaining - bound, 0.0)
+            
+            if candidates is None:
+                # 累加阶段: 整条倒排表向量化计算
+                acc[docs] += term_scores(weight, tfs, lengths[docs]) * valid[docs]
+                if hits is not None:
+                    hits[docs] += 1
+                if prune and remaining > 0 and len(acc) > k:
+                    theta = np.partition(acc, len(acc) - k)[len(acc) - k]
+                    if remaining < theta:
+                        # 未出现的文档已无法进入 Top-K，转为只更新候选文档
+                        candidates = np.flatnonzero(acc + remaining >= theta)
+                        scores = acc[candidates]
+            else:
+                # 剪枝阶段: 在有序倒排表上二分查找候选文档
+                pos = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                found = docs[pos] == candidates
+                scores[found] += term_scores(weight, tfs[pos[found]], lengths[candidates[found]])
+                if len(scores) > k:
+                    theta = np.partition(scores, len(scores) - k)[len(scores) - k]
+                    keep = scores + remaining >= theta
+                    candidates, scores = candidates[keep], scores[keep]
+        
+        if candidates is None:
+            mask = acc > 0
+            if hits is not None:
+                mask &= hits == len(plan)
+            candidates = np.flatnonzero(mask)
+            scores = acc[candidates]
+        if k is not None and len(candidates) > k:
+            # 保留与第 K 名同分的文档，同分按序号 (写入先后) 排序
+            keep = scores >= np.partition(scores, len(scores) - k)[len(scores) - k]
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))[:k]
+        return [(self._ids[o], round(float(s), 4)) for o, s in zip(candidates[order], scores[order])]
+    
+    def stats(self) -> Dict:
+        """文档数、词项数、倒排表长度与墓碑数"""
+        with self._lock:
+            return {
+                "documents": len(self._ordinals),
+                "terms": len(self._postings),
+                "postings": sum(len(entry[0]) for entry in self._postings.values()),
+                "tombstones": self._dead
+            }
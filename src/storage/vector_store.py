@@ -0,0 +1,391 @@
+"""
+SuiLight Knowledge Salon - 向量存储
+磁盘上的单位化 float32 向量矩阵 (内存映射) + ID 映射，用于语义相似度检索
+
+目录结构:
+- vectors.f32: 行主序 float32 矩阵，按容量倍增预分配，通过 np.memmap 访问
+- ids.txt: 每行 "ID\\t版本"，行号即矩阵行号，只追加
+- deleted.txt: 墓碑行号，只追加 (同一 ID 重新写入时旧行同样记为墓碑)
+- meta.json: 维度、向量模型名称与代数 (compact() 重排行号后代数加一，依赖行号的 ANN 索引据此失效)
+
+检索为分块矩阵乘法的暴力余弦 Top-K (向量已单位化，内积即余弦)，
+墓碑行在分块内置为 -inf；墓碑超过 1/4 时可调用 compact() 重写文件。
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VECTORS_NAME = "vectors.f32"
+IDS_NAME = "ids.txt"
+DELETED_NAME = "deleted.txt"
+META_NAME = "meta.json"
+
+# 检索时每块的行数 (控制 块行数 × 查询数 的分数矩阵内存)
+SEARCH_BLOCK_ROWS = 65536
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """按行单位化 (零向量保持为零)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1).astype(np.float32)
+
+
+class VectorStore:
+    """
+    内存映射向量存储
+    
+    支持增量追加、墓碑删除与批量余弦 Top-K 检索；
+    每个 ID 附带一个整数版本 (如输入文本的校验值)，供调用方判断向量是否过期。
+    """
+    
+    def __init__(self, directory: str, dim: int, model: str = ""):
+        """
+        打开 (或创建) 向量存储
+        
+        Args:
+            directory: 存储目录
+            dim: 向量维度
+            model: 向量模型名称；与已有存储不一致时清空重建
+        """
+        self.directory = directory
+        self.dim = dim
+        self.model = model
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        
+        meta = self._read_meta()
+        self.generation = meta.get("generation", 0)
+        if meta and (meta.get("dim") != dim or meta.get("model") != model):
+            logger.info(f"向量存储 {directory} 的模型/维度已变化，清空重建")
+            self._remove_files()
+            self.generation += 1
+        self._write_meta()
+        self._load()
+    
+    # ============= 文件 =============
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+    
+    def _read_meta(self) -> Dict:
+        if not os.path.exists(self._path(META_NAME)):
+            return {}
+        with open(self._path(META_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    
+    def _write_meta(self):
+        with open(self._path(META_NAME), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "model": self.model, "generation": self.generation}, f, ensure_ascii=False)
+    
+    def _remove_files(self):
+        for name in (VECTORS_NAME, IDS_NAME, DELETED_NAME):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+    
+    def _load(self):
+        """从文件加载 ID 映射与墓碑，打开矩阵的内存映射"""
+        ids: List[str] = []
+        versions: List[int] = []
+        if os.path.exists(self._path(IDS_NAME)):
+            with open(self._path(IDS_NAME), encoding="utf-8") as f:
+                for line in f:
+                    capsule_id, _, version = line.rstrip("\n").partition("\t")
+                    ids.append(capsule_id)
+                    versions.append(int(version or 0))
+        
+        # 向量写入在 ID 追加之前；中断时丢弃没有完整向量的 ID
+        vector_path = self._path(VECTORS_NAME)
+        rows_on_disk = os.path.getsize(vector_path) // (self.dim * 4) if os.path.exists(vector_path) else 0
+        if len(ids) > rows_on_disk:
+            ids, versions = ids[:rows_on_disk], versions[:rows_on_disk]
+            self._rewrite_ids(ids, versions)
+        
+        self._ids = ids
+        self._count = len(ids)
+        self._capacity = rows_on_disk
+        # 版本与有效掩码按矩阵容量分配，追加时不必整体复制
+        self._versions = np.zeros(rows_on_disk, dtype=np.int64)
+        self._versions[:self._count] = versions
+        self._alive = np.zeros(rows_on_disk, dtype=bool)
+        self._alive[:self._count] = True
+        if os.path.exists(self._path(DELETED_NAME)):
+            with open(self._path(DELETED_NAME), encoding="utf-8") as f:
+                deleted = np.array([int(line) for line in f if line.strip()], dtype=np.int64)
+            self._alive[deleted[deleted < self._count]] = False
+        self._row = {
+            capsule_id: row for row, capsule_id in enumerate(ids) if self._alive[row]
+        }
+        self._open_matrix()
+    
+    def _open_matrix(self):
+        if self._capacity:
+            self._matrix = np.memmap(
+                self._path(VECTORS_NAME), dtype=np.float32, mode="r+", shape=(self._capacity, self.dim)
+            )
+        else:
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+    
+    def _rewrite_ids(self, ids: List[str], versions: Iterable[int]):
+        with open(self._path(IDS_NAME), "w", encoding="utf-8") as f:
+            f.writelines(f"{capsule_id}\t{int(version)}\n" for capsule_id, version in zip(ids, versions))
+    
+    def _reserve(self, rows: int):
+        """按倍增扩展矩阵文件并重新映射"""
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, 2 * self._capacity, 1024)
+        if isinstance(self._matrix, np.memmap):
+            self._matrix.flush()
+        self._matrix = None
+        with open(self._path(VECTORS_NAME), "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._versions = np.concatenate([self._versions, np.zeros(capacity - self._capacity, dtype=np.int64)])
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._capacity = capacity
+        self._open_matrix()
+    
+    def __len__(self) -> int:
+        return len(self._row)
+    
+    def __contains__(self, capsule_id: str) -> bool:
+        return capsule_id in self._row
+    
+    # ============= 写入 =============
+    
+    def add(self, ids: List[str], vectors: np.ndarray, versions: Optional[List[int]] = None) -> int:
+        """
+        追加 (或替换) 向量
+        
+        Args:
+            ids: ID 列表
+            vectors: 向量 [n, dim]，写入前单位化
+            versions: 每个 ID 的整数版本
+        
+        Returns:
+            写入的向量数
+        """
+        vectors = normalize_rows(vectors)
+        if len(ids) != len(vectors) or vectors.shape[1] != self.dim:
+            raise ValueError(f"向量形状 {vectors.shape} 与 ID 数 {len(ids)} / 维度 {self.dim} 不一致")
+        if not ids:
+            return 0
+        versions = np.zeros(len(ids), dtype=np.int64) if versions is None else np.asarray(versions, dtype=np.int64)
+        
+        with self._lock:
+            # 批内重复的 ID 只保留最后一个
+            last = {capsule_id: i for i, capsule_id in enumerate(ids)}
+            keep = sorted(last.values())
+            ids = [ids[i] for i in keep]
+            vectors, versions = vectors[keep], versions[keep]
+            
+            start = self._count
+            self._reserve(start + len(ids))
+            self._matrix[start:start + len(ids)] = vectors
+            self._matrix.flush()
+            
+            replaced = [self._row[capsule_id] for capsule_id in ids if capsule_id in self._row]
+            with open(self._path(IDS_NAME), "a", encoding="utf-8") as f:
+                f.writelines(f"{capsule_id}\t{int(version)}\n" for capsule_id, version in zip(ids, versions))
+            self._append_tombstones(replaced)
+            
+            self._ids.extend(ids)
+            self._versions[start:start + len(ids)] = versions
+            self._alive[start:start + len(ids)] = True
+            self._alive[replaced] = False
+            for i, capsule_id in enumerate(ids):
+                self._row[capsule_id] = start + i
+            self._count += len(ids)
+            return len(ids)
+    
+    def delete(self, ids: List[str]) -> int:
+        """墓碑删除"""
+        with self._lock:
+            rows = [self._row.pop(capsule_id) for capsule_id in ids if capsule_id in self._row]
+            self._append_tombstones(rows)
+            self._alive[rows] = False
+            return len(rows)
+    
+    def _append_tombstones(self, rows: List[int]):
+        if rows:
+            with open(self._path(DELETED_NAME), "a", encoding="utf-8") as f:
+                f.writelines(f"{row}\n" for row in rows)
+    
+    def compact(self) -> int:
+        """
+        重写文件，去掉墓碑行
+        
+        Returns:
+            回收的行数
+        """
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._count])
+            removed = self._count - len(live)
+            if removed == 0:
+                return 0
+            
+            tmp_path = self._path(VECTORS_NAME + ".tmp")
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(self._matrix[live[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+            ids = [self._ids[row] for row in live]
+            versions = self._versions[live]
+            
+            self._matrix = None
+            os.replace(tmp_path, self._path(VECTORS_NAME))
+            self._rewrite_ids(ids, versions)
+            if os.path.exists(self._path(DELETED_NAME)):
+                os.remove(self._path(DELETED_NAME))
+            self.generation += 1
+            self._write_meta()
+            self._load()
+            logger.info(f"向量存储压缩完成: 回收 {removed} 行, 剩余 {len(live)} 行")
+            return removed
+    
+    def tombstone_ratio(self) -> float:
+        """墓碑行占比"""
+        return 1 - len(self._row) / self._count if self._count else 0.0
+    
+    # ============= 读取 =============
+    
+    def ids(self) -> List[str]:
+        """全部有效 ID"""
+        with self._lock:
+            return list(self._row)
+    
+    def versions(self) -> Dict[str, int]:
+        """{ID: 版本}"""
+        with self._lock:
+            return {capsule_id: int(self._versions[row]) for capsule_id, row in self._row.items()}
+    
+    def version(self, capsule_id: str) -> Optional[int]:
+        """单个 ID 的版本"""
+        with self._lock:
+            row = self._row.get(capsule_id)
+            return None if row is None else int(self._versions[row])
+    
+    @property
+    def row_count(self) -> int:
+        """已写入的行数 (含墓碑)"""
+        return self._count
+    
+    def live_rows(self) -> np.ndarray:
+        """有效行号"""
+        with self._lock:
+            return np.flatnonzero(self._alive[:self._count])
+    
+    def alive_mask(self, rows: np.ndarray) -> np.ndarray:
+        """行是否有效"""
+        with self._lock:
+            return self._alive[rows]
+    
+    def rows(self, rows) -> np.ndarray:
+        """按行号读取向量 (行号数组或切片)"""
+        with self._lock:
+            return np.asarray(self._matrix[rows])
+    
+    def snapshot(self) -> Dict:
+        """
+        当前矩阵文件的只读描述，供其他进程自行映射 (np.memmap mode="r") 并按行检索
+        
+        Returns:
+            {"path", "capacity", "count", "dim", "alive"}；alive 为前 count 行的有效掩码副本
+        """
+        with self._lock:
+            if isinstance(self._matrix, np.memmap):
+                self._matrix.flush()
+            return {
+                "path": self._path(VECTORS_NAME),
+                "capacity": self._capacity,
+                "count": self._count,
+                "dim": self.dim,
+                "alive": self._alive[:self._count].copy()
+            }
+    
+    def row_ids(self, rows: Iterable[int]) -> List[str]:
+        """行号对应的 ID"""
+        with self._lock:
+            return [self._ids[row] for row in rows]
+    
+    def row_of(self, capsule_id: str) -> int:
+        """ID 当前所在的行号 (不存在时为 -1)"""
+        return self._row.get(capsule_id, -1)
+    
+    def get(self, capsule_id: str) -> Optional[np.ndarray]:
+        """单个 (单位化) 向量"""
+        with self._lock:
+            row = self._row.get(capsule_id)
+            return None if row is None else np.array(self._matrix[row])
+    
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        exclude: Optional[List[Optional[str]]] = None,
+        block_rows: int = SEARCH_BLOCK_ROWS,
+        start_row: int = 0
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        批量余弦 Top-K
+        
+        Args:
+            queries: 查询向量 [q, dim] (会先单位化)
+            k: 每个查询返回的数量
+            exclude: 每个查询排除的 ID (通常是查询胶囊本身)
+            block_rows: 每块的行数
+            start_row: 只检索该行及之后的向量 (ANN 索引之后新增的尾部)
+        
+        Returns:
+            每个查询的 [(ID, 余弦相似度)]，按相似度降序
+        """
+        queries = normalize_rows(queries)
+        q = len(queries)
+        with self._lock:
+            count, matrix, alive = self._count, self._matrix, self._alive
+            exclude_rows = np.array([
+                self._row.get(capsule_id, -1) if capsule_id is not None else -1
+                for capsule_id in (exclude or [None] * q)
+            ], dtype=np.int64)
+            
+            best_scores = np.empty((0, q), dtype=np.float32)
+            best_rows = np.empty((0, q), dtype=np.int64)
+            for start in range(start_row, count, block_rows):
+                end = min(start + block_rows, count)
+                scores = matrix[start:end] @ queries.T
+                scores[~alive[start:end]] = -np.inf
+                inside = (exclude_rows >= start) & (exclude_rows < end)
+                scores[exclude_rows[inside] - start, np.flatnonzero(inside)] = -np.inf
+                
+                # 块内 Top-k 与已有结果合并
+                take = min(k, end - start)
+                top = np.argpartition(-scores, take - 1, axis=0)[:take]
+                best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=0)])
+                best_rows = np.concatenate([best_rows, top + start])
+                if len(best_scores) > k:
+                    keep = np.argpartition(-best_scores, k - 1, axis=0)[:k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=0)
+                    best_rows = np.take_along_axis(best_rows, keep, axis=0)
+            
+            results = []
+            for j in range(q):
+                order = np.argsort(-best_scores[:, j], kind="stable")
+                results.append([
+                    (self._ids[best_rows[i, j]], round(float(best_scores[i, j]), 4))
+                    for i in order if np.isfinite(best_scores[i, j])
+                ])
+            return results
+
+
+def get_vector_store(directory: str, dim: int, model: str = "") -> VectorStore:
+    """获取向量存储实例"""
+    return VectorStore(directory, dim, model)
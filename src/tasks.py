@@ -315,6 +315,7 @@ class TaskManager:
         """批量对话"""
         messages = params.get("messages", [])
         agent_ids = params.get("agent_ids", [])
+        user_id = params.get("user_id")
         
         if not self.registry:
             return {"error": "No registry"}
@@ -324,7 +325,7 @@ class TaskManager:
             for agent_id in agent_ids:
                 agent = self.registry.get(agent_id)
                 if agent:
-                    response = agent.chat(msg)
+                    response = agent.chat(msg, user_id=user_id)
                     results.append({
                         "agent": agent.config.name,
                         "message": msg,
@@ -0,0 +1,63 @@
+"""
+SuiLight Knowledge Salon - 热门胶囊 API
+FastAPI 路由
+
+胶囊浏览 / 分享 / 投票事件计入时间衰减热度排行；带 user_id 的浏览 / 分享同时计入用户兴趣画像。
+"""
+
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Optional
+import asyncio
+
+from src.capsule_trending import EVENT_WEIGHTS, capsule_trending
+from src.user_profiles import user_profiles
+
+router = APIRouter(prefix="/api/trending", tags=["热门胶囊"])
+
+
+@router.get("")
+async def get_trending_capsules(
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+) -> Dict:
+    """热门胶囊 (浏览 / 分享 / 投票的时间衰减热度排行)"""
+    capsules = await asyncio.to_thread(capsule_trending.get_trending, limit, offset)
+    return {
+        "success": True,
+        "data": {
+            "count": len(capsules),
+            "capsules": capsules,
+            "stats": capsule_trending.stats()
+        }
+    }
+
+
+@router.post("/capsules/{capsule_id}/events")
+async def record_capsule_event(
+    capsule_id: str,
+    event: str = "view",
+    value: int = Query(1, ge=-1, le=1),
+    user_id: Optional[str] = None
+) -> Dict:
+    """记录胶囊浏览 / 分享 / 投票事件 (投票 value 为 1 / -1；带 user_id 的浏览 / 分享计入用户兴趣画像)"""
+    if event not in EVENT_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"未知的事件类型: {event}")
+    if value == 0 or (value < 0 and event != "vote"):
+        raise HTTPException(status_code=400, detail="value 只能为 1 (投票可为 -1)")
+    
+    # 只为已存在的胶囊记录事件
+    from src.main import init_storage
+    if await asyncio.to_thread(init_storage().get_knowledge_capsule, capsule_id) is None:
+        raise HTTPException(status_code=404, detail="胶囊不存在")
+    
+    score = capsule_trending.record(capsule_id, event, value)
+    if user_id and event in ("view", "share"):
+        await asyncio.to_thread(user_profiles.record_activity, user_id, capsule_id, event)
+    return {
+        "success": True,
+        "data": {
+            "capsule_id": capsule_id,
+            "trending_score": round(score, 4),
+            **capsule_trending.get_counts(capsule_id)
+        }
+    }
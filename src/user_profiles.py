@@ -0,0 +1,608 @@
+"""
+SuiLight Knowledge Salon - 用户兴趣画像与批量推荐
+为活跃用户维护持久化的兴趣向量，离线批量计算每个用户的 Top-N 推荐胶囊
+
+- 行为来源: 浏览 / 分享胶囊 (user_activity 表) 与对话历史
+  (chat_history.metadata 中的 user_id，由 BaseAgent.chat(user_id=...) 写入)
+- 兴趣向量: 行为向量按权重与时间衰减加权求和后单位化，与胶囊语义向量处于同一空间
+  (浏览 / 分享取胶囊的语义向量，对话取用户消息的向量)
+- 批量推荐: 用户按块分配到进程池，每个进程以只读内存映射打开胶囊向量矩阵，
+  分块矩阵乘法取每个用户的 Top-N (排除已浏览 / 分享的胶囊)
+- 增量刷新: 按行为时间水位找出有新行为的用户，只重建这些用户的画像与推荐
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+import multiprocessing
+
+import numpy as np
+
+from src.storage.backup import DATA_DIR, DEFAULT_DATABASES
+from src.storage.vector_store import normalize_rows
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 行为类型与权重
+ACTIVITY_WEIGHTS = {
+    "view": 1.0,
+    "share": 3.0,
+    "chat": 1.0
+}
+
+# 行为的时间衰减半衰期 (天)
+ACTIVITY_HALF_LIFE_DAYS = 30
+
+# 构建画像时每个用户取的最近行为数
+ACTIVITY_LIMIT = 200
+
+# 全量计算的活跃用户范围 (天)
+ACTIVE_DAYS = 30
+
+# 每个用户保存的推荐数
+RECOMMEND_TOP_N = 50
+
+# 每个进程任务的用户数 / 每次矩阵乘法的胶囊行数
+USER_BLOCK = 256
+CAPSULE_BLOCK_ROWS = 65536
+
+# 单条 SQL 中 IN (...) 的参数上限
+QUERY_CHUNK = 500
+
+
+def score_user_block(
+    snapshot: Dict,
+    users: np.ndarray,
+    exclude: List[np.ndarray],
+    k: int,
+    block_rows: int = CAPSULE_BLOCK_ROWS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    一块用户对全部胶囊向量的 Top-K (在进程池中执行)
+    
+    Args:
+        snapshot: VectorStore.snapshot() (矩阵文件路径、容量、行数、有效掩码)
+        users: 单位化的用户向量 [u, dim]
+        exclude: 每个用户排除的胶囊行号
+        k: 每个用户的推荐数
+        block_rows: 每次矩阵乘法的胶囊行数
+    
+    Returns:
+        (行号 [u, k], 分数 [u, k])，按分数降序；不足 k 个时行号为 -1
+    """
+    count, alive = snapshot["count"], snapshot["alive"]
+    u = len(users)
+    if count:
+        matrix = np.memmap(
+            snapshot["path"], dtype=np.float32, mode="r", shape=(snapshot["capacity"], snapshot["dim"])
+        )
+    exclude_users = np.repeat(np.arange(u), [len(rows) for rows in exclude])
+    exclude_rows = np.concatenate(exclude).astype(np.int64)
+    
+    best_scores = np.empty((u, 0), dtype=np.float32)
+    best_rows = np.empty((u, 0), dtype=np.int64)
+    for start in range(0, count, block_rows):
+        end = min(start + block_rows, count)
+        scores = users @ np.asarray(matrix[start:end]).T
+        scores[:, ~alive[start:end]] = -np.inf
+        inside = (exclude_rows >= start) & (exclude_rows < end)
+        scores[exclude_users[inside], exclude_rows[inside] - start] = -np.inf
+        
+        take = min(k, end - start)
+        top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+        best_rows = np.concatenate([best_rows, top + start], axis=1)
+        if best_scores.shape[1] > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+    
+    # 按分数降序 (同分按行号)，无效位置置为 -1
+    order = np.lexsort((best_rows, -best_scores), axis=1) if best_scores.size else best_rows
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_rows = np.where(np.isfinite(best_scores), np.take_along_axis(best_rows, order, axis=1), -1)
+    return best_rows, best_scores
+
+
+class UserProfiles:
+    """
+    用户兴趣画像与预计算推荐
+    
+    行为、画像与推荐存于独立的 SQLite 数据库 (默认 data/user_profiles.db)；
+    胶囊向量来自语义索引 (SemanticIndex)。
+    """
+    
+    def __init__(self, workers: int = None):
+        """
+        初始化 (attach 时指定存储、语义索引与数据库)
+        
+        Args:
+            workers: 批量推荐的进程数，默认为 CPU 数；0 表示在当前进程内计算
+        """
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.db_path = None
+        self.chat_db = None
+        self.storage = None
+        self.semantic_index = None
+        self.last_report: Dict = {}
+        self._lock = threading.Lock()
+    
+    def attach(self, storage, semantic_index, db_path: str, chat_db: str = None):
+        """
+        绑定胶囊存储与语义索引
+        
+        Args:
+            storage: CapsuleStorage / ShardedCapsuleStorage
+            semantic_index: 已绑定存储的 SemanticIndex
+            db_path: 画像数据库路径
+            chat_db: 对话历史数据库，默认为 data/suilight.db
+        """
+        self.storage = storage
+        self.semantic_index = semantic_index
+        self.db_path = db_path
+        self.chat_db = chat_db or os.path.join(DATA_DIR, DEFAULT_DATABASES["suilight"])
+        self._ensure_db_exists()
+    
+    def _ensure_db_exists(self):
+        """确保数据库和表存在"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 用户行为 (浏览 / 分享胶囊)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_activity (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    capsule_id TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_user ON user_activity(user_id, created_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_time ON user_activity(created_at)")
+            
+            # 兴趣向量 (activity_at 为画像包含的最新行为时间)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_profiles (
+                    user_id TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    activities INTEGER DEFAULT 0,
+                    activity_at TEXT,
+                    updated_at TEXT
+                )
+            """)
+            
+            # 预计算的推荐
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_recommendations (
+                    user_id TEXT NOT NULL,
+                    rank INTEGER NOT NULL,
+                    capsule_id TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    computed_at TEXT,
+                    PRIMARY KEY (user_id, rank)
+                ) WITHOUT ROWID
+            """)
+            
+            # 增量刷新的行为时间水位
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS profile_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+    
+    @contextmanager
+    def _get_connection(self):
+        """获取数据库连接"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"用户画像数据库操作失败: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def _chat_connection(self):
+        """只读连接对话历史数据库 (不存在时为 None)"""
+        if not self.chat_db or not os.path.exists(self.chat_db):
+            yield None
+            return
+        conn = sqlite3.connect(f"file:{self.chat_db}?mode=ro", uri=True)
+        try:
+            try:
+                conn.execute("SELECT 1 FROM chat_history LIMIT 1")
+            except sqlite3.OperationalError:
+                # 数据库存在但尚未建表
+                conn.close()
+                conn = None
+            yield conn
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    # ============ 行为 ============
+    
+    def record_activity(self, user_id: str, capsule_id: str, kind: str = "view", created_at: str = None):
+        """
+        记录用户浏览 / 分享胶囊
+        
+        Args:
+            user_id: 用户 ID
+            capsule_id: 胶囊 ID
+            kind: view / share
+            created_at: 行为时间，默认为当前时间
+        """
+        if kind not in ("view", "share"):
+            raise ValueError(f"未知的行为类型: {kind}")
+        if self.db_path is None or not user_id:
+            return
+        with self._get_connection() as conn:
+            conn.execute(
+                "INSERT INTO user_activity (user_id, kind, capsule_id, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, kind, capsule_id, created_at or datetime.now().isoformat())
+            )
+    
+    def _get_meta(self, conn, key: str, default: str = "") -> str:
+        row = conn.execute("SELECT value FROM profile_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    
+    def _changed_users(self) -> Tuple[List[str], Dict[str, str]]:
+        """
+        水位之后有新行为的用户
+        
+        Returns:
+            (用户 ID 列表, 新水位)
+        """
+        users: Dict[str, None] = {}
+        with self._get_connection() as conn:
+            activity_mark = self._get_meta(conn, "activity_at")
+            chat_mark = self._get_meta(conn, "chat_at")
+            rows = conn.execute(
+                "SELECT user_id, MAX(created_at) FROM user_activity WHERE created_at > ? GROUP BY user_id",
+                (activity_mark,)
+            ).fetchall()
+        users.update(dict.fromkeys(user_id for user_id, _ in rows))
+        marks = {"activity_at": max([at for _, at in rows], default=activity_mark)}
+        
+        with self._chat_connection() as chat:
+            if chat is not None:
+                rows = chat.execute("""
+                    SELECT json_extract(metadata, '$.user_id') AS user_id, MAX(timestamp) FROM chat_history
+                    WHERE timestamp > ? AND json_valid(metadata) AND user_id IS NOT NULL
+                    GROUP BY user_id
+                """, (chat_mark,)).fetchall()
+                users.update(dict.fromkeys(user_id for user_id, _ in rows))
+                chat_mark = max([at for _, at in rows], default=chat_mark)
+        marks["chat_at"] = chat_mark
+        return list(users), marks
+    
+    def active_users(self, days: int = ACTIVE_DAYS) -> List[str]:
+        """最近 days 天有行为的用户"""
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        with self._get_connection() as conn:
+            users = dict.fromkeys(
+                row[0] for row in conn.execute(
+                    "SELECT DISTINCT user_id FROM user_activity WHERE created_at > ?", (since,)
+                )
+            )
+        with self._chat_connection() as chat:
+            if chat is not None:
+                users.update(dict.fromkeys(
+                    row[0] for row in chat.execute("""
+                        SELECT DISTINCT json_extract(metadata, '$.user_id') AS user_id FROM chat_history
+                        WHERE timestamp > ? AND json_valid(metadata) AND user_id IS NOT NULL
+                    """, (since,))
+                ))
+        return list(users)
+    
+    def _load_activities(self, user_ids: List[str]) -> Dict[str, List[Tuple[str, str, str]]]:
+        """每个用户最近 ACTIVITY_LIMIT 条行为: [(类型, 胶囊ID 或消息文本, 时间)]"""
+        activities: Dict[str, List[Tuple[str, str, str]]] = {user_id: [] for user_id in user_ids}
+        with self._get_connection() as conn:
+            for start in range(0, len(user_ids), QUERY_CHUNK):
+                chunk = user_ids[start:start + QUERY_CHUNK]
+                rows = conn.execute(f"""
+                    SELECT user_id, kind, capsule_id, created_at FROM (
+                        SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC) AS n
+                        FROM user_activity WHERE user_id IN ({",".join("?" * len(chunk))})
+                    ) WHERE n <= ?
+                """, (*chunk, ACTIVITY_LIMIT)).fetchall()
+                for user_id, kind, capsule_id, created_at in rows:
+                    activities[user_id].append((kind, capsule_id, created_at))
+        
+        with self._chat_connection() as chat:
+            if chat is not None:
+                for start in range(0, len(user_ids), QUERY_CHUNK):
+                    chunk = user_ids[start:start + QUERY_CHUNK]
+                    rows = chat.execute(f"""
+                        SELECT user_id, user_message, timestamp FROM (
+                            SELECT json_extract(metadata, '$.user_id') AS user_id, user_message, timestamp,
+                                   ROW_NUMBER() OVER (
+                                       PARTITION BY json_extract(metadata, '$.user_id') ORDER BY timestamp DESC
+                                   ) AS n
+                            FROM chat_history
+                            WHERE json_valid(metadata) AND json_extract(metadata, '$.user_id') IN ({",".join("?" * len(chunk))})
+                        ) WHERE n <= ?
+                    """, (*chunk, ACTIVITY_LIMIT)).fetchall()
+                    for user_id, message, timestamp in rows:
+                        if message:
+                            activities[user_id].append(("chat", message, timestamp))
+        
+        for user_id, items in activities.items():
+            items.sort(key=lambda item: item[2], reverse=True)
+            del items[ACTIVITY_LIMIT:]
+        return activities
+    
+    # ============ 画像 ============
+    
+    def build_profiles(self, user_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        重建用户兴趣向量并写入数据库
+        
+        Returns:
+            {用户ID: 单位化向量}；没有可用行为的用户不在结果中 (其旧画像与推荐被删除)
+        """
+        index = self.semantic_index
+        store = index.store
+        activities = self._load_activities(user_ids)
+        now = datetime.now()
+        
+        # 对话消息批量向量化
+        messages = list(dict.fromkeys(
+            text for items in activities.values() for kind, text, _ in items if kind == "chat"
+        ))
+        message_vectors = {}
+        for start in range(0, len(messages), index.batch_size):
+            batch = messages[start:start + index.batch_size]
+            message_vectors.update(zip(batch, normalize_rows(index.embed(batch))))
+        
+        profiles: Dict[str, np.ndarray] = {}
+        rows = []
+        updated_at = now.isoformat()
+        for user_id, items in activities.items():
+            vector = np.zeros(store.dim, dtype=np.float32)
+            used = 0
+            for kind, target, at in items:
+                v = message_vectors.get(target) if kind == "chat" else store.get(target)
+                if v is None:
+                    continue
+                try:
+                    age_days = max((now - datetime.fromisoformat(at)).total_seconds(), 0) / 86400
+                except (TypeError, ValueError):
+                    age_days = 0.0
+                vector += ACTIVITY_WEIGHTS[kind] * 0.5 ** (age_days / ACTIVITY_HALF_LIFE_DAYS) * v
+                used += 1
+            norm = float(np.linalg.norm(vector))
+            if not used or norm == 0:
+                continue
+            profiles[user_id] = vector / norm
+            rows.append((
+                user_id, index.model, store.dim, profiles[user_id].tobytes(), used,
+                items[0][2] if items else None, updated_at
+            ))
+        
+        empty = [(user_id,) for user_id in user_ids if user_id not in profiles]
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany("""
+                INSERT OR REPLACE INTO user_profiles
+                (user_id, model, dim, vector, activities, activity_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            cursor.executemany("DELETE FROM user_profiles WHERE user_id = ?", empty)
+            cursor.executemany("DELETE FROM user_recommendations WHERE user_id = ?", empty)
+        return profiles
+    
+    def get_profile(self, user_id: str) -> Optional[np.ndarray]:
+        """用户兴趣向量 (与当前向量模型不一致时视为不存在)"""
+        with self._get_connection() as conn:
+            row = conn.execute(
+                "SELECT model, vector FROM user_profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None or self.semantic_index is None or row[0] != self.semantic_index.model:
+            return None
+        return np.frombuffer(row[1], dtype=np.float32)
+    
+    # ============ 批量推荐 ============
+    
+    def _seen_rows(self, user_ids: List[str]) -> List[np.ndarray]:
+        """每个用户已浏览 / 分享胶囊的向量行号"""
+        store = self.semantic_index.store
+        seen: Dict[str, List[int]] = {user_id: [] for user_id in user_ids}
+        with self._get_connection() as conn:
+            for start in range(0, len(user_ids), QUERY_CHUNK):
+                chunk = user_ids[start:start + QUERY_CHUNK]
+                for user_id, capsule_id in conn.execute(
+                    f"SELECT DISTINCT user_id, capsule_id FROM user_activity WHERE user_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ):
+                    row = store.row_of(capsule_id)
+                    if row >= 0:
+                        seen[user_id].append(row)
+        return [np.array(seen[user_id], dtype=np.int64) for user_id in user_ids]
+    
+    def recommend(self, profiles: Dict[str, np.ndarray], top_n: int = RECOMMEND_TOP_N) -> int:
+        """
+        为用户计算 Top-N 推荐并替换其推荐列表
+        
+        用户按 USER_BLOCK 分块；workers > 0 且多于一块时分发到进程池。
+        
+        Args:
+            profiles: {用户ID: 兴趣向量}
+            top_n: 每个用户的推荐数
+        
+        Returns:
+            写入的推荐行数
+        """
+        store = self.semantic_index.store
+        user_ids = list(profiles)
+        if not user_ids:
+            return 0
+        snapshot = store.snapshot()
+        users = np.stack([profiles[user_id] for user_id in user_ids]).astype(np.float32)
+        seen = self._seen_rows(user_ids)
+        blocks = [
+            (users[start:start + USER_BLOCK], seen[start:start + USER_BLOCK])
+            for start in range(0, len(user_ids), USER_BLOCK)
+        ]
+        
+        if self.workers > 0 and len(blocks) > 1:
+            # spawn: 父进程中有后台线程，避免 fork 复制持有中的锁
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(blocks)), mp_context=context) as pool:
+                results = list(pool.map(
+                    score_user_block, *zip(*[(snapshot, u, s, top_n) for u, s in blocks])
+                ))
+        else:
+            results = [score_user_block(snapshot, u, s, top_n) for u, s in blocks]
+        
+        computed_at = datetime.now().isoformat()
+        rows = []
+        offset = 0
+        for block_rows, block_scores in results:
+            for i in range(len(block_rows)):
+                valid = block_rows[i] >= 0
+                capsule_ids = store.row_ids(block_rows[i][valid])
+                rows.extend(
+                    (user_ids[offset + i], rank, capsule_id, round(float(score), 4), computed_at)
+                    for rank, (capsule_id, score) in enumerate(zip(capsule_ids, block_scores[i][valid]))
+                )
+            offset += len(block_rows)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            
+            for start in range(0, len(user_ids), QUERY_CHUNK):
+                chunk = user_ids[start:start + QUERY_CHUNK]
+                cursor.execute(
+                    f"DELETE FROM user_recommendations WHERE user_id IN ({','.join('?' * len(chunk))})", chunk
+                )
+            cursor.executemany("""
+                INSERT INTO user_recommendations (user_id, rank, capsule_id, score, computed_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+    
+    def run(self, user_ids: List[str] = None) -> Dict:
+        """
+        全量计算: 重建活跃用户 (或指定用户) 的画像与推荐
+        
+        Returns:
+            计算报告
+        """
+        with self._lock:
+            started = time.perf_counter()
+            _, marks = self._changed_users()
+            users = user_ids if user_ids is not None else self.active_users()
+            profiles = self.build_profiles(users)
+            rows = self.recommend(profiles)
+            if user_ids is None:
+                self._save_marks(marks)
+            return self._report("full", users, profiles, rows, started)
+    
+    def refresh(self) -> Dict:
+        """
+        增量刷新: 只重建水位之后有新行为的用户
+        
+        Returns:
+            计算报告
+        """
+        with self._lock:
+            started = time.perf_counter()
+            users, marks = self._changed_users()
+            profiles = self.build_profiles(users)
+            rows = self.recommend(profiles)
+            self._save_marks(marks)
+            return self._report("incremental", users, profiles, rows, started)
+    
+    def _save_marks(self, marks: Dict[str, str]):
+        with self._get_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO profile_meta (key, value) VALUES (?, ?)", list(marks.items())
+            )
+    
+    def _report(self, mode: str, users: List[str], profiles: Dict, rows: int, started: float) -> Dict:
+        self.last_report = {
+            "mode": mode,
+            "users": len(users),
+            "profiles": len(profiles),
+            "recommendations": rows,
+            "computed_at": datetime.now().isoformat(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        if users:
+            logger.info(
+                f"用户推荐计算完成 ({mode}): {len(profiles)}/{len(users)} 个用户, "
+                f"{rows} 条推荐, 耗时 {self.last_report['duration_ms']}ms"
+            )
+        return self.last_report
+    
+    # ============ 查询 ============
+    
+    def get_recommendations(self, user_id: str, limit: int = 10) -> List[Dict]:
+        """
+        用户的预计算推荐
+        
+        Returns:
+            胶囊列表 (完整数据，附带 score)，按分数降序；没有推荐时返回空列表
+        """
+        if self.db_path is None:
+            return []
+        with self._get_connection() as conn:
+            rows = conn.execute(
+                "SELECT capsule_id, score FROM user_recommendations WHERE user_id = ? ORDER BY rank LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        capsules = {c["id"]: c for c in self.storage.get_knowledge_capsules_by_ids([r[0] for r in rows])}
+        return [{**capsules[capsule_id], "score": score} for capsule_id, score in rows if capsule_id in capsules]
+
+
+async def run_profile_loop(
+    profiles: UserProfiles,
+    interval: float = 600,
+    full_interval: float = 24 * 3600,
+    initial_delay: float = 300
+):
+    """
+    后台维护用户推荐: 每 interval 秒增量刷新有新行为的用户，每 full_interval 秒全量重算活跃用户
+    
+    Args:
+        profiles: 用户画像
+        interval: 增量刷新间隔 (秒)
+        full_interval: 全量计算间隔 (秒)
+        initial_delay: 服务启动后的首次延迟 (秒)
+    """
+    await asyncio.sleep(initial_delay)
+    last_full = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_full >= full_interval:
+                await asyncio.to_thread(profiles.run)
+                last_full = time.monotonic()
+            else:
+                await asyncio.to_thread(profiles.refresh)
+        except Exception as e:
+            logger.error(f"用户推荐计算失败: {e}")
+        await asyncio.sleep(interval)
+
+
+# 全局实例
+user_profiles = UserProfiles()
@@ -0,0 +1,26 @@
+"""
+SuiLight Knowledge Salon - 用户推荐 API
+FastAPI 路由
+"""
+
+from fastapi import APIRouter, Query
+from typing import Dict
+import asyncio
+
+from src.user_profiles import user_profiles
+
+router = APIRouter(prefix="/api/users", tags=["用户推荐"])
+
+
+@router.get("/{user_id}/recommendations")
+async def get_user_recommendations(user_id: str, limit: int = Query(10, ge=1, le=50)) -> Dict:
+    """用户的推荐胶囊 (按兴趣画像离线预计算)"""
+    capsules = await asyncio.to_thread(user_profiles.get_recommendations, user_id, limit)
+    return {
+        "success": True,
+        "data": {
+            "user_id": user_id,
+            "count": len(capsules),
+            "capsules": capsules
+        }
+    }
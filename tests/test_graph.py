@@ -0,0 +1,1241 @@
+"""
+SuiLight Knowledge Salon - 知识图谱单元测试
+"""
+
+import pytest
+import sys
+import os
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.graph import GraphEdge, GraphNode, KnowledgeGraph, KnowledgeGraphManager
+
+
+class TestKnowledgeGraph:
+    """知识图谱测试类"""
+    
+    @pytest.fixture
+    def graph(self):
+        """a - b - c - d 链, 另有 a -> e (cites) 和孤立节点 z"""
+        graph = KnowledgeGraph(name="测试图谱")
+        for node_id in "abcdez":
+            graph.add_node(GraphNode(id=node_id, type="capsule", label=node_id))
+        for i, (source, target) in enumerate([("a", "b"), ("c", "b"), ("c", "d")]):
+            graph.add_edge(GraphEdge(id=f"r{i}", source=source, target=target, type="related"))
+        graph.add_edge(GraphEdge(id="c0", source="a", target="e", type="cites"))
+        return graph
+    
+    def test_neighbors_use_both_directions(self, graph):
+        """测试邻居查询包含出边和入边"""
+        neighbors = {n["node"]["id"] for n in graph.get_neighbors("b")}
+        assert neighbors == {"a", "c"}
+        assert {n["node"]["id"] for n in graph.get_neighbors("a")} == {"b", "e"}
+    
+    def test_neighbors_filter_by_edge_type(self, graph):
+        """测试按边类型过滤"""
+        neighbors = graph.get_neighbors("a", edge_type="cites")
+        assert [n["node"]["id"] for n in neighbors] == ["e"]
+        assert neighbors[0]["edge"]["type"] == "cites"
+        assert graph.get_neighbors("a", edge_type="evolves") == []
+    
+    def test_index_follows_edge_changes(self, graph):
+        """测试替换 / 删除边后索引同步更新"""
+        graph.add_edge(GraphEdge(id="r0", source="a", target="d", type="related"))
+        assert {n["node"]["id"] for n in graph.get_neighbors("b")} == {"c"}
+        assert graph.degree("a") == 2
+        
+        assert graph.remove_edge("c0")
+        assert graph.get_neighbors("e") == []
+        assert not graph.remove_edge("c0")
+        
+        assert graph.remove_node("c")
+        assert "c" not in graph.nodes
+        assert graph.get_neighbors("b") == []
+        assert len(graph.edges) == 1
+    
+    def test_shortest_path(self, graph):
+        """测试双向 BFS 最短路径"""
+        assert graph.get_shortest_path("a", "d") == ["a", "b", "c", "d"]
+        assert graph.get_shortest_path("d", "e") == ["d", "c", "b", "a", "e"]
+        assert graph.get_shortest_path("a", "a") == ["a"]
+        assert graph.get_shortest_path("a", "z") == []
+        assert graph.get_shortest_path("a", "missing") == []
+        assert graph.get_shortest_path("b", "e", edge_type="related") == []
+        assert graph.get_shortest_path("a", "d", max_depth=2) == []
+        assert graph.get_shortest_path("a", "d", max_depth=3) == ["a", "b", "c", "d"]
+    
+    def test_shortest_path_matches_plain_bfs(self):
+        """测试随机图上路径长度与单向 BFS 一致"""
+        import random
+        from collections import deque
+        
+        rng = random.Random(3)
+        graph = KnowledgeGraph()
+        for i in range(200):
+            graph.add_node(GraphNode(id=str(i), type="capsule", label=str(i)))
+        for i in range(300):
+            graph.add_edge(GraphEdge(id=f"e{i}", source=str(rng.randrange(200)), target=str(rng.randrange(200))))
+        
+        def bfs_length(start, end):
+            dist = {start: 1}
+            queue = deque([start])
+            while queue:
+                node = queue.popleft()
+                if node == end:
+                    return dist[node]
+                for neighbor in graph.neighbor_ids(node):
+                    if neighbor not in dist:
+                        dist[neighbor] = dist[node] + 1
+                        queue.append(neighbor)
+            return 0
+        
+        for _ in range(50):
+            start, end = str(rng.randrange(200)), str(rng.randrange(200))
+            path = graph.get_shortest_path(start, end)
+            assert len(path) == bfs_length(start, end)
+            for a, b in zip(path, path[1:]):
+                assert b in set(graph.neighbor_ids(a))
+
+
+class TestKnowledgeGraphManager:
+    """知识图谱管理器测试类"""
+    
+    @pytest.fixture
+    def capsules(self):
+        return [
+            {"id": "c1", "title": "量子", "category": "自然科学", "keywords": ["物理", "量子", "测量"]},
+            {"id": "c2", "title": "测量", "category": "自然科学", "keywords": ["量子", "测量", "实验", "误差"]},
+            {"id": "c3", "title": "伦理", "category": "人文科学", "keywords": ["伦理", "实验"]},
+            {"id": "c4", "title": "诗歌", "category": "人文科学", "keywords": ["诗歌"]},
+        ]
+    
+    def test_related_edges_match_pairwise_overlap(self, capsules):
+        """测试倒排索引得到的关联边与两两比较一致"""
+        graph = KnowledgeGraphManager().build_from_capsules(capsules)
+        related = {
+            (e.source, e.target): round(e.weight, 4)
+            for e in graph.edges.values() if e.type == "related"
+        }
+        
+        # c1-c2 共享 2/4, c2-c3 共享 1/4 (= 25% > 20%), c1-c3 / c4 无重叠
+        assert related == {("c1", "c2"): 0.5, ("c2", "c3"): 0.25}
+    
+    def test_hub_keyword_fanout_is_capped(self):
+        """测试热门关键词只在质量最高的若干胶囊之间建立关联"""
+        capsules = [{"id": f"h{i:02d}", "keywords": ["热门"], "quality_score": i} for i in range(50)]
+        manager = KnowledgeGraphManager(max_keyword_fanout=5)
+        
+        pairs = list(manager._related_pairs(capsules))
+        
+        assert len(pairs) == 10
+        assert {i for pair in pairs for i in pair[:2]} == set(range(45, 50))
+    
+    def test_statistics(self, capsules):
+        """测试图谱统计 (列式向量化计算，关键词只计前 10 个，缺少等级时按质量分数推断)"""
+        capsules[0].update({"grade": "A", "quality_score": 85, "source_agents": ["a1", "a2"]})
+        capsules[1].update({"grade": "B", "quality_score": 61.3, "source_agents": ["a1"]})
+        capsules[3]["keywords"] = [f"k{i}" for i in range(12)]
+        
+        stats = KnowledgeGraphManager().get_statistics(capsules)
+        
+        assert stats == {
+            "total_capsules": 4, "total_keywords": 16, "total_agents": 2, "categories": 2,
+            "avg_quality": 36.57, "a_grade_count": 1, "b_grade_count": 1, "c_grade_count": 2
+        }
+
+
+class TestMainGraph:
+    """主图谱增量维护测试类"""
+    
+    @pytest.fixture
+    def storage(self, tmp_path):
+        from src.storage.capsule_storage import CapsuleStorage
+        return CapsuleStorage(str(tmp_path / "capsules.db"))
+    
+    @staticmethod
+    def _edge_set(graph):
+        return {
+            (frozenset((e.source, e.target)), e.type, round(e.weight, 4))
+            for e in graph.edges.values()
+        }
+    
+    def test_incremental_graph_matches_rebuild(self, storage):
+        """测试保存 / 更新 / 删除后主图谱与全量重建一致"""
+        import random
+        
+        rng = random.Random(5)
+        manager = KnowledgeGraphManager()
+        manager.attach_storage(storage)
+        
+        for i in range(40):
+            storage.save_knowledge_capsule({
+                "id": f"g{i}",
+                "title": f"胶囊 {i}",
+                "category": rng.choice(["自然科学", "人文科学"]),
+                "keywords": rng.sample([f"词{k}" for k in range(12)], 3),
+                "source_agents": [rng.choice(["newton", "darwin"])],
+                "created_at": f"2026-01-{i % 28 + 1:02d}T00:00:{i:02d}"
+            })
+        storage.save_knowledge_capsule({
+            "id": "g3", "title": "更新", "category": "交叉科学",
+            "keywords": ["新词"], "source_agents": ["turing"], "created_at": "2026-02-01T00:00:00"
+        })
+        for i in range(10, 20):
+            storage.delete_knowledge_capsule(f"g{i}")
+        
+        capsules = list(storage.iter_knowledge_capsules())
+        rebuilt = manager.build_from_capsules(capsules)
+        
+        assert set(manager.main_graph.nodes) == set(rebuilt.nodes)
+        assert self._edge_set(manager.main_graph) == self._edge_set(rebuilt)
+        assert manager.main_graph.nodes["category_交叉科学"].properties["count"] == 1
+        assert "agent_turing" in manager.main_graph.nodes
+        
+        storage.delete_knowledge_capsule("g3")
+        assert "agent_turing" not in manager.main_graph.nodes
+        assert "category_交叉科学" not in manager.main_graph.nodes
+    
+    def test_incremental_hub_keyword_matches_rebuild(self, storage):
+        """测试热门关键词超过候选上限时增量维护与全量重建一致"""
+        import random
+        
+        rng = random.Random(7)
+        manager = KnowledgeGraphManager(max_keyword_fanout=4)
+        manager.attach_storage(storage)
+        
+        for i in range(30):
+            storage.save_knowledge_capsule({
+                "id": f"hub{i}",
+                "title": f"胶囊 {i}",
+                "category": "自然科学",
+                "keywords": ["热门"] + rng.sample([f"词{k}" for k in range(4)], 1),
+                "source_agents": ["newton"],
+                "quality_score": rng.randint(0, 100),
+                "created_at": f"2026-01-01T00:00:{i:02d}"
+            })
+        for i in range(0, 30, 3):
+            capsule = storage.get_knowledge_capsule(f"hub{i}")
+            capsule["quality_score"] = rng.randint(0, 100)
+            storage.save_knowledge_capsule(capsule)
+        for i in range(0, 30, 4):
+            storage.delete_knowledge_capsule(f"hub{i}")
+        
+        rebuilt = manager.build_from_capsules(list(storage.iter_knowledge_capsules()))
+        assert self._edge_set(manager.main_graph) == self._edge_set(rebuilt)
+        assert max(manager.main_graph.degree(c, "related") for c in manager._capsules) <= 4 + 3
+    
+    def test_views_are_served_from_main_graph(self, storage):
+        """测试子视图: 最新胶囊、导出子图、相关胶囊"""
+        for i, keywords in enumerate([["量子", "测量"], ["量子", "测量", "误差"], ["诗歌"]]):
+            storage.save_knowledge_capsule({
+                "id": f"v{i}", "title": f"视图 {i}", "category": "自然科学",
+                "keywords": keywords, "created_at": f"2026-03-0{i + 1}T00:00:00"
+            })
+        manager = KnowledgeGraphManager()
+        manager.attach_storage(storage)
+        
+        assert [c["id"] for c in manager.get_recent_capsules(2)] == ["v2", "v1"]
+        
+        view = manager.export_view_json(limit=2)
+        node_ids = {n["id"] for n in view["nodes"]}
+        assert {"v1", "v2", "category_自然科学"} <= node_ids
+        assert "v0" not in node_ids
+        assert all(link["type"] != "related" for link in view["links"])
+        
+        full = manager.export_view_json(limit=10)
+        assert {(l["source"], l["target"]) for l in full["links"] if l["type"] == "related"} == {("v1", "v0")}
+        
+        related = manager.get_related_from_graph("v0", limit=2)
+        assert [c["id"] for c in related] == ["v1", "v2"]
+
+
+class TestGraphResponseCache:
+    """图谱响应缓存 / ETag 测试类"""
+    
+    @pytest.fixture
+    def client(self, tmp_path):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from src.graph import graph_manager
+        from src.graph_router import router, response_cache
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        storage.save_knowledge_capsule({"id": "e1", "title": "缓存", "keywords": ["图谱"]})
+        graph_manager.attach_storage(storage)
+        response_cache.clear()
+        
+        app = FastAPI()
+        app.include_router(router)
+        yield TestClient(app), storage
+        
+        storage.remove_listener(graph_manager.on_capsule_event)
+        graph_manager.storage = None
+    
+    def test_etag_and_not_modified(self, client):
+        """测试相同版本返回 304，写入后 ETag 变化"""
+        from src.graph_router import response_cache
+        
+        client, storage = client
+        first = client.get("/api/graph/export", params={"limit": 10})
+        etag = first.headers["etag"]
+        assert first.status_code == 200
+        assert first.json()["data"]["stats"]["node_count"] == 3
+        
+        cached = client.get("/api/graph/export", params={"limit": 10})
+        assert cached.headers["etag"] == etag
+        assert response_cache.hits == 1
+        
+        not_modified = client.get("/api/graph/export", params={"limit": 10},
+                                  headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        
+        other_params = client.get("/api/graph/export", params={"limit": 5})
+        assert other_params.headers["etag"] != etag
+        
+        storage.save_knowledge_capsule({"id": "e2", "title": "新胶囊", "keywords": ["图谱"]})
+        changed = client.get("/api/graph/export", params={"limit": 10},
+                             headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert changed.json()["data"]["stats"]["node_count"] == 4
+    
+    def test_etag_changes_after_restart(self, client):
+        """测试重启后重复的版本号不会让旧 ETag 返回 304"""
+        from src.graph import graph_manager
+        
+        client, storage = client
+        etag = client.get("/api/graph/export", params={"limit": 10}).headers["etag"]
+        
+        # 模拟重启: 重新加载主图谱，写入计数重放相同的版本号
+        version = graph_manager.version
+        graph_manager.attach_storage(storage)
+        graph_manager.version = version
+        
+        response = client.get("/api/graph/export", params={"limit": 10},
+                              headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+
+    def test_derived_writes_only_invalidate_their_endpoints(self, client):
+        """测试中心性 / 布局写入不改变数据版本，只让用到它们的接口 ETag 变化"""
+        from src.graph import graph_manager
+        
+        client, storage = client
+        version = graph_manager.version
+        timeline = client.get("/api/graph/timeline").headers["etag"]
+        export = client.get("/api/graph/export").headers["etag"]
+        statistics = client.get("/api/graph/statistics").headers["etag"]
+        
+        graph_manager.mark_centrality_updated("2026-01-01T00:00:00")
+        graph_manager.set_layout({"e1": (0.0, 0.0)})
+        assert graph_manager.version == version
+        
+        assert client.get("/api/graph/timeline").headers["etag"] == timeline
+        assert client.get("/api/graph/export").headers["etag"] != export
+        assert client.get("/api/graph/statistics").headers["etag"] != statistics
+
+
+class TestCompactGraph:
+    """CSR 紧凑图谱测试类"""
+    
+    @pytest.fixture
+    def graph(self):
+        import random
+        
+        rng = random.Random(11)
+        graph = KnowledgeGraph(name="紧凑")
+        for i in range(120):
+            graph.add_node(GraphNode(id=f"n{i}", type="capsule" if i % 3 else "keyword",
+                                     label=f"节点 {i}", properties={"rank": i}))
+        for i in range(400):
+            graph.add_edge(GraphEdge(
+                source=f"n{rng.randrange(120)}", target=f"n{rng.randrange(120)}",
+                type=rng.choice(["related", "has_keyword"]), weight=rng.random()
+            ))
+        return graph
+    
+    def test_queries_match_dict_graph(self, graph):
+        """测试邻居 / 度数 / 最短路径与字典图谱一致"""
+        compact = graph.to_compact()
+        degrees = compact.degrees()
+        related_degrees = compact.degrees("related")
+        
+        for node_id in graph.nodes:
+            index = compact.node_index[node_id]
+            assert sorted(compact.neighbors(node_id)) == sorted(graph.neighbor_ids(node_id))
+            assert sorted(compact.neighbors(node_id, "related")) == sorted(graph.neighbor_ids(node_id, "related"))
+            assert degrees[index] == graph.degree(node_id)
+            assert related_degrees[index] == graph.degree(node_id, "related")
+        
+        for i in range(0, 120, 7):
+            start, end = f"n{i}", f"n{(i * 13) % 120}"
+            assert len(compact.get_shortest_path(start, end)) == len(graph.get_shortest_path(start, end))
+    
+    def test_roundtrip_and_persistence(self, graph, tmp_path):
+        """测试转换回字典形式及保存 / 加载"""
+        from src.graph_csr import CompactGraph
+        
+        compact = graph.to_compact()
+        restored = compact.to_knowledge_graph()
+        
+        def edge_set(g):
+            return sorted((e.source, e.target, e.type, round(e.weight, 5)) for e in g.edges.values())
+        
+        assert restored.nodes.keys() == graph.nodes.keys()
+        assert restored.nodes["n4"].properties == {"rank": 4}
+        assert len(restored.edges) == len(graph.edges)
+        assert [e[:3] for e in edge_set(restored)] == [e[:3] for e in edge_set(graph)]
+        
+        compact.save(str(tmp_path / "csr"))
+        loaded = CompactGraph.load(str(tmp_path / "csr"))
+        assert loaded.neighbors("n5") == compact.neighbors("n5")
+        assert loaded.memory_usage()["per_edge"] < 30
+
+
+class TestGraphCentrality:
+    """图谱中心性测试类"""
+    
+    def test_path_graph_scores(self):
+        """测试路径图 a-b-c-d 的介数、度数与 PageRank"""
+        from src.graph_centrality import GraphCentrality
+        
+        graph = KnowledgeGraph()
+        for node_id in "abcd":
+            graph.add_node(GraphNode(id=node_id, type="capsule", label=node_id))
+        graph.add_node(GraphNode(id="category_x", type="category", label="x"))
+        for source, target in [("a", "b"), ("b", "c"), ("c", "d")]:
+            graph.add_edge(GraphEdge(source=source, target=target, type="related"))
+        graph.add_edge(GraphEdge(source="a", target="category_x", type="from_category"))
+        
+        scores = GraphCentrality(betweenness_samples=10).compute(graph)
+        
+        assert set(scores) == set("abcd")
+        assert scores["a"]["degree"] == 1 and scores["b"]["degree"] == 2
+        # b 位于 a-c、a-d 两对节点的最短路径上: 2 / C(3, 2)
+        assert scores["b"]["betweenness"] == pytest.approx(2 / 3)
+        assert scores["a"]["betweenness"] == 0
+        assert scores["b"]["pagerank"] > scores["a"]["pagerank"]
+        assert scores["b"]["pagerank"] == pytest.approx(scores["c"]["pagerank"])
+    
+    @pytest.mark.parametrize("sharded", [False, True])
+    def test_persisted_scores_sort_listings(self, tmp_path, sharded):
+        """测试中心性持久化并可用于胶囊列表排序"""
+        from src.graph_centrality import GraphCentrality
+        from src.storage.capsule_storage import CapsuleStorage
+        from src.storage.sharded_storage import ShardedCapsuleStorage
+        
+        if sharded:
+            storage = ShardedCapsuleStorage(str(tmp_path / "shards"))
+        else:
+            storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        
+        # hub 与其余胶囊都共享关键词，应有最高的 PageRank
+        storage.save_knowledge_capsule({
+            "id": "hub", "title": "枢纽", "category": "交叉科学",
+            "keywords": ["物理", "生物", "经济"], "quality_score": 10
+        })
+        for i, (category, keyword) in enumerate([("自然科学", "物理"), ("自然科学", "生物"),
+                                                 ("社会科学", "经济")]):
+            storage.save_knowledge_capsule({
+                "id": f"leaf{i}", "title": f"叶子 {i}", "category": category,
+                "keywords": [keyword], "quality_score": 90 - i
+            })
+        
+        manager = KnowledgeGraphManager()
+        manager.attach_storage(storage)
+        version = manager.version
+        report = GraphCentrality().run(manager)
+        
+        assert report["nodes"] == 7  # 4 个胶囊 + 3 个关键词
+        # 中心性只更新自己的写入计数，不改变触发后台重算的数据版本
+        assert manager.version == version
+        assert manager.derived_versions["centrality"] == 1
+        
+        by_pagerank = storage.list_knowledge_capsules(sort="pagerank")
+        assert by_pagerank[0]["id"] == "hub"
+        assert by_pagerank[0]["centrality"]["degree"] == 6
+        assert storage.list_knowledge_capsules(sort="quality")[0]["id"] == "leaf0"
+        assert storage.get_top_capsules(limit=1, sort="degree")[0]["id"] == "hub"
+        
+        top_keywords = storage.get_graph_centrality(node_type="keyword", limit=5)
+        assert {row["node_id"] for row in top_keywords} == {"keyword_物理", "keyword_生物", "keyword_经济"}
+        assert manager.get_centrality_summary(1)["top_capsules"][0]["node_id"] == "hub"
+
+
+class TestGraphCommunity:
+    """图谱社区发现测试类"""
+    
+    def test_label_propagation_splits_cliques(self):
+        """测试两个由弱边相连的团被分成两个社区"""
+        from src.graph_community import CommunityDetector
+        
+        graph = KnowledgeGraph()
+        groups = ["abcd", "wxyz"]
+        for group in groups:
+            for node_id in group:
+                graph.add_node(GraphNode(id=node_id, type="capsule", label=node_id))
+            for i, source in enumerate(group):
+                for target in group[i + 1:]:
+                    graph.add_edge(GraphEdge(source=source, target=target, type="related", weight=1.0))
+        graph.add_edge(GraphEdge(source="d", target="w", type="related", weight=0.3))
+        
+        communities = CommunityDetector().compute(graph)
+        
+        assert len({communities[n] for n in "abcd"}) == 1
+        assert len({communities[n] for n in "wxyz"}) == 1
+        assert communities["a"] != communities["z"]
+    
+    def test_communities_persist_and_update_incrementally(self, tmp_path):
+        """测试社区跨越分类、持久化后重新加载，并把新胶囊增量归入社区"""
+        from src.graph_community import CommunityDetector
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        topics = [
+            (["量子", "纠缠", "信息"], ["自然科学", "交叉科学", "人文科学"]),
+            (["市场", "博弈", "合作"], ["社会科学", "人文科学", "社会科学"]),
+        ]
+        for t, (keywords, categories) in enumerate(topics):
+            for i, category in enumerate(categories):
+                storage.save_knowledge_capsule({
+                    "id": f"t{t}_{i}", "title": f"主题 {t}-{i}", "category": category,
+                    "keywords": keywords, "source_agents": [f"agent{t}"], "quality_score": 70
+                })
+        
+        manager = KnowledgeGraphManager()
+        manager.attach_storage(storage)
+        assert manager.get_community_analysis()["method"] == "category"
+        
+        report = CommunityDetector().run(manager)
+        assert report["communities"] == 2
+        
+        analysis = manager.get_community_analysis()
+        assert analysis["method"] == "label_propagation"
+        assert [c["count"] for c in analysis["clusters"]] == [3, 3]
+        assert all(c["cross_disciplinary"] for c in analysis["clusters"])
+        assert analysis["clusters"][0]["keywords"]
+        
+        # 新胶囊按邻居投票归入已有社区
+        storage.save_knowledge_capsule({
+            "id": "new", "title": "新胶囊", "category": "交叉科学",
+            "keywords": ["市场", "博弈", "合作"], "quality_score": 60
+        })
+        assert manager.get_community("new") == manager.get_community("t1_0")
+        assert manager.get_community("new") != manager.get_community("t0_0")
+        
+        storage.delete_knowledge_capsule("new")
+        assert manager.get_community("new") is None
+        
+        # 重新绑定存储时加载已持久化的划分
+        reloaded = KnowledgeGraphManager()
+        reloaded.attach_storage(storage)
+        assert reloaded.communities_computed_at == manager.communities_computed_at
+        assert reloaded.get_community("t0_1") == manager.get_community("t0_1")
+
+
+class TestLevelOfDetail:
+    """分级细节视图测试类"""
+    
+    @pytest.fixture
+    def manager(self):
+        manager = KnowledgeGraphManager()
+        categories = ["自然科学", "社会科学", "人文科学"]
+        for i in range(120):
+            manager.upsert_capsule({
+                "id": f"c{i}", "title": f"胶囊 {i}", "category": categories[i % 3],
+                "keywords": [f"k{i % 10}", f"k{(i + 1) % 10}", f"t{i % 4}"],
+                "source_agents": [f"agent{i % 5}"], "quality_score": i % 100
+            })
+        return manager
+    
+    @staticmethod
+    def _assert_consistent(view):
+        ids = {node["id"] for node in view["nodes"]}
+        assert len(ids) == len(view["nodes"])
+        assert all(link["source"] in ids and link["target"] in ids for link in view["links"])
+    
+    def test_payload_is_bounded(self, manager):
+        """测试节点 / 边数受上限约束，折叠的胶囊计入超级节点"""
+        view = manager.export_lod_json(max_nodes=30, max_links=50)
+        self._assert_consistent(view)
+        
+        assert view["stats"]["node_count"] <= 30
+        assert view["stats"]["edge_count"] <= 50
+        clusters = [n for n in view["nodes"] if n["type"] == "cluster"]
+        capsules = [n for n in view["nodes"] if n["type"] == "capsule"]
+        assert {c["id"] for c in clusters} == {"category_自然科学", "category_社会科学", "category_人文科学"}
+        assert sum(c["count"] for c in clusters) + len(capsules) == 120
+        # 没有中心性时按质量分选择
+        assert "c99" in {c["id"] for c in capsules}
+    
+    def test_focus_and_expand(self, manager):
+        """测试焦点邻域与超级节点展开"""
+        view = manager.export_lod_json(max_nodes=30, focus="c3", depth=1)
+        self._assert_consistent(view)
+        visible = {n["id"] for n in view["nodes"]}
+        assert "c3" in visible
+        assert any(
+            {link["source"], link["target"]} & {"c3"} and link["type"] == "related"
+            for link in view["links"]
+        )
+        
+        view = manager.export_lod_json(max_nodes=30, expand=["category_社会科学"])
+        self._assert_consistent(view)
+        expanded = [n for n in view["nodes"] if n.get("group") == "category_社会科学"]
+        assert len(expanded) > 10
+
+
+class TestGraphLayout:
+    """图谱布局测试类"""
+    
+    def test_layout_separates_clusters(self):
+        """测试两个弱连接的团在布局中分开"""
+        import numpy as np
+        from src.graph_layout import GraphLayout
+        
+        graph = KnowledgeGraph()
+        groups = ["a", "b"]
+        for group in groups:
+            for i in range(12):
+                graph.add_node(GraphNode(id=f"{group}{i}", type="capsule", label=""))
+            for i in range(12):
+                for j in range(i + 1, 12):
+                    graph.add_edge(GraphEdge(source=f"{group}{i}", target=f"{group}{j}", type="related"))
+        graph.add_edge(GraphEdge(source="a0", target="b0", type="related", weight=0.1))
+        
+        positions = GraphLayout(iterations=100).compute(graph)
+        a = np.array([positions[f"a{i}"] for i in range(12)])
+        b = np.array([positions[f"b{i}"] for i in range(12)])
+        
+        assert np.abs(np.concatenate([a, b])).max() <= 1.0 + 1e-9
+        separation = np.linalg.norm(a.mean(axis=0) - b.mean(axis=0))
+        assert separation > 3 * max(a.std(axis=0).mean(), b.std(axis=0).mean())
+    
+    def test_layout_is_cached_and_refined(self, tmp_path):
+        """测试布局持久化、新节点就近放置后细化，并包含在导出中"""
+        from src.graph_layout import GraphLayout
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        for i in range(20):
+            storage.save_knowledge_capsule({
+                "id": f"c{i}", "title": f"胶囊 {i}", "category": "自然科学",
+                "keywords": [f"k{i % 4}", "共享"], "source_agents": ["agent1"], "quality_score": 60
+            })
+        
+        manager = KnowledgeGraphManager()
+        manager.attach_storage(storage)
+        layout = GraphLayout(iterations=30)
+        layout.run(manager)
+        assert set(manager.layout) == set(manager.main_graph.nodes)
+        
+        storage.save_knowledge_capsule({
+            "id": "new", "title": "新胶囊", "category": "社会科学",
+            "keywords": ["k1", "共享"], "source_agents": ["agent2"], "quality_score": 60
+        })
+        assert {"new", "category_社会科学", "agent_agent2"} <= set(manager._layout_pending)
+        assert layout.refine(manager) == 3
+        assert not manager._layout_pending
+        
+        view = manager.export_view_json(limit=5)
+        assert all("x" in node and "y" in node for node in view["nodes"])
+        lod = manager.export_lod_json(max_nodes=10)
+        assert all("x" in node for node in lod["nodes"])
+        
+        reloaded = KnowledgeGraphManager()
+        reloaded.attach_storage(storage)
+        assert reloaded.layout["c0"] == pytest.approx(manager.layout["c0"])
+        # 全量布局之后加入的胶囊在加载时重新放置
+        assert "new" in reloaded.layout and "new" in reloaded._layout_pending
+
+
+
+class TestGraphStore:
+    """SQLite 图谱存储测试类"""
+    
+    def test_recursive_queries_match_bfs(self, tmp_path):
+        """测试递归 CTE 的 k 跳邻域 / 最短路径与内存 BFS 一致"""
+        import random
+        from src.storage.graph_store import GraphStore
+        
+        rng = random.Random(7)
+        graph = KnowledgeGraph()
+        for i in range(150):
+            graph.add_node(GraphNode(id=str(i), type="capsule", label=str(i)))
+        for i in range(250):
+            graph.add_edge(GraphEdge(id=f"e{i}", source=str(rng.randrange(150)), target=str(rng.randrange(150)),
+                                     type=rng.choice(["related", "cites"])))
+        
+        store = GraphStore(str(tmp_path / "graph.db"))
+        assert store.save_graph("test", graph) == (150, len(graph.edges))
+        
+        manager = KnowledgeGraphManager()
+        manager.main_graph = graph
+        for _ in range(20):
+            start, end = str(rng.randrange(150)), str(rng.randrange(150))
+            expected = {(n["id"], n["depth"]) for n in manager.get_neighborhood(start, k=3, limit=1000)}
+            assert {(n["id"], n["depth"]) for n in store.k_hop("test", start, k=3)} == expected
+            expected = {(n["id"], n["depth"]) for n in manager.get_neighborhood(start, 2, "cites", "out")}
+            assert {(n["id"], n["depth"]) for n in store.k_hop("test", start, 2, "cites", "out")} == expected
+            
+            path = store.shortest_path("test", start, end, max_depth=10)
+            assert len(path) == len(graph.get_shortest_path(start, end))
+            for a, b in zip(path, path[1:]):
+                assert b in set(graph.neighbor_ids(a))
+        
+        assert store.shortest_path("test", "0", "149", max_depth=1) in ([], ["0", "149"])
+    
+    def test_main_graph_write_through_and_reload(self, tmp_path):
+        """测试主图谱增量写入图谱存储，重启时直接从存储加载"""
+        from src.storage.capsule_storage import CapsuleStorage
+        from src.storage.graph_store import GraphStore
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        store = GraphStore(str(tmp_path / "graph.db"))
+        manager = KnowledgeGraphManager()
+        manager.attach_storage(storage, store)
+        for i in range(12):
+            storage.save_knowledge_capsule({
+                "id": f"s{i}",
+                "title": f"胶囊 {i}",
+                "category": "自然科学" if i % 2 else "人文科学",
+                "keywords": [f"词{i % 4}", f"词{i % 3 + 4}", "共同"],
+                "source_agents": ["newton"],
+                "created_at": f"2026-01-{i + 1:02d}T00:00:00"
+            })
+        storage.save_knowledge_capsule({
+            "id": "s3", "title": "更新", "category": "交叉科学",
+            "keywords": ["新词"], "source_agents": ["turing"], "created_at": "2026-02-01T00:00:00"
+        })
+        storage.delete_knowledge_capsule("s5")
+        
+        counts = store.count("main")
+        assert counts == {"nodes": len(manager.main_graph.nodes), "edges": len(manager.main_graph.edges)}
+        assert store.get_node("main", "category_交叉科学")["properties"]["count"] == 1
+        
+        reloaded = KnowledgeGraphManager()
+        store.save_graph = None  # 一致时不应重建并整体写入
+        reloaded.attach_storage(storage, store)
+        assert set(reloaded.main_graph.nodes) == set(manager.main_graph.nodes)
+        assert TestMainGraph._edge_set(reloaded.main_graph) == TestMainGraph._edge_set(manager.main_graph)
+        assert [c["id"] for c in reloaded.get_related_from_graph("s1")] == \
+            [c["id"] for c in manager.get_related_from_graph("s1")]
+        
+        path = reloaded.find_path("s1", "category_人文科学")
+        assert len(path) == len(manager.main_graph.get_shortest_path("s1", "category_人文科学")) == 3
+        assert reloaded.find_path("s1", "agent_turing") == []
+        assert reloaded.get_neighborhood("missing") is None
+        
+        storage.delete_knowledge_capsule("s3")
+        assert store.get_node("main", "agent_turing") is None
+        assert store.get_node("main", "category_交叉科学") is None
+    
+    def test_offline_rewrite_triggers_rebuild(self, tmp_path):
+        """测试胶囊 ID 不变但内容在其他进程中被改写时不加载过期的图谱"""
+        from src.storage.capsule_storage import CapsuleStorage
+        from src.storage.graph_store import GraphStore
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        store = GraphStore(str(tmp_path / "graph.db"))
+        for i, keywords in enumerate([["量子", "测量"], ["量子", "测量"], ["诗歌", "韵律"]]):
+            storage.save_knowledge_capsule({
+                "id": f"o{i}", "title": f"胶囊 {i}", "category": "自然科学",
+                "keywords": keywords, "source_agents": ["newton"]
+            })
+        KnowledgeGraphManager().attach_storage(storage, store)
+        
+        # 另一个进程改写胶囊 (不经过本进程的监听器)
+        offline = CapsuleStorage(str(tmp_path / "capsules.db"))
+        offline.save_knowledge_capsule({
+            "id": "o2", "title": "胶囊 2", "category": "自然科学",
+            "keywords": ["量子", "测量"], "source_agents": ["newton"]
+        })
+        
+        reloaded = KnowledgeGraphManager()
+        reloaded.attach_storage(storage, store)
+        rebuilt = reloaded.build_from_capsules(list(storage.iter_knowledge_capsules()))
+        assert TestMainGraph._edge_set(reloaded.main_graph) == TestMainGraph._edge_set(rebuilt)
+        assert "o2" in reloaded.main_graph.neighbor_ids("o0", "related")
+        
+        # 指纹只存放在图谱存储的独立表中，不出现在导出的节点里
+        assert set(store.get_fingerprints("main")) == {"o0", "o1", "o2"}
+        assert all("fingerprint" not in node for node in reloaded.export_view_json(10)["nodes"])
+        assert all("fingerprint" not in node["properties"] for node in reloaded.get_neighborhood("o0"))
+
+
+class TestRelatedCapsules:
+    """预计算相关胶囊测试类"""
+    
+    @staticmethod
+    def _capsule(rng, i):
+        return {
+            "id": f"r{i}",
+            "title": f"胶囊 {i}",
+            "category": rng.choice(["自然科学", "人文科学", "交叉科学", None]),
+            "keywords": rng.sample([f"词{k}" for k in range(40)], rng.randint(0, 6)),
+            "quality_score": rng.randint(0, 100)
+        }
+    
+    def test_batch_matches_pairwise_scores(self):
+        """测试批量 Top-K 的分数与逐对打分一致"""
+        import random
+        from src.related_capsules import _terms, compute_related, related_score
+        
+        rng = random.Random(11)
+        capsules = [self._capsule(rng, i) for i in range(300)]
+        related = compute_related(capsules, top_k=8, max_posting=1000, batch_size=64)
+        
+        for capsule in capsules[:100]:
+            kw1 = set(_terms(capsule["keywords"]))
+            expected = sorted((
+                related_score(kw1, capsule["category"], set(_terms(other["keywords"])), other["category"])
+                for other in capsules if other["id"] != capsule["id"]
+            ), reverse=True)
+            expected = [score for score in expected if score > 0][:8]
+            assert [score for _, score in related.get(capsule["id"], [])] == pytest.approx(expected)
+    
+    def test_incremental_refresh_matches_full_run(self, tmp_path):
+        """测试增量刷新后的相关胶囊表与全量计算一致，接口为单次查询"""
+        import random
+        from src.knowledge.capsule import CapsuleRecommender
+        from src.related_capsules import RelatedCapsuleIndex, compute_related
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        rng = random.Random(12)
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        for i in range(200):
+            storage.save_knowledge_capsule(self._capsule(rng, i))
+        index = RelatedCapsuleIndex(top_k=6)
+        index.attach_storage(storage)
+        assert index.run()["capsules"] == storage.count_related_capsules()
+        
+        for i in range(200, 215):
+            storage.save_knowledge_capsule(self._capsule(rng, i))
+        for i in range(10):
+            storage.save_knowledge_capsule(self._capsule(rng, i))
+        for i in range(10, 15):
+            storage.delete_knowledge_capsule(f"r{i}")
+        assert index.refresh() == 30
+        
+        capsules = list(storage.iter_knowledge_capsules())
+        expected = compute_related(capsules, top_k=6)
+        stored = storage.get_related_capsule_ids([c["id"] for c in capsules])
+        for capsule_id, items in expected.items():
+            assert [score for _, score in stored[capsule_id]] == pytest.approx([score for _, score in items])
+        
+        related = index.get_related("r3", limit=3)
+        assert [c["id"] for c in related] == [related_id for related_id, _ in stored["r3"][:3]]
+        assert CapsuleRecommender(storage).get_similar_capsules("r3", limit=3) == related
+        assert index.get_related("r12") == []
+
+
+class TestCapsuleLSH:
+    """胶囊 MinHash/LSH 近重复索引测试类"""
+    
+    BASE = {
+        "title": "量子纠缠与信息传递",
+        "insight": "量子纠缠并不能用于超光速传递信息，因为单次测量结果是完全随机的",
+        "keywords": ["量子", "纠缠"],
+        "category": "自然科学"
+    }
+    
+    def test_near_duplicates_among_random_capsules(self):
+        """测试近重复胶囊能被找到，无关胶囊不会成为候选，估计值接近真实 Jaccard"""
+        import random
+        from src.capsule_lsh import CapsuleLSHIndex, capsule_shingles
+        
+        rng = random.Random(5)
+        chars = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜金生丽水玉出昆冈"
+        index = CapsuleLSHIndex()
+        capsules = {
+            f"n{i}": {"title": "".join(rng.choices(chars, k=8)), "insight": "".join(rng.choices(chars, k=40))}
+            for i in range(3000)
+        }
+        capsules["a"] = dict(self.BASE)
+        capsules["b"] = {**self.BASE, "insight": self.BASE["insight"] + "。", "title": "量子纠缠与信息的传递"}
+        ids = list(capsules)
+        index.add_many(ids[:2000], index.signatures([capsule_shingles(capsules[i])[0] for i in ids[:2000]]))
+        for capsule_id in ids[2000:]:
+            index.add(capsule_id, index.capsule_signature(capsules[capsule_id])[1])
+        assert len(index) == 3002
+        
+        true_jaccard = len(
+            set(capsule_shingles(capsules["a"])[0]) & set(capsule_shingles(capsules["b"])[0])
+        ) / len(set(capsule_shingles(capsules["a"])[0]) | set(capsule_shingles(capsules["b"])[0]))
+        duplicates = index.near_duplicates("a")
+        assert [capsule_id for capsule_id, _ in duplicates] == ["b"]
+        assert duplicates[0][1] == pytest.approx(true_jaccard, abs=0.1)
+        assert index.find_duplicates({**self.BASE, "id": "new"})[0][0] == "a"
+        assert index.find_duplicates({"title": "唐诗的格律", "insight": "近体诗讲究平仄与对仗"}) == []
+        
+        index.remove("b")
+        assert index.near_duplicates("a") == []
+        assert index.similar("missing") == []
+    
+    def test_storage_sync_and_generator_dedup(self, tmp_path):
+        """测试签名持久化、监听器增量维护与生成时去重"""
+        from src.capsule_lsh import CapsuleLSHIndex
+        from src.knowledge.capsule import CapsuleGenerator
+        from src.related_capsules import RelatedCapsuleIndex
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        storage.save_knowledge_capsule({**self.BASE, "id": "a"})
+        storage.save_knowledge_capsule({"id": "c", "title": "唐诗的格律", "insight": "近体诗讲究平仄与对仗"})
+        index = CapsuleLSHIndex()
+        index.attach_storage(storage)
+        assert len(index) == 2
+        
+        storage.save_knowledge_capsule({**self.BASE, "id": "b", "insight": self.BASE["insight"] + "！"})
+        assert index.near_duplicates("a")[0][0] == "b"
+        storage.delete_knowledge_capsule("c")
+        assert len(index) == 2
+        
+        # 重新加载复用持久化签名，过期签名重算
+        stored = {capsule_id: signature for capsule_id, _, signature in storage.iter_capsule_signatures()}
+        assert set(stored) == {"a", "b"}
+        reloaded = CapsuleLSHIndex()
+        reloaded.attach_storage(storage)
+        assert reloaded.near_duplicates("a") == index.near_duplicates("a")
+        
+        # 关键词 / 分类都不相关时，相关胶囊用文本相似的胶囊补足
+        storage.save_knowledge_capsule({**self.BASE, "id": "d", "keywords": [], "category": None})
+        related = RelatedCapsuleIndex(similarity_index=index)
+        related.attach_storage(storage)
+        filled = related.get_related("d", limit=2)
+        assert {c["id"] for c in filled} == {"a", "b"}
+        assert all(c["related_score"] == 0 and c["similarity"] > 0.5 for c in filled)
+        
+        generator = CapsuleGenerator(dedup_index=index)
+        contributions = [{"agent_name": "甲", "content": "量子纠缠不能用于超光速通信"}]
+        capsule = generator.generate_from_discussion("量子纠缠", "讨论", contributions, ["甲"])
+        assert capsule.duplicate_of == ""
+        storage.save_knowledge_capsule(capsule.to_dict())
+        again = generator.generate_from_discussion("量子纠缠", "讨论", contributions, ["甲"])
+        assert again.duplicate_of == capsule.id
+        assert again.to_dict()["duplicate_of"] == capsule.id
+
+
+class TestSemanticIndex:
+    """语义相似胶囊测试类"""
+    
+    def test_semantic_similar_and_incremental_sync(self, tmp_path):
+        """测试按胶囊 / 文本检索语义相似胶囊，胶囊写入删除后向量同步，重启只向量化变化的胶囊"""
+        from src.knowledge.capsule import CapsuleRecommender
+        from src.semantic_index import SemanticIndex, hash_embedding
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        calls = []
+        
+        def embed(texts):
+            calls.append(len(texts))
+            return hash_embedding(texts)
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        storage.save_knowledge_capsule({"id": "a", "title": "量子纠缠与信息传递", "insight": "量子纠缠不能用于超光速通信"})
+        storage.save_knowledge_capsule({"id": "b", "title": "量子计算原理", "insight": "量子比特的叠加与纠缠带来并行计算"})
+        storage.save_knowledge_capsule({"id": "c", "title": "唐诗的格律", "insight": "近体诗讲究平仄与对仗"})
+        index = SemanticIndex(embed_fn=embed, model="hash")
+        index.attach_storage(storage, str(tmp_path / "vectors"))
+        
+        assert [capsule_id for capsule_id, _ in index.get_semantic_similar("a", k=2)] == ["b", "c"]
+        assert index.get_semantic_similar(text="诗歌的平仄与对仗", k=1)[0][0] == "c"
+        assert index.get_semantic_similar("missing") is None
+        
+        storage.save_knowledge_capsule({"id": "d", "title": "量子纠缠与信息传递", "insight": "量子纠缠不能用于超光速通信！"})
+        storage.delete_knowledge_capsule("b")
+        recommender = CapsuleRecommender(storage, semantic_index=index)
+        similar = recommender.get_semantic_similar("a", k=2)
+        assert [c["id"] for c in similar] == ["d", "c"]
+        assert similar[0]["similarity"] > 0.9
+        
+        calls.clear()
+        storage.save_knowledge_capsule({"id": "c", "title": "宋词的词牌", "insight": "词牌规定了字数与平仄"})
+        reloaded = SemanticIndex(embed_fn=embed, model="hash")
+        reloaded.attach_storage(storage, str(tmp_path / "vectors"))
+        assert calls == [1, 1]  # 监听器重新向量化 c；重启时只做维度探测，不重新向量化
+        assert len(reloaded.store) == 3
+        
+        # 近似索引: 达到阈值后构建，全簇扫描时与暴力检索一致
+        assert not reloaded.ann_stale()
+        assert reloaded.ann_stale(min_vectors=1)
+        reloaded.build_ann(nlist=2)
+        assert not reloaded.ann_stale(min_vectors=1)
+        assert reloaded.get_semantic_similar("a", k=2, nprobe=2) == reloaded.get_semantic_similar("a", k=2, exact=True)
+
+
+class TestCapsuleBM25:
+    """胶囊全文检索测试类"""
+    
+    def test_storage_sync_recommendation_and_graph_query(self, tmp_path):
+        """测试存储同步、按兴趣推荐与知识图谱实体查询"""
+        from src.capsule_bm25 import CapsuleBM25Index
+        from src.knowledge.capsule import CapsuleRecommender
+        from src.knowledge.generator import KnowledgeGraph
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        storage.save_knowledge_capsule({"id": "a", "title": "量子计算入门", "insight": "量子比特可以叠加", "keywords": ["物理"]})
+        storage.save_knowledge_capsule({"id": "b", "title": "深度学习", "insight": "神经网络与计算", "keywords": ["AI"]})
+        index = CapsuleBM25Index()
+        index.attach_storage(storage)
+        assert [c["id"] for c in index.search_capsules("量子计算")] == ["a", "b"]
+        
+        storage.save_knowledge_capsule({"id": "c", "title": "咖啡的烘焙", "insight": "烘焙度影响风味"})
+        storage.delete_knowledge_capsule("a")
+        assert [c["id"] for c in index.search_capsules("烘焙 量子")] == ["c"]
+        
+        # 兴趣词不必与关键词完全一致
+        recommender = CapsuleRecommender(storage, text_index=index)
+        recommended = recommender.get_recommended_for_user(["神经网络"], limit=3)
+        assert [c["id"] for c in recommended] == ["b"] and recommended[0]["relevance"] > 0
+        
+        graph = KnowledgeGraph()
+        graph.add_entity("e1", "concept", {"name": "知识图谱", "tags": ["Graph", "图数据库"]})
+        graph.add_entity("e2", "concept", {"name": "图论"})
+        graph.add_entity("e3", "person", {"name": "欧拉", "field": "图论"})
+        assert [e["id"] for e in graph.query(keyword="图论")] == ["e2", "e3"]
+        assert [e["id"] for e in graph.query(entity_type="person", keyword="图论")] == ["e3"]
+        assert [e["id"] for e in graph.query(keyword="graph")] == ["e1"]
+
+
+class TestSearchService:
+    """统一搜索测试类"""
+    
+    def test_fusion_pagination_and_rerank(self, tmp_path):
+        """测试胶囊 / 对话 / Agent / 讨论主题的融合排序、分页、重排与各阶段耗时"""
+        import json
+        import sqlite3
+        from src.capsule_bm25 import CapsuleBM25Index
+        from src.search import SearchService
+        from src.semantic_index import SemanticIndex, hash_embedding
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        storage.save_knowledge_capsule({"id": "a", "title": "量子纠缠", "insight": "量子纠缠不能用于超光速通信", "quality_score": 40})
+        storage.save_knowledge_capsule({"id": "b", "title": "量子计算原理", "insight": "量子比特的叠加带来并行计算", "quality_score": 95})
+        storage.save_knowledge_capsule({"id": "c", "title": "唐诗的格律", "insight": "近体诗讲究平仄与对仗"})
+        storage.save_graph_centrality({
+            "b": {"node_type": "capsule", "pagerank": 0.5, "degree": 3, "betweenness": 0.2}
+        })
+        text_index = CapsuleBM25Index()
+        text_index.attach_storage(storage)
+        semantic = SemanticIndex(embed_fn=hash_embedding, model="hash")
+        semantic.attach_storage(storage, str(tmp_path / "vectors"))
+        
+        chat_db = str(tmp_path / "suilight.db")
+        conn = sqlite3.connect(chat_db)
+        conn.execute("CREATE TABLE chat_history (id TEXT PRIMARY KEY, agent_id TEXT, agent_name TEXT, user_message TEXT, bot_response TEXT, timestamp TEXT)")
+        conn.execute("INSERT INTO chat_history VALUES ('chat1', 'feynman', '费曼', '量子纠缠是什么？', '一种关联', '2024-01-01')")
+        conn.execute("INSERT INTO chat_history VALUES ('chat2', 'feynman', '费曼', '今天天气如何', '晴天', '2024-01-02')")
+        conn.commit()
+        conn.close()
+        topic_db = str(tmp_path / "topics.db")
+        conn = sqlite3.connect(topic_db)
+        conn.execute("CREATE TABLE topics (id TEXT PRIMARY KEY, data TEXT, created_at TEXT, updated_at TEXT)")
+        conn.execute("INSERT INTO topics VALUES ('t1', ?, '', '')", (json.dumps({"title": "量子计算的未来", "tags": ["物理"]}, ensure_ascii=False),))
+        conn.commit()
+        conn.close()
+        
+        service = SearchService(text_index, semantic, chat_db=chat_db, topic_db=topic_db)
+        result = service.search("量子纠缠")
+        ids = [(r["type"], r["id"]) for r in result["results"]]
+        # 同时被 BM25 与语义检索命中的胶囊排在最前
+        assert ids[0] == ("capsule", "a")
+        assert result["results"][0]["lexical_rank"] == 1 and result["results"][0]["semantic_rank"] == 1
+        assert ("chat", "chat1") in ids and ("chat", "chat2") not in ids
+        assert ("discussion", "t1") in ids
+        assert result["counts"]["agent"] > 0 and result["total"] == sum(result["counts"].values())
+        assert {"lexical", "semantic", "chat", "agent", "discussion", "fusion", "hydrate", "total"} <= set(result["latency_ms"])
+        
+        # 分页与类型过滤
+        pages = [service.search("量子纠缠", page=page, page_size=2)["results"] for page in (1, 2)]
+        assert [(r["type"], r["id"]) for r in pages[0] + pages[1]] == ids[:4]
+        only_capsules = service.search("量子", types=["capsule"])
+        assert set(only_capsules["counts"]) == {"capsule"}
+        assert {r["id"] for r in only_capsules["results"]} >= {"a", "b"}
+        
+        # 语义检索不返回相似度低于阈值的胶囊
+        assert service.search("zzqx blorf", types=["capsule"])["counts"]["capsule"] == 0
+        assert "c" not in {r["id"] for r in only_capsules["results"]}
+        
+        # 重排: 质量分与 PageRank 更高的 b 提前，胶囊仍占据原来的位置，融合得分随胶囊移动
+        plain = {r["id"]: r["score"] for r in service.search("量子纠缠", types=["capsule"])["results"]}
+        reranked = service.search("量子纠缠", types=["capsule"], rerank=True)
+        assert reranked["results"][0]["id"] == "b"
+        assert reranked["results"][0]["rerank_score"] > reranked["results"][1]["rerank_score"]
+        assert {r["id"]: r["score"] for r in reranked["results"]} == plain
+        assert "rerank" in reranked["latency_ms"]
+
+
+class TestCapsuleTrending:
+    """热门胶囊测试类"""
+    
+    def test_decayed_ranking_and_persistence(self, tmp_path):
+        """测试衰减热度与直接计算一致、排行增量维护、胶囊删除、持久化与推荐回退"""
+        import random
+        import time
+        from src.capsule_trending import EVENT_WEIGHTS, CapsuleTrending
+        from src.knowledge.capsule import CapsuleRecommender
+        from src.share import ShareManager
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        for i in range(20):
+            storage.save_knowledge_capsule({"id": f"c{i}", "title": f"胶囊{i}", "quality_score": i})
+        trending = CapsuleTrending(half_life=3600)
+        trending.attach_storage(storage, str(tmp_path / "trending.db"))
+        
+        rng = random.Random(7)
+        now = time.time()
+        events = [
+            (f"c{rng.randrange(20)}", rng.choice(["view", "share", "vote"]), 1, now - rng.uniform(0, 6 * 3600))
+            for _ in range(500)
+        ]
+        trending.record_many(events[:250])
+        for event in events[250:]:
+            trending.record(*event)
+        
+        expected = {}
+        for capsule_id, event, value, timestamp in events:
+            weight = EVENT_WEIGHTS[event] * value * 0.5 ** ((time.time() - timestamp) / 3600)
+            expected[capsule_id] = expected.get(capsule_id, 0.0) + weight
+        ranked = sorted(expected, key=lambda c: -expected[c])
+        top = trending.top(5)
+        assert [c for c, _ in top] == ranked[:5]
+        assert top[0][1] == pytest.approx(expected[ranked[0]], rel=1e-6)
+        assert [c for c, _ in trending.top(5, offset=5)] == [c for c, _ in trending.top(10)[5:]]
+        
+        # 前一小时的一次分享 = 一半的热度
+        assert trending.record("c19", "share", timestamp=time.time() - 3600) == pytest.approx(
+            expected.get("c19", 0.0) + 2.5, rel=1e-4
+        )
+        
+        # 平移基准时间不改变热度与顺序
+        before = trending.top(20)
+        trending._rebase(time.time())
+        assert [c for c, _ in trending.top(20)] == [c for c, _ in before]
+        
+        # 胶囊删除后移出排行；重新加载后与内存一致
+        storage.delete_knowledge_capsule(ranked[0])
+        assert ranked[0] not in [c for c, _ in trending.top(20)]
+        trending.save()
+        reloaded = CapsuleTrending(half_life=3600)
+        reloaded.attach_storage(CapsuleStorage(str(tmp_path / "capsules.db")), str(tmp_path / "trending.db"))
+        assert [c for c, _ in reloaded.top(20)] == [c for c, _ in trending.top(20)]
+        assert reloaded.get_counts(ranked[1]) == trending.get_counts(ranked[1])
+        
+        # 分享链接的浏览 / 分享计入热度；热门推荐按热度，不足时按质量补齐
+        shares = ShareManager()
+        shares.add_listener(reloaded.record)
+        link = shares.create_share_link("c0", "胶囊0")
+        before = reloaded.get_counts("c0")
+        shares.increment_share_count(link.id)
+        shares.generate_markdown(link.id)
+        assert reloaded.get_counts("c0") == {**before, "shares": before["shares"] + 1}
+        shares.record_view(link.short_id)
+        assert reloaded.get_counts("c0")["views"] == before["views"] + 1
+        assert link.view_count == 1 and link.share_count == 1
+        hot = CapsuleRecommender(storage, trending=reloaded).get_trending(limit=30)
+        assert [c["id"] for c in hot[:len(reloaded)]] == [c for c, _ in reloaded.top(30)]
+        assert hot[0]["trending_score"] > 0 and len(hot) == 19
+        assert [c["id"] for c in CapsuleRecommender(storage).get_trending(limit=2)] == ["c19", "c18"]
+
+
+    def test_event_route_requires_existing_capsule(self, tmp_path, monkeypatch):
+        """测试不存在的胶囊不能记录事件 (不进入排行)"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from src.capsule_trending import capsule_trending
+        from src.trending_router import router
+        from src.storage.capsule_storage import CapsuleStorage
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        storage.save_knowledge_capsule({"id": "ev1", "title": "事件"})
+        monkeypatch.setattr("src.main.CAPSULE_STORAGE", storage)
+        app = FastAPI()
+        app.include_router(router)
+        client = TestClient(app)
+        try:
+            assert client.post("/api/trending/capsules/ev_missing/events").status_code == 404
+            assert capsule_trending.get_counts("ev_missing")["views"] == 0
+            response = client.post("/api/trending/capsules/ev1/events", params={"event": "share"})
+            assert response.status_code == 200 and response.json()["data"]["shares"] == 1
+        finally:
+            capsule_trending.remove("ev1")
+
+
+class TestUserProfiles:
+    """用户兴趣画像与批量推荐测试类"""
+    
+    def test_batch_recommendations_and_incremental_refresh(self, tmp_path, monkeypatch):
+        """测试画像构建、进程池批量推荐与暴力计算一致、排除已看胶囊、增量刷新"""
+        import json
+        import sqlite3
+        import numpy as np
+        import src.user_profiles as profiles_module
+        from src.knowledge.capsule import CapsuleRecommender
+        from src.semantic_index import SemanticIndex, hash_embedding
+        from src.storage.capsule_storage import CapsuleStorage
+        from src.user_profiles import UserProfiles
+        
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        topics = ["量子纠缠与量子计算", "唐诗宋词的格律", "深度学习与神经网络", "咖啡烘焙与风味"]
+        for i in range(40):
+            storage.save_knowledge_capsule({"id": f"c{i}", "title": f"{topics[i % 4]} 第{i}篇", "insight": topics[i % 4]})
+        index = SemanticIndex(embed_fn=hash_embedding, model="hash")
+        index.attach_storage(storage, str(tmp_path / "vectors"))
+        
+        chat_db = str(tmp_path / "suilight.db")
+        conn = sqlite3.connect(chat_db)
+        conn.execute("CREATE TABLE chat_history (id TEXT PRIMARY KEY, agent_id TEXT, agent_name TEXT, user_message TEXT, bot_response TEXT, timestamp TEXT, metadata TEXT)")
+        conn.execute("INSERT INTO chat_history VALUES ('m1', 'a', 'A', '神经网络怎么训练？', '', '2099-01-01', ?)", (json.dumps({"user_id": "u4"}),))
+        conn.execute("INSERT INTO chat_history VALUES ('m2', 'a', 'A', '你好', '', '2099-01-01', '{}')")
+        conn.commit()
+        conn.close()
+        
+        profiles = UserProfiles(workers=2)
+        profiles.attach(storage, index, str(tmp_path / "profiles.db"), chat_db=chat_db)
+        for u in range(4):
+            for i in range(u, 12, 4):
+                profiles.record_activity(f"u{u}", f"c{i}", "share" if i == u else "view")
+        
+        monkeypatch.setattr(profiles_module, "USER_BLOCK", 2)
+        report = profiles.run()
+        assert report["users"] == 5 and report["profiles"] == 5
+        
+        # 与暴力计算一致: 按兴趣向量余弦排序，排除已浏览 / 分享的胶囊
+        for u in range(5):
+            user_id = f"u{u}"
+            vector = profiles.get_profile(user_id)
+            seen = {f"c{i}" for i in range(u, 12, 4)}
+            expected = sorted(
+                (c for c in index.store.ids() if c not in seen),
+                key=lambda c: (-float(index.store.get(c) @ vector), index.store.row_of(c))
+            )[:10]
+            recommended = profiles.get_recommendations(user_id, limit=10)
+            assert [c["id"] for c in recommended] == expected
+            assert recommended[0]["score"] >= recommended[-1]["score"]
+        # 兴趣集中于同一主题
+        assert all(int(c["id"][1:]) % 4 == 1 for c in profiles.get_recommendations("u1", limit=5))
+        assert all(int(c["id"][1:]) % 4 == 2 for c in profiles.get_recommendations("u4", limit=5))
+        
+        # 增量刷新只重建有新行为的用户
+        assert profiles.refresh()["users"] == 0
+        profiles.record_activity("u0", "c13", "share")
+        report = profiles.refresh()
+        assert report["users"] == 1 and report["profiles"] == 1
+        assert "c13" not in [c["id"] for c in profiles.get_recommendations("u0", limit=50)]
+        
+        recommender = CapsuleRecommender(storage, profiles=profiles)
+        assert recommender.get_recommended_for_user(limit=3, user_id="u1") == profiles.get_recommendations("u1", limit=3)
+        assert len(recommender.get_recommended_for_user(limit=3, user_id="nobody")) == 3
+
+
+# 运行测试
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
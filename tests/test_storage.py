@@ -7,6 +7,9 @@ import sys
 import os
 import tempfile
 import json
+import sqlite3
+
+import numpy as np
 
 # 添加项目路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -233,6 +236,29 @@ class TestCapsuleStorage:
         assert len(top_capsules) >= 1
         assert top_capsules[0]["quality_score"] >= 60
     
+    def test_batch_lookups_are_chunked(self, storage, monkeypatch):
+        """测试批量按 ID 读取在多个 IN 分块之间结果完整"""
+        import src.storage.capsule_storage as capsule_storage
+        
+        monkeypatch.setattr(capsule_storage, "QUERY_CHUNK", 2)
+        ids = [f"chunk_{i}" for i in range(5)]
+        storage.save_graph_centrality({
+            node_id: {"node_type": "capsule", "pagerank": 0.1 * i, "degree": i, "betweenness": 0.0}
+            for i, node_id in enumerate(ids)
+        })
+        storage.save_related_capsules({
+            node_id: [(ids[(i + 1) % 5], 0.9), (ids[(i + 2) % 5], 0.5)]
+            for i, node_id in enumerate(ids)
+        })
+        
+        centrality = storage.get_graph_centrality_by_ids(ids + ["missing"])
+        assert set(centrality) == set(ids)
+        assert centrality["chunk_3"]["degree"] == 3
+        
+        related = storage.get_related_capsule_ids(ids)
+        assert set(related) == set(ids)
+        assert related["chunk_4"] == [("chunk_0", 0.9), ("chunk_1", 0.5)]
+    
     # ============= 版本管理测试 =============
     
     def test_save_version(self, storage, sample_knowledge_capsule):
@@ -303,6 +329,51 @@ class TestCapsuleStorage:
         assert stats["knowledge_capsules_count"] >= 1
         assert stats["historical_capsules_count"] >= 1
     
+    # ============= 关键词 / Agent 索引测试 =============
+    
+    def test_keyword_links_maintained(self, storage, sample_knowledge_capsule):
+        """测试关键词映射随胶囊写入同步"""
+        storage.save_knowledge_capsule(sample_knowledge_capsule)
+        
+        assert storage.get_capsule_ids_by_keyword("测试") == ["test_kc_001"]
+        assert storage.get_capsule_ids_by_agent("测试专家1") == ["test_kc_001"]
+        
+        # 更新关键词后旧映射被替换
+        updated = sample_knowledge_capsule.copy()
+        updated["keywords"] = ["物理学"]
+        storage.save_knowledge_capsule(updated)
+        
+        assert storage.get_capsule_ids_by_keyword("测试") == []
+        assert storage.get_capsule_ids_by_keyword("物理学") == ["test_kc_001"]
+        
+        # 删除后映射被清理
+        storage.delete_knowledge_capsule("test_kc_001")
+        assert storage.get_capsule_ids_by_keyword("物理学") == []
+        assert storage.get_capsule_ids_by_agent("测试专家1") == []
+    
+    def test_keyword_frequency_and_cooccurrence(self, storage, sample_knowledge_capsule):
+        """测试关键词频次与共现统计"""
+        for i, keywords in enumerate([["A", "B"], ["A", "B", "C"], ["A"]]):
+            capsule = sample_knowledge_capsule.copy()
+            capsule["id"] = f"kw_{i}"
+            capsule["keywords"] = keywords
+            storage.save_knowledge_capsule(capsule)
+        
+        frequencies = storage.get_keyword_frequencies()
+        assert frequencies[0] == {"keyword": "A", "count": 3}
+        
+        pairs = storage.get_keyword_cooccurrence()
+        assert pairs[0] == {"keyword_a": "A", "keyword_b": "B", "count": 2}
+        
+        related = storage.get_keyword_cooccurrence("C")
+        assert {p["keyword_b"] for p in related} == {"A", "B"}
+        
+        sharing = storage.get_capsules_sharing_keywords("kw_1")
+        assert sharing[0] == {"capsule_id": "kw_0", "shared": 2}
+        
+        matched = storage.get_capsules_by_keywords(["B", "C"])
+        assert [c["id"] for c in matched][:2] == ["kw_1", "kw_0"]
+    
     # ============= 数据完整性测试 =============
     
     def test_capsule_json_integrity(self, storage, sample_knowledge_capsule):
@@ -363,6 +434,430 @@ class TestCapsuleStorage:
         assert "换行" in retrieved["insight"]
 
 
+class TestShardedCapsuleStorage:
+    """分片胶囊存储测试类"""
+    
+    @pytest.fixture
+    def storages(self, tmp_path):
+        from src.storage.sharded_storage import ShardedCapsuleStorage
+        
+        sharded = ShardedCapsuleStorage(str(tmp_path / "shards"))
+        single = CapsuleStorage(str(tmp_path / "single.db"))
+        categories = ["自然科学", "社会科学", "人文科学", "交叉科学", None]
+        for i in range(25):
+            capsule = {
+                "id": f"sh_{i}",
+                "title": f"分片胶囊 {i}",
+                "keywords": [f"kw{i % 3}", f"kw{i % 5}"],
+                "source_agents": [f"agent{i % 4}"],
+                "category": categories[i % len(categories)],
+                "quality_score": (i * 37) % 100,
+                "created_at": f"2026-01-{i + 1:02d}T00:00:00"
+            }
+            sharded.save_knowledge_capsule(dict(capsule))
+            single.save_knowledge_capsule(dict(capsule))
+        yield sharded, single
+        sharded.close()
+    
+    def test_writes_are_routed_by_category(self, storages):
+        """测试按分类写入不同分片"""
+        sharded, _ = storages
+        
+        assert set(sharded.shards) >= {"natural_science", "social_science", "default"}
+        assert sharded.get_stats()["shards"]["natural_science"] == 5
+        assert sharded.get_knowledge_capsule("sh_0")["category"] == "自然科学"
+    
+    def test_fan_out_matches_single_database(self, storages):
+        """测试扇出查询结果与单库一致"""
+        sharded, single = storages
+        ids = lambda capsules: [c["id"] for c in capsules]
+        
+        assert ids(sharded.list_knowledge_capsules(limit=7, offset=3)) == \
+            ids(single.list_knowledge_capsules(limit=7, offset=3))
+        assert ids(sharded.get_top_capsules(limit=5)) == ids(single.get_top_capsules(limit=5))
+        assert ids(sharded.search_capsules("分片", limit=6)) == \
+            ids(single.search_capsules("分片", limit=6))
+        assert sharded.get_keyword_frequencies() == single.get_keyword_frequencies()
+    
+    def test_faceted_search_counts(self, storages):
+        """测试分面数量与逐个胶囊计数一致，分片与单库一致"""
+        from collections import Counter
+        from src.storage.columnar import infer_grade
+        
+        sharded, single = storages
+        capsules = single.list_knowledge_capsules(limit=100)
+        
+        def expected(matched, facet_limit=10):
+            count = lambda values: Counter(values)
+            ranked = lambda counter, n=None: [
+                {"value": v, "count": c} for v, c in sorted(counter.items(), key=lambda x: (-x[1], x[0] or ""))[:n]
+            ]
+            return {
+                "category": ranked(count(c["category"] for c in matched)),
+                "grade": ranked(count(infer_grade(c["quality_score"]) for c in matched)),
+                "agent": ranked(count(a for c in matched for a in c["source_agents"]), facet_limit),
+                "keyword": ranked(count(k for c in matched for k in set(c["keywords"])), facet_limit),
+                "time": [
+                    {"value": v, "count": c}
+                    for v, c in sorted(count(c["created_at"][:10] for c in matched).items())
+                ]
+            }
+        
+        result = single.search_capsules_faceted(bucket="day", limit=5)
+        assert result["total"] == 25 and result["facets"] == expected(capsules)
+        assert [c["id"] for c in result["capsules"]] == [c["id"] for c in single.get_top_capsules(limit=5)]
+        
+        # 过滤条件同时作用于结果与分面
+        filters = {"keyword": "kw1", "grade": "C", "since": "2026-01-05", "bucket": "day", "facet_limit": 2}
+        matched = [
+            c for c in capsules
+            if "kw1" in c["keywords"] and infer_grade(c["quality_score"]) == "C" and c["created_at"] >= "2026-01-05"
+        ]
+        for storage in (single, sharded):
+            result = storage.search_capsules_faceted(**filters)
+            assert result["total"] == len(matched)
+            assert result["facets"] == expected(matched, facet_limit=2)
+            assert {c["id"] for c in result["capsules"]} == {c["id"] for c in matched}
+        
+        page = {"query": "分片", "limit": 4, "offset": 2, "facet_limit": 3}
+        assert sharded.search_capsules_faceted(**page)["facets"] == single.search_capsules_faceted(**page)["facets"]
+        assert [c["id"] for c in sharded.search_capsules_faceted(**page)["capsules"]] == \
+            [c["id"] for c in single.search_capsules_faceted(**page)["capsules"]]
+        assert sharded.search_capsules_faceted(category="自然科学", agent="agent0")["total"] == \
+            single.search_capsules_faceted(category="自然科学", agent="agent0")["total"]
+    
+    def test_category_change_moves_capsule(self, storages):
+        """测试修改分类后胶囊迁移到新分片"""
+        sharded, _ = storages
+        
+        capsule = sharded.get_knowledge_capsule("sh_0")
+        capsule["category"] = "人文科学"
+        sharded.save_knowledge_capsule(capsule)
+        
+        assert sharded.get_knowledge_capsule("sh_0")["category"] == "人文科学"
+        assert "sh_0" not in [c["id"] for c in sharded.list_knowledge_capsules(category="自然科学")]
+        assert sharded.delete_knowledge_capsule("sh_0") is True
+        assert sharded.get_knowledge_capsule("sh_0") is None
+    
+    def test_failed_category_change_keeps_old_copy(self, storages, monkeypatch):
+        """测试写入新分片失败时胶囊仍保留在旧分片"""
+        sharded, _ = storages
+        write = CapsuleStorage._write_knowledge_capsule
+        
+        def failing_write(storage, capsule):
+            if storage.db_path.endswith("humanities.db"):
+                raise sqlite3.OperationalError("disk I/O error")
+            return write(storage, capsule)
+        
+        monkeypatch.setattr(CapsuleStorage, "_write_knowledge_capsule", failing_write)
+        capsule = sharded.get_knowledge_capsule("sh_0")
+        capsule["category"] = "人文科学"
+        with pytest.raises(sqlite3.OperationalError):
+            sharded.save_knowledge_capsule(capsule)
+        
+        assert sharded.get_knowledge_capsule("sh_0")["category"] == "自然科学"
+    
+    def test_save_without_id_generates_one(self, storages):
+        """测试缺少 ID 的胶囊与单库存储一样自动生成 ID"""
+        sharded, _ = storages
+        capsule = {"title": "无 ID 胶囊", "category": "社会科学", "keywords": ["kw0"]}
+        assert sharded.save_knowledge_capsule(capsule)
+        
+        assert capsule["id"].startswith("kc_")
+        assert sharded.get_knowledge_capsule(capsule["id"])["title"] == "无 ID 胶囊"
+
+
+class TestSnapshotManager:
+    """在线快照测试类"""
+    
+    @pytest.fixture
+    def storage(self, tmp_path):
+        storage = CapsuleStorage(str(tmp_path / "capsules.db"))
+        for i in range(20):
+            storage.save_knowledge_capsule({
+                "id": f"snap_kc_{i}",
+                "title": f"快照测试胶囊 {i}",
+                "keywords": ["快照"]
+            })
+        return storage
+    
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_snapshot_and_restore(self, storage, tmp_path, compress):
+        """测试创建快照后恢复到快照时刻的数据"""
+        from src.storage.backup import SnapshotManager
+        
+        manager = SnapshotManager.from_storages(
+            storage, snapshot_dir=str(tmp_path / "snapshots"), pages_per_step=2
+        )
+        manifest = manager.create_snapshot(compress=compress)
+        
+        assert "capsules" in manifest["databases"]
+        assert manifest["databases"]["capsules"]["steps"] >= 1
+        assert manager.list_snapshots()[0]["id"] == manifest["id"]
+        
+        storage.delete_knowledge_capsule("snap_kc_0")
+        assert storage.get_knowledge_capsule("snap_kc_0") is None
+        
+        manager.restore_snapshot(manifest["id"])
+        assert storage.get_knowledge_capsule("snap_kc_0") is not None
+        assert storage.get_capsule_ids_by_keyword("快照") != []
+
+
+class TestDatabaseMaintenance:
+    """数据库维护测试类"""
+    
+    def test_maintenance_reclaims_space(self, tmp_path):
+        """测试删除数据后增量 VACUUM 回收空间"""
+        from src.storage.maintenance import DatabaseMaintenance
+        
+        db_path = str(tmp_path / "capsules.db")
+        storage = CapsuleStorage(db_path)
+        for i in range(100):
+            storage.save_knowledge_capsule({"id": f"m_{i}", "title": "维护" * 500})
+        for i in range(90):
+            storage.delete_knowledge_capsule(f"m_{i}")
+        
+        report = DatabaseMaintenance(databases={"capsules": db_path}).run_all()
+        result = report["databases"]["capsules"]
+        
+        assert result["steps"]["analyze"]["status"] == "ok"
+        assert result["steps"]["vacuum"]["mode"] == "incremental"
+        assert result["reclaimed_bytes"] > 0
+        assert result["after"]["freelist_count"] == 0
+        assert len(storage.list_knowledge_capsules()) == 10
+    
+    def test_maintenance_respects_time_budget(self, tmp_path):
+        """测试超出时间预算后跳过剩余步骤"""
+        from src.storage.maintenance import DatabaseMaintenance
+        
+        db_path = str(tmp_path / "capsules.db")
+        CapsuleStorage(db_path)
+        
+        report = DatabaseMaintenance(databases={"capsules": db_path}, time_budget=0).run_all()
+        steps = report["databases"]["capsules"]["steps"]
+        
+        assert all(step["status"] == "skipped" for step in steps.values())
+
+
+class TestColumnarSnapshot:
+    """列式快照与向量化分析测试类"""
+    
+    @pytest.fixture
+    def storage(self, tmp_path):
+        return CapsuleStorage(str(tmp_path / "capsules.db"))
+    
+    def test_snapshot_roundtrip_and_analytics(self, storage, tmp_path):
+        """测试快照保存 / mmap 加载后统计结果与原始数据一致"""
+        from src.storage.columnar import ColumnarSnapshot
+        from src.analytics import CapsuleAnalytics
+        
+        for i, score in enumerate([85, 70, 40]):
+            storage.save_knowledge_capsule({
+                "id": f"col_{i}",
+                "title": f"列式 {i}",
+                "category": "自然科学" if i < 2 else "人文科学",
+                "keywords": ["物理学", f"关键词{i}"],
+                "source_agents": ["newton"],
+                "quality_score": score,
+                "created_at": "2026-03-02T10:00:00"
+            })
+        
+        ColumnarSnapshot.from_storage(storage).save(str(tmp_path / "columnar"), parquet=False)
+        snapshot = ColumnarSnapshot.load(str(tmp_path / "columnar"))
+        analytics = CapsuleAnalytics(snapshot)
+        
+        assert len(snapshot) == 3
+        assert isinstance(snapshot["quality_score"], np.memmap)
+        assert snapshot.list_column("keyword", 0) == ["物理学", "关键词0"]
+        
+        stats = analytics.get_statistics()
+        assert stats["total_capsules"] == 3
+        assert stats["total_keywords"] == 4
+        assert stats["a_grade_count"] == 1
+        assert analytics.keyword_counts(1) == [{"keyword": "物理学", "count": 3}]
+        assert analytics.category_summary()[0]["category"] == "自然科学"
+        assert analytics.weekly_timeline() == [{"week": "2026-W09", "count": 3, "avg_quality": 65.0}]
+
+
+class TestVectorStore:
+    """内存映射向量存储测试类"""
+    
+    def test_search_matches_brute_force_with_tombstones(self, tmp_path):
+        """测试分块 Top-K 与完整暴力计算一致，墓碑 / 替换 / 压缩 / 重新打开后结果不变"""
+        from src.storage.vector_store import VectorStore
+        
+        rng = np.random.default_rng(3)
+        vectors = rng.standard_normal((3000, 32)).astype(np.float32)
+        store = VectorStore(str(tmp_path / "vectors"), 32, "test")
+        store.add([f"v{i}" for i in range(2000)], vectors[:2000])
+        store.add([f"v{i}" for i in range(2000, 3000)], vectors[2000:], versions=list(range(1000)))
+        store.delete([f"v{i}" for i in range(0, 3000, 4)])
+        store.add(["v1"], -vectors[1:2])
+        assert len(store) == 2250
+        assert store.version("v2001") == 1
+        
+        queries = rng.standard_normal((5, 32)).astype(np.float32)
+        results = store.search(queries, k=8, exclude=["v2", None, None, None, None], block_rows=500)
+        
+        expected_vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected_vectors[1] *= -1
+        scores = queries @ expected_vectors.T
+        scores[:, ::4] = -np.inf
+        scores[0, 2] = -np.inf
+        for j, result in enumerate(results):
+            assert [capsule_id for capsule_id, _ in result] == [f"v{i}" for i in np.argsort(-scores[j])[:8]]
+        
+        assert store.compact() == 751
+        assert store.search(queries, k=8, exclude=["v2", None, None, None, None]) == results
+        reopened = VectorStore(str(tmp_path / "vectors"), 32, "test")
+        assert len(reopened) == 2250
+        assert reopened.search(queries, k=8, exclude=["v2", None, None, None, None]) == results
+        
+        # 模型变化时清空重建
+        assert len(VectorStore(str(tmp_path / "vectors"), 32, "other")) == 0
+    
+    def test_ivf_index_recall_tail_and_invalidation(self, tmp_path):
+        """测试 IVF 索引全簇扫描与暴力检索一致，新增尾部 / 墓碑生效，压缩后索引失效"""
+        from src.storage.ivf_index import IVFIndex
+        from src.storage.vector_store import VectorStore
+        
+        rng = np.random.default_rng(4)
+        centers = rng.standard_normal((20, 16)).astype(np.float32)
+        vectors = centers[rng.integers(0, 20, 4000)] + 0.3 * rng.standard_normal((4000, 16)).astype(np.float32)
+        store = VectorStore(str(tmp_path / "vectors"), 16, "test")
+        store.add([f"v{i}" for i in range(3600)], vectors[:3600])
+        index = IVFIndex.build(store, nlist=20)
+        assert index.nlist == 20 and len(index.rows) == 3600
+        
+        store.add([f"v{i}" for i in range(3600, 4000)], vectors[3600:])
+        store.delete([f"v{i}" for i in range(0, 4000, 5)])
+        store.add(["v1"], vectors[3:4])
+        queries = vectors[rng.integers(0, 4000, 20)]
+        exclude = [f"v{i}" for i in range(20)]
+        
+        exact = store.search(queries, k=10, exclude=exclude)
+        assert [sorted(r) for r in index.search(queries, k=10, nprobe=20, exclude=exclude)] == [sorted(r) for r in exact]
+        recall = np.mean([
+            len({a for a, _ in e} & {a for a, _ in p}) / 10
+            for e, p in zip(exact, index.search(queries, k=10, nprobe=3, exclude=exclude))
+        ])
+        assert recall > 0.8
+        
+        loaded = IVFIndex.load(store)
+        assert loaded.tail_rows() == 401
+        assert [sorted(r) for r in loaded.search(queries, k=10, nprobe=20, exclude=exclude)] == [sorted(r) for r in exact]
+        
+        store.compact()
+        assert not index.is_valid()
+        assert IVFIndex.load(store) is None
+
+
+class TestEmbeddingCache:
+    """向量缓存测试类"""
+    
+    def test_cached_embedder_batches_coalesces_and_persists(self, tmp_path):
+        """测试未命中文本按批调用、并发请求合并、缓存跨实例持久化、失败不写入缓存"""
+        import threading
+        import time
+        from src.cached_embedder import CachedEmbedder
+        from src.storage.embedding_cache import EmbeddingCache
+        
+        calls = []
+        
+        def embed(texts):
+            calls.append(list(texts))
+            time.sleep(0.05)
+            return [[float(len(text)), 1.0] for text in texts]
+        
+        db_path = str(tmp_path / "embeddings.db")
+        embedder = CachedEmbedder(embed, "mock", "m", EmbeddingCache(db_path), batch_size=2)
+        results = [None] * 4
+        
+        def run(i):
+            results[i] = embedder(["a", "bb", "ccc", "a"])
+        
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # 3 段不同文本只向量化一次，按批大小 2 切分
+        assert sorted(len(batch) for batch in calls) == [1, 2]
+        assert all(result.tolist() == [[1, 1], [2, 1], [3, 1], [1, 1]] for result in results)
+        stats = embedder.stats()
+        assert stats["requests"] == 16 and stats["misses"] == 3 and stats["provider_calls"] == 2
+        
+        # 新实例从 SQLite 读取，只请求新文本
+        reopened = CachedEmbedder(embed, "mock", "m", EmbeddingCache(db_path))
+        assert reopened(["ccc", "dddd"]).tolist() == [[3, 1], [4, 1]]
+        assert calls[-1] == ["dddd"]
+        assert reopened.stats()["disk_hits"] == 1 and reopened.stats()["hit_rate"] == 0.5
+        # 缓存按模型隔离
+        assert EmbeddingCache(db_path).count("mock", "m") == 4
+        assert EmbeddingCache(db_path).count("mock", "other") == 0
+        
+        def fail(texts):
+            raise RuntimeError("provider down")
+        
+        broken = CachedEmbedder(fail, "mock", "m", EmbeddingCache(db_path))
+        with pytest.raises(RuntimeError):
+            broken(["eeeee"])
+        assert broken.stats()["provider_errors"] == 1
+        assert EmbeddingCache(db_path).count() == 4
+
+
+class TestBM25Index:
+    """BM25 倒排索引测试类"""
+    
+    def test_tokenize_and_pruned_top_k_matches_exhaustive(self):
+        """测试中英文分词、提前终止的 Top-K 与全量排序一致，删除 / 更新 / 压缩后结果正确"""
+        import random
+        from src.storage import text_index
+        from src.storage.text_index import BM25Index, tokenize
+        
+        assert tokenize("量子计算 AI-Lab") == ["量", "子", "计", "算", "量子", "子计", "计算", "ai", "lab"]
+        assert tokenize("ＧＰＵ，深度") == ["gpu", "深", "度", "深度"]
+        
+        rng = random.Random(5)
+        words = [f"w{i}" for i in range(40)]
+        docs = [
+            (f"d{i}", {
+                "title": "知识图谱" if i % 50 == 0 else "",
+                "body": [rng.choice(words) for _ in range(rng.randint(3, 30))] + (["rare"] if i % 300 == 0 else [])
+            })
+            for i in range(3000)
+        ]
+        index = BM25Index({"title": 2.0})
+        index.add_many(docs)
+        queries = ["rare w1 w2 w3", "w5 w7", "知识 w9", "w1 w2 w3 w4 w5 w6 w7 w8 rare rare"]
+        
+        original_min = text_index.COMPACT_MIN
+        text_index.COMPACT_MIN = 100
+        try:
+            for round_ in range(3):
+                for query in queries:
+                    ranked = index.search(query, k=None, exclude=["d300"])
+                    for k in (1, 7, 50):
+                        assert index.search(query, k=k, exclude=["d300"]) == ranked[:k]
+                for i in range(round_, 3000, 3):
+                    index.remove(f"d{i}")
+                index.add_many(docs[round_::11])
+            assert index.stats()["tombstones"] < len(index)
+        finally:
+            text_index.COMPACT_MIN = original_min
+        
+        # 字段权重: 标题命中得分高于正文
+        index.add("t1", {"title": "图谱", "body": "w1"})
+        index.add("t2", {"title": "w1", "body": "图谱"})
+        ranked = [doc_id for doc_id, _ in index.search("图谱", k=None) if doc_id in ("t1", "t2")]
+        assert ranked == ["t1", "t2"]
+        
+        # 全部词项命中
+        assert all("rare" in dict(docs)[doc_id]["body"] for doc_id, _ in index.search("rare w1", k=None, require_all=True))
+        assert index.search("rare 不存在", k=None, require_all=True) == []
+
+
 # 运行测试
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])